@@ -1,18 +1,34 @@
 #! /usr/bin/env python3
 
 import sys
+import tempfile
 
-from ..useradm.rbuserdb import RBUserDB
+import rbldif
+from rbuserdb import RBUserDB
+
+# Spool input to a temporary file counting the entries needing a uidNumber,
+# so a block of that size can be reserved before writing any out.
+spool = tempfile.TemporaryFile()
+count = 0
+for _, data in rbldif.read_records(sys.stdin.buffer):
+    entry = rbldif.parse_record(data)
+    if entry is not None and entry.get('uidNumber') == '-1':
+        count += 1
+    spool.write(data)
+spool.seek(0)
 
 udb = RBUserDB()
 udb.connect()
-fd, n = udb.uidNumber_getnext()
-for line in sys.stdin:
-    if line == 'uidNumber: -1\n':
-        print('uidNumber:', n)
-        n += 1
-    else:
-        print(line, end=' ')
+n = udb.uidNumber_reserve(count) if count else None
 
-udb.uidNumber_savenext(fd, n)
-udb.uidNumber_unlock(fd)
+# The counter should always be past any uidNumber in use, but check the
+# reserved block really is free in case it was set wrong.
+if count and not udb.uidNumber_index().is_free(n, count):
+    sys.exit('uidNumbers %d-%d are in use, fix counter with '
+             'useradm create_uidNumber' % (n, n + count - 1))
+
+for entry in rbldif.parse(spool):
+    if entry.get('uidNumber') == '-1':
+        entry.set('uidNumber', str(n))
+        n += 1
+    sys.stdout.buffer.write(entry.to_ldif())
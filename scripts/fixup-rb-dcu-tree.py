@@ -1,15 +1,14 @@
-#! /usr/bin/python
+#! /usr/bin/python3
 
 import re
 import sys
 
-re_dn = re.compile(r'^(dn: cn=.*?,).*(ou=.*?),o=DCU$')
+import rbldif
 
-for i in sys.stdin:
-    i = i.rstrip()
-    if i.startswith("dn:"):
-        print(re.sub(re_dn, r'\1\2,ou=dcu,o=redbrick', i))
-        print("objectClass: top")
-        print("objectClass: dcuAccount")
-    elif not i.startswith('objectClass:'):
-        print(i)
+re_dn = re.compile(r'^(cn=.*?,).*(ou=.*?),o=DCU$')
+
+for entry in rbldif.parse(sys.stdin.buffer):
+    entry.dn = re.sub(re_dn, r'\1\2,ou=dcu,o=redbrick', entry.dn)
+    entry.remove('objectClass')
+    entry.attrs[0:0] = [['objectClass', 'top'], ['objectClass', 'dcuAccount']]
+    sys.stdout.buffer.write(entry.to_ldif())
@@ -5,18 +5,20 @@ use strict;
 open USERLIST,"userlist";
 my @users = <USERLIST>;
 close USERLIST;
+chomp @users;
 
-foreach my $user(@users) {
-	chomp $user;
-	my @info = `/local/admin/scripts/rrs/useradm show $user`;
-
-	# get uidNumber
-	my $uidNumber;
-	foreach my $infoline(@info) {
-		if($infoline =~ /uidNumber: (\d*)/) {
-			$uidNumber = $1;
-		}
-	}
-	print $uidNumber . "\n";
+# Get uidNumber of every user with one useradm export.
+my %uidNumber;
+open EXPORT, "-|", "/local/admin/scripts/rrs/useradm", "export",
+	"--attrs", "uid,uidNumber", @users or die "useradm export: $!";
+<EXPORT>;
+while (my $line = <EXPORT>) {
+	chomp $line;
+	my ($uid, $number) = split /,/, $line;
+	$uidNumber{$uid} = $number;
 }
+close EXPORT;
 
+foreach my $user(@users) {
+	print(($uidNumber{$user} // '') . "\n");
+}
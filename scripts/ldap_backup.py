@@ -0,0 +1,107 @@
+#! /usr/bin/env python3
+
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""Incremental backup of the LDAP tree.
+
+Usage: ldap_backup.py [-d dir] [-H uri] [-i seconds] [-f]
+       ldap_backup.py [-d dir] -r [YYYYMMDDHHMMSS] > tree.ldif
+
+  -d dir      backup directory (default: ldap-backup)
+  -H uri      LDAP server (default: rbconfig.LDAP_URI)
+  -i seconds  keep running, taking a delta every interval
+  -f          take a full backup, starting a new chain
+  -r          rebuild tree as it was at given UTC time (default: latest)
+
+"""
+
+# System modules
+
+import getopt
+import sys
+import time
+
+import ldap
+import rbbackup
+import rbconfig
+from rberror import RBError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = "$Revision: 1.1 $"
+
+# --------------------------------------------------------------------------- #
+# MAIN                                                                        #
+# --------------------------------------------------------------------------- #
+
+
+def connect(uri):
+    """Return LDAP connection bound as root."""
+
+    with open(rbconfig.LDAP_ROOTPW_FILE, 'r') as pw_file:
+        password = pw_file.readline().rstrip()
+    ldap.set_option(ldap.OPT_PROTOCOL_VERSION, 3)
+    conn = ldap.initialize(uri)
+    conn.simple_bind_s(rbconfig.LDAP_ROOT_DN, password)
+    return conn
+
+
+def main():
+    """Program entry function."""
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:H:i:fhr')
+    except getopt.GetoptError as err:
+        print(err, file=sys.stderr)
+        print(__doc__.split('\n\n', 1)[1], file=sys.stderr)
+        sys.exit(1)
+
+    directory = 'ldap-backup'
+    uri = rbconfig.LDAP_URI
+    interval = full = rebuild = None
+    for o, a in opts:
+        if o == '-h':
+            print(__doc__.split('\n\n', 1)[1], file=sys.stderr)
+            sys.exit(0)
+        elif o == '-d':
+            directory = a
+        elif o == '-H':
+            uri = a
+        elif o == '-i':
+            interval = int(a)
+        elif o == '-f':
+            full = 1
+        elif o == '-r':
+            rebuild = 1
+
+    try:
+        if rebuild:
+            backup = rbbackup.RBBackup(directory)
+            total = backup.rebuild(sys.stdout.buffer,
+                                   args[0] if args else None)
+            print('Rebuilt %d entries' % total, file=sys.stderr)
+            return
+
+        backup = rbbackup.RBBackup(directory, connect(uri))
+        if full:
+            print('Full backup:', backup.full())
+        while True:
+            if not full:
+                filename = backup.incremental()
+                if filename:
+                    print(time.strftime('%Y-%m-%d %H:%M:%S'), filename)
+                    sys.stdout.flush()
+            full = None
+            if interval is None:
+                break
+            time.sleep(interval)
+    except RBError as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,10 @@
-#!/usr/bin/python
+#!/usr/bin/python3
+"""Add 9 to yearsPaid and reset newbie for founder and club/soc accounts.
+Same as: ldif_transform.py founder_soc"""
 import sys
 
-for i in sys.stdin:
-    i = i.rstrip()
-    if i.startswith("yearsPaid:"):
-        print("yearsPaid:", int(i.split()[1]) + 9)
-    elif i.startswith("newbie:"):
-        print("newbie: FALSE")
-    else:
-        print(i)
+import rbtransform
+
+if __name__ == '__main__':
+    rbtransform.transform(sys.stdin.buffer, sys.stdout.buffer,
+                          ['founder_soc'])
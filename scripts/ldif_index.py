@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""Index an LDIF dump or look up entries in it.
+
+Usage: ldif_index.py file.ldif               build (or rebuild) index
+       ldif_index.py file.ldif name|dn...    print entries as LDIF
+
+A name without an '=' is taken as a username in the accounts tree, e.g. to
+restore a deleted account from an old dump:
+
+    ldif_index.py slapcat.pre-newyear someuser | ldapadd ...
+
+"""
+
+# System modules
+
+import sys
+
+import rbconfig
+import rbldifindex
+from rberror import RBError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = "$Revision: 1.1 $"
+
+# --------------------------------------------------------------------------- #
+# MAIN                                                                        #
+# --------------------------------------------------------------------------- #
+
+
+def main():
+    """Program entry function."""
+
+    if len(sys.argv) < 2 or sys.argv[1] == '-h':
+        print(__doc__.split('\n\n')[1], file=sys.stderr)
+        sys.exit(1)
+
+    filename = sys.argv[1]
+    try:
+        if len(sys.argv) == 2:
+            print('Indexed %d entries' % rbldifindex.build_index(filename),
+                  file=sys.stderr)
+            return
+
+        index = rbldifindex.RBLDIFIndex(filename)
+        missing = 0
+        for name in sys.argv[2:]:
+            dn = name if '=' in name else 'uid=%s,%s' % (
+                name, rbconfig.LDAP_ACCOUNTS_TREE)
+            entry = index.get(dn)
+            if entry is None:
+                print('Not found: %s' % dn, file=sys.stderr)
+                missing += 1
+            else:
+                sys.stdout.buffer.write(entry.to_ldif())
+        index.close()
+    except RBError as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""Run a chain of LDIF transforms over an LDIF dump on all CPUs.
+
+Usage: ldif_transform.py [-j processes] [-u uidNumber] transform...
+                         < input.ldif > output.ldif
+
+e.g. the new year rollover:
+
+    ldif_transform.py yearsPaid newbie < slapcat.pre-newyear > slapcat.pre-rrs
+
+"""
+
+# System modules
+
+import getopt
+import sys
+
+import rbtransform
+from rberror import RBError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = "$Revision: 1.1 $"
+
+# --------------------------------------------------------------------------- #
+# MAIN                                                                        #
+# --------------------------------------------------------------------------- #
+
+
+def usage():
+    """Print usage and list of transforms."""
+
+    print(__doc__.split('\n\n')[1], file=sys.stderr)
+    print('\nTransforms:\n', file=sys.stderr)
+    for name, (_, desc, _) in sorted(rbtransform.TRANSFORMS.items()):
+        print('  %-12s %s' % (name, desc), file=sys.stderr)
+
+
+def main():
+    """Program entry function."""
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hj:u:')
+    except getopt.GetoptError as err:
+        print(err, file=sys.stderr)
+        usage()
+        sys.exit(1)
+
+    processes = None
+    context = {}
+    for o, a in opts:
+        if o == '-h':
+            usage()
+            sys.exit(0)
+        elif o == '-j':
+            processes = int(a)
+        elif o == '-u':
+            context['uidNumber'] = int(a)
+
+    if not args:
+        usage()
+        sys.exit(1)
+
+    try:
+        total = rbtransform.transform(sys.stdin.buffer, sys.stdout.buffer,
+                                      args, processes, context)
+    except RBError as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+    print('%d records transformed' % total, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
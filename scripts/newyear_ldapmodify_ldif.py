@@ -1,7 +1,8 @@
 #!/usr/bin/python3
-import string
 import sys
 
+import rbldif
+
 """
 -mak
 This simply takes the ldif generated by newyear_ldif.py
@@ -12,44 +13,25 @@ ldapmodify -x -D cn=root,ou=ldap,o=redbrick -y /etc/ldap.secret \
         -f [LDIF_FROM_THIS_SCRIPT]
 """
 
-years_paid = ''
-uid = ''
-
-# print modify ldif template
-
-
-def modifyTemplate(uid, years_paid, newbie, reserved):
-    if uid != '' and years_paid != '' and reserved is False:
-        modTemp = "dn: uid=" + uid.strip() + \
-            "\nchangetype: modify\nreplace: years_paid\nyears_paid: " + \
-            years_paid.strip() + "\n"
-        if newbie == '1':
-            modTemp += "-\nreplace: newbie\nnewbie: FALSE\n\n"
-        else:
-            modTemp += "\n"
-        print(modTemp)
-
-
-# open ldif
-with open(sys.argv[1], 'r') as content:
-    ldif = content.read()
-# split by user
-getdn = string.split(ldif, 'dn: uid=')
-for i in range(1, len(getdn)):
-    thisdn = getdn[i].split('\n')
-    newbie = 'NONE'
-    reserved = False
-    # split by users variables
-    for j in range(0, len(thisdn)):
-        x = thisdn[j].rstrip()
-        uid = thisdn[0].rstrip()
-        if 'reserved' in uid:
-            reserved = True
-        try:
-            if x.startswith("years_paid:"):
-                years_paid = str(int(x.split()[1])).strip()
-            elif x.startswith("newbie:"):
-                newbie = '1'
-        except IndexError:
-            break
-    modifyTemplate(uid, years_paid, newbie, reserved)
+
+def modify_entry(entry):
+    """Return modify change record for given user entry or None if it's not
+    a paying user."""
+
+    years_paid = entry.get('yearsPaid')
+    if (not entry.dn.startswith('uid=') or 'ou=reserved' in entry.dn or
+            years_paid is None):
+        return None
+
+    attrs = [('changetype', 'modify'), ('replace', 'yearsPaid'),
+             ('yearsPaid', str(int(years_paid)))]
+    if entry.get('newbie') is not None:
+        attrs += [('-', ''), ('replace', 'newbie'), ('newbie', 'FALSE')]
+    return rbldif.RBLDIFEntry(entry.dn, attrs)
+
+
+with open(sys.argv[1], 'rb') as content:
+    for entry in rbldif.parse(content):
+        change = modify_entry(entry)
+        if change is not None:
+            sys.stdout.buffer.write(change.to_ldif())
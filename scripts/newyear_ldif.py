@@ -1,11 +1,10 @@
-#!/usr/bin/python
+#!/usr/bin/python3
+"""Decrement yearsPaid and reset newbie in an LDIF dump for the new year.
+Same as: ldif_transform.py yearsPaid newbie"""
 import sys
 
-for i in sys.stdin:
-    i = i.rstrip()
-    if i.startswith("yearsPaid:"):
-        print("yearsPaid:", int(i.split()[1]) - 1)
-    elif i.startswith("newbie:"):
-        print("newbie: FALSE")
-    else:
-        print(i)
+import rbtransform
+
+if __name__ == '__main__':
+    rbtransform.transform(sys.stdin.buffer, sys.stdout.buffer,
+                          ['yearsPaid', 'newbie'])
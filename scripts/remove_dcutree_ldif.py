@@ -1,10 +1,9 @@
-#! /usr/bin/env python
+#! /usr/bin/env python3
 
 import sys
 
-dcu = 0
-for line in sys.stdin:
-    if line.startswith('dn:'):
-        dcu = line.find('ou=dcu') != -1
-    if not dcu:
-        print(line, end=' ')
+import rbldif
+
+for entry in rbldif.parse(sys.stdin.buffer):
+    if entry.dn.find('ou=dcu') == -1:
+        sys.stdout.buffer.write(entry.to_ldif())
@@ -0,0 +1,12 @@
+"""RedBrick Test Package."""
+
+import os
+import sys
+
+# The useradm modules import each other as top level modules (e.g.
+# 'import rbconfig'), so make them importable. Appended so that 'useradm'
+# still resolves to the package.
+#
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                 'useradm'))
@@ -0,0 +1,530 @@
+"""RedBrick Test Module; useradm benchmark suite.
+
+Runs useradm commands (stats, checkdb, list_*, check_userfree, the RRS
+card() flow, pre_sync, each sync stage and unpaid_*) against FakeLDAPObject
+directories and a scratch filesystem holding a synthetic dataset (see
+dataset), at each given size. For every command the wall time, LDAP
+operations by type and forked processes are recorded and saved as JSON so
+runs can be compared.
+
+    python -m tests.benchmark [-n size,...] [-s seed] [-c command,...]
+                              [-o results.json]
+    python -m tests.benchmark -C old.json new.json
+
+External commands run for real but harmlessly: setquota, chown and chgrp
+are true(1), cp copies a scratch skeleton, and su, sendmail and the
+mailman scripts are shell scripts that drain their input. Ownership can't
+be given away without root, so os.chown is a no-op while it runs."""
+
+import collections
+import contextlib
+import getopt
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import ldap
+from tests import dataset, fakeldap
+from useradm import rrs
+from useradm import useradm as cli
+
+# useradm imports these (as flat modules) only for commands that need them.
+import rbaccount
+import rbuserdb
+
+rbconfig = cli.rbconfig
+RBError = cli.RBError
+RBOpt = cli.RBOpt
+RBUser = cli.RBUser
+RBAccount = rbaccount.RBAccount
+RBUserDB = rbuserdb.RBUserDB
+
+SIZES = (1000, 5000)
+
+COMMANDS = ('stats', 'list_users', 'list_newbies', 'list_renewals',
+            'list_unavailable', 'list_unpaid', 'list_unpaid_normal',
+            'list_unpaid_reset', 'list_unpaid_grace', 'check_userfree',
+            'checkdb', 'checkdb_incremental', 'card', 'pre_sync',
+            'sync_rename', 'sync_convert', 'sync_add', 'sync_renew',
+            'unpaid_warn', 'unpaid_disable', 'unpaid_delete')
+
+# Lookups done by the check_userfree and card benchmarks and the fraction
+# of accounts renamed, converted and renewed in RRS before sync.
+#
+LOOKUPS = 200
+RENAME_RATE = 0.01
+CONVERT_RATE = 0.005
+RENEW_RATE = 0.05
+
+SCRIPTS = {
+    'bin/su': 'exec /bin/sh -c "$2"\n',
+    'bin/sendmail': 'exec cat >/dev/null\n',
+    'mailman/bin/add_members': 'exec cat >/dev/null\n',
+    'mailman/bin/remove_members': 'exit 0\n',
+}
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class Counters:
+    """LDAP operation and fork counts."""
+
+    def __init__(self):
+        """Create new Counters object with all counts zero."""
+
+        self.ldap = collections.Counter()
+        self.forks = 0
+
+    def snapshot(self):
+        """Return copy of the current counts."""
+
+        return collections.Counter(self.ldap), self.forks
+
+    def since(self, snapshot):
+        """Return (LDAP operations, forks) since given snapshot."""
+
+        ldap_ops, forks = snapshot
+        return dict(self.ldap - ldap_ops), self.forks - forks
+
+
+class CountingLDAP:
+    """Proxy for an LDAPObject counting calls by method name."""
+
+    def __init__(self, conn, counters):
+        """Create new CountingLDAP for given connection."""
+
+        self.conn = conn
+        self.counters = counters
+
+    def __getattr__(self, name):
+        attr = getattr(self.conn, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.counters.ldap[name] += 1
+            return attr(*args, **kwargs)
+
+        return call
+
+
+class Form:
+    """Minimal cgi.FieldStorage for rrs.py."""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def getfirst(self, name, default=None):
+        return self.fields.get(name, default)
+
+
+class Benchmark:
+    """Benchmark run for one dataset size in a scratch directory."""
+
+    def __init__(self, size, seed, tmpdir):
+        """Create dataset of given size and seed below tmpdir and point
+        useradm at it."""
+
+        self.size = size
+        self.seed = seed
+        self.tmpdir = tmpdir
+        self.counters = Counters()
+        self.results = []
+        self.saved = []
+        self.data = dataset.Dataset(size, seed,
+                                    root=os.path.join(tmpdir, 'root'))
+
+    def patch(self, obj, attr, value):
+        """Set attribute, saving the old value for restore()."""
+
+        old = getattr(obj, attr)
+        self.saved.append(lambda: setattr(obj, attr, old))
+        setattr(obj, attr, value)
+
+    def restore(self):
+        """Undo all patch() and environment changes."""
+
+        while self.saved:
+            self.saved.pop()()
+
+    def path(self, name):
+        """Return path of given file in the scratch directory."""
+
+        return os.path.join(self.tmpdir, name)
+
+    def setup(self):
+        """Write and load the dataset, create the scratch filesystem and
+        configure useradm for it."""
+
+        self.extra_user_files = rbconfig.gen_extra_user_files
+        rb_ldif, dcu_ldif = self.data.write(self.tmpdir)
+        for name, key in self.data.skeleton(newbies=False).items():
+            self.patch(rbconfig, name, key)
+
+        for name, text in SCRIPTS.items():
+            os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+            with open(self.path(name), 'w') as fd:
+                fd.write('#!/bin/sh\n' + text)
+            os.chmod(self.path(name), 0o755)
+        os.makedirs(self.path('skel'))
+        with open(os.path.join(self.path('skel'), '.zshrc'), 'w') as fd:
+            fd.write('# zshrc\n')
+        with open(self.path('shells'), 'w') as fd:
+            fd.write('\n'.join(dataset.LONELY) + '\n' +
+                     rbconfig.SHELL_EXPIRED + '\n')
+        open(self.path('passwd'), 'w').close()
+
+        for name, value in (
+                ('DIR_SKEL', self.path('skel')),
+                ('DIR_MAILMAN', self.path('mailman')),
+                ('FILE_SHELLS', self.path('shells')),
+                ('FILE_BACKUP_PASSWD', self.path('passwd')),
+                ('FILE_CHECKDB_STATE', self.path('checkdb.json')),
+                ('FILE_SYNC_JOURNAL', self.path('sync.db')),
+                ('COMMAND_SENDMAIL', self.path('bin/sendmail')),
+                ('COMMAND_SETQUOTA', 'true'),
+                ('COMMAND_CHOWN', 'true'),
+                ('COMMAND_CHGRP', 'true')):
+            self.patch(rbconfig, name, value)
+        self.patch(rbconfig, 'gen_extra_user_files', lambda uid: [
+            i if i.startswith(self.data.root) else self.data.root + i
+            for i in self.extra_user_files(uid)])
+        path = os.environ['PATH']
+        self.saved.append(lambda: os.environ.__setitem__('PATH', path))
+        os.environ['PATH'] = self.path('bin') + os.pathsep + path
+        self.patch(os, 'chown', lambda *args, **kwargs: None)
+        self.patch(os, 'lchown', lambda *args, **kwargs: None)
+        self.patch(sys, 'stdin', io.StringIO())
+
+        # Count every process started, os.popen included.
+        #
+        execute_child = subprocess.Popen._execute_child
+
+        def counting_execute_child(popen, *args, **kwargs):
+            self.counters.forks += 1
+            return execute_child(popen, *args, **kwargs)
+
+        self.patch(subprocess.Popen, '_execute_child', counting_execute_child)
+
+        # Class level caches would carry over from a previous size.
+        #
+        self.patch(RBUserDB, 'valid_shells', None)
+        self.patch(RBUserDB, 'backup_shells', None)
+        self.patch(RBAccount, 'signed_in_cache', (None, frozenset()))
+
+        udb = RBUserDB()
+        udb.ldap = CountingLDAP(fakeldap.load([rb_ldif], False),
+                                self.counters)
+        udb.ldap_dcu = CountingLDAP(fakeldap.load([dcu_ldif], False),
+                                    self.counters)
+        self.patch(cli, 'UDB', udb)
+        self.patch(cli, 'ACC', RBAccount())
+        self.patch(cli, 'OPT', RBOpt())
+        self.patch(rrs, 'udb', udb)
+
+    def measure(self, command, func, *args):
+        """Run func with output captured and record its wall time, LDAP
+        operations and forks (or the error it raised or exited with) under
+        given command name."""
+
+        snapshot = self.counters.snapshot()
+        error = None
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(output):
+            try:
+                func(*args)
+            except SystemExit:
+                error = ' '.join(output.getvalue().split('\n')[-4:]).strip()
+            except Exception as err:  # pylint: disable=broad-except
+                error = '%s: %s' % (err.__class__.__name__, err)
+        wall = time.perf_counter() - start
+        ldap_ops, forks = self.counters.since(snapshot)
+        self.results.append({
+            'size': self.size,
+            'command': command,
+            'wall': wall,
+            'ldap': ldap_ops,
+            'ldap_total': sum(ldap_ops.values()),
+            'forks': forks,
+            'error': error,
+        })
+
+    def opt(self, *args, **attrs):
+        """Set a fresh useradm RBOpt with given arguments and
+        attributes."""
+
+        opt = RBOpt()
+        opt.args = list(args)
+        for key, value in attrs.items():
+            setattr(opt, key, value)
+        cli.OPT = opt
+
+    # ------------------------------------------------------------------ #
+    # COMMANDS                                                           #
+    # ------------------------------------------------------------------ #
+
+    def names(self):
+        """Return sample of usernames for check_userfree: existing,
+        reserved, groups and free."""
+
+        rand = random.Random(self.seed)
+        uids = [i['uid'] for i in self.data.users]
+        names = rand.sample(uids, min(LOOKUPS // 2, len(uids)))
+        names += ['rsvd%d' % i for i in range(LOOKUPS // 10)]
+        names += list(dataset.GROUPS)
+        names += ['free%d' % i for i in range(LOOKUPS - len(names))]
+        return names
+
+    def check_userfree(self):
+        """Check a sample of usernames as add does."""
+
+        for name in self.names():
+            try:
+                cli.UDB.check_userfree(name)
+            except RBError:
+                pass
+
+    def card(self):
+        """Swipe a sample of DCU cards at the RRS card reader: half
+        existing accounts (renewals) and half DCU students without one
+        (new accounts)."""
+
+        rand = random.Random(self.seed)
+        renewals = [i[2] for i in self.data.people if i[1] in
+                    set(u['uid'] for u in self.data.users)]
+        newbies = [i[2] for i in self.data.people[len(renewals):]]
+        ids = (rand.sample(renewals, min(LOOKUPS // 2, len(renewals))) +
+               rand.sample(newbies, min(LOOKUPS // 2, len(newbies))))
+        updatedby = self.data.users[0]['uid']
+        for num in ids:
+            rrs.usr = RBUser()
+            rrs.opt = RBOpt()
+            rrs.udb.setopt(rrs.opt)
+            rrs.form = Form({'updatedby': updatedby, 'cardid': str(num)})
+            try:
+                rrs.card()
+            except RBError:
+                pass
+
+    def rrs_changes(self):
+        """Make the changes RRS would during the year on the LDAP tree
+        and write them to rrs.log: renames, member to associate
+        conversions and renewals. Newbies are already in the tree without
+        accounts."""
+
+        rand = random.Random(self.seed)
+        conn = cli.UDB.ldap.conn
+        log = []
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        members = [i for i in self.data.users
+                   if i['usertype'] == 'member' and not i['newbie']]
+        rand.shuffle(members)
+        renames = members[:int(len(members) * RENAME_RATE)]
+        members = members[len(renames):]
+        converts = members[:int(len(members) * CONVERT_RATE)]
+        taken = set(i['uid'] for i in self.data.users)
+
+        for usr in renames:
+            newuid = usr['uid'][:rbconfig.MAXLEN_UNAME - 1] + 'x'
+            if newuid in taken:
+                continue
+            taken.add(newuid)
+            conn.rename_s(RBUserDB.uid2dn(usr['uid']), 'uid=' + newuid)
+            conn.modify_s(RBUserDB.uid2dn(newuid), [(
+                ldap.MOD_REPLACE, 'homeDirectory',
+                [rbconfig.gen_homedir(newuid, 'member').encode()])])
+            log.append('%s:%s:rename-existing:%s:%s' %
+                       (stamp, self.data.users[0]['uid'], usr['uid'], newuid))
+
+        for usr in converts:
+            conn.modify_s(RBUserDB.uid2dn(usr['uid']), [
+                (ldap.MOD_DELETE, 'objectClass', [b'member']),
+                (ldap.MOD_ADD, 'objectClass', [b'associat']),
+                (ldap.MOD_REPLACE, 'gidNumber',
+                 [str(dataset.GROUPS['associat']).encode()]),
+                (ldap.MOD_REPLACE, 'homeDirectory', [
+                    rbconfig.gen_homedir(usr['uid'], 'associat').encode()])])
+            log.append('%s:%s:convert:%s:associat' %
+                       (stamp, self.data.users[0]['uid'], usr['uid']))
+
+        for usr in self.data.users:
+            if (not usr['newbie'] and usr['yearsPaid'] and
+                    usr['yearsPaid'] > 0 and rand.random() < RENEW_RATE):
+                log.append('%s:%s:renew:%s:%s:%d' %
+                           (stamp, self.data.users[0]['uid'], usr['uid'],
+                            usr['usertype'], rand.random() < 0.3))
+
+        with open(self.path('rrs.log'), 'w') as fd:
+            fd.write(''.join(line + '\n' for line in log))
+
+    def sync(self, commands):
+        """Run useradm sync, measuring each stage."""
+
+        stages = []
+        for stage, func in cli.SYNC_STAGES:
+            def timed(*args, stage=stage, func=func):
+                if 'sync_' + stage in commands:
+                    self.measure('sync_' + stage, func, *args)
+                else:
+                    func(*args)
+            stages.append((stage, timed))
+        self.patch(cli, 'SYNC_STAGES', tuple(stages))
+        self.opt(self.path('rrs.log'), self.path('presync'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli.sync()
+
+    def run(self, commands=COMMANDS):
+        """Run given commands (in COMMANDS order). Returns list of result
+        dictionaries."""
+
+        self.setup()
+        try:
+            for command in COMMANDS:
+                if command not in commands and not (
+                        command == 'pre_sync' and
+                        any(i.startswith('sync_') for i in commands)):
+                    continue
+                if command.startswith('sync_'):
+                    if command == 'sync_rename':
+                        self.rrs_changes()
+                        self.sync(commands)
+                elif command == 'check_userfree':
+                    self.measure(command, self.check_userfree)
+                elif command == 'card':
+                    self.measure(command, self.card)
+                elif command == 'checkdb_incremental':
+                    self.opt(incremental=1)
+                    self.measure(command, cli.checkdb)
+                elif command == 'pre_sync':
+                    # get_pre_sync() wants an existing file.
+                    #
+                    open(self.path('presync'), 'w').close()
+                    self.opt(self.path('presync'))
+                    self.measure(command, cli.pre_sync)
+                else:
+                    self.opt()
+                    self.measure(command, getattr(cli, command))
+        finally:
+            self.restore()
+        return self.results
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def run(sizes=SIZES, seed=0, commands=COMMANDS):
+    """Run benchmarks at each given size. Returns results dictionary."""
+
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results += Benchmark(size, seed, tmpdir).run(commands)
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=fakeldap.ROOT).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        'meta': {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'revision': revision,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'sizes': list(sizes),
+        },
+        'results': results,
+    }
+
+
+def report(results, fd=sys.stdout):
+    """Print table of given results."""
+
+    print('%-20s %7s %9s %7s %6s' % ('command', 'size', 'wall', 'ldap',
+                                     'forks'), file=fd)
+    for res in results['results']:
+        print('%-20s %7d %9.3f %7d %6d%s' %
+              (res['command'], res['size'], res['wall'], res['ldap_total'],
+               res['forks'], res['error'] and '  ' + res['error'] or ''),
+              file=fd)
+
+
+def compare(old, new, fd=sys.stdout):
+    """Print table comparing two results dictionaries."""
+
+    old_res = dict(((i['command'], i['size']), i) for i in old['results'])
+    print('%-20s %7s %9s %9s %7s %7s %7s %6s %6s' %
+          ('command', 'size', 'old wall', 'new wall', 'ratio', 'old ldap',
+           'new ldap', 'old fk', 'new fk'), file=fd)
+    for res in new['results']:
+        prev = old_res.get((res['command'], res['size']))
+        if prev is None:
+            continue
+        print('%-20s %7d %9.3f %9.3f %7.2f %7d %7d %6d %6d' %
+              (res['command'], res['size'], prev['wall'], res['wall'],
+               res['wall'] / prev['wall'] if prev['wall'] else 0,
+               prev['ldap_total'], res['ldap_total'], prev['forks'],
+               res['forks']), file=fd)
+
+
+def main():
+    """Program entry function."""
+
+    usage = __doc__.split('\n\n')[1]
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'c:Chn:o:s:')
+    except getopt.GetoptError as err:
+        print(err, file=sys.stderr)
+        print(usage, file=sys.stderr)
+        sys.exit(1)
+
+    sizes, seed, commands, output, comparing = SIZES, 0, COMMANDS, None, 0
+    for o, a in opts:
+        if o == '-h':
+            print(usage, file=sys.stderr)
+            sys.exit(0)
+        elif o == '-n':
+            sizes = [int(i) for i in a.split(',')]
+        elif o == '-s':
+            seed = int(a)
+        elif o == '-c':
+            commands = a.split(',')
+            for i in commands:
+                if i not in COMMANDS:
+                    print('Unknown command: %s' % i, file=sys.stderr)
+                    sys.exit(1)
+        elif o == '-o':
+            output = a
+        elif o == '-C':
+            comparing = 1
+
+    if comparing:
+        if len(args) != 2:
+            print(usage, file=sys.stderr)
+            sys.exit(1)
+        with open(args[0]) as old, open(args[1]) as new:
+            compare(json.load(old), json.load(new))
+        return
+
+    results = run(sizes, seed, commands)
+    report(results)
+    if output:
+        with open(output, 'w') as fd:
+            json.dump(results, fd, indent=1)
+
+
+if __name__ == '__main__':
+    main()
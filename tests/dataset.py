@@ -0,0 +1,377 @@
+"""RedBrick Test Module; synthetic membership dataset generator.
+
+Generates a RedBrick LDAP tree (accounts of every usertype, posixGroups,
+reserved names and the uidNumber counter) and the matching DCU AD
+entries (students, staff and alumni with the ids the accounts refer to
+plus DCU people without accounts), following userdb.schema and the
+dcuAccount object class. The same size, mix, distribution and seed always
+give the same data.
+
+    python -m tests.dataset [-n size] [-s seed] [-m usertype=weight,...]
+                            [-y yearsPaid=weight,...] [-k root] directory
+
+writes rb.ldif and dcu.ldif to directory and with -k creates home and
+webtree directories and signaway state files below root (with the
+homeDirectory attributes pointing there)."""
+
+import getopt
+import os
+import random
+import sys
+import time
+
+from useradm import rbconfig, rbldif
+
+# Relative weights of usertypes.
+#
+USERTYPE_MIX = {'member': 700, 'associat': 80, 'staff': 30, 'committe': 12,
+                'society': 60, 'club': 40, 'projects': 20, 'guest': 20,
+                'redbrick': 10, 'intersoc': 5, 'dcu': 5, 'founders': 3}
+
+# Relative weights of yearsPaid for paying usertypes.
+#
+YEARS_PAID = {-1: 150, 0: 250, 1: 450, 2: 100, 3: 30, 4: 20}
+
+# gidNumber of each usertype's group.
+#
+GROUPS = {'committe': 100, 'founders': 101, 'society': 102, 'member': 103,
+          'associat': 107, 'club': 108, 'staff': 109, 'guest': 1011,
+          'projects': 1014, 'intersoc': 1016, 'redbrick': 1017, 'dcu': 31382}
+
+# Fraction of paid members that are newbies and of all accounts that have
+# signed in.
+#
+NEWBIE_RATE = 0.25
+SIGNED_RATE = 0.6
+
+# modifyTimestamp of the first account, the rest follow a minute apart.
+#
+MODIFIED = 1598961600
+
+# DCU people without a RedBrick account per account with a DCU id.
+#
+DCU_EXTRA = 2
+
+FIRST_NAMES = ('Aoife', 'Cian', 'Ciara', 'Conor', 'Eoin', 'Niamh', 'Sean',
+               'Sinead', 'Orla', 'Darragh', 'Roisin', 'Padraig', 'Aisling',
+               'Oisin', 'Grainne', 'Liam', 'Emma', 'Jack', 'Sarah', 'Adam')
+SURNAMES = ('Murphy', 'Kelly', 'Byrne', 'Ryan', 'OBrien', 'Walsh', 'Smith',
+            'Doyle', 'McCarthy', 'Gallagher', 'Doherty', 'Kennedy', 'Lynch',
+            'Murray', 'Quinn', 'Moore', 'McLoughlin', 'Carroll', 'Connolly',
+            'Daly', 'Connell', 'Wilson', 'Dunne', 'Brennan', 'Burke')
+COURSES = ('CASE', 'CA', 'EC', 'ECSA', 'BS', 'AC', 'COMS', 'JRN', 'MECH',
+           'BIOT', 'PS', 'GE')
+DEPARTMENTS = ('Computing', 'Electronic Engineering', 'Business School',
+               'Library', 'ISS', 'Mathematics', 'Physics')
+LONELY = ('/usr/local/shells/zsh', '/bin/bash')
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class Dataset:
+    """A generated set of users. users is a list of dictionaries of
+    RBUser attribute names (plus 'signed') in uidNumber order."""
+
+    def __init__(self, size, seed=0, mix=None, years=None,
+                 newbies=NEWBIE_RATE, signed=SIGNED_RATE, uidnumber=10000,
+                 root=''):
+        """Generate size users with given usertype and yearsPaid weights
+        (defaults USERTYPE_MIX and YEARS_PAID), newbie and signed-in
+        rates, starting at given uidNumber. Home directories are below
+        given root directory (see skeleton)."""
+
+        self.seed = seed
+        self.root = root
+        self.rand = random.Random(seed)
+        mix = sorted((mix or USERTYPE_MIX).items())
+        years = sorted((years or YEARS_PAID).items())
+        usertypes = self.rand.choices([i[0] for i in mix],
+                                      [i[1] for i in mix], k=size)
+        self.uids = set(rbconfig.USERTYPES)
+        self.ids = set()
+        self.suffixes = {}
+        self.users = []
+        for n, usertype in enumerate(usertypes):
+            first = self.rand.choice(FIRST_NAMES)
+            last = self.rand.choice(SURNAMES)
+            usr = {
+                'uid': self.new_uid(last, first),
+                'usertype': usertype,
+                'objectClass': [usertype] + rbconfig.LDAP_DEFAULT_OBJECTCLASS,
+                'cn': '%s %s' % (first, last),
+                'uidNumber': uidnumber + n,
+                'gidNumber': GROUPS[usertype],
+                'loginShell': self.rand.choice(LONELY),
+                'newbie': False,
+                'yearsPaid': None,
+                'id': None,
+                'course': None,
+                'year': None,
+                'signed': self.rand.random() < signed,
+            }
+            usr['homeDirectory'] = root + rbconfig.gen_homedir(usr['uid'],
+                                                               usertype)
+            usr['altmail'] = '%s@redbrick.dcu.ie' % usr['uid']
+            if usertype in rbconfig.USERTYPES_PAYING:
+                usr['yearsPaid'] = self.rand.choices(
+                    [i[0] for i in years], [i[1] for i in years])[0]
+                usr['newbie'] = (usr['yearsPaid'] > 0 and
+                                 self.rand.random() < newbies)
+            if usertype in rbconfig.USERTYPES_DCU:
+                usr['id'] = self.new_id()
+                usr['altmail'] = '%s.%s%d@mail.dcu.ie' % (
+                    first.lower(), last.lower(), n)
+            if usertype in ('member', 'committe'):
+                usr['course'] = self.rand.choice(COURSES)
+                usr['year'] = str(self.rand.randint(1, 4))
+            self.users.append(usr)
+        self.people = self.dcu_people()
+
+    def new_uid(self, last, first):
+        """Return an unused username of at most rbconfig.MAXLEN_UNAME
+        characters in the DCU style (surname, initial, number)."""
+
+        base = (last[:rbconfig.MAXLEN_UNAME - 2] + first[0]).lower()
+        uid = base
+        while uid in self.uids:
+            n = self.suffixes[base] = self.suffixes.get(base, 1) + 1
+            uid = base[:rbconfig.MAXLEN_UNAME - len(str(n))] + str(n)
+        self.uids.add(uid)
+        return uid
+
+    def new_id(self):
+        """Return an unused 8 digit DCU id number."""
+
+        while True:
+            num = self.rand.randint(10000000, 99999999)
+            if num not in self.ids:
+                self.ids.add(num)
+                return num
+
+    # ------------------------------------------------------------------ #
+    # REDBRICK TREE                                                      #
+    # ------------------------------------------------------------------ #
+
+    def rb_entries(self):
+        """Return iterator of RBLDIFEntry objects for the RedBrick tree,
+        parents first."""
+
+        yield rbldif.RBLDIFEntry(rbconfig.LDAP_TREE, (
+            ('objectClass', 'top'), ('objectClass', 'organization'),
+            ('o', 'redbrick')))
+        for tree in (rbconfig.LDAP_ACCOUNTS_TREE, rbconfig.LDAP_GROUP_TREE,
+                     rbconfig.LDAP_RESERVED_TREE):
+            yield rbldif.RBLDIFEntry(tree, (
+                ('objectClass', 'top'), ('objectClass', 'organizationalUnit'),
+                ('ou', tree.split(',')[0].split('=')[1])))
+        yield rbldif.RBLDIFEntry(rbconfig.LDAP_UIDNUMBER_DN, (
+            ('objectClass', 'top'), ('objectClass', 'uidNumberCounter'),
+            ('cn', 'uidNumber'),
+            ('uidNumber', str(self.users[-1]['uidNumber'] + 1
+                              if self.users else 10000))))
+
+        members = {}
+        for usr in self.users:
+            members.setdefault(usr['usertype'], []).append(usr['uid'])
+        for group, gid in sorted(GROUPS.items()):
+            yield rbldif.RBLDIFEntry(
+                'cn=%s,%s' % (group, rbconfig.LDAP_GROUP_TREE),
+                [('objectClass', 'top'), ('objectClass', 'posixGroup'),
+                 ('cn', group), ('gidNumber', str(gid))] +
+                [('memberUid', i) for i in members.get(group, ())])
+
+        for usr in self.users:
+            yield self.account(usr)
+
+        rand = random.Random(self.seed + 1)
+        for n in range(max(len(self.users) // 100, 1)):
+            uid = 'rsvd%d' % n
+            yield rbldif.RBLDIFEntry(
+                'uid=%s,%s' % (uid, rbconfig.LDAP_RESERVED_TREE),
+                [('objectClass', 'reserved'), ('uid', uid),
+                 ('description', 'Reserved name %d' % n)] +
+                ([('flag', 'static')] if rand.random() < 0.5 else []))
+
+    def account(self, usr):
+        """Return RBLDIFEntry for given user."""
+
+        attrs = [('objectClass', i) for i in usr['objectClass']]
+        attrs += [
+            ('uid', usr['uid']), ('cn', usr['cn']),
+            ('altmail', usr['altmail']),
+            ('newbie', usr['newbie'] and 'TRUE' or 'FALSE'),
+            ('created', '2010-09-01 12:00:00'), ('createdby', 'rrs'),
+            ('updated', '2020-09-01 12:00:00'), ('updatedby', 'rrs'),
+            ('uidNumber', str(usr['uidNumber'])),
+            ('gidNumber', str(usr['gidNumber'])),
+            ('gecos', usr['cn']), ('loginShell', usr['loginShell']),
+            ('homeDirectory', usr['homeDirectory']),
+            ('userPassword', '{CRYPT}*'),
+            ('createTimestamp', '20100901120000Z'),
+            ('modifyTimestamp', time.strftime('%Y%m%d%H%M%SZ', time.gmtime(
+                MODIFIED + 60 * (usr['uidNumber'] % 100000)))),
+        ]
+        attrs += [('host', i) for i in rbconfig.LDAP_DEFAULT_HOSTS]
+        for attr in 'id', 'course', 'year', 'yearsPaid':
+            if usr[attr] is not None:
+                attrs.append((attr, str(usr[attr])))
+        return rbldif.RBLDIFEntry(
+            'uid=%s,%s' % (usr['uid'], rbconfig.LDAP_ACCOUNTS_TREE), attrs)
+
+    # ------------------------------------------------------------------ #
+    # DCU TREE                                                           #
+    # ------------------------------------------------------------------ #
+
+    def dcu_people(self):
+        """Return list of (kind, uid, id, first name, surname, course,
+        year) for DCU AD: each account with a DCU id (members and committee
+        as students, staff as staff, associates as alumni) and DCU_EXTRA
+        students without an account for each of those."""
+
+        rand = random.Random(self.seed + 2)
+        people = []
+        for usr in self.users:
+            if usr['id'] is None:
+                continue
+            first, last = usr['cn'].split(' ', 1)
+            kind = {'staff': 'staff', 'associat': 'alumni'}.get(
+                usr['usertype'], 'student')
+            people.append((kind, usr['uid'], usr['id'], first, last,
+                           usr['course'] or rand.choice(COURSES),
+                           usr['year'] or str(rand.randint(1, 4))))
+        for _ in range(DCU_EXTRA * len(people)):
+            first = rand.choice(FIRST_NAMES)
+            last = rand.choice(SURNAMES)
+            people.append(('student', self.new_uid(last, first),
+                           self.new_id(), first, last, rand.choice(COURSES),
+                           str(rand.randint(1, 4))))
+        return people
+
+    def dcu_entries(self):
+        """Return iterator of RBLDIFEntry objects for DCU AD."""
+
+        rand = random.Random(self.seed + 3)
+        for kind, uid, num, first, last, course, year in self.people:
+            mail = '%s.%s%d@mail.dcu.ie' % (first.lower(), last.lower(),
+                                            num % 1000)
+            attrs = [('objectClass', 'top'), ('objectClass', 'dcuAccount'),
+                     ('givenName', first), ('sn', last), ('mail', mail),
+                     ('uid', uid), ('employeeNumber', str(num))]
+            if kind == 'student':
+                tree = rbconfig.LDAP_DCU_STUDENTS_TREE
+                cn = uid
+                attrs += [('l', course + year),
+                          ('gecos', '%s %s, %d' % (first, last, num))]
+            elif kind == 'staff':
+                tree = rbconfig.LDAP_DCU_STAFF_TREE
+                cn = uid
+                attrs += [('l', rand.choice(DEPARTMENTS)),
+                          ('gecos', '%s %s,%d' % (first, last, num))]
+            else:
+                tree = rbconfig.LDAP_DCU_ALUMNI_TREE
+                cn = str(num)
+                attrs += [('l', '%s%d' % (course, rand.randint(2000, 2020)))]
+            yield rbldif.RBLDIFEntry('CN=%s,%s' % (cn, tree),
+                                     [('cn', cn)] + attrs)
+
+    # ------------------------------------------------------------------ #
+    # OUTPUT                                                             #
+    # ------------------------------------------------------------------ #
+
+    def write(self, directory):
+        """Write rb.ldif and dcu.ldif to given directory. Returns their
+        paths."""
+
+        paths = []
+        for name, entries in (('rb.ldif', self.rb_entries()),
+                              ('dcu.ldif', self.dcu_entries())):
+            path = os.path.join(directory, name)
+            with open(path, 'wb') as fd:
+                rbldif.write(fd, entries)
+            paths.append(path)
+        return paths
+
+    def skeleton(self, newbies=True):
+        """Create home and webtree directories and signaway state files
+        for all users (or only those that aren't newbies, leaving them for
+        useradm sync to create) below the root directory, e.g.
+        /home/member/a/abc becomes root/home/member/a/abc. Ownership is
+        left as the current user unless running as root. Returns
+        dictionary of the rbconfig directory settings to use with it."""
+
+        dirs = {
+            'DIR_HOME': self.root + rbconfig.DIR_HOME,
+            'DIR_WEBTREE': self.root + rbconfig.DIR_WEBTREE,
+            'DIR_SIGNAWAY_STATE': self.root + rbconfig.DIR_SIGNAWAY_STATE,
+        }
+        os.makedirs(dirs['DIR_SIGNAWAY_STATE'], exist_ok=True)
+        for usr in self.users:
+            if usr['newbie'] and not newbies:
+                continue
+            for path in (usr['homeDirectory'],
+                         self.root + rbconfig.gen_webtree(usr['uid'])):
+                os.makedirs(path, 0o711, exist_ok=True)
+                if os.getuid() == 0:
+                    os.chown(path, usr['uidNumber'], usr['gidNumber'])
+            if usr['signed']:
+                open(os.path.join(dirs['DIR_SIGNAWAY_STATE'], usr['uid']),
+                     'w').close()
+        return dirs
+
+
+# --------------------------------------------------------------------------- #
+# MAIN                                                                        #
+# --------------------------------------------------------------------------- #
+
+
+def parse_weights(text, key=str):
+    """Return dictionary of key -> weight from 'key=weight,...'."""
+
+    res = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        res[key(name)] = float(weight)
+    return res
+
+
+def main():
+    """Program entry function."""
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hk:m:n:s:y:')
+    except getopt.GetoptError as err:
+        print(err, file=sys.stderr)
+        print(__doc__.split('\n\n')[1], file=sys.stderr)
+        sys.exit(1)
+
+    size, seed, mix, years, root = 1000, 0, None, None, None
+    for o, a in opts:
+        if o == '-h':
+            print(__doc__.split('\n\n')[1], file=sys.stderr)
+            sys.exit(0)
+        elif o == '-n':
+            size = int(a)
+        elif o == '-s':
+            seed = int(a)
+        elif o == '-m':
+            mix = parse_weights(a)
+        elif o == '-y':
+            years = parse_weights(a, int)
+        elif o == '-k':
+            root = a
+    if len(args) != 1:
+        print(__doc__.split('\n\n')[1], file=sys.stderr)
+        sys.exit(1)
+
+    data = Dataset(size, seed, mix, years, root=root or '')
+    for path in data.write(args[0]):
+        print(path)
+    if root:
+        for name, path in sorted(data.skeleton().items()):
+            print('%s = %s' % (name, path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""RedBrick Test Module; in-process stand-in for python-ldap LDAPObject.
+
+FakeLDAPObject implements the parts of LDAPObject that RBUserDB uses
+(simple_bind_s, whoami_s, search_s, search/result, search_ext/result3
+with the simple paged results control, add_s, modify_s, modify/delete
+(asynchronous, for result), delete_s, rename_s, unbind/unbind_s) over an ldapdirectory.Directory.
+Errors are the python-ldap exceptions slapd would give, so RBUserDB error
+handling runs unchanged. Needs python-ldap itself for those exceptions and
+constants.
+
+    rb, dcu = fakeldap.redbrick()
+    udb = RBUserDB()
+    udb.ldap, udb.ldap_dcu = rb, dcu
+"""
+
+import itertools
+import os
+
+import ldap
+
+from tests import ldapdirectory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_SCHEMA = os.path.join(ROOT, 'rbschema')
+DIR_LDIF = os.path.join(ROOT, 'ldif')
+
+
+class FakeLDAPObject:
+    """python-ldap LDAPObject over an in-memory directory."""
+
+    def __init__(self, directory=None, credentials=None):
+        """Create new FakeLDAPObject for given Directory (empty with the
+        rbschema/ schema if None). credentials is a dictionary of bind DN
+        -> password, if None any bind succeeds."""
+
+        self.directory = directory or ldapdirectory.Directory(schema())
+        self.credentials = credentials
+        self.who = ''
+        self.msgids = itertools.count(1)
+        self.pending = {}
+        self.paged = {}
+        self.bound = True
+
+    def call(self, func, *args, **kwargs):
+        """Call Directory method, raising python-ldap exceptions."""
+
+        if not self.bound:
+            raise ldap.LDAPError({'desc': 'Connection unbound'})
+        try:
+            return func(*args, **kwargs)
+        except ldapdirectory.DirectoryError as err:
+            raise getattr(ldap, err.result)({'desc': err.result.replace(
+                '_', ' ').capitalize(), 'info': err.info})
+
+    def set_option(self, option, invalue):
+        """Options are accepted and ignored."""
+
+    def simple_bind_s(self, who='', cred='', serverctrls=None,
+                      clientctrls=None):
+        """Bind as given DN."""
+
+        if who and self.credentials is not None and \
+                self.credentials.get(who) != cred:
+            raise ldap.INVALID_CREDENTIALS({'desc': 'Invalid credentials'})
+        self.who = who
+        self.bound = True
+
+    def whoami_s(self):
+        """Return authorization identity of the bound DN."""
+
+        if not self.bound:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        return self.who and 'dn:' + self.who or ''
+
+    def unbind_s(self):
+        """Close the connection."""
+
+        self.bound = False
+        self.pending.clear()
+        self.paged.clear()
+
+    unbind = unbind_s
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)',
+                 attrlist=None, attrsonly=0):
+        """Search and return list of (dn, attributes)."""
+
+        return self.call(self.directory.search, base, scope, filterstr,
+                         attrlist, attrsonly)
+
+    def search(self, base, scope, filterstr='(objectClass=*)', attrlist=None,
+               attrsonly=0):
+        """Start a search and return its message id for result()."""
+
+        msgid = next(self.msgids)
+        self.pending[msgid] = self.search_s(base, scope, filterstr, attrlist,
+                                            attrsonly)
+        return msgid
+
+    def result(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        """Return (result type, list of (dn, attributes)) for a search
+        started with search(). With all false entries are returned one at
+        a time, then an empty search result. For modify() and delete()
+        the list is empty, or their error is raised."""
+
+        if msgid == ldap.RES_ANY:
+            if not self.pending:
+                raise ldap.NO_RESULTS_RETURNED({'desc': 'No results returned'})
+            msgid = min(self.pending)
+        if msgid not in self.pending:
+            raise ldap.NO_RESULTS_RETURNED({'desc': 'No results returned'})
+        if isinstance(self.pending[msgid], tuple):
+            restype, err = self.pending.pop(msgid)
+            if err is not None:
+                raise err
+            return restype, []
+        if all or not self.pending[msgid]:
+            return ldap.RES_SEARCH_RESULT, self.pending.pop(msgid)
+        return ldap.RES_SEARCH_ENTRY, [self.pending[msgid].pop(0)]
+
+    def search_ext(self, base, scope, filterstr='(objectClass=*)',
+                   attrlist=None, attrsonly=0, serverctrls=None):
+        """Start a search and return its message id for result3(). A
+        simple paged results control in serverctrls (any object with size
+        and cookie) gives one page, its cookie the offset of the next."""
+
+        res = self.search_s(base, scope, filterstr, attrlist, attrsonly)
+        ctrls = []
+        for ctrl in serverctrls or ():
+            if hasattr(ctrl, 'size') and hasattr(ctrl, 'cookie'):
+                offset = int(ctrl.cookie or 0)
+                more = offset + ctrl.size < len(res)
+                res = res[offset:offset + ctrl.size]
+                ctrls.append(type(ctrl)(
+                    False, size=0,
+                    cookie=str(offset + ctrl.size).encode() if more else b''))
+        msgid = next(self.msgids)
+        self.paged[msgid] = (res, ctrls)
+        return msgid
+
+    def result3(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        """Return (result type, list of (dn, attributes), message id,
+        response controls) for a search started with search_ext()."""
+
+        if msgid == ldap.RES_ANY and self.paged:
+            msgid = min(self.paged)
+        if msgid not in self.paged:
+            raise ldap.NO_RESULTS_RETURNED({'desc': 'No results returned'})
+        res, ctrls = self.paged.pop(msgid)
+        return ldap.RES_SEARCH_RESULT, res, msgid, ctrls
+
+    def abandon(self, msgid):
+        """Forget a search started with search() or search_ext()."""
+
+        self.pending.pop(msgid, None)
+        self.paged.pop(msgid, None)
+
+    def add_s(self, dn, modlist):
+        """Add entry."""
+
+        self.call(self.directory.add, dn, modlist, self.who)
+
+    def modify_s(self, dn, modlist):
+        """Modify entry."""
+
+        self.call(self.directory.modify, dn, modlist, self.who)
+
+    def delete_s(self, dn):
+        """Delete entry."""
+
+        self.call(self.directory.delete, dn)
+
+    def modify(self, dn, modlist):
+        """Modify entry and return message id for result()."""
+
+        return self.request(ldap.RES_MODIFY, self.modify_s, dn, modlist)
+
+    def delete(self, dn):
+        """Delete entry and return message id for result()."""
+
+        return self.request(ldap.RES_DELETE, self.delete_s, dn)
+
+    def request(self, restype, func, *args):
+        """Call func now, keeping its result (or error) for result()."""
+
+        msgid = next(self.msgids)
+        try:
+            func(*args)
+        except ldap.LDAPError as err:
+            self.pending[msgid] = (restype, err)
+        else:
+            self.pending[msgid] = (restype, None)
+        return msgid
+
+    def rename_s(self, dn, newrdn, newsuperior=None, delold=1,
+                 serverctrls=None, clientctrls=None):
+        """Rename entry."""
+
+        self.call(self.directory.rename, dn, newrdn, newsuperior, delold,
+                  self.who)
+
+
+def schema():
+    """Return Schema loaded from rbschema/."""
+
+    res = ldapdirectory.Schema()
+    res.load_dir(DIR_SCHEMA)
+    return res
+
+
+def load(filenames, check=True):
+    """Return FakeLDAPObject holding entries from given LDIF files."""
+
+    conn = FakeLDAPObject()
+    for filename in filenames:
+        with open(filename, 'rb') as fd:
+            conn.directory.load_ldif(fd, check)
+    return conn
+
+
+def redbrick():
+    """Return (RedBrick LDAP, DCU AD) FakeLDAPObjects loaded from the
+    sample entries in ldif/."""
+
+    return (load([os.path.join(DIR_LDIF, 'rb_account.ldif')]),
+            load([os.path.join(DIR_LDIF, i)
+                  for i in ('dcu_student.ldif', 'dcu_grad.ldif')]))
@@ -0,0 +1,1019 @@
+"""RedBrick Test Module; in-memory LDAP directory model used by fakeldap.
+
+Holds entries with equality, presence and ordering indexes on every
+attribute, evaluates RFC 4515 search filters against them and applies
+add, modify, delete and rename with the checks slapd does that the useradm
+code relies on (existing entries and values, parent entries, RDN values,
+MUST attributes of known object classes). Matching rules and attribute
+names come from the OpenLDAP schema files in rbschema/ plus the built in
+attribute types those files leave commented out.
+
+Nothing here imports python-ldap. Errors are DirectoryError with the name
+of the python-ldap exception that slapd's result code maps to."""
+
+import bisect
+import os
+import re
+import time
+
+from useradm import rbldif
+
+# python-ldap modify operation codes (ldap.MOD_ADD etc.).
+#
+MOD_ADD, MOD_DELETE, MOD_REPLACE = 0, 1, 2
+
+# python-ldap search scopes (ldap.SCOPE_BASE etc.).
+#
+SCOPE_BASE, SCOPE_ONELEVEL, SCOPE_SUBTREE = 0, 1, 2
+
+# Attribute types built into slapd or defined in schema files not in
+# rbschema/ (nis.schema).
+#
+BUILTIN_SCHEMA = '''
+attributetype ( 2.5.4.0 NAME 'objectClass' EQUALITY objectIdentifierMatch )
+attributetype ( 2.5.4.41 NAME 'name' EQUALITY caseIgnoreMatch
+    SUBSTR caseIgnoreSubstringsMatch )
+attributetype ( 2.5.4.3 NAME ( 'cn' 'commonName' ) SUP name )
+attributetype ( 0.9.2342.19200300.100.1.1 NAME ( 'uid' 'userid' )
+    EQUALITY caseIgnoreMatch SUBSTR caseIgnoreSubstringsMatch )
+attributetype ( 2.5.4.35 NAME 'userPassword' EQUALITY octetStringMatch )
+attributetype ( 1.3.6.1.1.1.1.0 NAME 'uidNumber' EQUALITY integerMatch
+    ORDERING integerOrderingMatch )
+attributetype ( 1.3.6.1.1.1.1.1 NAME 'gidNumber' EQUALITY integerMatch
+    ORDERING integerOrderingMatch )
+attributetype ( 2.5.18.1 NAME 'createTimestamp'
+    EQUALITY generalizedTimeMatch ORDERING generalizedTimeOrderingMatch
+    NO-USER-MODIFICATION USAGE directoryOperation )
+attributetype ( 2.5.18.2 NAME 'modifyTimestamp'
+    EQUALITY generalizedTimeMatch ORDERING generalizedTimeOrderingMatch
+    NO-USER-MODIFICATION USAGE directoryOperation )
+attributetype ( 2.5.18.3 NAME 'creatorsName'
+    EQUALITY distinguishedNameMatch NO-USER-MODIFICATION
+    USAGE directoryOperation )
+attributetype ( 2.5.18.4 NAME 'modifiersName'
+    EQUALITY distinguishedNameMatch NO-USER-MODIFICATION
+    USAGE directoryOperation )
+attributetype ( 1.3.6.1.1.16.4 NAME 'entryUUID' EQUALITY UUIDMatch
+    NO-USER-MODIFICATION USAGE directoryOperation )
+attributetype ( 1.3.6.1.4.1.4203.666.1.7 NAME 'entryCSN'
+    EQUALITY CSNMatch NO-USER-MODIFICATION USAGE directoryOperation )
+attributetype ( 2.5.21.9 NAME 'structuralObjectClass'
+    EQUALITY objectIdentifierMatch NO-USER-MODIFICATION
+    USAGE directoryOperation )
+objectclass ( 1.3.6.1.4.1.1466.101.120.111 NAME 'extensibleObject'
+    SUP top AUXILIARY )
+'''
+
+# Schema definition keywords followed by a value or list of values, the
+# rest are flags.
+#
+SCHEMA_VALUE_KEYWORDS = ('NAME', 'DESC', 'SUP', 'EQUALITY', 'ORDERING',
+                         'SUBSTR', 'SYNTAX', 'USAGE', 'MUST', 'MAY')
+
+RE_SCHEMA_TOKEN = re.compile(r"\(|\)|'[^']*'|[^\s()']+")
+RE_ATTR_DESC = re.compile(r'^([A-Za-z][A-Za-z0-9-]*|[0-9]+(\.[0-9]+)*)'
+                          r'(;[A-Za-z0-9-]+)*$')
+RE_DN_SPLIT = re.compile(r'(?<!\\),')
+
+# --------------------------------------------------------------------------- #
+# ERRORS                                                                      #
+# --------------------------------------------------------------------------- #
+
+
+class DirectoryError(Exception):
+    """Operation failed. result is the python-ldap exception name."""
+
+    def __init__(self, result, info=''):
+        Exception.__init__(self, result, info)
+        self.result = result
+        self.info = info
+
+
+# --------------------------------------------------------------------------- #
+# MATCHING RULES                                                              #
+# --------------------------------------------------------------------------- #
+
+
+def decode(value):
+    """Return bytes value as str."""
+    return value.decode('utf-8', 'surrogateescape')
+
+
+def norm_case_ignore(value):
+    """caseIgnore*Match: case folded, insignificant spaces removed"""
+    return ' '.join(decode(value).lower().split())
+
+
+def norm_case_exact(value):
+    """caseExact*Match: insignificant spaces removed"""
+    return ' '.join(decode(value).split())
+
+
+def norm_integer(value):
+    """integerMatch, None if not an integer"""
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def norm_boolean(value):
+    """booleanMatch, None if not TRUE or FALSE"""
+    value = decode(value).upper()
+    return value if value in ('TRUE', 'FALSE') else None
+
+
+def norm_dn_value(value):
+    """distinguishedNameMatch"""
+    return normalise_dn(decode(value))
+
+
+def norm_octet(value):
+    """octetStringMatch"""
+    return bytes(value)
+
+
+# Matching rules by substring of their (lower case) name, first match wins.
+# Anything else is compared case insensitively.
+#
+MATCHING_RULES = (('caseexact', norm_case_exact),
+                  ('integer', norm_integer),
+                  ('boolean', norm_boolean),
+                  ('distinguishedname', norm_dn_value),
+                  ('uniquemember', norm_dn_value),
+                  ('octetstring', norm_octet),
+                  ('generalizedtime', norm_case_exact),
+                  ('csn', norm_case_exact))
+
+
+def matching_rule(name):
+    """Return normalising function for given matching rule name."""
+
+    name = name.lower()
+    for key, func in MATCHING_RULES:
+        if key in name:
+            return func
+    return norm_case_ignore
+
+
+# --------------------------------------------------------------------------- #
+# SCHEMA                                                                      #
+# --------------------------------------------------------------------------- #
+
+
+class AttributeType:
+    """An attribute type definition."""
+
+    def __init__(self, names, oid=None, sup=None, equality=None,
+                 ordering=None, substr=None, operational=False,
+                 no_user_mod=False):
+        self.names = tuple(names)
+        self.name = self.names[0]
+        self.key = self.name.lower()
+        self.oid = oid
+        self.sup = sup
+        self.rules = {'EQUALITY': equality, 'ORDERING': ordering,
+                      'SUBSTR': substr}
+        self.operational = operational
+        self.no_user_mod = no_user_mod
+        self.schema = None
+
+    def rule(self, kind):
+        """Return matching rule name of given kind, following SUP."""
+
+        seen = set()
+        attr = self
+        while attr is not None and attr.key not in seen:
+            if attr.rules[kind]:
+                return attr.rules[kind]
+            seen.add(attr.key)
+            attr = attr.sup and self.schema and self.schema.attrs.get(
+                attr.sup.lower())
+        return None
+
+    def equality(self):
+        """Return equality normalising function (default caseIgnore)."""
+
+        rule = self.rule('EQUALITY')
+        return matching_rule(rule) if rule else norm_case_ignore
+
+    def ordering(self):
+        """Return ordering normalising function or None if the attribute
+        has no ordering rule (so ordering matches are undefined)."""
+
+        rule = self.rule('ORDERING')
+        return matching_rule(rule) if rule else None
+
+    def substr(self):
+        """Return substring normalising function or None if substring
+        matches are undefined (non string equality)."""
+
+        rule = self.rule('SUBSTR')
+        if rule:
+            return matching_rule(rule)
+        func = self.equality()
+        return func if func in (norm_case_ignore, norm_case_exact) else None
+
+
+class ObjectClass:
+    """An object class definition."""
+
+    def __init__(self, names, sup=(), must=()):
+        self.names = tuple(names)
+        self.key = self.names[0].lower()
+        self.sup = tuple(sup)
+        self.must = tuple(must)
+
+
+class Schema:
+    """Attribute types and object classes from OpenLDAP schema files."""
+
+    def __init__(self):
+        self.attrs = {}
+        self.classes = {}
+        self.unknown = {}
+        self.parse(BUILTIN_SCHEMA)
+
+    def load_dir(self, directory):
+        """Load all .schema files in given directory."""
+
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.schema'):
+                with open(os.path.join(directory, name)) as fd:
+                    self.parse(fd.read())
+
+    def parse(self, text):
+        """Load definitions from given schema file text."""
+
+        lines = []
+        for line in text.splitlines():
+            if line.startswith('#') or not line.strip():
+                continue
+            if line[0].isspace() and lines:
+                lines[-1] += ' ' + line.strip()
+            else:
+                lines.append(line.strip())
+
+        for line in lines:
+            keyword = line.split(None, 1)[0].lower()
+            if keyword in ('attributetype', 'objectclass'):
+                fields = parse_definition(line[len(keyword):])
+                if keyword == 'attributetype':
+                    self.add_attr(fields)
+                else:
+                    self.add_class(fields)
+
+    def add_attr(self, fields):
+        """Add attribute type from parsed definition fields."""
+
+        names = fields.get('NAME') or [fields['OID']]
+        attr = AttributeType(
+            names, fields['OID'], (fields.get('SUP') or [None])[0],
+            (fields.get('EQUALITY') or [None])[0],
+            (fields.get('ORDERING') or [None])[0],
+            (fields.get('SUBSTR') or [None])[0],
+            (fields.get('USAGE') or ['userApplications'])[0] !=
+            'userApplications', 'NO-USER-MODIFICATION' in fields)
+        attr.schema = self
+        for name in names + [fields['OID']]:
+            self.attrs[name.lower()] = attr
+
+    def add_class(self, fields):
+        """Add object class from parsed definition fields."""
+
+        names = fields.get('NAME') or [fields['OID']]
+        objectclass = ObjectClass(names, fields.get('SUP', ()),
+                                  fields.get('MUST', ()))
+        for name in names + [fields['OID']]:
+            self.classes[name.lower()] = objectclass
+
+    def attr(self, name):
+        """Return AttributeType for given attribute description (options
+        are ignored). Unknown attributes get a caseIgnore type."""
+
+        name = name.split(';', 1)[0]
+        lname = name.lower()
+        attr = self.attrs.get(lname) or self.unknown.get(lname)
+        if attr is None:
+            attr = self.unknown[lname] = AttributeType((name, ))
+        return attr
+
+    def must(self, objectclasses):
+        """Return set of attribute keys required by given object class
+        names. Unknown classes require nothing."""
+
+        must = set()
+        todo = [i.lower() for i in objectclasses]
+        seen = set()
+        while todo:
+            name = todo.pop()
+            if name in seen or name not in self.classes:
+                continue
+            seen.add(name)
+            objectclass = self.classes[name]
+            must.update(self.attr(i).key for i in objectclass.must)
+            todo.extend(i.lower() for i in objectclass.sup)
+        return must
+
+
+def parse_definition(text):
+    """Return dictionary of keyword -> list of values for given schema
+    definition text starting at its opening parenthesis. OID is the
+    numeric OID, flags map to empty lists."""
+
+    tokens = RE_SCHEMA_TOKEN.findall(text)
+    if not tokens or tokens[0] != '(':
+        raise ValueError('Schema definition does not start with (: %r' %
+                         text[:60])
+    fields = {'OID': tokens[1]}
+    pos = 2
+    while pos < len(tokens) and tokens[pos] != ')':
+        keyword = tokens[pos].upper()
+        pos += 1
+        if keyword not in SCHEMA_VALUE_KEYWORDS and \
+                not keyword.startswith('X-'):
+            fields[keyword] = []
+        elif tokens[pos] == '(':
+            end = tokens.index(')', pos)
+            fields[keyword] = [
+                i.strip("'") for i in tokens[pos + 1:end] if i != '$'
+            ]
+            pos = end + 1
+        else:
+            fields[keyword] = [tokens[pos].strip("'")]
+            pos += 1
+    return fields
+
+
+# --------------------------------------------------------------------------- #
+# DISTINGUISHED NAMES                                                         #
+# --------------------------------------------------------------------------- #
+
+
+def split_dn(dn):
+    """Return list of RDN strings of given DN."""
+
+    return [i.strip() for i in RE_DN_SPLIT.split(dn)] if dn.strip() else []
+
+
+def split_rdn(rdn):
+    """Return (attribute, value) of given RDN string."""
+
+    attr, _, value = rdn.partition('=')
+    return attr.strip(), re.sub(r'\\(.)', r'\1', value.strip())
+
+
+def normalise_dn(dn):
+    """Return DN in canonical form for use as a key."""
+
+    return ','.join('%s=%s' % (attr.lower(), ' '.join(value.lower().split()))
+                    for attr, value in map(split_rdn, split_dn(dn)))
+
+
+def parent_key(key):
+    """Return key of parent of given DN key ('' for top level)."""
+
+    rdns = split_dn(key)
+    return ','.join(rdns[1:])
+
+
+# --------------------------------------------------------------------------- #
+# FILTERS                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+def unescape(value):
+    """Return bytes of given RFC 4515 assertion value."""
+
+    out = bytearray()
+    raw = value.encode('utf-8', 'surrogateescape')
+    pos = 0
+    while pos < len(raw):
+        if raw[pos:pos + 1] == b'\\':
+            try:
+                out.append(int(raw[pos + 1:pos + 3], 16))
+            except ValueError:
+                raise ValueError('Bad escape in filter value %r' % value)
+            if len(raw[pos + 1:pos + 3]) != 2:
+                raise ValueError('Bad escape in filter value %r' % value)
+            pos += 3
+        else:
+            out.append(raw[pos])
+            pos += 1
+    return bytes(out)
+
+
+def parse_filter(text):
+    """Return parse tree of given RFC 4515 filter string. Nodes are tuples:
+    ('&', [nodes]), ('|', [nodes]), ('!', node), ('=*', attr),
+    (op, attr, value) for op in = >= <= ~= and ('sub', attr, initial,
+    [any], final) with bytes values (initial/final None if absent).
+    Filters without enclosing parentheses are accepted like OpenLDAP.
+    Raises ValueError for invalid filters."""
+
+    text = text.strip()
+    if not text.startswith('('):
+        text = '(' + text + ')'
+    node, pos = parse_node(text, 0)
+    if pos != len(text):
+        raise ValueError('Trailing characters in filter %r' % text)
+    return node
+
+
+def parse_node(text, pos):
+    """Return (node, position after it) for filter at given position."""
+
+    if text[pos:pos + 1] != '(':
+        raise ValueError('Expected ( at %d in filter %r' % (pos, text))
+    pos += 1
+    char = text[pos:pos + 1]
+    if char in ('&', '|'):
+        children = []
+        pos += 1
+        while text[pos:pos + 1] == '(':
+            child, pos = parse_node(text, pos)
+            children.append(child)
+        node = (char, children)
+    elif char == '!':
+        child, pos = parse_node(text, pos + 1)
+        node = ('!', child)
+    else:
+        end = text.find(')', pos)
+        if end < 0 or '(' in text[pos:end]:
+            raise ValueError('Unbalanced parentheses in filter %r' % text)
+        node = parse_item(text[pos:end])
+        pos = end
+    if text[pos:pos + 1] != ')':
+        raise ValueError('Expected ) at %d in filter %r' % (pos, text))
+    return node, pos + 1
+
+
+def parse_item(item):
+    """Return node for a simple filter item (the part between
+    parentheses)."""
+
+    eq = item.find('=')
+    if eq < 1:
+        raise ValueError('Invalid filter item %r' % item)
+    op = '='
+    attr = item[:eq]
+    if attr[-1] in '<>~:':
+        op = attr[-1] + '='
+        attr = attr[:-1]
+    if op == ':=':
+        raise ValueError('Extensible match filters are not supported: %r' %
+                         item)
+    if not RE_ATTR_DESC.match(attr):
+        raise ValueError('Invalid attribute description %r in filter' % attr)
+    value = item[eq + 1:]
+    if op != '=' or '*' not in value:
+        return (op, attr, unescape(value))
+    if value == '*':
+        return ('=*', attr)
+    parts = [unescape(i) for i in value.split('*')]
+    return ('sub', attr, parts[0] or None, [i for i in parts[1:-1] if i],
+            parts[-1] or None)
+
+
+# --------------------------------------------------------------------------- #
+# DIRECTORY                                                                   #
+# --------------------------------------------------------------------------- #
+
+
+def generalized_time():
+    """Return current UTC time as a GeneralizedTime string."""
+
+    return time.strftime('%Y%m%d%H%M%SZ', time.gmtime())
+
+
+def as_values(name, values):
+    """Return list of bytes values from a python-ldap modlist value (bytes,
+    list of bytes or None). Like python-ldap, str values are a TypeError."""
+
+    if values is None:
+        return []
+    if isinstance(values, bytes):
+        return [values]
+    values = list(values)
+    for value in values:
+        if not isinstance(value, bytes):
+            raise TypeError('expected a byte string in the list', name, value)
+    return values
+
+
+class Entry:
+    """A directory entry: DN and dictionary of attribute key -> [name as
+    given, [bytes values]]. Normalised values are cached per matching
+    rule so entries are replaced, not changed, once indexed."""
+
+    __slots__ = ('dn', 'attrs', 'cache')
+
+    def __init__(self, dn, attrs=None):
+        self.dn = dn
+        self.attrs = dict((k, [v[0], list(v[1])])
+                          for k, v in (attrs or {}).items())
+        self.cache = {}
+
+    def copy(self, dn=None):
+        """Return a copy of this entry, optionally with a new DN."""
+
+        return Entry(self.dn if dn is None else dn, self.attrs)
+
+    def values(self, key):
+        """Return list of values of given attribute key."""
+
+        rec = self.attrs.get(key)
+        return rec[1] if rec else []
+
+    def normalised(self, key, func):
+        """Return list of values of given attribute key normalised with
+        given function, skipping values it can't normalise."""
+
+        cache_key = (key, func)
+        if cache_key not in self.cache:
+            self.cache[cache_key] = [
+                i for i in map(func, self.values(key)) if i is not None
+            ]
+        return self.cache[cache_key]
+
+
+class Directory:
+    """In-memory directory of entries with indexes on every attribute."""
+
+    def __init__(self, schema=None, clock=generalized_time):
+        """Create empty directory using given Schema (built in attribute
+        types only if None). clock returns modifyTimestamp values."""
+
+        self.schema = schema or Schema()
+        self.clock = clock
+        self.entries = {}
+        self.seq = {}
+        self.children = {}
+        self.eq_index = {}
+        self.pres_index = {}
+        self.ord_index = {}
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ------------------------------------------------------------------ #
+    # INDEXES                                                            #
+    # ------------------------------------------------------------------ #
+
+    def insert(self, key, entry):
+        """Add entry to the directory and its indexes."""
+
+        self.entries[key] = entry
+        self.counter += 1
+        self.seq[key] = self.counter
+        self.children.setdefault(parent_key(key), set()).add(key)
+        for attr in entry.attrs:
+            atype = self.schema.attr(attr)
+            self.pres_index.setdefault(attr, set()).add(key)
+            index = self.eq_index.setdefault(attr, {})
+            for value in entry.normalised(attr, atype.equality()):
+                index.setdefault(value, set()).add(key)
+            self.ord_index.pop(attr, None)
+
+    def remove(self, key):
+        """Remove entry from the directory and its indexes. Returns it."""
+
+        entry = self.entries.pop(key)
+        del self.seq[key]
+        siblings = self.children[parent_key(key)]
+        siblings.discard(key)
+        if not siblings:
+            del self.children[parent_key(key)]
+        for attr in entry.attrs:
+            atype = self.schema.attr(attr)
+            self.pres_index[attr].discard(key)
+            index = self.eq_index[attr]
+            for value in entry.normalised(attr, atype.equality()):
+                keys = index.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[value]
+            self.ord_index.pop(attr, None)
+        return entry
+
+    def ordering(self, attr, func):
+        """Return (sorted values, keys) ordering index for given attribute
+        key, building it if it has changed since last used."""
+
+        if attr not in self.ord_index:
+            pairs = sorted((value, key)
+                           for key in self.pres_index.get(attr, ())
+                           for value in self.entries[key].normalised(
+                               attr, func))
+            self.ord_index[attr] = ([i[0] for i in pairs],
+                                    [i[1] for i in pairs])
+        return self.ord_index[attr]
+
+    def candidates(self, node):
+        """Return set of keys that may match given filter node using the
+        indexes, or None if the filter can't be answered from them."""
+
+        op = node[0]
+        if op == '&':
+            sets = [i for i in map(self.candidates, node[1]) if i is not None]
+            if not sets:
+                return None
+            sets.sort(key=len)
+            return set.intersection(*sets) if len(sets) > 1 else set(sets[0])
+        if op == '|':
+            sets = [self.candidates(i) for i in node[1]]
+            if any(i is None for i in sets):
+                return None
+            return set().union(*sets)
+        if op == '!' or op == 'sub':
+            return None
+
+        atype = self.schema.attr(node[1])
+        if op == '=*':
+            return self.pres_index.get(atype.key, set())
+        if op in ('=', '~='):
+            value = atype.equality()(node[2])
+            return self.eq_index.get(atype.key, {}).get(value, set())
+        func = atype.ordering()
+        value = func and func(node[2])
+        if value is None:
+            return set()
+        values, keys = self.ordering(atype.key, func)
+        if op == '>=':
+            return set(keys[bisect.bisect_left(values, value):])
+        return set(keys[:bisect.bisect_right(values, value)])
+
+    # ------------------------------------------------------------------ #
+    # FILTER EVALUATION                                                  #
+    # ------------------------------------------------------------------ #
+
+    def match(self, node, entry):
+        """Return True, False or None (undefined) for given filter node
+        against given entry."""
+
+        op = node[0]
+        if op == '&':
+            results = [self.match(i, entry) for i in node[1]]
+            if False in results:
+                return False
+            return None if None in results else True
+        if op == '|':
+            results = [self.match(i, entry) for i in node[1]]
+            if True in results:
+                return True
+            return None if None in results else False
+        if op == '!':
+            result = self.match(node[1], entry)
+            return None if result is None else not result
+
+        atype = self.schema.attr(node[1])
+        if op == '=*':
+            return atype.key in entry.attrs
+        if atype.key not in entry.attrs:
+            return False
+        if op == 'sub':
+            func = atype.substr()
+            if func is None:
+                return None
+            initial = node[2] and func(node[2])
+            middle = [func(i) for i in node[3]]
+            final = node[4] and func(node[4])
+            return any(substring_match(value, initial, middle, final)
+                       for value in entry.normalised(atype.key, func))
+        if op in ('=', '~='):
+            func = atype.equality()
+            value = func(node[2])
+            if value is None:
+                return None
+            return value in entry.normalised(atype.key, func)
+
+        func = atype.ordering()
+        value = func and func(node[2])
+        if value is None:
+            return None
+        values = entry.normalised(atype.key, func)
+        if op == '>=':
+            return any(i >= value for i in values)
+        return any(i <= value for i in values)
+
+    # ------------------------------------------------------------------ #
+    # OPERATIONS                                                         #
+    # ------------------------------------------------------------------ #
+
+    def get(self, dn):
+        """Return entry for given DN. Raises NO_SUCH_OBJECT."""
+
+        entry = self.entries.get(normalise_dn(dn))
+        if entry is None:
+            raise DirectoryError('NO_SUCH_OBJECT', dn)
+        return entry
+
+    def search(self, base, scope, filterstr='(objectClass=*)', attrlist=None,
+               attrsonly=False):
+        """Return list of (dn, attributes) like python-ldap search_s."""
+
+        try:
+            node = parse_filter(filterstr)
+        except ValueError as err:
+            raise DirectoryError('FILTER_ERROR', str(err))
+        bkey = normalise_dn(base)
+        if bkey and bkey not in self.entries:
+            raise DirectoryError('NO_SUCH_OBJECT', base)
+
+        keys = self.candidates(node)
+        if scope == SCOPE_BASE:
+            keys = {bkey} if keys is None or bkey in keys else set()
+        elif scope == SCOPE_ONELEVEL:
+            level = self.children.get(bkey, set())
+            keys = level if keys is None else keys & level
+        elif scope == SCOPE_SUBTREE:
+            if keys is None:
+                keys = self.subtree(bkey)
+            elif bkey:
+                keys = set(i for i in keys
+                           if i == bkey or i.endswith(',' + bkey))
+        else:
+            raise DirectoryError('PROTOCOL_ERROR', 'Bad scope %r' % scope)
+
+        results = []
+        for key in sorted((i for i in keys if i in self.entries),
+                          key=self.seq.get):
+            entry = self.entries[key]
+            if self.match(node, entry) is True:
+                results.append((entry.dn, self.attributes(entry, attrlist,
+                                                          attrsonly)))
+        return results
+
+    def subtree(self, bkey):
+        """Return set of keys of given entry and all below it."""
+
+        if not bkey:
+            return set(self.entries)
+        keys = set()
+        todo = [bkey]
+        while todo:
+            key = todo.pop()
+            keys.add(key)
+            todo.extend(self.children.get(key, ()))
+        return keys
+
+    def attributes(self, entry, attrlist, attrsonly):
+        """Return python-ldap result attribute dictionary for given entry
+        and requested attribute list."""
+
+        user, oper, names = not attrlist, False, {}
+        for name in attrlist or ():
+            if name == '*':
+                user = True
+            elif name == '+':
+                oper = True
+            elif name != '1.1':
+                names[self.schema.attr(name).key] = name.split(';', 1)[0]
+
+        result = {}
+        for key, (name, values) in entry.attrs.items():
+            atype = self.schema.attr(key)
+            if key in names:
+                name = names[key]
+            elif not (oper if atype.operational else user):
+                continue
+            elif key in self.schema.attrs:
+                name = atype.name
+            result[name] = [] if attrsonly else list(values)
+        return result
+
+    def check(self, entry, rdn_key=None):
+        """Raise DirectoryError if entry breaks the schema or lost its RDN
+        value."""
+
+        attr, value = split_rdn(split_dn(entry.dn)[0])
+        atype = self.schema.attr(attr)
+        func = atype.equality()
+        if func(value.encode('utf-8', 'surrogateescape')) not in \
+                entry.normalised(atype.key, func):
+            raise DirectoryError(
+                'NOT_ALLOWED_ON_RDN' if rdn_key else 'NAMING_VIOLATION',
+                'value of naming attribute %s is not present in entry' %
+                attr)
+        if 'objectclass' not in entry.attrs:
+            raise DirectoryError('OBJECT_CLASS_VIOLATION',
+                                 'no objectClass attribute')
+        classes = [decode(i) for i in entry.values('objectclass')]
+        missing = self.schema.must(classes) - set(entry.attrs)
+        if missing:
+            raise DirectoryError(
+                'OBJECT_CLASS_VIOLATION', 'object class %s requires '
+                'attribute %s' % ('/'.join(classes), sorted(missing)[0]))
+
+    def put(self, entry, name, values):
+        """Set attribute on a new or copied entry from add or replace."""
+
+        atype = self.schema.attr(name)
+        if not values:
+            entry.attrs.pop(atype.key, None)
+            return
+        func = atype.equality()
+        seen = set()
+        for value in values:
+            norm = func(value)
+            if norm in seen:
+                raise DirectoryError('TYPE_OR_VALUE_EXISTS',
+                                     '%s: value #%d provided more than once' %
+                                     (name, values.index(value)))
+            seen.add(norm)
+        entry.attrs[atype.key] = [name.split(';', 1)[0], list(values)]
+
+    def stamp(self, entry, who, create=False):
+        """Set operational timestamps and names on given entry."""
+
+        now = self.clock().encode()
+        if create:
+            for name, value in (('createTimestamp', now),
+                                ('creatorsName', who.encode())):
+                if self.schema.attr(name).key not in entry.attrs:
+                    entry.attrs[self.schema.attr(name).key] = [name, [value]]
+        for name, value in (('modifyTimestamp', now), ('modifiersName',
+                                                       who.encode())):
+            if not create or self.schema.attr(name).key not in entry.attrs:
+                entry.attrs[self.schema.attr(name).key] = [name, [value]]
+
+    def add(self, dn, modlist, who='', check=True):
+        """Add entry with given DN and list of (attribute, values)."""
+
+        key = normalise_dn(dn)
+        if not key:
+            raise DirectoryError('UNWILLING_TO_PERFORM', 'empty DN')
+        if key in self.entries:
+            raise DirectoryError('ALREADY_EXISTS', dn)
+        parent = parent_key(key)
+        if parent and parent not in self.entries:
+            raise DirectoryError('NO_SUCH_OBJECT', 'parent does not exist')
+
+        entry = Entry(dn)
+        for name, values in modlist:
+            values = as_values(name, values)
+            atype = self.schema.attr(name)
+            if atype.key in entry.attrs:
+                values = entry.values(atype.key) + values
+            self.put(entry, name, values)
+        if check:
+            self.check(entry)
+        self.stamp(entry, who, create=True)
+        self.insert(key, entry)
+
+    def delete(self, dn):
+        """Delete leaf entry with given DN."""
+
+        key = normalise_dn(dn)
+        if key not in self.entries:
+            raise DirectoryError('NO_SUCH_OBJECT', dn)
+        if self.children.get(key):
+            raise DirectoryError('NOT_ALLOWED_ON_NONLEAF', dn)
+        self.remove(key)
+
+    def modify(self, dn, modlist, who=''):
+        """Apply python-ldap modlist of (op, attribute, values) to entry
+        with given DN. All changes are applied or none."""
+
+        key = normalise_dn(dn)
+        if key not in self.entries:
+            raise DirectoryError('NO_SUCH_OBJECT', dn)
+        entry = self.entries[key].copy()
+
+        for op, name, values in modlist:
+            values = as_values(name, values)
+            atype = self.schema.attr(name)
+            if atype.no_user_mod:
+                raise DirectoryError('CONSTRAINT_VIOLATION',
+                                     '%s: no user modification allowed' %
+                                     name)
+            current = entry.values(atype.key)
+            func = atype.equality()
+            norms = [func(i) for i in current]
+            if op == MOD_ADD:
+                if not values:
+                    raise DirectoryError('PROTOCOL_ERROR',
+                                         '%s: no values given' % name)
+                for value in values:
+                    if func(value) in norms:
+                        raise DirectoryError('TYPE_OR_VALUE_EXISTS',
+                                             '%s: value exists' % name)
+                self.put(entry, name, current + values)
+            elif op == MOD_DELETE:
+                if not current:
+                    raise DirectoryError('NO_SUCH_ATTRIBUTE', name)
+                keep = current
+                for value in values:
+                    norm = func(value)
+                    if norm not in norms:
+                        raise DirectoryError('NO_SUCH_ATTRIBUTE',
+                                             '%s: no such value' % name)
+                    keep = [i for i in keep if func(i) != norm]
+                self.put(entry, name, keep if values else [])
+            elif op == MOD_REPLACE:
+                self.put(entry, name, values)
+            else:
+                raise DirectoryError('PROTOCOL_ERROR',
+                                     'unknown modify operation %r' % op)
+            entry.cache = {}
+
+        self.check(entry, rdn_key=key)
+        self.stamp(entry, who)
+        self.remove(key)
+        self.insert(key, entry)
+
+    def rename(self, dn, newrdn, newsuperior=None, delold=True, who=''):
+        """Rename leaf entry with given DN to new RDN, optionally moving it
+        below a new parent."""
+
+        key = normalise_dn(dn)
+        if key not in self.entries:
+            raise DirectoryError('NO_SUCH_OBJECT', dn)
+        if self.children.get(key):
+            raise DirectoryError('NOT_ALLOWED_ON_NONLEAF', dn)
+        old = self.entries[key]
+        if newsuperior is None:
+            newsuperior = ','.join(split_dn(old.dn)[1:])
+        elif normalise_dn(newsuperior) not in self.entries:
+            raise DirectoryError('NO_SUCH_OBJECT', newsuperior)
+        newdn = newrdn + (',' + newsuperior if newsuperior else '')
+        newkey = normalise_dn(newdn)
+        if newkey != key and newkey in self.entries:
+            raise DirectoryError('ALREADY_EXISTS', newdn)
+
+        entry = old.copy(newdn)
+        if delold:
+            attr, value = split_rdn(split_dn(old.dn)[0])
+            atype = self.schema.attr(attr)
+            func = atype.equality()
+            norm = func(value.encode('utf-8', 'surrogateescape'))
+            self.put(entry, entry.attrs[atype.key][0],
+                     [i for i in entry.values(atype.key) if func(i) != norm])
+        attr, value = split_rdn(newrdn)
+        atype = self.schema.attr(attr)
+        func = atype.equality()
+        value = value.encode('utf-8', 'surrogateescape')
+        current = entry.values(atype.key)
+        if func(value) not in [func(i) for i in current]:
+            self.put(entry, attr, current + [value])
+        entry.cache = {}
+
+        self.check(entry, rdn_key=newkey)
+        self.stamp(entry, who)
+        self.remove(key)
+        self.insert(newkey, entry)
+
+    # ------------------------------------------------------------------ #
+    # LOADING                                                            #
+    # ------------------------------------------------------------------ #
+
+    def load_ldif(self, fd, check=True):
+        """Add entries from given binary file object of LDIF content
+        records. Ancestors missing from the file are created as
+        extensibleObject entries holding just their RDN value, so LDIF
+        from a subtree search loads on its own. Returns number of entries
+        loaded."""
+
+        count = 0
+        for record in rbldif.parse(fd):
+            if record.changetype:
+                raise ValueError('LDIF change records are not supported: %s' %
+                                 record.dn)
+            rdns = split_dn(record.dn)
+            for i in range(len(rdns) - 1, 0, -1):
+                ancestor = ','.join(rdns[i:])
+                if normalise_dn(ancestor) not in self.entries:
+                    attr, value = split_rdn(rdns[i])
+                    self.add(ancestor, (('objectClass', (b'top',
+                                                         b'extensibleObject')),
+                                        (attr, value.encode())), check=False)
+            attrs = {}
+            for attr, value in record.attrs:
+                attrs.setdefault(attr, []).append(
+                    value.encode('utf-8', 'surrogateescape'))
+            self.add(record.dn, list(attrs.items()), check=check)
+            count += 1
+        return count
+
+
+def substring_match(value, initial, middle, final):
+    """Return True if normalised value matches substring assertion."""
+
+    pos = 0
+    if initial is not None:
+        if not value.startswith(initial):
+            return False
+        pos = len(initial)
+    end = len(value)
+    if final is not None:
+        if not value.endswith(final) or end - len(final) < pos:
+            return False
+        end -= len(final)
+    for part in middle:
+        found = value.find(part, pos, end)
+        if found < 0:
+            return False
+        pos = found + len(part)
+    return True
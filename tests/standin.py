@@ -0,0 +1,24 @@
+"""RedBrick Test Module; minimal RBUserDB and LDAPObject stand-ins for
+tests of code that only wraps or counts calls on them. Unlike fakeldap,
+python-ldap is not needed."""
+
+
+class Conn:
+    """LDAPObject stand-in returning a fixed search result"""
+
+    def search_s(self, base, scope, filterstr=None, attrlist=None):
+        return [('uid=a,o=rb', {'uid': [b'a'], 'cn': [b'Alice']})]
+
+    def modify_s(self, dn, modlist):
+        return None
+
+
+class UserDB:
+    """RBUserDB stand-in with both connections and a wrapper method"""
+
+    def __init__(self):
+        self.ldap = Conn()
+        self.ldap_dcu = Conn()
+
+    def wrapper(self, function, *args):
+        return function(*args)
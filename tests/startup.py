@@ -0,0 +1,154 @@
+"""RedBrick Test Module; useradm startup benchmark.
+
+Runs useradm as a new process for each case (help, command usage and
+freename) and reports the wall time, the number of modules imported and
+the number of LDAP binds made. freename runs against a stand-in LDAP that
+finds nothing and optionally sleeps for given latency on each bind, as a
+connect to a remote server would.
+
+    python -m tests.startup [-r repeat] [-l bind-latency-ms] [case,...]"""
+
+import getopt
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_USERADM = os.path.join(ROOT, 'useradm')
+
+# Case name -> (useradm arguments, needs stand-in LDAP)
+#
+CASES = {
+    'help': (['-h'], False),
+    'usage': (['freename', '-h'], False),
+    'freename': (['freename', 'nosuch'], True),
+}
+
+# Run in the new process before useradm. Reports the modules loaded and
+# binds made at exit, after useradm's own exit handlers.
+#
+BOOTSTRAP = '''
+import atexit, runpy, sys, time
+binds = []
+atexit.register(lambda: print('startup: %%d %%d' %% (len(sys.modules),
+                len(binds)), file=sys.stderr))
+sys.path.insert(0, %(dir)r)
+if %(ldap)r:
+    import ldap
+    import rbconfig
+
+    class Conn:
+        def simple_bind_s(self, *args):
+            binds.append(args)
+            time.sleep(%(latency)r)
+
+        def search_s(self, *args, **kwargs):
+            return []
+
+        def unbind(self):
+            pass
+
+    ldap.initialize = lambda uri: Conn()
+    rbconfig.LDAP_ROOTPW_FILE = rbconfig.LDAP_DCU_RBPW = %(secret)r
+sys.argv = ['useradm'] + %(args)r
+runpy.run_path(%(script)r, run_name='__main__')
+'''
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def run_case(case, latency=0.0, secret=os.devnull):
+    """Run useradm once for given case. Returns (wall time, modules
+    loaded, LDAP binds, exit status)."""
+
+    args, standin = CASES[case]
+    code = BOOTSTRAP % {
+        'dir': DIR_USERADM,
+        'ldap': standin,
+        'latency': latency,
+        'secret': secret,
+        'args': args,
+        'script': os.path.join(DIR_USERADM, 'useradm.py')
+    }
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                          text=True, stdin=subprocess.DEVNULL)
+    wall = time.perf_counter() - start
+    modules = binds = None
+    for line in proc.stderr.splitlines():
+        if line.startswith('startup: '):
+            modules, binds = [int(i) for i in line.split()[1:]]
+    return wall, modules, binds, proc.returncode
+
+
+def run(cases=tuple(CASES), repeat=10, latency=0.0):
+    """Run each given case repeat times. Returns list of result
+    dictionaries."""
+
+    results = []
+    with tempfile.NamedTemporaryFile('w', suffix='.secret') as secret:
+        secret.write('secret\n')
+        secret.flush()
+        for case in cases:
+            runs = [run_case(case, latency, secret.name)
+                    for _ in range(repeat)]
+            walls = [i[0] for i in runs]
+            results.append({
+                'case': case,
+                'min': min(walls),
+                'median': statistics.median(walls),
+                'modules': runs[-1][1],
+                'binds': runs[-1][2],
+                'status': runs[-1][3],
+            })
+    return results
+
+
+def report(results, fd=sys.stdout):
+    """Print table of given results."""
+
+    print('%-10s %9s %9s %8s %6s %6s' %
+          ('case', 'min ms', 'median ms', 'modules', 'binds', 'status'),
+          file=fd)
+    for res in results:
+        print('%-10s %9.1f %9.1f %8s %6s %6d' %
+              (res['case'], 1000 * res['min'], 1000 * res['median'],
+               res['modules'], res['binds'], res['status']), file=fd)
+
+
+def main():
+    """Program entry function."""
+
+    usage = __doc__.split('\n\n')[-1]
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hl:r:')
+    except getopt.GetoptError as err:
+        print(err, file=sys.stderr)
+        print(usage, file=sys.stderr)
+        sys.exit(1)
+
+    repeat, latency = 10, 0.0
+    for o, a in opts:
+        if o == '-h':
+            print(usage, file=sys.stderr)
+            sys.exit(0)
+        elif o == '-r':
+            repeat = int(a)
+        elif o == '-l':
+            latency = float(a) / 1000
+    cases = args and args[0].split(',') or tuple(CASES)
+    for i in cases:
+        if i not in CASES:
+            print('Unknown case: %s' % i, file=sys.stderr)
+            sys.exit(1)
+
+    report(run(cases, repeat, latency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""RedBrick Test Module; Tests the benchmark suite runs cleanly."""
+
+import unittest
+
+try:
+    import ldap
+    from tests import benchmark
+except ImportError:
+    ldap = None
+
+
+@unittest.skipIf(ldap is None, 'python-ldap is not installed')
+class BenchmarkTestCase(unittest.TestCase):
+    """Test Case class for the benchmark suite"""
+
+    def test_run(self):
+        """Every command runs without error on a small dataset"""
+        results = benchmark.run((200, ))
+        self.assertEqual([i['command'] for i in results['results']],
+                         list(benchmark.COMMANDS))
+        for res in results['results']:
+            self.assertIsNone(res['error'], res['command'])
+        res = dict((i['command'], i) for i in results['results'])
+        self.assertEqual(res['stats']['ldap'], {'search_s': 1})
+        self.assertEqual(res['checkdb']['forks'], 0)
+        self.assertGreater(res['unpaid_warn']['forks'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
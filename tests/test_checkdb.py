@@ -0,0 +1,141 @@
+"""RedBrick Test Module; Tests incremental useradm checkdb."""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from useradm import useradm as cli
+
+try:
+    import ldap
+    from tests import dataset, fakeldap, ldapdirectory
+    # useradm uses the flat modules (see tests/__init__.py).
+    import rbaccount
+    import rbconfig
+    import rbuserdb
+except ImportError:
+    ldap = None
+
+
+@unittest.skipIf(ldap is None, 'python-ldap is not installed')
+class CheckDBTestCase(unittest.TestCase):
+    """Test Case class for incremental checkdb"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = dataset.Dataset(20, root=self.tmpdir.name)
+        self.data.write(self.tmpdir.name)
+        dirs = self.data.skeleton()
+        dirs['FILE_CHECKDB_STATE'] = os.path.join(self.tmpdir.name,
+                                                  'checkdb.json')
+        self.patches = [mock.patch.object(rbconfig, name, value)
+                        for name, value in dirs.items()]
+        for patch in self.patches:
+            patch.start()
+
+        # Entries changed by the tests get modifyTimestamps from this clock.
+        #
+        self.now = '20260101000000'
+        self.udb = rbuserdb.RBUserDB()
+        self.udb.ldap, self.udb.ldap_dcu = (self.load(i)
+                                            for i in ('rb.ldif', 'dcu.ldif'))
+        self.udb.valid_shells = dict(
+            (usr['loginShell'], 1) for usr in self.data.users)
+        self.saved = cli.UDB, cli.ACC, cli.OPT
+        cli.UDB, cli.ACC = self.udb, rbaccount.RBAccount()
+        cli.OPT = cli.RBOpt()
+
+        # Old, unchanged accounts (dataset timestamps are in 2020).
+        #
+        modified = self.udb.dict_modified()
+        self.last = max(modified, key=modified.get)
+        self.old = [i['uid'] for i in self.data.users
+                    if i['usertype'] == 'member' and not i['newbie'] and
+                    i['uid'] != self.last]
+
+    def tearDown(self):
+        cli.UDB, cli.ACC, cli.OPT = self.saved
+        for patch in self.patches:
+            patch.stop()
+        self.tmpdir.cleanup()
+
+    def load(self, name):
+        """Return FakeLDAPObject holding given dataset LDIF file."""
+
+        conn = fakeldap.FakeLDAPObject(ldapdirectory.Directory(
+            fakeldap.schema(), clock=lambda: self.now + 'Z'))
+        with open(os.path.join(self.tmpdir.name, name), 'rb') as fd:
+            conn.directory.load_ldif(fd, False)
+        return conn
+
+    def set_years(self, uid, years):
+        """Set yearsPaid of given user."""
+
+        self.udb.ldap.modify_s(
+            self.udb.uid2dn(uid),
+            [(ldap.MOD_REPLACE, 'yearsPaid', str(years).encode())])
+
+    def checkdb(self, incremental=True):
+        """Run checkdb, return (output, users given database checks, users
+        given filesystem checks)."""
+
+        cli.OPT.incremental = incremental and 1 or None
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), \
+                mock.patch.object(cli, 'checkdb_user',
+                                  wraps=cli.checkdb_user) as user, \
+                mock.patch.object(cli, 'checkdb_dirs',
+                                  wraps=cli.checkdb_dirs) as dirs:
+            cli.checkdb()
+        return (out.getvalue(), set(i[0][0].uid for i in user.call_args_list),
+                set(i[0][0] for i in dirs.call_args_list))
+
+    def test_incremental(self):
+        """Only users changed since the last run are checked again"""
+        full, checked, _ = self.checkdb(False)
+        self.assertEqual(checked,
+                         set(i['uid'] for i in self.data.users))
+
+        # Unchanged users reuse their findings. The newest entry is at the
+        # high-water mark so it is always checked again.
+        #
+        out, checked, fs_checked = self.checkdb()
+        self.assertEqual(out, full)
+        self.assertEqual(checked, {self.last})
+        self.assertEqual(fs_checked, {self.last})
+
+        # A user modified after the high-water mark.
+        #
+        self.set_years(self.old[0], 9)
+        out, checked, _ = self.checkdb()
+        self.assertIn(self.old[0], checked)
+        self.assertNotIn(self.old[1], checked)
+        self.assertIn('%s  has bogus yearsPaid: 9' %
+                      self.old[0].ljust(rbconfig.MAXLEN_UNAME), out)
+
+        # A change in the same second as the high-water mark.
+        #
+        self.set_years(self.old[1], 8)
+        out, checked, _ = self.checkdb()
+        self.assertEqual(checked, {self.old[0], self.old[1]})
+        self.assertIn('has bogus yearsPaid: 8', out)
+        self.assertIn('has bogus yearsPaid: 9', out)
+
+        # A directory whose ctime changed gets its filesystem checks redone
+        # but not the database checks.
+        #
+        usr = [i for i in self.data.users if i['uid'] == self.old[2]][0]
+        os.chmod(usr['homeDirectory'], 0o777)
+        out, checked, fs_checked = self.checkdb()
+        self.assertNotIn(self.old[2], checked)
+        self.assertIn(self.old[2], fs_checked)
+        self.assertNotIn(self.old[3], fs_checked)
+        self.assertIn('%s  has WORLD writeable home' %
+                      self.old[2].ljust(rbconfig.MAXLEN_UNAME), out)
+
+
+if __name__ == '__main__':
+    unittest.main()
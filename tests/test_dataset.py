@@ -0,0 +1,67 @@
+"""RedBrick Test Module; Tests the synthetic membership dataset."""
+
+import os
+import tempfile
+import unittest
+
+from tests import dataset, ldapdirectory
+from useradm import rbconfig, rbstats
+
+
+class DatasetTestCase(unittest.TestCase):
+    """Test Case class for the dataset generator"""
+
+    def test_seed(self):
+        """Same seed gives same users, different seed different users"""
+        self.assertEqual(dataset.Dataset(200, 7).users,
+                         dataset.Dataset(200, 7).users)
+        self.assertNotEqual(dataset.Dataset(200, 7).users,
+                            dataset.Dataset(200, 8).users)
+
+    def test_load(self):
+        """Generated LDIF passes schema checks and matches the users"""
+        schema = ldapdirectory.Schema()
+        schema.load_dir('rbschema')
+        with tempfile.TemporaryDirectory() as tmp:
+            data = dataset.Dataset(500, 1, mix={'member': 3, 'staff': 1,
+                                                'society': 1},
+                                   root=os.path.join(tmp, 'root'))
+            rb_ldif, dcu_ldif = data.write(tmp)
+            rb = ldapdirectory.Directory(schema)
+            with open(rb_ldif, 'rb') as fd:
+                rb.load_ldif(fd)
+            dcu = ldapdirectory.Directory(schema)
+            with open(dcu_ldif, 'rb') as fd:
+                dcu.load_ldif(fd)
+            with open(rb_ldif, 'rb') as fd:
+                stats = rbstats.from_ldif(fd)
+
+            accounts = rb.search(rbconfig.LDAP_ACCOUNTS_TREE,
+                                 ldapdirectory.SCOPE_ONELEVEL, '(uid=*)')
+            self.assertEqual(len(accounts), 500)
+            self.assertEqual(stats.totals()['TOTAL'], 500)
+            members = [i for i in data.users if i['usertype'] == 'member']
+            staff = stats.usertypes['staff']['TOTAL']
+            self.assertEqual(staff, len(
+                [i for i in data.users if i['usertype'] == 'staff']))
+            self.assertTrue(all(len(i['uid']) <= rbconfig.MAXLEN_UNAME
+                                for i in data.users))
+
+            usr = members[0]
+            res = dcu.search(rbconfig.LDAP_DCU_STUDENTS_TREE,
+                             ldapdirectory.SCOPE_SUBTREE,
+                             '(employeeNumber=%d)' % usr['id'])
+            self.assertEqual(len(res), 1)
+            self.assertEqual(len(dcu.search(
+                rbconfig.LDAP_DCU_STUDENTS_TREE, ldapdirectory.SCOPE_SUBTREE,
+                '(objectClass=dcuAccount)')),
+                len(members) + dataset.DCU_EXTRA * (len(members) + staff))
+
+            dirs = data.skeleton()
+            self.assertTrue(os.path.isdir(usr['homeDirectory']))
+            self.assertEqual(len(os.listdir(dirs['DIR_SIGNAWAY_STATE'])),
+                             sum(i['signed'] for i in data.users))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""RedBrick Test Module; Tests RBUserDB against the fake LDAP server."""
+
+import unittest
+
+try:
+    import ldap
+    from tests import fakeldap
+    from useradm import rbuserdb
+except ImportError:
+    ldap = None
+
+
+@unittest.skipIf(ldap is None, 'python-ldap is not installed')
+class FakeLDAPTestCase(unittest.TestCase):
+    """Test Case class for RBUserDB over FakeLDAPObject"""
+
+    def setUp(self):
+        self.udb = rbuserdb.RBUserDB()
+        self.udb.ldap, self.udb.ldap_dcu = fakeldap.redbrick()
+
+    def test_search(self):
+        """RBUserDB searches run against the sample accounts"""
+        self.assertEqual(self.udb.uidNumber_findmax(), 102007)
+        self.assertEqual(list(self.udb.dict_modified()), ['newb'])
+        msgid = self.udb.ldap.search('o=redbrick', ldap.SCOPE_SUBTREE,
+                                     '(uid=newb)', ['gidNumber'])
+        self.assertEqual(self.udb.ldap.result(msgid),
+                         (ldap.RES_SEARCH_RESULT,
+                          [('uid=newb,ou=accounts,o=redbrick',
+                            {'gidNumber': [b'1017']})]))
+
+    def test_uidnumber_counter(self):
+        """uidNumber counter is created and reserved from"""
+        self.assertRaises(rbuserdb.RBFatalError, self.udb.uidNumber_read)
+        self.udb.uidNumber_set(102008)
+        self.assertEqual(self.udb.uidNumber_reserve(5), 102008)
+        self.assertEqual(self.udb.uidNumber_getnext(), 102013)
+        self.assertEqual(self.udb.uidNumber_read(), 102014)
+
+    def test_errors(self):
+        """Directory errors are python-ldap exceptions"""
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.udb.ldap.delete_s,
+                          'uid=nosuch,ou=accounts,o=redbrick')
+        self.assertRaises(ldap.FILTER_ERROR, self.udb.ldap.search_s,
+                          'o=redbrick', ldap.SCOPE_SUBTREE, '(uid=')
+        self.assertRaises(ldap.INVALID_CREDENTIALS,
+                          fakeldap.FakeLDAPObject(credentials={}).simple_bind_s,
+                          'cn=root,ou=ldap,o=redbrick', 'secret')
+
+
+if __name__ == '__main__':
+    unittest.main()
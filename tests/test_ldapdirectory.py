@@ -0,0 +1,156 @@
+"""RedBrick Test Module; Tests the in-memory LDAP directory model."""
+
+import io
+import unittest
+
+from tests import ldapdirectory
+from tests.ldapdirectory import (SCOPE_BASE, SCOPE_ONELEVEL, SCOPE_SUBTREE,
+                                 MOD_ADD, MOD_DELETE, MOD_REPLACE,
+                                 DirectoryError)
+
+ENTRY = '''dn: uid=%(uid)s,ou=accounts,o=redbrick
+objectClass: member
+objectClass: posixAccount
+uid: %(uid)s
+cn: User %(n)d
+altmail: %(uid)s@mail.dcu.ie
+newbie: FALSE
+created: 2020-01-01 00:00:00
+createdby: admin
+updated: 2020-01-01 00:00:00
+updatedby: admin
+yearsPaid: %(years)d
+id: %(n)d
+year: 1
+course: CASE
+uidNumber: %(n)d
+gidNumber: 103
+homeDirectory: /home/member/%(uid)s
+userPassword: x
+loginShell: /bin/zsh
+
+'''
+
+
+def directory(count=50):
+    """Return Directory with the rbschema schema and count accounts"""
+    schema = ldapdirectory.Schema()
+    schema.load_dir('rbschema')
+    res = ldapdirectory.Directory(schema, clock=lambda: '20260101000000Z')
+    res.load_ldif(io.BytesIO(''.join(
+        ENTRY % {'uid': 'user%d' % i, 'n': 1000 + i, 'years': i % 4 - 1}
+        for i in range(count)).encode()))
+    return res
+
+
+class LDAPFilterTestCase(unittest.TestCase):
+    """Test Case class for RFC 4515 filter parsing"""
+
+    def test_parse(self):
+        """Nested filters, escapes, presence and substrings parse"""
+        self.assertEqual(
+            ldapdirectory.parse_filter(
+                r'(&(objectClass=*)(|(cn=a\2a*b*c)(!(uidNumber>=5))))'),
+            ('&', [('=*', 'objectClass'),
+                   ('|', [('sub', 'cn', b'a*', [b'b'], b'c'),
+                          ('!', ('>=', 'uidNumber', b'5'))])]))
+        self.assertEqual(ldapdirectory.parse_filter('uid=foo'),
+                         ('=', 'uid', b'foo'))
+
+    def test_invalid(self):
+        """Invalid filters are rejected"""
+        for text in ('(uid=foo', '(&(uid=a)', '(=foo)', r'(cn=\zz)',
+                     '(cn:dn:=x)', '(uid=a)(uid=b)'):
+            self.assertRaises(ValueError, ldapdirectory.parse_filter, text)
+
+
+class LDAPDirectoryTestCase(unittest.TestCase):
+    """Test Case class for the indexed directory"""
+
+    def setUp(self):
+        self.dir = directory()
+
+    def search(self, filterstr, base='ou=accounts,o=redbrick',
+               scope=SCOPE_ONELEVEL):
+        """Return sorted list of uids found"""
+        return sorted(
+            data['uid'][0].decode()
+            for _, data in self.dir.search(base, scope, filterstr, ['uid']))
+
+    def test_index_matches_scan(self):
+        """Indexed searches give the same result as a full scan"""
+        for filterstr in ('(yearsPaid>=1)', '(yearsPaid<=-1)',
+                          '(&(objectClass=MEMBER)(uidNumber<=1010))',
+                          '(|(uid=USER3)(cn=user 4))', '(!(yearsPaid=0))',
+                          '(&(newbie=false)(altmail=*3@*))'):
+            node = ldapdirectory.parse_filter(filterstr)
+            scan = sorted(
+                entry.dn for entry in self.dir.entries.values()
+                if self.dir.match(node, entry) is True)
+            found = sorted(dn for dn, _ in self.dir.search(
+                'o=redbrick', SCOPE_SUBTREE, filterstr, ['1.1']))
+            self.assertEqual(found, scan, filterstr)
+        self.assertEqual(len(self.search('(yearsPaid>=2)')), 12)
+        self.assertEqual(self.search('(altmail=*3@*)'),
+                         ['user13', 'user23', 'user3', 'user33', 'user43'])
+
+    def test_attributes(self):
+        """Attribute lists, operational attributes and base scope"""
+        (dn, data), = self.dir.search('uid=user1,ou=accounts,o=redbrick',
+                                      SCOPE_BASE, attrlist=['userid', '+'])
+        self.assertEqual(data, {'userid': [b'user1'],
+                                'createTimestamp': [b'20260101000000Z'],
+                                'modifyTimestamp': [b'20260101000000Z'],
+                                'creatorsName': [b''],
+                                'modifiersName': [b'']})
+        (_, data), = self.dir.search(dn, SCOPE_BASE)
+        self.assertNotIn('modifyTimestamp', data)
+        self.assertEqual(data['objectClass'], [b'member', b'posixAccount'])
+        self.assertRaises(DirectoryError, self.dir.search,
+                          'ou=nosuch,o=redbrick', SCOPE_SUBTREE)
+
+    def test_modify(self):
+        """Modify operations update indexes and fail atomically"""
+        dn = 'uid=user1,ou=accounts,o=redbrick'
+        self.dir.modify(dn, ((MOD_DELETE, 'uidNumber', b'1001'),
+                             (MOD_ADD, 'uidNumber', b'5000')))
+        self.assertEqual(self.search('(uidNumber>=5000)'), ['user1'])
+        with self.assertRaises(DirectoryError) as ctx:
+            self.dir.modify(dn, ((MOD_REPLACE, 'cn', b'X'),
+                                 (MOD_DELETE, 'uidNumber', b'1001')))
+        self.assertEqual(ctx.exception.result, 'NO_SUCH_ATTRIBUTE')
+        self.assertEqual(self.search('(cn=X)'), [])
+        for modlist, result in (
+                (((MOD_ADD, 'uid', b'USER1'), ), 'TYPE_OR_VALUE_EXISTS'),
+                (((MOD_DELETE, 'uid', None), ), 'NOT_ALLOWED_ON_RDN'),
+                (((MOD_DELETE, 'altmail', None), ), 'OBJECT_CLASS_VIOLATION'),
+                (((MOD_REPLACE, 'modifyTimestamp', b'1'), ),
+                 'CONSTRAINT_VIOLATION')):
+            with self.assertRaises(DirectoryError) as ctx:
+                self.dir.modify(dn, modlist)
+            self.assertEqual(ctx.exception.result, result)
+        self.assertRaises(TypeError, self.dir.modify, dn,
+                          ((MOD_REPLACE, 'cn', 'str'), ))
+
+    def test_add_rename_delete(self):
+        """Add, rename and delete keep the tree and indexes consistent"""
+        self.dir.rename('uid=user1,ou=accounts,o=redbrick', 'uid=renamed')
+        self.assertEqual(self.search('(uid=user1)'), [])
+        self.assertEqual(self.search('(uid=renamed)'), ['renamed'])
+        self.dir.delete('uid=renamed,ou=accounts,o=redbrick')
+        self.assertEqual(len(self.search('(objectClass=*)')), 49)
+        for dn, result in (('uid=user2,ou=accounts,o=redbrick',
+                            'ALREADY_EXISTS'),
+                           ('uid=x,ou=nosuch,o=redbrick', 'NO_SUCH_OBJECT'),
+                           ('cn=x,o=redbrick', 'OBJECT_CLASS_VIOLATION')):
+            with self.assertRaises(DirectoryError) as ctx:
+                self.dir.add(dn, (('objectClass', b'uidNumberCounter'),
+                                  ('cn', b'x')))
+            self.assertEqual(ctx.exception.result, result)
+        with self.assertRaises(DirectoryError) as ctx:
+            self.dir.delete('ou=accounts,o=redbrick')
+        self.assertEqual(ctx.exception.result, 'NOT_ALLOWED_ON_NONLEAF')
+
+
+if __name__ == '__main__':
+    unittest.main()
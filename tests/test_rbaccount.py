@@ -0,0 +1,74 @@
+"""RedBrick Test Module; Tests the rbaccount module."""
+
+import os
+import tempfile
+import unittest
+
+from useradm import rbaccount
+
+
+class RBAccountSignedInTestCase(unittest.TestCase):
+    """Test Case class for the cached signed-in set"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = rbaccount.rbconfig.DIR_SIGNAWAY_STATE
+        rbaccount.rbconfig.DIR_SIGNAWAY_STATE = self.tmpdir.name
+
+    def tearDown(self):
+        rbaccount.rbconfig.DIR_SIGNAWAY_STATE = self.saved
+        rbaccount.RBAccount.signed_in_cache = (None, frozenset())
+        self.tmpdir.cleanup()
+
+    def touch(self, name, mtime):
+        """Create file in state directory and set directory mtime"""
+        open(os.path.join(self.tmpdir.name, name), 'w').close()
+        os.utime(self.tmpdir.name, (mtime, mtime))
+
+    def test_cache(self):
+        """Set is rescanned only when the directory mtime changes"""
+        self.touch('alice', 1000)
+        self.touch('bob', 1000)
+        self.assertEqual(rbaccount.RBAccount.signed_in(), {'alice', 'bob'})
+        self.touch('carol', 1000)
+        self.assertEqual(rbaccount.RBAccount.signed_in(), {'alice', 'bob'})
+        self.touch('dave', 2000)
+        self.assertEqual(rbaccount.RBAccount.signed_in(),
+                         {'alice', 'bob', 'carol', 'dave'})
+
+    def test_recent(self):
+        """Scans in the same second as the last change are not cached"""
+        self.touch('alice', 1000)
+        os.utime(self.tmpdir.name)
+        self.assertEqual(rbaccount.RBAccount.signed_in(), {'alice'})
+        self.assertIsNone(rbaccount.RBAccount.signed_in_cache[0])
+
+    def test_missing(self):
+        """No one has signed in if the state directory is missing"""
+        rbaccount.rbconfig.DIR_SIGNAWAY_STATE = os.path.join(
+            self.tmpdir.name, 'missing')
+        self.assertEqual(rbaccount.RBAccount.signed_in(), frozenset())
+
+
+class RBAccountStatDirsTestCase(unittest.TestCase):
+    """Test Case class for the filesystem audit stat"""
+
+    def test_stat_dirs(self):
+        """Directories are stat'ed, missing paths and files are None"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in 'alice', 'bob':
+                os.makedirs(os.path.join(tmpdir, 'home', name))
+            os.chmod(os.path.join(tmpdir, 'home', 'bob'), 0o700)
+            open(os.path.join(tmpdir, 'home', 'carol'), 'w').close()
+            paths = [os.path.join(tmpdir, *i) for i in (
+                ('home', 'alice'), ('home', 'bob/'), ('home', 'carol'),
+                ('home', 'dave'), ('webtree', 'alice'))]
+            res = rbaccount.RBAccount.stat_dirs(paths)
+        self.assertEqual(list(res), paths)
+        self.assertEqual([i is not None for i in res.values()],
+                         [True, True, False, False, False])
+        self.assertEqual(res[paths[1]].st_mode & 0o777, 0o700)
+
+
+if __name__ == '__main__':
+    unittest.main()
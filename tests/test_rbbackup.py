@@ -0,0 +1,151 @@
+"""RedBrick Test Module; Tests the rbbackup module."""
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+try:
+    import ldap
+    from tests import dataset, fakeldap, ldapdirectory
+    # Flat modules, as the scripts use them (see tests/__init__.py).
+    import rbbackup
+    import rbconfig
+    import rbldif
+except ImportError:
+    ldap = None
+
+
+@unittest.skipIf(ldap is None, 'python-ldap is not installed')
+class RBBackupTestCase(unittest.TestCase):
+    """Test Case class for incremental LDAP backups"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        data = dataset.Dataset(10)
+        data.write(self.tmpdir.name)
+        self.uids = [i['uid'] for i in data.users]
+
+        # The directory and backup file names share one clock, moved on by
+        # hand so timestamps can fall in the same second.
+        #
+        self.now = '20260101000000'
+        self.ldap = fakeldap.FakeLDAPObject(ldapdirectory.Directory(
+            fakeldap.schema(), clock=lambda: self.now + 'Z'))
+        with open(os.path.join(self.tmpdir.name, 'rb.ldif'), 'rb') as fd:
+            self.ldap.directory.load_ldif(fd, False)
+        self.patch = mock.patch.object(rbbackup, 'time')
+        self.patch.start().strftime.side_effect = lambda fmt, t: self.now
+        self.backup = rbbackup.RBBackup(
+            os.path.join(self.tmpdir.name, 'backup'), self.ldap)
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmpdir.cleanup()
+
+    def dn(self, n):
+        """Return DN of nth user."""
+
+        return 'uid=%s,%s' % (self.uids[n], rbconfig.LDAP_ACCOUNTS_TREE)
+
+    def set_cn(self, n, value):
+        """Change cn of nth user."""
+
+        self.ldap.modify_s(self.dn(n),
+                           [(ldap.MOD_REPLACE, 'cn', value.encode())])
+
+    def read(self, name):
+        """Return list of entries in given backup file."""
+
+        with rbbackup.gzip.open(os.path.join(self.backup.directory, name),
+                                'rb') as fd:
+            return list(rbldif.parse(fd))
+
+    def rebuild(self, when=None):
+        """Return dictionary of DN -> entry rebuilt at given time."""
+
+        out = io.BytesIO()
+        count = self.backup.rebuild(out, when)
+        out.seek(0)
+        tree = dict((i.dn, i) for i in rbldif.parse(out))
+        self.assertEqual(len(tree), count)
+        return tree
+
+    def test_incremental(self):
+        """Deltas hold changed entries and deletes since the last backup"""
+        base = self.backup.incremental()
+        self.assertEqual(base, 'base-%s.ldif.gz' % self.now)
+        total = len(self.read(base))
+        self.assertIsNone(self.backup.incremental())
+
+        self.now = '20260101000100'
+        self.set_cn(0, 'Changed Name')
+        self.ldap.delete_s(self.dn(1))
+        self.now = '20260101000200'
+        delta = self.backup.incremental()
+        self.assertEqual(delta, 'delta-20260101000200.ldif.gz')
+        entries = self.read(delta)
+        self.assertEqual([(i.dn, i.changetype) for i in entries],
+                         [(self.dn(0), None), (self.dn(1), 'delete')])
+        self.assertEqual(entries[0].get('cn'), 'Changed Name')
+
+        self.now = '20260101000300'
+        self.assertIsNone(self.backup.incremental())
+        tree = self.rebuild()
+        self.assertEqual(len(tree), total - 1)
+        self.assertNotIn(self.dn(1), tree)
+        self.assertEqual(tree[self.dn(0)].get('cn'), 'Changed Name')
+
+    def test_same_second(self):
+        """A change in the same second as the high-water mark is backed up,
+        entries at the mark that did not change are not"""
+        self.backup.full()
+        self.set_cn(0, 'Same Second')
+        self.now = '20260101000100'
+        delta = self.backup.incremental()
+        self.assertEqual([i.dn for i in self.read(delta)], [self.dn(0)])
+        self.assertEqual(self.rebuild()[self.dn(0)].get('cn'), 'Same Second')
+
+        self.now = '20260101000200'
+        self.assertIsNone(self.backup.incremental())
+
+    def test_rebuild(self):
+        """The tree can be rebuilt as it was at any backup"""
+        self.backup.full()
+        original = self.rebuild()[self.dn(0)].get('cn')
+        for n, stamp in enumerate(('20260101000100', '20260101000200')):
+            self.now = stamp
+            self.set_cn(0, 'Name %d' % n)
+            self.backup.incremental()
+
+        self.assertEqual(self.backup.chain('20260101000130'), [
+            'base-20260101000000.ldif.gz', 'delta-20260101000100.ldif.gz'
+        ])
+        self.assertEqual(self.rebuild('20260101000000')[self.dn(0)].get('cn'),
+                         original)
+        self.assertEqual(self.rebuild('20260101000130')[self.dn(0)].get('cn'),
+                         'Name 0')
+        self.assertEqual(self.rebuild()[self.dn(0)].get('cn'), 'Name 1')
+        self.assertRaises(rbbackup.RBFatalError, self.backup.chain,
+                          '20251231235959')
+
+        # Parents are written before their children.
+        #
+        out = io.BytesIO()
+        self.backup.rebuild(out)
+        out.seek(0)
+        dns = [i.dn for i in rbldif.parse(out)]
+        self.assertEqual(dns[0], rbconfig.LDAP_TREE)
+        self.assertLess(dns.index(rbconfig.LDAP_ACCOUNTS_TREE),
+                        dns.index(self.dn(0)))
+
+        # A full backup starts a new chain.
+        #
+        self.now = '20260101000300'
+        self.backup.full()
+        self.assertEqual(self.backup.chain(), ['base-20260101000300.ldif.gz'])
+
+
+if __name__ == '__main__':
+    unittest.main()
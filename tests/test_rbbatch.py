@@ -0,0 +1,141 @@
+"""RedBrick Test Module; Tests the rbbatch module."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+
+try:
+    import ldap
+    from tests import dataset, fakeldap
+    # Flat modules, as useradm uses them (see tests/__init__.py).
+    import rbaccount
+    import rbbatch
+    import rbuserdb
+    from rbopt import RBOpt
+except ImportError:
+    ldap = None
+
+
+@unittest.skipIf(ldap is None, 'python-ldap is not installed')
+class RBBatchTestCase(unittest.TestCase):
+    """Test Case class for batch operations"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        data = dataset.Dataset(20)
+        data.write(self.tmpdir.name)
+        self.uids = [i['uid'] for i in data.users]
+        self.udb = rbuserdb.RBUserDB()
+        self.udb.ldap, self.udb.ldap_dcu = (fakeldap.load(
+            [os.path.join(self.tmpdir.name, i)], False)
+                                            for i in ('rb.ldif', 'dcu.ldif'))
+        self.udb.valid_shells = {'/bin/bash': 1, '/usr/local/shells/zsh': 1}
+        self.opt = RBOpt()
+        self.opt.dbonly = 1
+        self.opt.updatedby = self.uids[0]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_batch(self, text):
+        """Run operations in given text, return list of results."""
+
+        out = io.StringIO()
+        batch = rbbatch.RBBatch(self.udb, rbaccount.RBAccount(), self.opt,
+                                window=3)
+        batch.run(rbbatch.read_operations(io.StringIO(text)), out)
+        self.batch = batch
+        return [json.loads(i) for i in out.getvalue().splitlines()]
+
+    def attr(self, uid, name):
+        """Return attribute of given user in LDAP."""
+
+        res = self.udb.ldap.search_s(rbbatch.rbconfig.LDAP_ACCOUNTS_TREE,
+                                     ldap.SCOPE_ONELEVEL, 'uid=%s' % uid)
+        return res[0][1][name][0].decode() if res else None
+
+    def test_read_operations(self):
+        """JSON lines and CSV are read with their line numbers"""
+        ops = list(
+            rbbatch.read_operations(
+                io.StringIO('\n# comment\n{"op": "resetsh", "uid": "a"}\n'
+                            '[1]\n')))
+        self.assertEqual(ops[0], (3, {'op': 'resetsh', 'uid': 'a'}))
+        self.assertIsInstance(ops[1][1], rbbatch.RBFatalError)
+        ops = list(
+            rbbatch.read_operations(
+                io.StringIO('uid, op ,loginShell\na,setshell,/bin/sh\n\n'
+                            'b,resetsh,\nc,resetsh,,x\n')))
+        self.assertEqual(ops[:2], [(2, {
+            'uid': 'a',
+            'op': 'setshell',
+            'loginShell': '/bin/sh'
+        }), (4, {
+            'uid': 'b',
+            'op': 'resetsh'
+        })])
+        self.assertIsInstance(ops[2][1], rbbatch.RBFatalError)
+
+    def test_run(self):
+        """Each operation gets a result in order and failures don't stop
+        the batch"""
+        first, other = self.uids[1], self.uids[2]
+        res = self.run_batch('\n'.join([
+            '{"op": "setshell", "uid": "%s", "loginShell": "/bin/bash", '
+            '"override": true}' % first,
+            '{"op": "setshell", "uid": "nosuch", "loginShell": "/bin/bash"}',
+            '{"op": "update", "uid": "%s", "cn": "New Name"}' % other,
+            '{"op": "setshell", "uid": "%s", "loginShell": "/bin/ksh"}' %
+            other,
+            '{"op": "disuser", "uid": "%s"}' % other,
+            '{"op": "setshell", "uid": "%s", "loginShell": '
+            '"/usr/local/shells/zsh", "override": "yes"}' % first,
+            '{"op": "delete", "uid": "%s", "extra": 1}' % first,
+        ]))
+        self.assertEqual([i['line'] for i in res], list(range(1, 8)))
+        self.assertEqual([i['status'] for i in res], [
+            'ok', 'error', 'ok', 'error', 'error', 'ok', 'error'
+        ])
+        self.assertIn("'nosuch' does not exist", res[1]['message'])
+        self.assertIn('Not a valid shell', res[3]['message'])
+        self.assertIn('Unknown op', res[4]['message'])
+        self.assertIn('Unknown field: extra', res[6]['message'])
+        self.assertEqual(self.attr(first, 'loginShell'),
+                         '/usr/local/shells/zsh')
+        self.assertEqual(self.attr(other, 'cn'), 'New Name')
+        self.assertEqual(self.batch.failed, 4)
+        self.assertEqual(self.batch.counts[('setshell', 'ok')], 2)
+        fd = io.StringIO()
+        self.batch.summary(fd)
+        self.assertTrue(
+            fd.getvalue().startswith('batch: 7 operations, 3 ok, 4 failed'))
+        self.assertIsInstance(self.udb.ldap, fakeldap.FakeLDAPObject)
+
+    def test_delete(self):
+        """Delete waits for its database write"""
+        uid = self.uids[3]
+        res = self.run_batch('uid,op\n%s,delete\n' % uid)
+        self.assertEqual(res[0]['status'], 'ok')
+        self.assertIsNone(self.attr(uid, 'uid'))
+
+    def test_pipeline(self):
+        """Write errors are kept by tag until flushed"""
+        pipe = rbbatch.LDAPPipeline(self.udb.ldap)
+        pipe.tag = 1
+        pipe.modify_s(self.udb.uid2dn(self.uids[1]),
+                      [(ldap.MOD_REPLACE, 'loginShell', b'/bin/bash')])
+        pipe.tag = 2
+        pipe.delete_s(self.udb.uid2dn('nosuch'))
+        self.assertEqual(len(pipe.pending), 2)
+        pipe.flush()
+        self.assertEqual(list(pipe.failed), [2])
+        self.assertEqual(self.attr(self.uids[1], 'loginShell'), '/bin/bash')
+        pipe.tag = 3
+        pipe.delete_s(self.udb.uid2dn('nosuch'))
+        self.assertRaises(ldap.NO_SUCH_OBJECT, pipe.wait, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
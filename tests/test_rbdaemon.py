@@ -0,0 +1,173 @@
+"""RedBrick Test Module; Tests the rbdaemon module and useradm daemon."""
+
+import io
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from useradm import rbdaemon
+from useradm import useradm as cli
+
+try:
+    import ldap
+    from tests import dataset, fakeldap
+    # useradm uses the flat modules (see tests/__init__.py).
+    import rbaccount
+    import rbuserdb
+except ImportError:
+    ldap = None
+
+
+def echo(request, stdin, stdout, stderr):
+    """Handler echoing a line of input in upper case"""
+    print('argv: %s' % ' '.join(request['argv']), file=stdout)
+    stdout.write('Your name? ')
+    print(stdin.readline().strip().upper(), file=stdout)
+    print('done', file=stderr)
+    return 3
+
+
+class DaemonTestCase(unittest.TestCase):
+    """Base class running clients against a daemon on a scratch socket"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'useradm.sock')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def forward(self, argv, stdin=b''):
+        """Run argv in daemon, return (status, stdout, stderr)"""
+        stdout, stderr = io.BytesIO(), io.BytesIO()
+        status = rbdaemon.forward(self.path, argv, io.BytesIO(stdin), stdout,
+                                  stderr)
+        return status, stdout.getvalue().decode(), stderr.getvalue().decode()
+
+    def serve(self, serve, clients):
+        """Call serve() while clients() runs in a thread, then stop the
+        daemon with SIGTERM. Returns clients() return value."""
+        res = []
+
+        def run():
+            try:
+                for _ in range(1000):
+                    if os.path.exists(self.path):
+                        break
+                    time.sleep(0.01)
+                res.append(clients())
+            finally:
+                os.kill(os.getpid(), signal.SIGTERM)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        try:
+            serve()
+        except SystemExit:
+            pass
+        thread.join()
+        self.assertFalse(os.path.exists(self.path))
+        return res[0]
+
+
+class RBDaemonTestCase(DaemonTestCase):
+    """Test Case class for the daemon protocol"""
+
+    def test_no_daemon(self):
+        """Without a daemon the command is run locally"""
+        self.assertIsNone(rbdaemon.forward(self.path, ['list_users']))
+
+    def test_forward(self):
+        """Output, input and exit status are relayed"""
+        server = rbdaemon.RBDaemon(self.path, echo)
+        server.listen()
+        res = self.serve(server.serve,
+                         lambda: self.forward(['show', 'x'], b'alice\n'))
+        self.assertEqual(res, (3, 'argv: show x\nYour name? ALICE\n',
+                               'done\n'))
+
+    def test_input_eof(self):
+        """An end of file answer ends one read, the client is asked again
+        for the next"""
+        server, client = socket.socketpair()
+        answers = [b'', b'hello\n', b'']
+
+        def answer():
+            for data in answers:
+                try:
+                    kind, _ = rbdaemon.recv_frame(client)
+                except OSError:
+                    return
+                if kind == b'r':
+                    rbdaemon.send_frame(client, b'i', data)
+
+        client.settimeout(5)
+
+        thread = threading.Thread(target=answer)
+        thread.start()
+        stdin = io.TextIOWrapper(io.BufferedReader(
+            rbdaemon.FrameReader(server, lambda: None)))
+        try:
+            self.assertEqual([stdin.readline() for _ in answers],
+                             ['', 'hello\n', ''])
+        finally:
+            thread.join()
+            server.close()
+            client.close()
+
+    def test_allowed(self):
+        """Root and the daemon's own user are allowed, others not"""
+        server = rbdaemon.RBDaemon(self.path, echo, group=None)
+        self.assertTrue(server.allowed(0, 0))
+        self.assertTrue(server.allowed(os.geteuid(), 12345))
+        self.assertFalse(server.allowed(54321, 54321))
+
+
+@unittest.skipIf(ldap is None, 'python-ldap is not installed')
+class UseradmDaemonTestCase(DaemonTestCase):
+    """Test Case class for useradm commands run by the daemon"""
+
+    def setUp(self):
+        super().setUp()
+        data = dataset.Dataset(20)
+        data.write(self.tmpdir.name)
+        self.taken = data.users[0]['uid']
+        udb = rbuserdb.RBUserDB()
+        udb.ldap, udb.ldap_dcu = (fakeldap.load(
+            [os.path.join(self.tmpdir.name, i)], False)
+                                  for i in ('rb.ldif', 'dcu.ldif'))
+        self.saved = cli.UDB, cli.ACC, cli.OPT
+        cli.UDB, cli.ACC = udb, rbaccount.RBAccount()
+        cli.OPT = cli.RBOpt()
+        cli.OPT.args = [self.path]
+
+    def tearDown(self):
+        cli.UDB, cli.ACC, cli.OPT = self.saved
+        super().tearDown()
+
+    def test_commands(self):
+        """Commands run in the daemon give the same output as locally"""
+
+        def clients():
+            return (self.forward(['freename', 'nosuch']),
+                    self.forward(['freename', self.taken]),
+                    self.forward(['freename'], b'other\n'),
+                    self.forward(['disuser', self.taken]))
+
+        free, taken, asked, local = self.serve(cli.daemon, clients)
+        self.assertEqual(free, (0, "Username 'nosuch' is free.\n", ''))
+        self.assertEqual(taken[0], 1)
+        self.assertIn("Username '%s' is already taken" % self.taken, taken[1])
+        self.assertEqual(asked[0], 0)
+        self.assertIn('Enter new username', asked[1])
+        self.assertTrue(asked[1].endswith("Username 'other' is free.\n"))
+        self.assertEqual(local[0], 1)
+        self.assertIn('--local', local[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""RedBrick Test Module; Tests the rbexport module and paged user search."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+
+try:
+    import ldap
+    from tests import dataset, fakeldap
+    # Flat modules, as useradm uses them (see tests/__init__.py).
+    import rbexport
+    import rbuserdb
+except ImportError:
+    ldap = None
+
+
+@unittest.skipIf(ldap is None, 'python-ldap is not installed')
+class RBExportTestCase(unittest.TestCase):
+    """Test Case class for useradm export"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = dataset.Dataset(30)
+        self.data.write(self.tmpdir.name)
+        self.udb = rbuserdb.RBUserDB()
+        self.udb.ldap = fakeldap.load(
+            [os.path.join(self.tmpdir.name, 'rb.ldif')], False)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def export(self, fmt, attrs, filterstr, size=4):
+        """Return output of exporting given search."""
+
+        out = io.StringIO()
+        exporter = rbexport.RBExport(out, fmt, attrs)
+        exporter.export(
+            self.udb.search_paged(filterstr, exporter.attrlist, size))
+        return out.getvalue()
+
+    def test_filter(self):
+        """Paged search finds the same users as the list methods"""
+        paid = self.udb.filter_users(paid='grace')
+        self.assertEqual(
+            sorted(i[1]['uid'][0].decode()
+                   for i in self.udb.search_paged(paid, ['uid'], 3)),
+            sorted(self.udb.list_unpaid_grace()))
+        members = [i['uid'] for i in self.data.users
+                   if i['usertype'] == 'member' and i['newbie']]
+        found = self.udb.search_paged(
+            self.udb.filter_users(['member'], newbie=True), ['uid'], 2)
+        self.assertEqual(sorted(i[1]['uid'][0].decode() for i in found),
+                         sorted(members))
+        uids = [self.data.users[2]['uid'], self.data.users[5]['uid'], '*']
+        found = self.udb.search_paged(self.udb.filter_users(uids=uids),
+                                      ['uid'])
+        self.assertEqual(sorted(i[1]['uid'][0].decode() for i in found),
+                         sorted(uids[:2]))
+        self.assertRaises(rbuserdb.RBFatalError, self.udb.filter_users,
+                          ['nosuch'])
+        self.assertRaises(rbuserdb.RBFatalError, self.udb.filter_users,
+                          paid='maybe')
+
+    def test_formats(self):
+        """CSV, JSON lines and LDIF hold the projected attributes"""
+        usr = self.data.users[0]
+        filterstr = self.udb.filter_users(uids=[usr['uid']])
+        attrs = ['uid', 'usertype', 'uidNumber', 'host', 'birthday']
+        self.assertEqual(
+            self.export('csv', attrs, filterstr).splitlines(),
+            ['uid,usertype,uidNumber,host,birthday',
+             '%s,%s,%d,paphos;metharme,' % (usr['uid'], usr['usertype'],
+                                            usr['uidNumber'])])
+        self.assertEqual(
+            json.loads(self.export('jsonl', attrs, filterstr)), {
+                'uid': usr['uid'],
+                'usertype': usr['usertype'],
+                'uidNumber': usr['uidNumber'],
+                'host': ['paphos', 'metharme'],
+                'birthday': None
+            })
+        ldif = self.export('ldif', attrs, filterstr)
+        self.assertTrue(ldif.startswith('dn: uid=%s,' % usr['uid']))
+        self.assertIn('objectClass: %s\n' % usr['usertype'], ldif)
+        self.assertNotIn('birthday', ldif)
+
+        everyone = self.export('csv', ['uid'], self.udb.filter_users())
+        self.assertEqual(len(everyone.splitlines()), len(self.data.users) + 1)
+        self.assertRaises(rbexport.RBFatalError, rbexport.RBExport,
+                          io.StringIO(), 'xml')
+        self.assertRaises(rbexport.RBFatalError, rbexport.RBExport,
+                          io.StringIO(), 'csv', ['passwd'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""RedBrick Test Module; Tests the rbjournal module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from useradm import rbjournal
+
+
+class RBJournalTestCase(unittest.TestCase):
+    """Test Case class for the sync journal"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfile = os.path.join(self.tmpdir, 'sync.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_runs(self):
+        """Outcomes are kept per run and lookups span all runs"""
+        journal = rbjournal.RBJournal(self.dbfile)
+        journal.start_run('rrs.log', 'presync.txt')
+        journal.record('renew', None, 'started')
+        journal.record('renew', 'alice', 'mailed', 'alice@example.com')
+        journal.finish_run()
+        journal.close()
+
+        journal = rbjournal.RBJournal(self.dbfile)
+        journal.start_run()
+        journal.add_users('renew', 'mailed', ['bob', 'carol'])
+        self.assertEqual(journal.users('renew', 'mailed'),
+                         set(['alice', 'bob', 'carol']))
+        self.assertEqual(journal.users('add', 'mailed'), set())
+        self.assertEqual([i[0] for i in journal.runs()], [1, 2])
+        self.assertEqual(journal.last_run(), 2)
+        self.assertEqual([i[1:4] for i in journal.outcomes(1)],
+                         [('renew', None, 'started'),
+                          ('renew', 'alice', 'mailed')])
+        self.assertIsNone(journal.runs()[1][2])
+        journal.close()
+
+    def test_test_mode(self):
+        """Nothing is written in test mode"""
+        journal = rbjournal.RBJournal(self.dbfile, test=True)
+        journal.start_run()
+        journal.record('add', 'newb', 'created')
+        journal.finish_run()
+        self.assertEqual(journal.runs(), [])
+        self.assertEqual(journal.users('add', 'created'), set())
+        journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""RedBrick Test Module; Tests the rbldif module."""
+
+import io
+import os
+import unittest
+
+from useradm import rbldif
+
+LDIF_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'ldif')
+
+FOLDED = b'''version: 1
+
+# comment that is
+ folded
+dn: uid=newb,ou=accounts,o=redbrick
+uid: newb
+cn: a very long name that goes on and on and on and on and on and on and o
+ n and on
+userPassword:: e0NSWVBUfSo=
+description:: IGxlYWRpbmcgc3BhY2U=
+
+dn: uid=newb,ou=accounts,o=redbrick
+changetype: modify
+replace: yearsPaid
+yearsPaid: 1
+-
+replace: newbie
+newbie: FALSE
+'''
+
+
+class RBLDIFTestCase(unittest.TestCase):
+    """Test Case class for LDIF reading and writing"""
+
+    def test_parse(self):
+        """Folded lines, base64 values, comments and change records"""
+        entries = list(rbldif.parse(io.BytesIO(FOLDED)))
+        self.assertEqual(len(entries), 2)
+        entry, change = entries
+        self.assertEqual(entry.dn, 'uid=newb,ou=accounts,o=redbrick')
+        self.assertEqual(entry.get('CN'), 'a very long name that goes on and '
+                         'on and on and on and on and on and on and on')
+        self.assertEqual(entry.get('userPassword'), '{CRYPT}*')
+        self.assertEqual(entry.get('description'), ' leading space')
+        self.assertIsNone(entry.changetype)
+        self.assertEqual(change.changetype, 'modify')
+        self.assertEqual(change.attrs[3], ['-', ''])
+
+    def test_round_trip(self):
+        """Written entries read back the same, with long lines folded"""
+        entries = list(rbldif.parse(io.BytesIO(FOLDED)))
+        entries[0].add('jpegPhoto', b'\xff\xd8\x00binary'.decode(
+            'utf-8', 'surrogateescape'))
+        out = io.BytesIO()
+        rbldif.write(out, entries)
+        data = out.getvalue()
+        self.assertTrue(all(len(i) <= rbldif.LINE_WIDTH
+                            for i in data.split(b'\n')))
+        self.assertIn(b'description:: IGxlYWRpbmcgc3BhY2U=\n', data)
+        self.assertIn(b'\n-\n', data)
+        again = list(rbldif.parse(io.BytesIO(data)))
+        self.assertEqual([(i.dn, i.attrs) for i in again],
+                         [(i.dn, i.attrs) for i in entries])
+        self.assertEqual(
+            again[0].get('jpegPhoto').encode('utf-8', 'surrogateescape'),
+            b'\xff\xd8\x00binary')
+
+    def test_records(self):
+        """Raw records cover the whole file at the right offsets"""
+        data = open(os.path.join(LDIF_DIR, 'dcu_student.ldif'), 'rb').read()
+        records = list(rbldif.read_records(io.BytesIO(data)))
+        self.assertEqual(b''.join(i[1] for i in records), data)
+        for offset, raw in records:
+            self.assertEqual(data[offset:offset + len(raw)], raw)
+
+    def test_modify(self):
+        """Setting and removing attribute values"""
+        entry = rbldif.RBLDIFEntry('uid=x', [('host', 'a'), ('host', 'b'),
+                                             ('yearsPaid', '2')])
+        entry.add('host', 'c')
+        self.assertEqual(entry.get_all('host'), ['a', 'b', 'c'])
+        entry.set('host', 'd')
+        self.assertEqual(entry.attrs, [['host', 'd'], ['yearsPaid', '2']])
+        entry.remove('HOST')
+        entry.set('newbie', 'FALSE')
+        self.assertEqual(entry.attrs, [['yearsPaid', '2'],
+                                       ['newbie', 'FALSE']])
+
+
+if __name__ == '__main__':
+    unittest.main()
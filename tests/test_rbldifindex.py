@@ -0,0 +1,57 @@
+"""RedBrick Test Module; Tests the rbldifindex module."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from useradm import rbldifindex
+
+ENTRY = '''dn: uid=user%d,ou=accounts,o=redbrick
+uid: user%d
+cn: User number %d with a name long enough to be folded over more than one
+  line
+
+'''
+
+
+class RBLDIFIndexTestCase(unittest.TestCase):
+    """Test Case class for LDIF index lookups"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ldif = os.path.join(self.tmpdir, 'dump.ldif')
+        with open(self.ldif, 'w') as fd:
+            fd.write('version: 1\n\n')
+            for i in range(300):
+                fd.write(ENTRY % (i, i, i))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        """Entries are found by DN regardless of case and spacing"""
+        self.assertEqual(rbldifindex.build_index(self.ldif), 300)
+        index = rbldifindex.RBLDIFIndex(self.ldif)
+        self.assertEqual(len(index), 300)
+        entry = index.get('UID=user0, ou=accounts, o=redbrick')
+        self.assertEqual(entry.get('uid'), 'user0')
+        entry = index.get('uid=user299,ou=accounts,o=redbrick')
+        self.assertTrue(entry.get('cn').startswith('User number 299 with'))
+        self.assertIn('uid=user150,ou=accounts,o=redbrick', index)
+        self.assertNotIn('uid=user300,ou=accounts,o=redbrick', index)
+        index.close()
+
+    def test_stale(self):
+        """An index is rejected once the LDIF file changes"""
+        rbldifindex.build_index(self.ldif)
+        with open(self.ldif, 'a') as fd:
+            fd.write(ENTRY % (300, 300, 300))
+        os.utime(self.ldif, ns=(0, time.time_ns() + 10**9))
+        self.assertRaises(rbldifindex.RBFatalError, rbldifindex.RBLDIFIndex,
+                          self.ldif)
+
+
+if __name__ == '__main__':
+    unittest.main()
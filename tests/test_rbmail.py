@@ -0,0 +1,56 @@
+"""RedBrick Test Module; Tests the mail templates of the rbmail module."""
+
+import email
+import unittest
+
+from useradm import rbmail
+from useradm.rbuser import RBUser
+
+
+class RBMailTestCase(unittest.TestCase):
+    """Test Case class for RBMailTemplate"""
+
+    def setUp(self):
+        self.usr = RBUser(uid='newb', usertype='member', cn='New Member',
+                          altmail='newb@mail.dcu.ie', id=12345678,
+                          course='CASE', year='3', yearsPaid=0, newbie=True)
+
+    def test_welcome(self):
+        """Welcome mail is a complete message with optional lines"""
+        msg = email.message_from_string(rbmail.WELCOME.render(self.usr))
+        self.assertEqual(msg['To'], 'newb@mail.dcu.ie')
+        self.assertIsNotNone(msg['Date'])
+        self.assertIsNotNone(msg['Message-ID'])
+        body = msg.get_payload()
+        self.assertIn('Thank you for joining.', body)
+        self.assertIn('            id number: 12345678\n', body)
+        self.assertNotIn('password', body.split('---')[0])
+
+        self.usr.passwd = 'secret'
+        self.usr.course = None
+        body = email.message_from_string(
+            rbmail.WELCOME.render(self.usr)).get_payload()
+        self.assertIn('             password: secret\n\n', body)
+        self.assertNotIn('course:', body)
+
+    def test_unpaid_batch(self):
+        """Renewal reminders use template data and conditional headers"""
+        other = RBUser(self.usr, uid='old', yearsPaid=-1,
+                       altmail='old@redbrick.dcu.ie')
+        data = {'deadline': '30th October 2016', 'prices': 'Members EUR 4\n'}
+        res = rbmail.UNPAID.render_batch((self.usr, other), data)
+        self.assertEqual([i[0] for i in res],
+                         ['newb@mail.dcu.ie', 'old@redbrick.dcu.ie'])
+
+        msg = email.message_from_string(res[0][1])
+        self.assertEqual(msg['Cc'], 'newb@mail.dcu.ie')
+        self.assertIn('renew by the 30th October 2016', msg.get_payload())
+        self.assertIn('Members EUR 4\n', msg.get_payload())
+
+        msg = email.message_from_string(res[1][1])
+        self.assertIsNone(msg['Cc'])
+        self.assertIn('WILL BE\nDELETED', msg.get_payload())
+
+
+if __name__ == "__main__":
+    unittest.main()
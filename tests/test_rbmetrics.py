@@ -0,0 +1,57 @@
+"""RedBrick Test Module; Tests the rbmetrics module."""
+
+import os
+import tempfile
+import unittest
+
+from tests.standin import UserDB
+from useradm import rbmetrics
+
+
+class RBMetricsTestCase(unittest.TestCase):
+    """Test Case class for RRS metrics"""
+
+    def test_observe(self):
+        """Histogram buckets are cumulative"""
+        metrics = rbmetrics.RBMetrics()
+        metrics.observe('rrs_request_seconds', 0.02, mode='card')
+        metrics.observe('rrs_request_seconds', 3, mode='card')
+        hist = metrics.histograms['rrs_request_seconds']['mode="card"']
+        self.assertEqual(hist['count'], 2)
+        self.assertEqual(hist['buckets'][rbmetrics.BUCKETS.index(0.025)], 1)
+        self.assertEqual(hist['buckets'][rbmetrics.BUCKETS.index(5)], 2)
+        self.assertEqual(rbmetrics.label_string({'op': 'a"b'}), 'op="a\\"b"')
+
+    def test_save(self):
+        """LDAP calls are recorded per backend and totals merged across
+        requests into the exposition file"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            state = os.path.join(tmpdir, 'metrics.json')
+            filename = os.path.join(tmpdir, 'metrics.prom')
+            for _ in range(2):
+                metrics = rbmetrics.RBMetrics()
+                udb = UserDB()
+                metrics.instrument(udb)
+                udb.ldap.search_s('o=rb', 1, '(uid=a)')
+                udb.ldap_dcu.search_s('o=dcu', 1, '(uid=a)')
+                metrics.observe('rrs_request_seconds', 0.1, mode='card',
+                                stage='action')
+                metrics.inc('rrs_errors_total', mode='card')
+                metrics.save(state, filename)
+            with open(filename) as fd:
+                lines = fd.read().splitlines()
+
+        self.assertIn('# TYPE rrs_ldap_seconds histogram', lines)
+        self.assertIn('rrs_ldap_seconds_count{backend="dcu",op="search_s"} 2',
+                      lines)
+        self.assertIn('rrs_ldap_seconds_bucket{backend="rb",op="search_s",'
+                      'le="+Inf"} 2', lines)
+        self.assertIn('rrs_ldap_bytes_total{backend="rb",op="search_s"} 42',
+                      lines)
+        self.assertIn('rrs_request_seconds_bucket{mode="card",stage="action",'
+                      'le="0.1"} 2', lines)
+        self.assertIn('rrs_errors_total{mode="card"} 2', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
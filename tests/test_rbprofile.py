@@ -0,0 +1,43 @@
+"""RedBrick Test Module; Tests the rbprofile module."""
+
+import io
+import unittest
+
+from tests.standin import UserDB
+from useradm import rbprofile
+
+
+class RBProfileTestCase(unittest.TestCase):
+    """Test Case class for operation counters"""
+
+    def test_percentile(self):
+        """Nearest rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(rbprofile.percentile(values, 50), 50)
+        self.assertEqual(rbprofile.percentile(values, 99), 99)
+        self.assertEqual(rbprofile.percentile([7], 90), 7)
+
+    def test_instrument(self):
+        """LDAP calls, wrapped writes and bytes returned are counted"""
+        profile = rbprofile.RBProfile()
+        udb = UserDB()
+        profile.instrument(udb)
+        for _ in range(3):
+            udb.ldap.search_s('o=rb', 1, '(uid=a)')
+        udb.wrapper(udb.ldap.modify_s, 'uid=a,o=rb', [])
+        self.assertEqual(len(profile.times['ldap.search_s']), 3)
+        self.assertEqual(profile.bytes['ldap.search_s'], 3 * 21)
+        self.assertEqual(len(profile.times['wrapper.modify_s']), 1)
+        self.assertEqual(len(profile.times['ldap.modify_s']), 1)
+
+        out = io.StringIO()
+        profile.report(out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('operation'))
+        self.assertEqual([i.split()[:2] for i in lines[1:]],
+                         [['ldap.modify_s', '1'], ['ldap.search_s', '3'],
+                          ['wrapper.modify_s', '1']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""RedBrick Test Module; Tests the rbrrslog module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from useradm import rbrrslog
+
+LOG = [
+    '2016-09-20 12:00:01:cain:renew:alice:member:0\n',
+    '2016-09-20 12:01:00:cain:rename-existing:alice:alicia\n',
+    '2016-09-20 12:02:00:cain:convert:bob:associat\n',
+]
+
+
+class RBRRSLogTestCase(unittest.TestCase):
+    """Test Case class for incremental rrs.log processing"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.tmpdir, 'rrs.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, lines, mode='a'):
+        """Write given lines to the log file"""
+        with open(self.logfile, mode) as fd:
+            fd.write(''.join(lines))
+
+    def test_maps(self):
+        """Renames carry password and convert flags to the new username"""
+        self.write(LOG + ['2016-09-20 12:03:00:cain:rename-existing:bob:bobby\n'])
+        rrslog = rbrrslog.RBRRSLog(self.logfile)
+        self.assertEqual(rrslog.update(), 4)
+        self.assertEqual(rrslog.user_rename(), {'alice': 'alicia', 'bob': 'bobby'})
+        self.assertEqual(rrslog.reset_password, {'alicia': 0})
+        self.assertEqual(rrslog.user_convert, {'bobby': 1})
+
+    def test_incremental(self):
+        """Only new complete lines are read and state survives a reload"""
+        self.write(LOG[:2] + ['2016-09-20 12:02:00:cain:conv'])
+        rrslog = rbrrslog.RBRRSLog(self.logfile)
+        self.assertEqual(rrslog.update(), 2)
+        rrslog.set_stage_done('rename')
+
+        rrslog = rbrrslog.RBRRSLog(self.logfile)
+        self.assertTrue(rrslog.stage_done('rename'))
+        self.assertEqual(rrslog.update(), 0)
+        self.assertTrue(rrslog.stage_done('rename'))
+
+        self.write(['ert:bob:associat\n'])
+        self.assertEqual(rrslog.update(), 1)
+        self.assertFalse(rrslog.stage_done('rename'))
+        self.assertEqual(rrslog.user_convert, {'bob': 1})
+        self.assertEqual(rrslog.user_rename(), {'alice': 'alicia'})
+
+    def test_invalid_utf8(self):
+        """A line that isn't UTF-8 is skipped, not fatal"""
+        with open(self.logfile, 'wb') as fd:
+            fd.write(LOG[0].encode() +
+                     b'2016-09-20 12:00:30:cain:renew:\xe9:member:1\n' +
+                     ''.join(LOG[1:]).encode())
+        rrslog = rbrrslog.RBRRSLog(self.logfile)
+        self.assertEqual(rrslog.update(), 3)
+        self.assertEqual(rrslog.user_rename(), {'alice': 'alicia'})
+        self.assertEqual(rrslog.reset_password, {'alicia': 0})
+
+    def test_truncated(self):
+        """A new shorter log starts processing from scratch"""
+        self.write(LOG)
+        rrslog = rbrrslog.RBRRSLog(self.logfile)
+        rrslog.update()
+        rrslog.save()
+        self.write(LOG[2:], 'w')
+        rrslog = rbrrslog.RBRRSLog(self.logfile)
+        self.assertEqual(rrslog.update(), 1)
+        self.assertEqual(rrslog.user_rename(), {})
+        self.assertEqual(rrslog.reset_password, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
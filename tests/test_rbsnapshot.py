@@ -0,0 +1,60 @@
+"""RedBrick Test Module; Tests the rbsnapshot module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from useradm import rbsnapshot
+
+OLD_LDAP = {
+    'newb': {'homeDirectory': '/home/member/n/newb', 'usertype': 'member'},
+    'admin': {'homeDirectory': '/home/committe/admin',
+              'usertype': 'committe'},
+    'zed': {'homeDirectory': '/home/associat/z/zed', 'usertype': 'associat'},
+}
+
+
+class RBSnapshotTestCase(unittest.TestCase):
+    """Test Case class for snapshot files"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.snapfile = os.path.join(self.tmpdir, 'presync.snap')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        """Records can be looked up by username"""
+        rbsnapshot.write_snapshot(self.snapfile, OLD_LDAP)
+        self.assertTrue(rbsnapshot.is_snapshot(self.snapfile))
+        snap = rbsnapshot.RBSnapshot(self.snapfile)
+        self.assertEqual(len(snap), 3)
+        self.assertEqual(list(snap), ['admin', 'newb', 'zed'])
+        self.assertEqual(snap['newb']['homeDirectory'], '/home/member/n/newb')
+        self.assertEqual(snap['zed']['usertype'], 'associat')
+        self.assertIsNone(snap['admin']['uidNumber'])
+        self.assertNotIn('nobody', snap)
+        self.assertIsNone(snap.get('aaa'))
+        self.assertRaises(KeyError, snap.__getitem__, 'zzz')
+        snap.close()
+
+    def test_convert(self):
+        """Old pprint style pre_sync files are converted"""
+        oldfile = os.path.join(self.tmpdir, 'presync.txt')
+        with open(oldfile, 'w') as fd:
+            fd.write('global old_ldap\nold_ldap = ')
+            fd.write(repr(dict((k.encode(), v) for k, v in OLD_LDAP.items())))
+        self.assertFalse(rbsnapshot.is_snapshot(oldfile))
+        self.assertRaises(rbsnapshot.RBFatalError, rbsnapshot.RBSnapshot, oldfile)
+
+        self.assertEqual(rbsnapshot.convert_pre_sync(oldfile, self.snapfile), 3)
+        snap = rbsnapshot.RBSnapshot(self.snapfile)
+        self.assertEqual(dict((k, v['usertype']) for k, v in snap.items()),
+                         dict((k, v['usertype']) for k, v in OLD_LDAP.items()))
+        snap.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""RedBrick Test Module; Tests the rbstats module."""
+
+import contextlib
+import io
+import unittest
+
+from useradm import rbstats
+
+ENTRY = '''dn: uid=%(uid)s,ou=accounts,o=redbrick
+uid: %(uid)s
+objectClass: %(usertype)s
+objectClass: posixAccount
+%(extra)s
+'''
+
+
+def gen_ldif(users):
+    """Return LDIF for given (uid, usertype, extra lines) tuples"""
+    return ''.join(ENTRY % {'uid': uid, 'usertype': usertype, 'extra': extra}
+                   for uid, usertype, extra in users).encode()
+
+
+class RBStatsTestCase(unittest.TestCase):
+    """Test Case class for stats from an LDIF dump"""
+
+    LDIF = gen_ldif([
+        ('alice', 'member', 'yearsPaid: 1\nnewbie: TRUE\n'),
+        ('bob', 'member', 'yearsPaid: 0\nnewbie: FALSE\n'),
+        ('carol', 'committe', 'yearsPaid: 2\n'),
+        ('dave', 'society', ''),
+        ('eve', 'staff', 'yearsPaid: 1\n'),
+    ]) + b'''dn: uid=frank,ou=reserved,o=redbrick
+uid: frank
+objectClass: member
+
+dn: cn=uidNumber,o=redbrick
+objectClass: uidNumberCounter
+uidNumber: 5
+
+'''
+
+    def test_counts(self):
+        """Accounts are counted by usertype, payment and signed-in status"""
+        stats = rbstats.from_ldif(io.BytesIO(self.LDIF),
+                                  {'alice', 'dave'})
+        member = stats.usertypes['member']
+        self.assertEqual((member['TOTAL'], member['paid'], member['unpaid'],
+                          member['signed_newbie'], member['nosign_unpaid']),
+                         (2, 1, 1, 1, 1))
+        self.assertEqual(stats.usertypes['society']['signed_nonpay'], 1)
+        self.assertEqual(stats.totals()['TOTAL'], 5)
+        self.assertEqual(stats.quorum(), (3, 2))
+
+    def test_report(self):
+        """Report prints with no one signed in or no newbies"""
+        for ldif in self.LDIF, b'':
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                rbstats.from_ldif(io.BytesIO(ldif), None).report()
+            self.assertIn('Quorum (rounded-up square root of above):',
+                          out.getvalue())
+        self.assertIn('0 of 0 newbies signed-in (0%)', out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
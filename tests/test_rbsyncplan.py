@@ -0,0 +1,134 @@
+"""RedBrick Test Module; Tests the rbsyncplan module."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from useradm import rbconfig, rbldif, rbsnapshot, rbsyncplan
+
+OLD_LDAP = {
+    'alice': {'usertype': 'member', 'uidNumber': '1001', 'id': '1111'},
+    'bob': {'usertype': 'member', 'uidNumber': '1002', 'id': '2222'},
+    'carol': {'usertype': 'member', 'uidNumber': '1003', 'id': '3333'},
+    'dave': {'usertype': 'associat', 'uidNumber': '1004', 'id': None},
+    'eve': {'usertype': 'member', 'uidNumber': '1005', 'id': '5555'},
+}
+
+NEW_LDAP = {
+    # Renamed and converted.
+    'alicia': {'usertype': 'associat', 'uidNumber': '1001', 'id': '1111',
+               'yearsPaid': '1', 'newbie': 'FALSE'},
+    # Unchanged, not renewed.
+    'bob': {'usertype': 'member', 'uidNumber': '1002', 'id': '2222',
+            'yearsPaid': '-1', 'newbie': 'FALSE'},
+    # Recreated with a new uidNumber, matched on id.
+    'carl': {'usertype': 'member', 'uidNumber': '2003', 'id': '3333',
+             'yearsPaid': '1', 'newbie': 'FALSE'},
+    # Converted, renewed.
+    'dave': {'usertype': 'staff', 'uidNumber': '1004', 'id': None,
+             'yearsPaid': '2', 'newbie': 'FALSE'},
+    # New, reusing eve's uidNumber.
+    'newb': {'usertype': 'member', 'uidNumber': '1005', 'id': '6666',
+             'yearsPaid': '1', 'newbie': 'TRUE'},
+}
+
+
+class RBSyncPlanTestCase(unittest.TestCase):
+    """Test Case class for deriving sync actions"""
+
+    def check(self, plan):
+        """Check plan for OLD_LDAP -> NEW_LDAP"""
+        self.assertEqual(plan.renames, {'alice': 'alicia', 'carol': 'carl'})
+        self.assertEqual(plan.converts, {'alicia': ('member', 'associat'),
+                                         'dave': ('associat', 'staff')})
+        self.assertEqual(plan.adds, ['newb'])
+        self.assertEqual(plan.deletes, ['eve'])
+        self.assertEqual(plan.renewals, ['alicia', 'carl', 'dave'])
+        self.assertEqual(plan.user_rename_reverse['carl'], 'carol')
+        self.assertEqual(plan.reset_password, {'alicia': 0, 'carl': 0,
+                                               'dave': 0})
+
+    def test_plan(self):
+        """Accounts are matched on uidNumber, id then username"""
+        plan = rbsyncplan.RBSyncPlan(OLD_LDAP, NEW_LDAP)
+        self.check(plan)
+        self.assertEqual(plan.report()[-1],
+                         '2 renames, 2 converts, 1 deletes, 1 adds, '
+                         '3 renewals')
+
+    def test_snapshots(self):
+        """Snapshot files can be compared directly"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            oldfile = os.path.join(tmpdir, 'old.snap')
+            newfile = os.path.join(tmpdir, 'new.snap')
+            rbsnapshot.write_snapshot(oldfile, OLD_LDAP)
+            rbsnapshot.write_snapshot(newfile, NEW_LDAP)
+            old = rbsnapshot.RBSnapshot(oldfile)
+            new = rbsnapshot.RBSnapshot(newfile)
+            self.check(rbsyncplan.RBSyncPlan(old, new))
+            old.close()
+            new.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_ldif(self):
+        """An LDIF dump can be the new tree"""
+        fd = io.BytesIO()
+        rbldif.write(fd, [
+            rbldif.RBLDIFEntry(rbconfig.LDAP_ACCOUNTS_TREE,
+                               [('objectClass', 'organizationalUnit')])
+        ] + [
+            rbldif.RBLDIFEntry(
+                'uid=%s,%s' % (uid, rbconfig.LDAP_ACCOUNTS_TREE),
+                [('objectClass', 'posixAccount'),
+                 ('objectClass', rec['usertype']), ('uid', uid)] +
+                [(key, rec[key]) for key in ('uidNumber', 'id', 'yearsPaid',
+                                             'newbie') if rec[key]])
+            for uid, rec in NEW_LDAP.items()
+        ])
+        fd.seek(0)
+        new = rbsyncplan.read_ldif(fd)
+        self.assertEqual(sorted(new), sorted(NEW_LDAP))
+        self.assertIsNone(new['dave']['id'])
+        self.check(rbsyncplan.RBSyncPlan(OLD_LDAP, new))
+
+    def test_old_pre_sync(self):
+        """Renames of accounts in a converted old style pre_sync dump come
+        from the rrs.log rename map"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            oldfile = os.path.join(tmpdir, 'pre_sync')
+            with open(oldfile, 'w') as fd:
+                fd.write('old_ldap = %r\n' % dict(
+                    (uid, {'homeDirectory': '/home/%s' % uid,
+                           'usertype': rec['usertype']})
+                    for uid, rec in OLD_LDAP.items()))
+            rbsnapshot.convert_pre_sync(oldfile, oldfile + '.snap')
+            old = rbsnapshot.RBSnapshot(oldfile + '.snap')
+
+            plan = rbsyncplan.RBSyncPlan(old, NEW_LDAP)
+            self.assertEqual(plan.renames, {})
+            self.assertIn('5 old accounts have no uidNumber or id',
+                          plan.warnings[0])
+
+            plan = rbsyncplan.RBSyncPlan(old, NEW_LDAP, renames={
+                'alice': 'alicia', 'carol': 'carl', 'eve': 'gone'})
+            self.check(plan)
+            self.assertEqual(plan.warnings, [])
+            old.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_duplicates(self):
+        """Duplicate uidNumbers in the old tree are not used for matching"""
+        old = dict(OLD_LDAP, zed={'usertype': 'member', 'uidNumber': '1002'})
+        plan = rbsyncplan.RBSyncPlan(old, NEW_LDAP)
+        self.assertEqual(plan.deletes, ['eve', 'zed'])
+        self.assertIn('uidNumber 1002', plan.warnings[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""RedBrick Test Module; Tests the rbtransform module."""
+
+import io
+import unittest
+
+from useradm import rbldif, rbtransform
+
+ENTRY = '''dn: uid=user%d,ou=accounts,o=redbrick
+uid: user%d
+uidNumber: %d
+yearsPaid: %d
+newbie: TRUE
+
+'''
+
+
+def gen_ldif(count):
+    """Return LDIF with count entries, every third needing a uidNumber"""
+    return ''.join(ENTRY % (i, i, -1 if i % 3 == 0 else 1000 + i, i % 5)
+                   for i in range(count)).encode()
+
+
+class RBTransformTestCase(unittest.TestCase):
+    """Test Case class for the LDIF transform pipeline"""
+
+    def run_chain(self, names, processes, count=1200):
+        """Return transformed entries"""
+        out = io.BytesIO()
+        total = rbtransform.transform(io.BytesIO(gen_ldif(count)), out, names,
+                                      processes, {'uidNumber': 5000})
+        self.assertEqual(total, count)
+        return list(rbldif.parse(io.BytesIO(out.getvalue())))
+
+    def test_order(self):
+        """Parallel output matches serial output and keeps input order"""
+        names = ['yearsPaid', 'newbie', 'uidNumber']
+        serial = self.run_chain(names, 1)
+        parallel = self.run_chain(names, 3)
+        self.assertEqual([(i.dn, i.attrs) for i in serial],
+                         [(i.dn, i.attrs) for i in parallel])
+        self.assertEqual(parallel[7].dn, 'uid=user7,ou=accounts,o=redbrick')
+        self.assertEqual(parallel[7].get('yearsPaid'), '1')
+        self.assertEqual(parallel[7].get('newbie'), 'FALSE')
+        self.assertEqual([parallel[i].get('uidNumber') for i in (0, 1, 3, 6)],
+                         ['5000', '1001', '5001', '5002'])
+
+    def test_unknown(self):
+        """Unknown transforms are rejected"""
+        self.assertRaises(rbtransform.RBFatalError, rbtransform.transform,
+                          io.BytesIO(), io.BytesIO(), ['nosuch'])
+
+
+if __name__ == '__main__':
+    unittest.main()
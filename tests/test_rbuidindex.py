@@ -0,0 +1,48 @@
+"""RedBrick Test Module; Tests the rbuidindex module."""
+
+import unittest
+
+from useradm.rbuidindex import RBUidNumberIndex
+
+PAIRS = [('a', 100), ('b', 101), ('c', 102), ('d', 105), ('e', 106),
+         ('f', 110), ('g', 101), ('h', '102')]
+
+
+class RBUidNumberIndexTestCase(unittest.TestCase):
+    """Test Case class for the uidNumber index"""
+
+    def setUp(self):
+        self.index = RBUidNumberIndex(PAIRS)
+
+    def test_lookup(self):
+        """Max, membership and duplicates"""
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.max(), 110)
+        self.assertIn(105, self.index)
+        self.assertNotIn(103, self.index)
+        self.assertEqual(self.index.duplicates(),
+                         [(101, ['b', 'g']), (102, ['c', 'h'])])
+        self.assertEqual(RBUidNumberIndex([]).max(), -1)
+
+    def test_next_free(self):
+        """Next free uidNumber skips runs of used ones"""
+        self.assertEqual(self.index.next_free(0), 0)
+        self.assertEqual(self.index.next_free(100), 103)
+        self.assertEqual(self.index.next_free(102), 103)
+        self.assertEqual(self.index.next_free(104), 104)
+        self.assertEqual(self.index.next_free(105), 107)
+        self.assertEqual(self.index.next_free(110), 111)
+
+    def test_free_ranges(self):
+        """Free ranges between used uidNumbers"""
+        self.assertEqual(list(self.index.free_ranges(100)),
+                         [(103, 104), (107, 109)])
+        self.assertEqual(list(self.index.free_ranges(98, 112)),
+                         [(98, 99), (103, 104), (107, 109), (111, 112)])
+        self.assertTrue(self.index.is_free(107, 3))
+        self.assertFalse(self.index.is_free(107, 4))
+        self.assertTrue(self.index.is_free(111, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
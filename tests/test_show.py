@@ -0,0 +1,114 @@
+"""RedBrick Test Module; Tests useradm show and info for many users."""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from useradm import useradm as cli
+
+try:
+    import ldap
+    from tests import dataset, fakeldap
+    # useradm uses the flat modules (see tests/__init__.py).
+    import rbaccount
+    import rbconfig
+    import rbuserdb
+except ImportError:
+    ldap = None
+
+
+@unittest.skipIf(ldap is None, 'python-ldap is not installed')
+class ShowTestCase(unittest.TestCase):
+    """Test Case class for show and info commands"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = dataset.Dataset(20, root=self.tmpdir.name)
+        self.data.write(self.tmpdir.name)
+        dirs = self.data.skeleton(newbies=False)
+        self.patch = mock.patch.object(rbconfig, 'DIR_SIGNAWAY_STATE',
+                                       dirs['DIR_SIGNAWAY_STATE'])
+        self.patch.start()
+        self.udb = rbuserdb.RBUserDB()
+        self.udb.ldap = fakeldap.load(
+            [os.path.join(self.tmpdir.name, 'rb.ldif')], False)
+        self.searches = 0
+        search_s = self.udb.ldap.search_s
+
+        def counted(*args, **kwargs):
+            self.searches += 1
+            return search_s(*args, **kwargs)
+
+        self.udb.ldap.search_s = counted
+        self.saved = cli.UDB, cli.ACC, cli.OPT
+        cli.UDB, cli.ACC = self.udb, rbaccount.RBAccount()
+        cli.OPT = cli.RBOpt()
+
+    def tearDown(self):
+        cli.UDB, cli.ACC, cli.OPT = self.saved
+        self.patch.stop()
+        self.tmpdir.cleanup()
+
+    def run_command(self, command, args, stdin=''):
+        """Run command with given arguments, return (status, output,
+        errors)."""
+
+        cli.OPT.args = list(args)
+        out, err = io.StringIO(), io.StringIO()
+        status = 0
+        with contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(err), \
+                mock.patch('sys.stdin', io.StringIO(stdin)):
+            try:
+                getattr(cli, command)()
+            except SystemExit as exit:
+                status = exit.code
+        return status, out.getvalue(), err.getvalue()
+
+    def test_show(self):
+        """Users are shown in the order given, found with one search"""
+        old = [i for i in self.data.users if not i['newbie']][:2]
+        newbie = [i for i in self.data.users if i['newbie']][0]
+        byid = [i for i in self.data.users if i['id']][-1]
+        status, out, err = self.run_command(
+            'show', [old[1]['uid'], 'nosuch', '-', str(byid['id'])],
+            '%s Bad!\n' % old[0]['uid'])
+        self.assertEqual(status, 1)
+        self.assertEqual(self.searches, 1)
+
+        uids = [line.split(': ')[1] for line in out.splitlines()
+                if line.strip().startswith('uid:')]
+        self.assertEqual(uids, [old[1]['uid'], old[0]['uid'], byid['uid']])
+        self.assertEqual(err.splitlines(), [
+            "FATAL: User 'nosuch' does not exist",
+            'FATAL: Invalid characters in username'
+        ])
+        self.assertEqual(out.count('Account Information'), 3)
+        self.assertEqual(out.count('homedir mode: 0711'),
+                         2 + (not byid['newbie']))
+
+        status, out, err = self.run_command('show', [newbie['uid']])
+        self.assertEqual(status, 0)
+        self.assertIn('homedir mode: Home directory does not exist', out)
+
+        # A user given twice is shown twice and is not an error.
+        #
+        status, out, err = self.run_command('show', [old[0]['uid']] * 2)
+        self.assertEqual((status, err), (0, ''))
+        self.assertEqual(out.count('Account Information'), 2)
+
+    def test_info(self):
+        """info shows no account details"""
+        uids = [i['uid'] for i in self.data.users[:3]]
+        status, out, _ = self.run_command('info', uids)
+        self.assertEqual(status, 0)
+        self.assertEqual(out.count('User Information'), 3)
+        self.assertNotIn('Account Information', out)
+        self.assertNotIn('userPassword', out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+"""RedBrick Test Module; Tests useradm loads only what a command needs."""
+
+import os
+import subprocess
+import sys
+import unittest
+
+from tests import startup
+from useradm import useradm as cli
+
+# Print which of the lazily imported modules useradm -h loaded.
+#
+CHECK = '''
+import runpy, sys
+sys.path.insert(0, %r)
+sys.argv = ['useradm', '-h']
+try:
+    runpy.run_path(%r, run_name='__main__')
+except SystemExit:
+    pass
+print(','.join(i for i in ('ldap', 'rbuserdb', 'rbaccount', 'readline',
+                           'rbmail', 'rbjournal') if i in sys.modules))
+'''
+
+
+class StartupTestCase(unittest.TestCase):
+    """Test Case class for command dispatch and lazy imports"""
+
+    def test_backends(self):
+        """Every command says which backends it needs"""
+        self.assertEqual(set(cli.CMDS_BACKENDS), set(cli.CMDS))
+        for cmd, backends in cli.CMDS_BACKENDS.items():
+            self.assertTrue(set(backends) <= {'userdb', 'dcu', 'account'})
+            if 'dcu' in backends:
+                self.assertIn('userdb', backends, cmd)
+        self.assertEqual(cli.CMDS_BACKENDS['freename'], ('userdb', ))
+
+    def test_help(self):
+        """useradm -h imports no database or account modules"""
+        proc = subprocess.run(
+            [sys.executable, '-c', CHECK % (startup.DIR_USERADM, os.path.join(
+                startup.DIR_USERADM, 'useradm.py'))],
+            capture_output=True, text=True, stdin=subprocess.DEVNULL)
+        self.assertIn('Usage: useradm command', proc.stdout)
+        self.assertEqual(proc.stdout.splitlines()[-1], '')
+
+
+if __name__ == '__main__':
+    unittest.main()
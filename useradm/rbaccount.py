@@ -4,10 +4,12 @@
 """RedBrick Account Module; contains RBAccount class."""
 
 # System modules
+import concurrent.futures
 import os
 import re
 import shutil
 import sys
+import time
 
 import rbconfig
 from rberror import RBFatalError, RBWarningError
@@ -30,6 +32,11 @@ __author__ = 'Cillian Sharkey'
 class RBAccount:
     """Class to interface with Unix accounts."""
 
+    # Signed-in usernames from the last scan of the signaway state
+    # directory, keyed on (directory, mtime) of that scan.
+    #
+    signed_in_cache = (None, frozenset())
+
     def __init__(self):
         """Create new RBAccount object."""
 
@@ -52,7 +59,7 @@ class RBAccount:
         webtree = rbconfig.gen_webtree(usr.uid)
         self.wrapper(os.mkdir, webtree, 0o711)
         self.wrapper(os.chown, webtree, usr.uidNumber, usr.gidNumber)
-        self.cmd('%s -Rp %s %s' % (rbconfig.command_cp, rbconfig.dir_skel,
+        self.cmd('%s -Rp %s %s' % (rbconfig.COMMAND_CP, rbconfig.DIR_SKEL,
                                    usr.homeDirectory))
         self.wrapper(os.chmod, usr.homeDirectory, 0o711)
         self.wrapper(os.symlink, webtree,
@@ -69,7 +76,7 @@ class RBAccount:
         # alternate email address, but only if they're a dcu person and
         # have an alternate email that's not a redbrick address.
         #
-        if (usr.usertype in rbconfig.usertypes_dcu and usr.altmail and not
+        if (usr.usertype in rbconfig.USERTYPES_DCU and usr.altmail and not
                 re.search(r'@.*redbrick\.dcu\.ie', usr.altmail)):
             forward_file = os.path.join(usr.homeDirectory, '.forward')
             forwards = self.my_open(forward_file)
@@ -80,7 +87,7 @@ class RBAccount:
         # Change user & group ownership recursively on home directory.
         #
         self.cmd('%s -Rh %s:%s %s' %
-                 (rbconfig.command_chown, usr.uidNumber, usr.usertype,
+                 (rbconfig.COMMAND_CHOWN, usr.uidNumber, usr.usertype,
                   self.shquote(usr.homeDirectory)))
 
         # Set quotas for each filesystem.
@@ -210,13 +217,13 @@ class RBAccount:
 
         # Do supplementary group shit in rbuserdb.
         #
-        # if rbconfig.convert_primary_groups.has_key(usertype):
-        #       group = rbconfig.convert_primary_groups[usertype]
+        # if rbconfig.CONVERT_PRIMARY_GROUPS.has_key(usertype):
+        #       group = rbconfig.CONVERT_PRIMARY_GROUPS[usertype]
         # else:
         #       group = usertype
 
-        # if rbconfig.convert_extra_groups.has_key(usertype):
-        #       groups = '-G ' + rbconfig.convert_extra_groups[usertype]
+        # if rbconfig.CONVERT_EXTRA_GROUPS.has_key(usertype):
+        #       groups = '-G ' + rbconfig.CONVERT_EXTRA_GROUPS[usertype]
         # else:
         #       groups = ''
 
@@ -251,7 +258,7 @@ class RBAccount:
         # important!!
         #
         self.cmd("%s -Rh %s %s %s" %
-                 (rbconfig.command_chgrp, newusr.gidNumber,
+                 (rbconfig.COMMAND_CHGRP, newusr.gidNumber,
                   self.shquote(newusr.homeDirectory),
                   self.shquote(rbconfig.gen_webtree(oldusr.uid))))
 
@@ -286,7 +293,7 @@ class RBAccount:
         function in rbconfig module."""
 
         self.cmd("%s -r %s %d %d %d %d %s" %
-                 (rbconfig.command_setquota, self.shquote(str(username)), bqs,
+                 (rbconfig.COMMAND_SETQUOTA, self.shquote(str(username)), bqs,
                   bqh, iqs, iqh, filesystem))
 
     def quota_delete(self, username, filesystem):
@@ -299,19 +306,49 @@ class RBAccount:
     # ------------------------------------------------------------------- #
 
     @classmethod
-    def show(cls, usr):
-        """Show account details on standard output."""
+    def show(cls, usr, dirstat=None):
+        """Show account details on standard output. dirstat is a
+        stat_dirs() result to take the home directory from, if given."""
 
         print("%13s:" % 'homedir mode', end=' ')
-        if os.path.isdir(usr.homeDirectory):
-            print('%04o' % (os.stat(usr.homeDirectory)[0] & 0o7777))
+        if dirstat is not None:
+            home = dirstat.get(usr.homeDirectory)
+        elif os.path.isdir(usr.homeDirectory):
+            home = os.stat(usr.homeDirectory)
+        else:
+            home = None
+        if home is not None:
+            print('%04o' % (home.st_mode & 0o7777))
         else:
             print('Home directory does not exist')
-        print("%13s: %s" % (
-            'logged in',
-            os.path.exists(
-                os.path.join(rbconfig.dir_signaway_state, usr.uid)
-            ) and 'true' or 'false'))
+        print("%13s: %s" % ('logged in', usr.uid in cls.signed_in() and
+                            'true' or 'false'))
+
+    @classmethod
+    def signed_in(cls):
+        """Return set of usernames that have signed in (i.e. have a file
+        in the signaway state directory).
+
+        The directory is read with one scandir and the set is kept until
+        the directory's mtime changes, so repeated checks only cost one
+        stat. A scan in the same second as the last change is not cached
+        as a file added later in that second may not change the mtime on
+        filesystems with coarse timestamps (e.g. NFS)."""
+
+        directory = rbconfig.DIR_SIGNAWAY_STATE
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return frozenset()
+        if cls.signed_in_cache[0] == (directory, mtime):
+            return cls.signed_in_cache[1]
+
+        with os.scandir(directory) as entries:
+            uids = frozenset(i.name for i in entries
+                             if not i.name.startswith('.'))
+        if time.time_ns() - mtime > 1000000000:
+            cls.signed_in_cache = ((directory, mtime), uids)
+        return uids
 
     # ------------------------------------------------------------------- #
     # USER CHECKING AND INFORMATION RETRIEVAL METHODS                     #
@@ -334,6 +371,50 @@ class RBAccount:
             raise RBFatalError(
                 "Account '%s' does not exist (no home directory)" % usr.uid)
 
+    @classmethod
+    def stat_dirs(cls, paths):
+        """Return dictionary of path -> os.stat_result for given directory
+        paths, or None for those that don't exist or aren't directories.
+
+        Each parent directory is read once with scandir, which tells which
+        paths exist and are directories without a stat each. Only those
+        are then stat'ed for ownership and mode, from a pool of
+        rbconfig.AUDIT_THREADS threads as each stat on NFS is a round
+        trip to the server."""
+
+        parents = {}
+        for path in paths:
+            parent, name = os.path.split(os.path.normpath(path))
+            parents.setdefault(parent, set()).add(name)
+
+        def scan(parent):
+            """Return names in parent that are directories."""
+
+            try:
+                with os.scandir(parent) as entries:
+                    return [(parent, i.name) for i in entries
+                            if i.name in parents[parent] and i.is_dir()]
+            except OSError:
+                return []
+
+        def stat(path):
+            """Return stat of path or None if it has gone."""
+
+            try:
+                return os.stat(path)
+            except OSError:
+                return None
+
+        result = dict((path, None) for path in paths)
+        with concurrent.futures.ThreadPoolExecutor(
+                rbconfig.AUDIT_THREADS) as pool:
+            found = set(
+                os.path.join(parent, name)
+                for dirs in pool.map(scan, parents) for parent, name in dirs)
+            todo = [path for path in result if os.path.normpath(path) in found]
+            result.update(zip(todo, pool.map(stat, todo)))
+        return result
+
     # ------------------------------------------------------------------- #
     # OTHER METHODS                                                       #
     # ------------------------------------------------------------------- #
@@ -342,7 +423,7 @@ class RBAccount:
         """Add email address to mailing list."""
 
         list_file = self.my_popen("su -c '%s/bin/add_members -r - %s' list" %
-                                  (rbconfig.dir_mailman,
+                                  (rbconfig.DIR_MAILMAN,
                                    self.shquote(mail_list)))
         list_file.write('%s\n' % email)
         self.my_close(list_file)
@@ -351,7 +432,7 @@ class RBAccount:
         """Delete email address from a mailing list."""
 
         self.runcmd("su -c '%s/bin/remove_members %s %s' list" %
-                    (rbconfig.dir_mailman, self.shquote(mail_list),
+                    (rbconfig.DIR_MAILMAN, self.shquote(mail_list),
                      self.shquote(email)))
 
     # ------------------------------------------------------------------ #
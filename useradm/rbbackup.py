@@ -0,0 +1,250 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Backup Module; contains RBBackup class for incremental backups
+of the LDAP tree.
+
+A backup directory holds a chain of gzipped LDIF files:
+
+    base-YYYYMMDDHHMMSS.ldif.gz     full copy of the tree
+    delta-YYYYMMDDHHMMSS.ldif.gz    entries added or modified since the
+                                    previous file, as content records, and
+                                    deleted entries as delete change records
+    state.json                      high-water modifyTimestamp, hashes of
+                                    the entries backed up at it and the
+                                    file the chain is up to
+    dns.gz                          DNs in the tree at the last backup
+
+Only entries with a modifyTimestamp at or after the high-water mark are
+fetched for a delta. Timestamps are to the second, so an entry at the mark
+may have changed after the last backup in the same second; it is only left
+out if it is identical to the copy already backed up. Deletes don't change
+any timestamp so they are found by comparing the DNs now in the tree with
+those at the last backup, which only needs a search returning no
+attributes."""
+
+# System modules
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+
+import ldap
+import rbconfig
+import rbldif
+from rberror import RBFatalError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+RE_BACKUP = re.compile(r'^(base|delta)-(\d{14})\.ldif\.gz$')
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBBackup:
+    """Class for an incremental backup directory of an LDAP tree."""
+
+    def __init__(self, directory, conn=None, base=rbconfig.LDAP_TREE):
+        """Create new RBBackup object for given directory. An LDAP
+        connection is only needed for taking backups, not rebuilding."""
+
+        self.directory = directory
+        self.ldap = conn
+        self.base = base
+        self.state_file = os.path.join(directory, 'state.json')
+        self.dns_file = os.path.join(directory, 'dns.gz')
+
+    # ------------------------------------------------------------------ #
+    # BACKUP                                                             #
+    # ------------------------------------------------------------------ #
+
+    def load_state(self):
+        """Return state dictionary or None if there is no backup yet."""
+
+        try:
+            with open(self.state_file) as fd:
+                return json.load(fd)
+        except FileNotFoundError:
+            return None
+
+    def save_state(self, state, dns):
+        """Save state and DN set atomically (DN set first, as the state
+        refers to it)."""
+
+        with gzip.open(self.dns_file + '.tmp', 'wt', encoding='utf-8',
+                       errors='surrogateescape') as fd:
+            for dn in sorted(dns):
+                fd.write(dn + '\n')
+        os.rename(self.dns_file + '.tmp', self.dns_file)
+
+        with open(self.state_file + '.tmp', 'w') as fd:
+            json.dump(state, fd)
+        os.rename(self.state_file + '.tmp', self.state_file)
+
+    def load_dns(self):
+        """Return set of DNs in the tree at the last backup."""
+
+        with gzip.open(self.dns_file, 'rt', encoding='utf-8',
+                       errors='surrogateescape') as fd:
+            return set(line.rstrip('\n') for line in fd)
+
+    def search(self, filterstr, attrs):
+        """Return LDAP search results for given filter below the base."""
+
+        return self.ldap.search_s(self.base, ldap.SCOPE_SUBTREE, filterstr,
+                                  attrs)
+
+    def write(self, kind, entries, deletes=()):
+        """Write given search results and deleted DNs to a new backup file
+        of given kind. Returns (filename, highest modifyTimestamp)."""
+
+        stamp = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+        filename = '%s-%s.ldif.gz' % (kind, stamp)
+        path = os.path.join(self.directory, filename)
+        hwm = ''
+        with gzip.open(path + '.tmp', 'wb') as fd:
+            for dn, data in entries:
+                entry = result2entry(dn, data)
+                hwm = max(hwm, entry.get('modifyTimestamp') or '')
+                fd.write(entry.to_ldif())
+            for dn in sorted(deletes):
+                fd.write(
+                    rbldif.RBLDIFEntry(dn, (('changetype', 'delete'),
+                                            )).to_ldif())
+        os.rename(path + '.tmp', path)
+        return filename, hwm
+
+    def full(self):
+        """Take a full backup, starting a new chain. Returns filename."""
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        res = self.search('(objectClass=*)', ['*', 'modifyTimestamp'])
+        filename, hwm = self.write('base', res)
+        self.save_state({'hwm': hwm, 'at_hwm': hashes_at(res, hwm),
+                         'last': filename}, set(dn for dn, _ in res))
+        return filename
+
+    def incremental(self):
+        """Take a delta backup of changes since the last backup, or a full
+        one if there is none. Returns filename or None if nothing changed."""
+
+        state = self.load_state()
+        if state is None:
+            return self.full()
+
+        if state['hwm']:
+            res = self.search('(modifyTimestamp>=%s)' % state['hwm'],
+                              ['*', 'modifyTimestamp'])
+        else:
+            res = self.search('(objectClass=*)', ['*', 'modifyTimestamp'])
+        dns = set(dn for dn, _ in self.search('(objectClass=*)', ['1.1']))
+        deletes = self.load_dns() - dns
+
+        # The >= filter always returns the entries at the high-water mark
+        # again. Leave out those identical to the copy in the last backup,
+        # but not ones changed later in the same second.
+        #
+        at_hwm = state.get('at_hwm', {})
+        changed = [(dn, data) for dn, data in res
+                   if at_hwm.get(dn) != entry_hash(dn, data)]
+        if not changed and not deletes:
+            return None
+
+        filename, hwm = self.write('delta', changed, deletes)
+        hwm = max(hwm, state['hwm'])
+        self.save_state({'hwm': hwm, 'at_hwm': hashes_at(res, hwm),
+                         'last': filename}, dns)
+        return filename
+
+    # ------------------------------------------------------------------ #
+    # REBUILD                                                            #
+    # ------------------------------------------------------------------ #
+
+    def chain(self, when=None):
+        """Return list of backup filenames (oldest first) needed to
+        rebuild the tree as it was at given time (YYYYMMDDHHMMSS UTC, or
+        latest if None)."""
+
+        files = []
+        for name in sorted(os.listdir(self.directory),
+                           key=lambda n: RE_BACKUP.sub(r'\2\1', n)):
+            res = RE_BACKUP.search(name)
+            if not res or (when is not None and res.group(2) > when):
+                continue
+            if res.group(1) == 'base':
+                files = []
+            files.append(name)
+        if not files or not files[0].startswith('base-'):
+            raise RBFatalError('No full backup in %s%s' %
+                               (self.directory, ' before %s' % when
+                                if when else ''))
+        return files
+
+    def rebuild(self, outfd, when=None):
+        """Write the tree as it was at given time (see chain()) to given
+        binary file object as LDIF. Returns number of entries written."""
+
+        tree = {}
+        for name in self.chain(when):
+            with gzip.open(os.path.join(self.directory, name), 'rb') as fd:
+                for _, data in rbldif.read_records(fd):
+                    entry = rbldif.parse_record(data)
+                    if entry is None:
+                        continue
+                    key = entry.dn.lower()
+                    if entry.changetype == 'delete':
+                        tree.pop(key, None)
+                    else:
+                        tree[key] = data
+
+        # Parents must come before children for slapadd/ldapadd, so sort on
+        # the number of RDNs.
+        #
+        for key in sorted(tree, key=lambda k: (k.count(','), k)):
+            data = tree[key]
+            outfd.write(data if data.endswith(b'\n\n') else
+                        data.rstrip(b'\n') + b'\n\n')
+        return len(tree)
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def result2entry(dn, data):
+    """Return RBLDIFEntry for given LDAP search result."""
+
+    return rbldif.RBLDIFEntry(
+        dn, [(attr, value.decode('utf-8', 'surrogateescape'))
+             for attr, values in data.items() for value in values])
+
+
+def entry_hash(dn, data):
+    """Return hash of given LDAP search result, independent of attribute
+    and value order."""
+
+    digest = hashlib.sha1(dn.encode('utf-8', 'surrogateescape'))
+    for attr, values in sorted(data.items()):
+        for value in sorted(values):
+            digest.update(b'\0%s\0%s' % (attr.encode(), value))
+    return digest.hexdigest()
+
+
+def hashes_at(results, hwm):
+    """Return dictionary of DN -> entry_hash() for the search results with
+    given modifyTimestamp."""
+
+    return dict((dn, entry_hash(dn, data)) for dn, data in results
+                if hwm and data.get('modifyTimestamp', [b''])[0].decode() ==
+                hwm)
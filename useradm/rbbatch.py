@@ -0,0 +1,413 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Batch Module; contains RBBatch class for running a stream of
+useradm operations over one set of connections and LDAPPipeline which sends
+LDAP writes without waiting for each result.
+
+Operations are read as JSON lines or as CSV with a header row. Each gives
+op and uid, plus the RBUser attributes (FIELDS) the op uses:
+
+    setshell   loginShell
+    resetsh
+    renew      usertype, id, cn, altmail, ... (as the renew options)
+    update     newbie, id, cn, altmail, ... (as the update options)
+    convert    usertype
+    delete
+
+updatedby defaults to -u or $LOGNAME. override (as -o) and passwd (renew
+only, as -p) are per operation flags.
+
+Writes are pipelined: the results of a window of operations are collected
+together, so an operation is only reported once its window is done.
+Operations that change accounts (delete, convert and renew to a different
+usertype) wait for their own database writes first, so an account is never
+changed when the database write failed."""
+
+# System modules
+
+import copy
+import csv
+import itertools
+import json
+import os
+import time
+
+import ldap
+
+# RedBrick modules
+
+import rbconfig
+from rberror import RBError, RBFatalError, RBWarningError
+from rbuser import RBUser
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+OPS = ('setshell', 'resetsh', 'renew', 'update', 'convert', 'delete')
+
+# RBUser attributes an operation may give.
+
+FIELDS = ('uid', 'usertype', 'newbie', 'cn', 'altmail', 'id', 'course',
+          'year', 'yearsPaid', 'birthday', 'loginShell', 'updatedby')
+
+FLAGS = ('op', 'override', 'passwd')
+
+# Operations sent before waiting for their results.
+
+WINDOW = 64
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBBatch:
+    """Class to run batch operations with given RBUserDB and RBAccount."""
+
+    def __init__(self, udb, acc, opt, window=WINDOW):
+        """Create new RBBatch object. opt gives the defaults for every
+        operation (-o, -T, -d, -a, -u)."""
+
+        self.udb = udb
+        self.acc = acc
+        self.opt = opt
+        self.window = window
+        self.pipe = None
+        self.counts = {}
+        self.failed = 0
+        self.seconds = 0.0
+
+    def run(self, operations, out):
+        """Run (line number, record) operations as read by
+        read_operations(), writing a JSON result line for each to out."""
+
+        start = time.time()
+        self.pipe = self.udb.ldap = LDAPPipeline(self.udb.ldap)
+        results, uids = [], set()
+        try:
+            for lineno, rec in operations:
+                # A user given again waits for the writes before it so its
+                # ops see them.
+                #
+                uid = rec.get('uid') if isinstance(rec, dict) else None
+                if len(results) >= self.window or (uid and uid in uids):
+                    self.flush(results, out)
+                    uids.clear()
+                results.append(self.execute(lineno, rec))
+                uids.add(uid)
+            self.flush(results, out)
+        finally:
+            self.udb.ldap = self.pipe.conn
+            self.udb.setopt(self.opt)
+            self.acc.setopt(self.opt)
+            self.seconds += time.time() - start
+
+    def flush(self, results, out):
+        """Wait for outstanding writes, then write and count the given
+        results, marking those whose writes failed."""
+
+        self.pipe.flush()
+        for res in results:
+            err = self.pipe.failed.pop(res['line'], None)
+            if err is not None and res['status'] == 'ok':
+                res['status'] = 'error'
+                res['message'] = message(err)
+            key = (res['op'], res['status'])
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if res['status'] != 'ok':
+                self.failed += 1
+            out.write(json.dumps(res) + '\n')
+        out.flush()
+        self.pipe.failed.clear()
+        del results[:]
+
+    def execute(self, lineno, rec):
+        """Run one operation and return its result dictionary."""
+
+        res = {'line': lineno, 'op': None, 'uid': None, 'status': None}
+        try:
+            if isinstance(rec, Exception):
+                raise rec
+            res['op'], res['uid'] = rec.get('op'), rec.get('uid')
+            op, usr, opt = parse_record(rec, self.opt)
+            self.udb.setopt(opt)
+            self.acc.setopt(opt)
+            self.pipe.tag = lineno
+            res.update(getattr(self, 'op_' + op)(usr, opt))
+            res['status'] = 'ok'
+        except (RBError, ldap.LDAPError) as err:
+            res['status'] = 'error'
+            res['message'] = message(err)
+        finally:
+            self.pipe.tag = None
+        return res
+
+    def summary(self, fd):
+        """Print operation counts to given file."""
+
+        total = sum(self.counts.values())
+        print('batch: %d operations, %d ok, %d failed (%.1fs)' %
+              (total, total - self.failed, self.failed, self.seconds),
+              file=fd)
+        for op in sorted(set(i[0] or '-' for i in self.counts)):
+            print('  %-10s %6d ok %6d failed' %
+                  (op, self.counts.get((op, 'ok'), 0),
+                   sum(n for (i, status), n in self.counts.items()
+                       if (i or '-') == op and status != 'ok')), file=fd)
+
+    # ------------------------------------------------------------------- #
+    # OPERATIONS                                                          #
+    # ------------------------------------------------------------------- #
+
+    def op_setshell(self, usr, opt):
+        """Set user's shell."""
+
+        if not usr.loginShell:
+            raise RBFatalError('loginShell must be given')
+        self.udb.get_user_byname(usr)
+        self.check_paid(usr)
+        if not self.udb.valid_shell(usr.loginShell):
+            self.udb.rberror(RBWarningError('Not a valid shell'))
+        self.udb.set_shell(usr)
+        return {
+            'message': 'Account shell set for %s (%s)' % (usr.uid,
+                                                          usr.loginShell)
+        }
+
+    def op_resetsh(self, usr, opt):
+        """Reset user's shell."""
+
+        self.udb.get_user_byname(usr)
+        self.check_paid(usr)
+        if self.udb.reset_shell(usr):
+            return {
+                'message': 'Account shell reset for %s (%s)' %
+                           (usr.uid, usr.loginShell)
+            }
+        return {'message': 'Account %s already had valid shell, no action '
+                           'performed.' % usr.uid}
+
+    def op_renew(self, usr, opt):
+        """Renew user."""
+
+        self.connect_dcu()
+        curusr = RBUser()
+        self.udb.get_userinfo_renew(usr, curusr, override=1)
+        self.udb.check_unpaid(curusr)
+        self.udb.get_userdefaults_renew(usr)
+        self.udb.check_updatedby(usr.updatedby)
+
+        res = {'message': 'User renewed: %s' % usr.uid}
+        if not opt.aconly:
+            self.udb.renew(usr)
+        if opt.setpasswd:
+            usr.passwd = rbconfig.gen_passwd()
+            self.udb.set_passwd(usr)
+            res['passwd'] = usr.passwd
+
+        if curusr.usertype != usr.usertype:
+            if not opt.aconly:
+                self.udb.convert(curusr, usr)
+            if not opt.dbonly:
+                self.pipe.wait(self.pipe.tag)
+                self.acc.convert(curusr, usr)
+            res['message'] += ', converted: %s -> %s' % (curusr.usertype,
+                                                         usr.usertype)
+
+        if self.udb.reset_shell(usr):
+            res['message'] += ', shell reset (%s)' % usr.loginShell
+        return res
+
+    def op_update(self, usr, opt):
+        """Update user (database only)."""
+
+        self.udb.update(usr)
+        return {'message': 'User updated: %s' % usr.uid}
+
+    def op_convert(self, usr, opt):
+        """Convert user to a different usertype."""
+
+        if not usr.usertype:
+            raise RBFatalError('usertype must be given')
+        newusr = RBUser(usertype=usr.usertype)
+        usr.usertype = None
+        if not opt.aconly:
+            self.udb.convert(usr, newusr)
+        if not opt.dbonly:
+            self.pipe.wait(self.pipe.tag)
+            self.acc.convert(usr, newusr)
+        return {
+            'message': 'User converted: %s -> %s' % (usr.uid,
+                                                     newusr.usertype)
+        }
+
+    def op_delete(self, usr, opt):
+        """Delete user and account."""
+
+        self.udb.get_user_byname(usr)
+        if not opt.aconly:
+            self.udb.delete(usr)
+        if not opt.dbonly:
+            self.pipe.wait(self.pipe.tag)
+            self.acc.delete(usr)
+        return {'message': 'User deleted: %s' % usr.uid}
+
+    # ------------------------------------------------------------------- #
+    # INTERNAL METHODS                                                    #
+    # ------------------------------------------------------------------- #
+
+    def check_paid(self, usr):
+        """Raise RBWarningError if user has not renewed."""
+
+        if usr.yearsPaid is not None and usr.yearsPaid < 1:
+            self.udb.rberror(
+                RBWarningError("User '%s' has not renewed" % usr.uid))
+
+    def connect_dcu(self):
+        """Connect to DCU LDAP on first use."""
+
+        if self.udb.ldap_dcu is None:
+            self.udb.connect_dcu()
+
+
+class LDAPPipeline:
+    """LDAPObject whose modify_s and delete_s send the request and return
+    without waiting for its result. flush() collects the results, keeping
+    errors in failed by the tag set when each request was sent."""
+
+    def __init__(self, conn):
+        """Create new LDAPPipeline for given connection."""
+
+        self.conn = conn
+        self.tag = None
+        self.pending = []
+        self.failed = {}
+
+    def __getattr__(self, attr):
+        return getattr(self.conn, attr)
+
+    def modify_s(self, dn, modlist):
+        self.pending.append((self.conn.modify(dn, modlist), self.tag))
+
+    def delete_s(self, dn):
+        self.pending.append((self.conn.delete(dn), self.tag))
+
+    def flush(self):
+        """Wait for the results of all requests sent."""
+
+        pending, self.pending = self.pending, []
+        for msgid, tag in pending:
+            try:
+                self.conn.result(msgid)
+            except ldap.LDAPError as err:
+                self.failed.setdefault(tag, err)
+
+    def wait(self, tag):
+        """Wait for all requests sent and raise the first error of those
+        with given tag."""
+
+        self.flush()
+        if tag in self.failed:
+            raise self.failed.pop(tag)
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def read_operations(fd):
+    """Yield (line number, record) for each operation in given text file of
+    JSON lines or CSV with a header row. record is a dictionary, or an
+    RBFatalError for a line that can't be read. Blank lines and JSON lines
+    starting with '#' are skipped."""
+
+    numbered = enumerate(fd, 1)
+    for lineno, line in numbered:
+        if line.strip() and not line.startswith('#'):
+            break
+    else:
+        return
+
+    if line.lstrip().startswith('{'):
+        for lineno, line in itertools.chain([(lineno, line)], numbered):
+            if not line.strip() or line.startswith('#'):
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError as err:
+                rec = RBFatalError('Invalid JSON: %s' % err)
+            if not isinstance(rec, (dict, Exception)):
+                rec = RBFatalError('Operation must be a JSON object')
+            yield lineno, rec
+        return
+
+    header = [i.strip() for i in next(csv.reader([line]))]
+    reader = csv.DictReader(fd, header)
+    for rec in reader:
+        if None in rec:
+            rec = RBFatalError('More fields than the header')
+        else:
+            rec = dict((k, v) for k, v in rec.items() if v not in (None, ''))
+        yield lineno + reader.line_num, rec
+
+
+def parse_record(rec, opt):
+    """Return (op, RBUser, RBOpt) for given operation record, with options
+    from opt and the record's flags."""
+
+    op = rec.get('op')
+    if op not in OPS:
+        raise RBFatalError("Unknown op '%s'" % op)
+    unknown = sorted(set(rec) - set(FIELDS) - set(FLAGS))
+    if unknown:
+        raise RBFatalError('Unknown field: %s' % ', '.join(unknown))
+    if not rec.get('uid'):
+        raise RBFatalError('uid must be given')
+
+    attrs = {}
+    for key in FIELDS:
+        value = rec.get(key)
+        if value is None or value == '':
+            continue
+        if key == 'newbie':
+            value = boolean(value)
+        elif key in ('id', 'yearsPaid'):
+            try:
+                value = int(value)
+            except ValueError:
+                raise RBFatalError('%s must be a number' % key)
+        else:
+            value = str(value)
+        attrs[key] = value
+    attrs.setdefault(
+        'updatedby', opt.updatedby or os.environ.get('LOGNAME') or
+        os.environ.get('SU_FROM'))
+
+    recopt = copy.copy(opt)
+    if boolean(rec.get('override')):
+        recopt.override = 1
+    recopt.setpasswd = boolean(rec.get('passwd'))
+    return op, RBUser(**attrs), recopt
+
+
+def boolean(value):
+    """Return truth of given JSON value or CSV field."""
+
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def message(err):
+    """Return message for given RBError or LDAPError."""
+
+    if isinstance(err, ldap.LDAPError) and err.args and \
+            isinstance(err.args[0], dict):
+        return ': '.join(
+            str(err.args[0][i]) for i in ('desc', 'info') if err.args[0].get(i))
+    return str(err)
@@ -5,9 +5,11 @@
 
 # System modules
 
+import calendar
 import os
 import random
 import string
+import time
 
 # ------------------------------------------------------------------- #
 # DATA                                                                #
@@ -40,6 +42,16 @@ LDAP_ACCOUNTS_TREE = 'ou=accounts,o=redbrick'
 LDAP_GROUP_TREE = 'ou=groups,o=redbrick'
 LDAP_RESERVED_TREE = 'ou=reserved,o=redbrick'
 
+# Entry holding the next free uidNumber and number of attempts to update it
+# before giving up.
+
+LDAP_UIDNUMBER_DN = 'cn=uidNumber,o=redbrick'
+UIDNUMBER_RETRIES = 20
+
+# Entries per page of paged searches (useradm export).
+
+LDAP_PAGE_SIZE = 500
+
 # DCU LDAP settings.
 
 LDAP_DCU_URI = 'ldap://ad.dcu.ie'
@@ -74,16 +86,31 @@ DIR_DAFT = '/local/share/daft'
 DIR_SKEL = '/etc/skel'
 DIR_MAILMAN = '/var/lib/mailman'
 
+# Number of threads checkdb uses to stat home and webtree directories.
+
+AUDIT_THREADS = 16
+
 # Filenames.
 
-FILE_UIDNUMBER = DIR_RRS + 'uidNumber.txt'
 FILE_PRE_SYNC = DIR_RRS + 'presync.txt'
 FILE_RRSLOG = DIR_RRS + 'rrs.log'
+FILE_SYNC_JOURNAL = DIR_RRS + 'sync.db'
+FILE_CHECKDB_STATE = DIR_RRS + 'checkdb.json'
+FILE_RRS_METRICS = DIR_RRS + 'metrics.prom'
+FILE_RRS_METRICS_STATE = DIR_RRS + 'metrics.json'
+FILE_USERADM_SOCKET = DIR_RRS + 'useradm.sock'
 FILE_SHELLS = '/etc/shells'
 FILE_BACKUP_PASSWD = '/var/backups/passwd.pre-expired'
 SHELL_DEFAULT = '/usr/local/shells/zsh'
 SHELL_EXPIRED = '/usr/local/shells/expired'
 
+# useradm daemon: members of this group may use it as well as root (None
+# for root only), and connections idle for this many seconds are checked
+# before the next command.
+
+DAEMON_GROUP = None
+DAEMON_IDLE_CHECK = 300
+
 # Unix group files: (group file, hostname) pairs.
 
 FILES_GROUP = (('/etc/group', 'Deathray'), ('/local/share/var/carbon/group',
@@ -106,6 +133,14 @@ COMMAND_CHGRP = '/bin/chgrp'
 COMMAND_CP = '/bin/cp'
 COMMAND_SENDMAIL = '/usr/sbin/sendmail'
 
+# Renewal reminder data. The deadline is given as (day, month) and falls in
+# the current academic year. Prices are (description, euro) pairs in the
+# order they are listed in the reminder mail.
+
+RENEWAL_DEADLINE = (30, 10)
+MEMBERSHIP_PRICES = (('Members', 4), ('Associates', 8), ('Staff', 8),
+                     ('Guests', 10))
+
 # Valid account USERTYPES and descriptions.
 #
 USERTYPES = {
@@ -194,7 +229,31 @@ def gen_webtree(username):
     return os.path.join(DIR_WEBTREE, username[0], username)
 
 
-def gen_quotas():
+def gen_renewal_deadline(now=None):
+    """Return the renewal deadline for the current academic year as a
+    string suitable for use in a mail, e.g. '30th October 2016'."""
+
+    now = now or time.localtime()
+    day, month = RENEWAL_DEADLINE
+    if day in (1, 21, 31):
+        suffix = 'st'
+    elif day in (2, 22):
+        suffix = 'nd'
+    elif day in (3, 23):
+        suffix = 'rd'
+    else:
+        suffix = 'th'
+
+    # The academic year starts in September, anything before that is
+    # still the previous academic year.
+    year = now.tm_year if now.tm_mon >= 9 else now.tm_year - 1
+    if month < 9:
+        year += 1
+
+    return '%d%s %s %d' % (day, suffix, calendar.month_name[month], year)
+
+
+def gen_quotas(usertype=None):
     """Returns a dictionary of quota limits for filesystems (possibly
     depending on the given usertype, if any).
 
@@ -0,0 +1,347 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Daemon Module; contains RBDaemon class for serving useradm
+commands over a Unix domain socket and forward() for the client side.
+
+Clients are authenticated by their peer credentials (root, the daemon's
+own user or members of rbconfig.DAEMON_GROUP). Commands are run one at a
+time. Every message is a frame: one type byte, a 4 byte length and data.
+
+    client -> daemon   q  request (JSON: argv, cwd, env, tty)
+                       i  standard input data, empty for end of file
+    daemon -> client   o  standard output data
+                       e  standard error data
+                       r  read request (4 byte maximum size)
+                       x  exit status (text)
+"""
+
+# System modules
+
+import grp
+import io
+import json
+import os
+import pwd
+import signal
+import socket
+import struct
+import sys
+import time
+
+# RedBrick modules
+
+import rbconfig
+from rberror import RBFatalError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+FRAME = struct.Struct('!cI')
+SIZE = struct.Struct('!I')
+PEERCRED = struct.Struct('3i')
+
+# Seconds a client has to send its request after connecting.
+
+REQUEST_TIMEOUT = 10
+
+# Environment variables commands use, passed from client to daemon.
+
+ENVIRONMENT = ('LOGNAME', 'SU_FROM', 'PAGER', 'EDITOR', 'VISUAL')
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBDaemon:
+    """Class for a Unix socket server running one command per connection.
+
+    handler(request, stdin, stdout, stderr) runs the command given by the
+    request dictionary with text streams relayed to and from the client and
+    returns its exit status."""
+
+    def __init__(self, path, handler, group=rbconfig.DAEMON_GROUP, log=None):
+        """Create new RBDaemon for given socket path and handler."""
+
+        if not hasattr(socket, 'SO_PEERCRED'):
+            raise RBFatalError('Peer credentials are not supported here')
+        self.path = path
+        self.handler = handler
+        self.group = group
+        self.log = log
+        self.sock = None
+        self.busy = self.stopping = False
+
+    def listen(self):
+        """Create listening socket, replacing a stale socket file."""
+
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise RBFatalError('A daemon is already listening on %s' %
+                                   self.path)
+            finally:
+                probe.close()
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o117)
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        if self.group:
+            try:
+                os.chown(self.path, -1, grp.getgrnam(self.group).gr_gid)
+            except (KeyError, OSError):
+                pass
+        self.sock.listen(16)
+
+    def serve(self):
+        """Accept and handle connections until stopped by SIGTERM (after
+        the command being run, if any) or KeyboardInterrupt."""
+
+        def stop(signum, frame):
+            self.stopping = True
+            if not self.busy:
+                raise SystemExit(0)
+
+        if self.sock is None:
+            self.listen()
+        previous = signal.signal(signal.SIGTERM, stop)
+        try:
+            while not self.stopping:
+                conn = self.sock.accept()[0]
+                self.busy = True
+                try:
+                    with conn:
+                        self.handle(conn)
+                finally:
+                    self.busy = False
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self.close()
+
+    def close(self):
+        """Close listening socket and remove socket file."""
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def handle(self, conn):
+        """Authenticate client, run its request and send exit status."""
+
+        start = time.perf_counter()
+        pid, uid, gid = peer_credentials(conn)
+        request = {}
+        try:
+            # Don't let a client that never sends its request hold up
+            # everyone else.
+            conn.settimeout(REQUEST_TIMEOUT)
+            kind, data = recv_frame(conn)
+            conn.settimeout(None)
+            if kind != b'q':
+                return
+            request = json.loads(data.decode())
+            if not self.allowed(uid, gid):
+                send_frame(conn, b'e', b'useradm daemon: permission denied\n')
+                status = 1
+            else:
+                status = self.run(conn, request)
+            send_frame(conn, b'x', str(status).encode())
+        except (OSError, EOFError, ValueError) as err:
+            status = 'aborted (%s)' % err
+        if self.log:
+            print('%s pid=%d uid=%d %s: %s %.0fms' %
+                  (time.strftime('%Y-%m-%d %H:%M:%S'), pid, uid, ' '.join(
+                      request.get('argv', ())), status,
+                   1000 * (time.perf_counter() - start)), file=self.log)
+            self.log.flush()
+
+    def run(self, conn, request):
+        """Call handler with streams relayed over given connection."""
+
+        # Standard output is line buffered only for a terminal, as it would
+        # be for the command run by the client itself.
+        #
+        stdout = io.TextIOWrapper(io.BufferedWriter(FrameWriter(conn, b'o')),
+                                  encoding='utf-8', errors='replace',
+                                  line_buffering=bool(request.get('tty')))
+        stderr = io.TextIOWrapper(io.BufferedWriter(FrameWriter(conn, b'e')),
+                                  encoding='utf-8', errors='replace',
+                                  line_buffering=True)
+
+        def flush():
+            stdout.flush()
+            stderr.flush()
+
+        stdin = io.TextIOWrapper(io.BufferedReader(FrameReader(conn, flush)),
+                                 encoding='utf-8', errors='replace')
+        try:
+            return self.handler(request, stdin, stdout, stderr)
+        finally:
+            flush()
+
+    def allowed(self, uid, gid):
+        """Return true if given peer user and group may run commands."""
+
+        if uid in (0, os.geteuid()):
+            return True
+        if not self.group:
+            return False
+        try:
+            group = grp.getgrnam(self.group)
+            if gid == group.gr_gid:
+                return True
+            return pwd.getpwuid(uid).pw_name in group.gr_mem
+        except KeyError:
+            return False
+
+
+class FrameWriter(io.RawIOBase):
+    """Raw stream sending everything written as frames of given type."""
+
+    def __init__(self, conn, kind):
+        """Create new FrameWriter for given connection."""
+
+        super().__init__()
+        self.conn = conn
+        self.kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        send_frame(self.conn, self.kind, bytes(data))
+        return len(data)
+
+
+class FrameReader(io.RawIOBase):
+    """Raw stream asking the client for standard input when read. Output
+    is flushed first so prompts are seen. An end of file from the client
+    ends that one read only, as Ctrl-D at a terminal does, so later reads
+    ask the client again."""
+
+    def __init__(self, conn, flush):
+        """Create new FrameReader for given connection."""
+
+        super().__init__()
+        self.conn = conn
+        self.flush_output = flush
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        self.flush_output()
+        send_frame(self.conn, b'r', SIZE.pack(len(buf)))
+        kind, data = recv_frame(self.conn)
+        if kind != b'i':
+            raise EOFError('Unexpected frame from client')
+        data = data[:len(buf)]
+        buf[:len(data)] = data
+        return len(data)
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def send_frame(conn, kind, data=b''):
+    """Send a frame of given type and data."""
+
+    conn.sendall(FRAME.pack(kind, len(data)) + data)
+
+
+def recv_frame(conn):
+    """Receive a frame and return (type, data). Raises EOFError if the
+    connection is closed."""
+
+    kind, size = FRAME.unpack(recv_exact(conn, FRAME.size))
+    return kind, recv_exact(conn, size)
+
+
+def recv_exact(conn, size):
+    """Receive exactly size bytes."""
+
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise EOFError('Connection closed')
+        data += chunk
+    return data
+
+
+def peer_credentials(conn):
+    """Return (pid, uid, gid) of the process at the other end of given Unix
+    socket connection."""
+
+    return PEERCRED.unpack(
+        conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, PEERCRED.size))
+
+
+def forward(path, argv, stdin=None, stdout=None, stderr=None):
+    """Run useradm command line argv in the daemon listening on path,
+    relaying binary standard streams (sys ones by default). Returns exit
+    status, or None if there is no daemon."""
+
+    if not os.path.exists(path):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except OSError:
+        conn.close()
+        return None
+
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    stderr = stderr or sys.stderr.buffer
+    with conn:
+        send_frame(
+            conn, b'q',
+            json.dumps({
+                'argv': list(argv),
+                'cwd': os.getcwd(),
+                'tty': stdout.isatty(),
+                'env': dict((i, os.environ[i]) for i in ENVIRONMENT
+                            if i in os.environ)
+            }).encode())
+        while 1:
+            try:
+                kind, data = recv_frame(conn)
+            except (OSError, EOFError):
+                stdout.flush()
+                stderr.write(b'useradm: lost connection to daemon\n')
+                stderr.flush()
+                return 1
+            if kind == b'o':
+                stdout.write(data)
+            elif kind == b'e':
+                stdout.flush()
+                stderr.write(data)
+                stderr.flush()
+            elif kind == b'r':
+                stdout.flush()
+                try:
+                    data = stdin.read1(SIZE.unpack(data)[0])
+                except (OSError, ValueError):
+                    data = b''
+                send_frame(conn, b'i', data)
+            elif kind == b'x':
+                stdout.flush()
+                return int(data)
@@ -0,0 +1,131 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Export Module; contains RBExport class which writes user search
+results with a chosen set of attributes as CSV, JSON lines or LDIF.
+
+Attributes are RBUser attribute names. usertype is taken from objectClass.
+Multiple values (objectClass, host) are joined with ';' in CSV and are lists
+in JSON, where numbers are integers and newbie a boolean. A missing
+attribute is empty in CSV, null in JSON and left out of LDIF."""
+
+# System modules
+
+import csv
+import json
+
+# RedBrick modules
+
+import rbconfig
+import rbldif
+from rberror import RBFatalError
+from rbuser import RBUser
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+FORMATS = ('csv', 'jsonl', 'ldif')
+
+DEFAULT_ATTRS = ('uid', 'usertype', 'newbie', 'cn', 'altmail', 'id',
+                 'course', 'year', 'yearsPaid', 'uidNumber', 'loginShell')
+
+INTEGER_ATTRS = ('id', 'yearsPaid', 'uidNumber', 'gidNumber',
+                 'shadowLastChange')
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBExport:
+    """Class to write search results to a text file in given format."""
+
+    def __init__(self, fd, fmt='csv', attrs=DEFAULT_ATTRS):
+        """Create new RBExport object for given format and attributes."""
+
+        if fmt not in FORMATS:
+            raise RBFatalError("Invalid format '%s' (%s)" %
+                               (fmt, ', '.join(FORMATS)))
+        if not attrs:
+            raise RBFatalError('No attributes given')
+        for attr in attrs:
+            if attr not in RBUser.attr_list:
+                raise RBFatalError("Invalid attribute '%s'" % attr)
+
+        self.fd = fd
+        self.fmt = fmt
+        self.attrs = tuple(attrs)
+        self.count = 0
+        self.csv = None
+        if fmt == 'csv':
+            self.csv = csv.writer(fd, lineterminator='\n')
+            self.csv.writerow(self.attrs)
+
+    @property
+    def attrlist(self):
+        """LDAP attributes to search for."""
+
+        return sorted(
+            set('objectClass' if i == 'usertype' else i for i in self.attrs))
+
+    def export(self, results):
+        """Write all given (dn, attributes) search results. Returns number
+        of users written."""
+
+        for dn, data in results:
+            self.write(dn, data)
+        self.fd.flush()
+        return self.count
+
+    def write(self, dn, data):
+        """Write one search result."""
+
+        values = dict((attr, [i.decode('utf-8', 'surrogateescape')
+                              for i in data.get(attr, ())])
+                      for attr in self.attrlist)
+        if 'usertype' in self.attrs:
+            values['usertype'] = [
+                i for i in values['objectClass'] if i in rbconfig.USERTYPES
+            ][:1]
+
+        if self.fmt == 'csv':
+            self.csv.writerow([';'.join(values[i]) for i in self.attrs])
+        elif self.fmt == 'jsonl':
+            self.fd.write(
+                json.dumps(dict((i, json_value(i, values[i]))
+                                for i in self.attrs)) + '\n')
+        else:
+            entry = rbldif.RBLDIFEntry(dn)
+            for attr in self.attrs:
+                if attr == 'usertype' and 'objectClass' in self.attrs:
+                    continue
+                for value in values[attr]:
+                    entry.add('objectClass' if attr == 'usertype' else attr,
+                              value)
+            self.fd.write(entry.to_ldif().decode('utf-8', 'surrogateescape'))
+        self.count += 1
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def json_value(attr, values):
+    """Return JSON value for given attribute's list of values."""
+
+    if attr in RBUser.attr_list_value:
+        return values
+    if not values:
+        return None
+    if attr == 'newbie':
+        return values[0] == 'TRUE'
+    if attr in INTEGER_ATTRS:
+        try:
+            return int(values[0])
+        except ValueError:
+            pass
+    return values[0]
@@ -0,0 +1,155 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Journal Module; contains RBJournal class for recording what each
+sync run did in an sqlite database."""
+
+# System modules
+
+import sqlite3
+import time
+
+from rberror import RBFatalError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    finished TEXT,
+    rrslog TEXT,
+    presync TEXT
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    run INTEGER NOT NULL REFERENCES runs(run),
+    time TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    uid TEXT,
+    action TEXT NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS outcomes_action ON outcomes (stage, action, uid);
+CREATE INDEX IF NOT EXISTS outcomes_run ON outcomes (run);
+'''
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBJournal:
+    """Class for the sync journal. Each sync run is recorded along with an
+    outcome for every stage started and completed and every action taken
+    on a user. Each outcome is committed as it is recorded so the journal
+    is accurate even if sync is interrupted.
+
+    In test mode nothing is written but lookups still work, so a test run
+    shows what a real run would skip."""
+
+    def __init__(self, filename, test=False):
+        """Open (creating if needed) given journal database."""
+
+        self.filename = filename
+        self.test = test
+        self.run = None
+        try:
+            self.db = sqlite3.connect(filename)
+            self.db.executescript(SCHEMA)
+        except sqlite3.Error as err:
+            raise RBFatalError("Could not open sync journal '%s' [%s]" %
+                               (filename, err))
+
+    def close(self):
+        """Close journal database."""
+
+        self.db.close()
+
+    def start_run(self, rrslog=None, presync=None):
+        """Record the start of a new sync run."""
+
+        if self.test:
+            return
+        with self.db:
+            cur = self.db.execute(
+                'INSERT INTO runs (started, rrslog, presync) '
+                'VALUES (?, ?, ?)', (timestamp(), rrslog, presync))
+        self.run = cur.lastrowid
+
+    def finish_run(self):
+        """Record the end of the current sync run."""
+
+        if self.test or self.run is None:
+            return
+        with self.db:
+            self.db.execute('UPDATE runs SET finished = ? WHERE run = ?',
+                            (timestamp(), self.run))
+
+    def record(self, stage, uid, action, detail=None):
+        """Record outcome of given action on given user (or None for the
+        stage itself) in given stage of the current run."""
+
+        if self.test or self.run is None:
+            return
+        with self.db:
+            self.db.execute(
+                'INSERT INTO outcomes (run, time, stage, uid, action, detail) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self.run, timestamp(), stage, uid, action, detail))
+
+    def users(self, stage, action):
+        """Return set of usernames that had given action done in given
+        stage by any run."""
+
+        return set(row[0] for row in self.db.execute(
+            'SELECT uid FROM outcomes WHERE stage = ? AND action = ?',
+            (stage, action)))
+
+    def add_users(self, stage, action, uids):
+        """Record given action as done in given stage for all given
+        usernames in one transaction (e.g. importing old state)."""
+
+        if self.test or self.run is None:
+            return
+        now = timestamp()
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO outcomes (run, time, stage, uid, action) '
+                'VALUES (?, ?, ?, ?, ?)',
+                ((self.run, now, stage, uid, action) for uid in uids))
+
+    def runs(self):
+        """Return list of (run, started, finished, rrslog, presync) for all
+        runs, oldest first."""
+
+        return self.db.execute(
+            'SELECT run, started, finished, rrslog, presync FROM runs '
+            'ORDER BY run').fetchall()
+
+    def last_run(self):
+        """Return number of the most recent run or None."""
+
+        return self.db.execute('SELECT MAX(run) FROM runs').fetchone()[0]
+
+    def outcomes(self, run):
+        """Return list of (time, stage, uid, action, detail) for given run
+        in the order they were recorded."""
+
+        return self.db.execute(
+            'SELECT time, stage, uid, action, detail FROM outcomes '
+            'WHERE run = ? ORDER BY rowid', (run,)).fetchall()
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def timestamp():
+    """Return current time as a journal timestamp."""
+
+    return time.strftime('%Y-%m-%d %H:%M:%S')
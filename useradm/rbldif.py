@@ -0,0 +1,253 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick LDIF Module; contains RBLDIFEntry class and functions for
+streaming LDIF (RFC 2849) files such as slapcat dumps.
+
+Files are read and written a record at a time so memory use does not grow
+with the size of the dump. Folded lines and base64 values are handled in
+both directions. Values are str, decoded as UTF-8 with surrogateescape so
+binary values (e.g. jpegPhoto) are written back unchanged."""
+
+# System modules
+
+import base64
+import re
+
+from rberror import RBFatalError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+# Maximum output line length before folding.
+#
+LINE_WIDTH = 76
+
+# A value must be base64 encoded if it starts with a space, colon or less
+# than sign, ends with a space or contains anything outside printable ASCII
+# (RFC 2849 SAFE-STRING is stricter about the first character only).
+#
+RE_UNSAFE = re.compile(r'^[ :<]|[^\x20-\x7e]| $')
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBLDIFEntry:
+    """Class for an LDIF record: a DN and an ordered list of [attribute,
+    value] pairs. Change records keep their changetype and any modify
+    operation lines ('replace: x', '-' separators with an empty value) as
+    pairs in the order read. Attribute names are matched case
+    insensitively."""
+
+    def __init__(self, dn, attrs=None):
+        """Create new RBLDIFEntry object with given DN and list of
+        (attribute, value) pairs."""
+
+        self.dn = dn
+        self.attrs = [list(i) for i in attrs or ()]
+
+    def __repr__(self):
+        return 'RBLDIFEntry(%r, %r)' % (self.dn, self.attrs)
+
+    @property
+    def changetype(self):
+        """Changetype of a change record or None for a content record."""
+
+        return self.get('changetype')
+
+    def get(self, name, default=None):
+        """Return first value of given attribute."""
+
+        name = name.lower()
+        for attr, value in self.attrs:
+            if attr.lower() == name:
+                return value
+        return default
+
+    def get_all(self, name):
+        """Return list of all values of given attribute."""
+
+        name = name.lower()
+        return [value for attr, value in self.attrs if attr.lower() == name]
+
+    def add(self, name, value):
+        """Add given attribute value after any existing values of that
+        attribute (or at the end)."""
+
+        lname = name.lower()
+        pos = len(self.attrs)
+        for i, (attr, _) in enumerate(self.attrs):
+            if attr.lower() == lname:
+                pos = i + 1
+        self.attrs.insert(pos, [name, value])
+
+    def set(self, name, value):
+        """Replace all values of given attribute with a single value, kept
+        in the position of the first existing value (or added at the
+        end)."""
+
+        lname = name.lower()
+        for i, (attr, _) in enumerate(self.attrs):
+            if attr.lower() == lname:
+                self.attrs[i][1] = value
+                self.attrs[i + 1:] = [
+                    j for j in self.attrs[i + 1:] if j[0].lower() != lname
+                ]
+                return
+        self.attrs.append([name, value])
+
+    def remove(self, name):
+        """Remove all values of given attribute."""
+
+        lname = name.lower()
+        self.attrs = [i for i in self.attrs if i[0].lower() != lname]
+
+    def to_ldif(self, width=LINE_WIDTH):
+        """Return record in LDIF format as bytes, including the blank line
+        that ends it."""
+
+        lines = [format_line('dn', self.dn, width)]
+        for attr, value in self.attrs:
+            if attr == '-':
+                lines.append(b'-\n')
+            else:
+                lines.append(format_line(attr, value, width))
+        lines.append(b'\n')
+        return b''.join(lines)
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def read_records(fd):
+    """Return iterator of (offset, data) pairs for each record in given
+    binary file object. data is the raw bytes of the record including any
+    trailing blank lines, so joining all of them gives back the file."""
+
+    offset = 0
+    record = []
+    size = 0
+    content = False
+    for line in fd:
+        blank = not line.strip()
+        if blank and content:
+            record.append(line)
+            size += len(line)
+            yield offset, b''.join(record)
+            offset += size
+            record = []
+            size = 0
+            content = False
+            continue
+        if not blank:
+            content = True
+        record.append(line)
+        size += len(line)
+    if record:
+        yield offset, b''.join(record)
+
+
+def unfold(data):
+    """Return list of logical lines in given raw record with folded lines
+    joined and comments removed."""
+
+    lines = []
+    comment = False
+    for line in data.split(b'\n'):
+        line = line.rstrip(b'\r')
+        if line.startswith(b' '):
+            if not comment:
+                if not lines:
+                    raise RBFatalError('LDIF continuation line without a '
+                                       'line to continue')
+                lines[-1] += line[1:]
+        elif line.startswith(b'#'):
+            comment = True
+        elif line:
+            comment = False
+            lines.append(line)
+    return lines
+
+
+def parse_line(line):
+    """Return (attribute, value) pair for given unfolded line."""
+
+    if line == b'-':
+        return '-', ''
+    pos = line.find(b':')
+    if pos < 1:
+        raise RBFatalError('Invalid LDIF line: %r' % line[:80])
+    attr = line[:pos].decode('ascii', 'surrogateescape')
+    value = line[pos + 1:]
+    if value.startswith(b':'):
+        try:
+            value = base64.b64decode(value[1:].strip(), validate=True)
+        except ValueError:
+            raise RBFatalError('Invalid base64 value for %s' % attr)
+    elif value.startswith(b'<'):
+        raise RBFatalError('LDIF URL values are not supported (%s)' % attr)
+    else:
+        value = value.lstrip(b' ')
+    return attr, value.decode('utf-8', 'surrogateescape')
+
+
+def parse_record(data):
+    """Return RBLDIFEntry for given raw record, or None if the record has no
+    DN (i.e. only comments, a version line or the search result trailer
+    ldapsearch adds)."""
+
+    pairs = [parse_line(line) for line in unfold(data)]
+    if pairs and pairs[0][0].lower() == 'version':
+        pairs.pop(0)
+    if not pairs or pairs[0][0].lower() in ('search', 'result'):
+        return None
+    if pairs[0][0].lower() != 'dn':
+        raise RBFatalError('LDIF record does not start with dn: %r' %
+                           (pairs[0], ))
+    return RBLDIFEntry(pairs[0][1], pairs[1:])
+
+
+def parse(fd):
+    """Return iterator of RBLDIFEntry objects for each record in given
+    binary file object."""
+
+    for _, data in read_records(fd):
+        entry = parse_record(data)
+        if entry is not None:
+            yield entry
+
+
+def format_line(attr, value, width=LINE_WIDTH):
+    """Return given attribute value as an LDIF line (bytes), base64 encoded
+    if needed and folded at given width."""
+
+    if isinstance(value, bytes):
+        raw = value
+        value = value.decode('utf-8', 'surrogateescape')
+    else:
+        raw = value.encode('utf-8', 'surrogateescape')
+    if RE_UNSAFE.search(value):
+        line = ('%s:: ' % attr).encode() + base64.b64encode(raw)
+    else:
+        line = ('%s: ' % attr).encode() + raw
+
+    if len(line) <= width:
+        return line + b'\n'
+    folded = [line[:width]]
+    for i in range(width, len(line), width - 1):
+        folded.append(b' ' + line[i:i + width - 1])
+    return b'\n'.join(folded) + b'\n'
+
+
+def write(fd, entries, width=LINE_WIDTH):
+    """Write given RBLDIFEntry objects to given binary file object."""
+
+    for entry in entries:
+        fd.write(entry.to_ldif(width))
@@ -0,0 +1,188 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick LDIF Index Module; contains RBLDIFIndex class for looking up
+entries in large LDIF dumps (e.g. slapcat backups) by DN.
+
+The index is a sidecar file (the LDIF filename with '.idx' appended) holding
+an open addressing hash table of DN hash -> (offset, length) of the record
+in the LDIF file (all integers little endian):
+
+    magic       8 bytes 'RBLDIX1\\n'
+    slots       8 byte unsigned, number of hash table slots
+    count       8 byte unsigned, number of entries
+    size        8 byte unsigned, size of LDIF file when indexed
+    mtime       8 byte unsigned, mtime of LDIF file in ns when indexed
+    table       slots entries of (8 byte DN hash, 8 byte offset + 1, 4 byte
+                length), an offset of 0 marks an empty slot
+
+Both files are memory mapped, a lookup reads one or two slots and the
+record itself, which is checked against the DN asked for."""
+
+# System modules
+
+import array
+import hashlib
+import mmap
+import os
+import struct
+
+import rbldif
+from rberror import RBFatalError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+MAGIC = b'RBLDIX1\n'
+HEADER = struct.Struct('<QQQQ')
+SLOT = struct.Struct('<QQI')
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBLDIFIndex:
+    """Class for read only DN lookups in an indexed LDIF file."""
+
+    def __init__(self, filename, index=None):
+        """Open given LDIF file and its index. Raises RBFatalError if the
+        index is missing or out of date."""
+
+        self.filename = filename
+        self.index = index or filename + '.idx'
+        self.maps = []
+        self.files = []
+
+        try:
+            self.ldif = self.mmap(filename)
+            self.table = self.mmap(self.index)
+        except (IOError, ValueError) as err:
+            self.close()
+            raise RBFatalError("Could not open LDIF index '%s' [%s]" %
+                               (self.index, err))
+
+        if self.table[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise RBFatalError("'%s' is not an LDIF index" % self.index)
+        self.slots, self.count, size, mtime = HEADER.unpack_from(
+            self.table, len(MAGIC))
+        stat = os.stat(filename)
+        if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+            self.close()
+            raise RBFatalError("LDIF index '%s' is out of date, rebuild it" %
+                               self.index)
+
+    def mmap(self, filename):
+        """Return read only memory map of given file."""
+
+        fd = open(filename, 'rb')
+        self.files.append(fd)
+        data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(data)
+        return data
+
+    def close(self):
+        """Unmap and close files."""
+
+        for i in self.maps + self.files:
+            i.close()
+        self.maps = []
+        self.files = []
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, dn):
+        return self.raw(dn) is not None
+
+    def raw(self, dn):
+        """Return raw LDIF record for given DN or None."""
+
+        key = dn_hash(dn)
+        norm = normalise_dn(dn)
+        start = len(MAGIC) + HEADER.size
+        slot = key % self.slots
+        while True:
+            khash, offset, length = SLOT.unpack_from(self.table,
+                                                     start + slot * SLOT.size)
+            if not offset:
+                return None
+            if khash == key:
+                data = self.ldif[offset - 1:offset - 1 + length]
+                if normalise_dn(record_dn(data)) == norm:
+                    return data
+            slot = (slot + 1) % self.slots
+
+    def get(self, dn):
+        """Return RBLDIFEntry for given DN or None."""
+
+        data = self.raw(dn)
+        return None if data is None else rbldif.parse_record(data)
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def normalise_dn(dn):
+    """Return DN in canonical form for comparison: lower case with no
+    spaces around separators."""
+
+    return ','.join('='.join(j.strip() for j in i.split('='))
+                    for i in dn.lower().split(','))
+
+
+def dn_hash(dn):
+    """Return 64 bit hash of normalised DN."""
+
+    return int.from_bytes(
+        hashlib.blake2b(normalise_dn(dn).encode('utf-8', 'surrogateescape'),
+                        digest_size=8).digest(), 'little')
+
+
+def record_dn(data):
+    """Return DN of given raw record or None if it has none."""
+
+    entry = rbldif.parse_record(data)
+    return None if entry is None else entry.dn
+
+
+def build_index(filename, index=None):
+    """Build index for given LDIF file. Returns number of entries indexed.
+    Index is written to a temporary file first and renamed into place."""
+
+    index = index or filename + '.idx'
+    keys, offsets, lengths = array.array('Q'), array.array('Q'), array.array(
+        'L')
+    with open(filename, 'rb') as ldif:
+        stat = os.fstat(ldif.fileno())
+        for offset, data in rbldif.read_records(ldif):
+            dn = record_dn(data)
+            if dn is not None:
+                keys.append(dn_hash(dn))
+                offsets.append(offset)
+                lengths.append(len(data.rstrip()))
+
+    # Keep the table at most half full so probe sequences stay short.
+    #
+    slots = max(2 * len(keys), 1)
+    table = bytearray(slots * SLOT.size)
+    for key, offset, length in zip(keys, offsets, lengths):
+        slot = key % slots
+        while SLOT.unpack_from(table, slot * SLOT.size)[1]:
+            slot = (slot + 1) % slots
+        SLOT.pack_into(table, slot * SLOT.size, key, offset + 1, length)
+
+    tmpfile = index + '.tmp'
+    with open(tmpfile, 'wb') as fd:
+        fd.write(MAGIC)
+        fd.write(HEADER.pack(slots, len(keys), stat.st_size,
+                             stat.st_mtime_ns))
+        fd.write(table)
+    os.rename(tmpfile, index)
+    return len(keys)
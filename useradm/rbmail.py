@@ -0,0 +1,272 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Mail Module; contains RBMailTemplate class and the templates for
+all mails sent to users."""
+
+# System modules
+
+import email.utils
+import re
+import string
+
+import rbconfig
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+MAIL_FROM = 'Redbrick Admin Team <admins@redbrick.dcu.ie>'
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBMailTemplate:
+    """Class for a precompiled mail message template.
+
+    A template is a list of (header, value) pairs and a message body. Values
+    and body use string.Template '${name}' placeholders which are filled in
+    from the attributes of an RBUser object and any extra template data
+    given. A header which renders to an empty value is left out.
+
+    A body line starting with '?name ' is only included if 'name' has a
+    value (i.e. is not None or empty), e.g. '?course      course: ${course}'.
+
+    An optional derive function is called with the RBUser object and the
+    dictionary of template values for each message so that it can add any
+    values that depend on the user (e.g. a paragraph chosen by yearsPaid).
+
+    """
+
+    re_cond = re.compile(r'^\?(\w+) ?(.*)$', re.S)
+
+    def __init__(self, headers, body, derive=None):
+        """Create new RBMailTemplate object, compiling the given headers
+        and body."""
+
+        self.headers = [(name, string.Template(value))
+                        for name, value in headers]
+        self.derive = derive
+
+        # Body is compiled into a list of (condition, template) pairs.
+        # Runs of unconditional lines are joined into a single template
+        # so that they are substituted in one go.
+        #
+        self.body = []
+        text = []
+        for line in body.splitlines(True):
+            res = self.re_cond.search(line)
+            if res:
+                if text:
+                    self.body.append((None, string.Template(''.join(text))))
+                    text = []
+                self.body.append((res.group(1), string.Template(res.group(2))))
+            else:
+                text.append(line)
+        if text:
+            self.body.append((None, string.Template(''.join(text))))
+
+    def render(self, usr, data=None):
+        """Return complete RFC 5322 message for given RBUser object (which
+        may be None for mails that are not about a user)."""
+
+        values = dict(data or ())
+        if usr is not None:
+            for i in usr.attr_list_all:
+                values[i] = getattr(usr, i)
+        if self.derive:
+            self.derive(usr, values)
+
+        # Conditions are tested on the actual values, substitution is done
+        # with None replaced by an empty string.
+        #
+        subst = dict((k, '' if v is None else v) for k, v in values.items())
+
+        message = []
+        for name, value in self.headers:
+            value = value.safe_substitute(subst)
+            if value:
+                message.append('%s: %s\n' % (name, value))
+        message.append('Date: %s\n' % email.utils.formatdate(localtime=True))
+        message.append('Message-ID: %s\n' %
+                       email.utils.make_msgid(domain=rbconfig.DCU_ZONES[0]))
+        message.append('MIME-Version: 1.0\n')
+        message.append('Content-Type: text/plain; charset=utf-8\n')
+        message.append('Content-Transfer-Encoding: 8bit\n\n')
+
+        for cond, tmpl in self.body:
+            if cond is None or values.get(cond) not in (None, ''):
+                message.append(tmpl.safe_substitute(subst))
+
+        return ''.join(message)
+
+    def render_batch(self, users, data=None):
+        """Return list of (recipient, message) pairs for given list of
+        RBUser objects. Template data is shared by all messages."""
+
+        return [(usr.altmail, self.render(usr, data)) for usr in users]
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def gen_unpaid_data():
+    """Return template data for the renewal reminder from rbconfig."""
+
+    return {
+        'deadline': rbconfig.gen_renewal_deadline(),
+        'prices': ''.join('%-12s EUR %d\n' % (desc, price)
+                          for desc, price in rbconfig.MEMBERSHIP_PRICES)
+    }
+
+
+def derive_welcome(usr, values):
+    """Add newbie dependant greeting to welcome template values."""
+
+    if usr.newbie:
+        values['greeting'] = ('Welcome to Redbrick, the DCU Networking '
+                              'Society! Thank you for joining.')
+    else:
+        values['greeting'] = ('Welcome back to Redbrick, the DCU Networking '
+                              'Society! Thank you for renewing.')
+
+
+def derive_unpaid(usr, values):
+    """Add Cc header and yearsPaid dependant notice to renewal reminder
+    template values."""
+
+    # Don't Cc their alternate address if it's just their redbrick one.
+    #
+    if usr.altmail and usr.altmail.lower().find(
+            '%s@redbrick.dcu.ie' % usr.uid) == -1:
+        values['cc'] = usr.altmail
+    else:
+        values['cc'] = None
+
+    if usr.yearsPaid == 0:
+        values['notice'] = UNPAID_NOTICE_DISABLE.safe_substitute(
+            deadline=values.get('deadline', ''))
+    else:
+        values['notice'] = UNPAID_NOTICE_DELETE.template
+
+
+# --------------------------------------------------------------------------- #
+# TEMPLATES                                                                   #
+# --------------------------------------------------------------------------- #
+
+WELCOME = RBMailTemplate(
+    (('From', MAIL_FROM),
+     ('Subject', 'Welcome to Redbrick! - Your Account Details'),
+     ('To', '${altmail}'),
+     ('Reply-To', 'admin-request@redbrick.dcu.ie')), '''\
+${greeting}
+
+Your Redbrick Account details are:
+
+             username: ${uid}
+?passwd              password: ${passwd}
+?passwd
+         account type: ${usertype}
+                 name: ${cn}
+?id             id number: ${id}
+?course                course: ${course}
+?year                  year: ${year}
+
+-------------------------------------------------------------------------------
+
+your Redbrick webpage: https://www.redbrick.dcu.ie/~${uid}
+your Redbrick email: ${uid}@redbrick.dcu.ie
+
+You can find out more about our services at:
+https://www.redbrick.dcu.ie/about/welcome
+
+We recommend that you change your password as soon as you login.
+
+Problems with your password or wish to change your username? Contact:
+admin-request@redbrick.dcu.ie
+
+Problems using Redbrick in general or not sure what to do? Contact:
+helpdesk-request@redbrick.dcu.ie
+
+Have fun!
+
+- Redbrick Admin Team
+''', derive_welcome)
+
+UNPAID_NOTICE_DISABLE = string.Template('''\
+If you do not renew by the ${deadline}, your account will be disabled.
+Your account will remain on the system for a grace period of a year - you
+just won't be able to login. So don't worry, it won't be deleted any time
+soon! You can renew at any time during the year.
+''')
+
+UNPAID_NOTICE_DELETE = string.Template('''\
+If you do not renew within the following month, your account WILL BE
+DELETED at the start of the new year. This is because you were not
+recorded as having paid for last year and as such are nearing the end of
+your one year 'grace' period to renew. Please make sure to renew as soon
+as possible otherwise please contact us at: accounts@redbrick.dcu.ie.
+''')
+
+UNPAID = RBMailTemplate(
+    (('From', MAIL_FROM),
+     ('Subject', 'Time to renew your Redbrick account!'),
+     ('To', '${uid}@redbrick.dcu.ie'),
+     ('Cc', '${cc}'),
+     ('Reply-To', 'accounts@redbrick.dcu.ie')), '''\
+Hey there,
+
+It's that time again to renew your Redbrick account!
+Membership prices, as set by the SLC, are as follows:
+
+${prices}
+Note: if you have left DCU, you need to apply for associate membership.
+
+You can pay in person, by lodging money into our account, electronic bank
+transfer, or even PayPal! All the details you need are here:
+
+https://www.redbrick.dcu.ie/help/joining/
+
+Our bank details are:
+
+a/c name: DCU Redbrick Society
+IBAN: IE59BOFI90675027999600
+BIC: BOFIIE2D
+a/c number: 27999600
+sort code: 90 - 67 - 50
+
+Please Note!
+------------
+${notice}
+If in fact you have renewed and have received this email in error, it is
+important you let us know. Just reply to this email and tell us how and
+when you renewed and we'll sort it out.
+
+For your information, your current Redbrick account details are:
+
+         username: ${uid}
+     account type: ${usertype}
+             name: ${cn}
+alternative email: ${altmail}
+?id             id number: ${id}
+?course                course: ${course}
+?year                  year: ${year}
+
+If any of the above details are wrong, please correct them when you
+renew!
+
+- Redbrick Admin Team
+''', derive_unpaid)
+
+COMMITTEE = RBMailTemplate(
+    (('From', MAIL_FROM),
+     ('Subject', '${subject}'),
+     ('To', 'committee@redbrick.dcu.ie')), '''\
+${body}
+''')
@@ -0,0 +1,234 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Metrics Module; contains RBMetrics class for recording RRS
+request, phase and LDAP latencies as Prometheus histograms.
+
+Every RRS request is a new CGI process, so save() adds the values recorded
+by a request to the totals kept in a JSON state file and rewrites the
+Prometheus text exposition file from them. The exposition file can be read
+by the node_exporter textfile collector or fetched from server.py as
+/metrics."""
+
+# System modules
+
+import fcntl
+import functools
+import json
+import os
+import time
+
+# RedBrick modules
+
+import rbconfig
+from rbprofile import LDAPProxy
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+# Histogram bucket upper bounds in seconds.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# RBUserDB connection attribute -> backend label.
+
+BACKENDS = {'ldap': 'rb', 'ldap_dcu': 'dcu'}
+
+# Metric name -> (type, help text).
+
+METRICS = {
+    'rrs_request_seconds':
+    ('histogram', 'RRS request latency by mode and stage (form or action).'),
+    'rrs_phase_seconds':
+    ('histogram', 'RRS time spent in CGI startup, database connect and the '
+     'command itself.'),
+    'rrs_ldap_seconds':
+    ('histogram', 'LDAP operation latency by backend and operation.'),
+    'rrs_ldap_bytes_total':
+    ('counter', 'Bytes returned by LDAP searches by backend and operation.'),
+    'rrs_errors_total': ('counter', 'RRS requests ending in an error by mode.')
+}
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBMetrics:
+    """Class for histograms and counters of a single RRS request."""
+
+    def __init__(self):
+        """Create new RBMetrics object."""
+
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, seconds, **labels):
+        """Add a value in seconds to named histogram."""
+
+        hist = self.histograms.setdefault(name, {}).setdefault(
+            label_string(labels), new_histogram())
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist['buckets'][i] += 1
+        hist['sum'] += seconds
+        hist['count'] += 1
+
+    def inc(self, name, value=1, **labels):
+        """Add value to named counter."""
+
+        counter = self.counters.setdefault(name, {})
+        key = label_string(labels)
+        counter[key] = counter.get(key, 0) + value
+
+    def wrap(self, name, func, size=None):
+        """Return func wrapped to record its latency in rrs_ldap_seconds.
+        name is connection.operation as given by rbprofile.LDAPProxy. If
+        given, size(result) is added to rrs_ldap_bytes_total."""
+
+        attr, op = name.split('.', 1)
+        labels = {'backend': BACKENDS.get(attr, attr), 'op': op}
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                res = func(*args, **kwargs)
+            finally:
+                self.observe('rrs_ldap_seconds', time.perf_counter() - start,
+                             **labels)
+            if size is not None:
+                self.inc('rrs_ldap_bytes_total', size(res), **labels)
+            return res
+
+        return timed
+
+    def instrument(self, udb):
+        """Record every call on the LDAP connections of given (connected)
+        RBUserDB."""
+
+        for attr in BACKENDS:
+            if getattr(udb, attr, None) is not None:
+                setattr(udb, attr, LDAPProxy(getattr(udb, attr), attr, self))
+
+    def save(self, state=None, filename=None):
+        """Add recorded values to the totals in the state file and rewrite
+        the exposition file from them. The state file is locked for the
+        duration so concurrent requests are not lost."""
+
+        state = state or rbconfig.FILE_RRS_METRICS_STATE
+        filename = filename or rbconfig.FILE_RRS_METRICS
+
+        with open(state, 'a+') as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            fd.seek(0)
+            try:
+                totals = json.loads(fd.read() or '{}')
+            except ValueError:
+                # A truncated state file restarts the totals, which a
+                # scraper treats as a counter reset.
+                totals = {}
+            totals = self.merge(totals)
+            fd.seek(0)
+            fd.truncate()
+            json.dump(totals, fd)
+            fd.flush()
+
+            tmp = filename + '.tmp'
+            with open(tmp, 'w') as out:
+                out.write(exposition(totals))
+            os.replace(tmp, filename)
+
+    def merge(self, totals):
+        """Return given totals (as kept in the state file) with recorded
+        values added."""
+
+        histograms = totals.setdefault('histograms', {})
+        counters = totals.setdefault('counters', {})
+        for name, values in self.histograms.items():
+            for key, hist in values.items():
+                total = histograms.setdefault(name, {}).get(key)
+                if not total or len(total['buckets']) != len(BUCKETS):
+                    total = histograms[name][key] = new_histogram()
+                total['buckets'] = [
+                    a + b for a, b in zip(total['buckets'], hist['buckets'])
+                ]
+                total['sum'] += hist['sum']
+                total['count'] += hist['count']
+        for name, values in self.counters.items():
+            for key, value in values.items():
+                total = counters.setdefault(name, {})
+                total[key] = total.get(key, 0) + value
+        return totals
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def new_histogram():
+    """Return empty histogram."""
+
+    return {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+
+
+def label_string(labels):
+    """Return labels as a Prometheus label list without braces, sorted by
+    name."""
+
+    return ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')) for k, v in sorted(labels.items()))
+
+
+def series(name, key, extra=''):
+    """Return Prometheus series name for given metric name and label
+    strings."""
+
+    key = ','.join(i for i in (key, extra) if i)
+    return '%s{%s}' % (name, key) if key else name
+
+
+def exposition(totals):
+    """Return given totals in the Prometheus text exposition format."""
+
+    lines = []
+    histograms = totals.get('histograms', {})
+    counters = totals.get('counters', {})
+    for name in sorted(set(histograms) | set(counters)):
+        kind, text = METRICS.get(name, ('untyped', name))
+        lines.append('# HELP %s %s' % (name, text))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for key, hist in sorted(histograms.get(name, {}).items()):
+            for bound, count in zip(BUCKETS, hist['buckets']):
+                lines.append('%s %d' % (series(
+                    name + '_bucket', key, 'le="%s"' % bound), count))
+            lines.append('%s %d' % (series(name + '_bucket', key,
+                                           'le="+Inf"'), hist['count']))
+            lines.append('%s %r' % (series(name + '_sum', key), hist['sum']))
+            lines.append('%s %d' % (series(name + '_count', key),
+                                    hist['count']))
+        for key, value in sorted(counters.get(name, {}).items()):
+            lines.append('%s %d' % (series(name, key), value))
+    return '\n'.join(lines) + '\n'
+
+
+def process_age():
+    """Return seconds since this process started (i.e. including
+    interpreter startup and module imports) or None if not known. Needs
+    Linux /proc."""
+
+    try:
+        with open('/proc/self/stat') as fd:
+            stat = fd.read()
+        with open('/proc/uptime') as fd:
+            uptime = float(fd.read().split()[0])
+        # Fields after the command name start at field 3, starttime is
+        # field 22 in clock ticks since boot.
+        start = int(stat.rsplit(')', 1)[1].split()[19])
+        return max(uptime - start / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError):
+        return None
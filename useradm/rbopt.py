@@ -49,5 +49,12 @@ class RBOpt:
         self.quiet = None
         self.rrslog = None
         self.presync = None
+        self.incremental = None
+        self.profile = None
+        self.profile_dump = None
+        self.local = None
+        self.format = None
+        self.attrs = None
+        self.paid = None
         # Used by rrs.
         self.action = None
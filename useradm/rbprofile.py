@@ -0,0 +1,155 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Profile Module; contains RBProfile class for timing LDAP
+operations, database writes, commands and mails of a useradm run.
+
+Nothing is instrumented unless RBProfile.instrument() is called, the
+methods it wraps are replaced on the given objects only, so a run without
+profiling is unchanged."""
+
+# System modules
+
+import cProfile
+import functools
+import math
+import time
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+PERCENTILES = (50, 90, 99)
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBProfile:
+    """Class for per-operation counts, latencies and bytes returned."""
+
+    def __init__(self, dump=None):
+        """Create new RBProfile object. If given a filename, cProfile
+        statistics are also collected and saved to it by report()."""
+
+        self.times = {}
+        self.bytes = {}
+        self.dump = dump
+        self.profiler = None
+        if dump:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def wrap(self, name, func, size=None):
+        """Return func wrapped to record its latency under given name. If
+        given, size(result) is the number of bytes returned."""
+
+        times = self.times.setdefault(name, [])
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                res = func(*args, **kwargs)
+            finally:
+                times.append(time.perf_counter() - start)
+            if size is not None:
+                self.bytes[name] = self.bytes.get(name, 0) + size(res)
+            return res
+
+        return timed
+
+    def instrument(self, udb=None, acc=None):
+        """Instrument given RBUserDB (wrapper, by the function it wraps,
+        and every call on its LDAP connections) and RBAccount (runcmd)."""
+
+        if udb is not None:
+            for attr in 'ldap', 'ldap_dcu':
+                if getattr(udb, attr) is not None:
+                    setattr(udb, attr, LDAPProxy(getattr(udb, attr), attr,
+                                                 self))
+            wrapper = udb.wrapper
+
+            def timed_wrapper(function, *args, **kwargs):
+                return self.wrap('wrapper.' + function.__name__, wrapper)(
+                    function, *args, **kwargs)
+
+            udb.wrapper = timed_wrapper
+        if acc is not None:
+            acc.runcmd = self.wrap('runcmd', acc.runcmd,
+                                   lambda res: len(res[0] or ''))
+
+    def report(self, fd):
+        """Print table of operations to given file and save cProfile
+        statistics if requested."""
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.dump)
+
+        print('%-24s %6s %9s %8s %8s %8s %8s %10s' %
+              (('operation', 'count', 'total ms') +
+               tuple('p%d ms' % i for i in PERCENTILES) + ('max ms', 'bytes')),
+              file=fd)
+        for name in sorted(self.times):
+            times = sorted(self.times[name])
+            if not times:
+                continue
+            print('%-24s %6d %9.1f %s %8.2f %10s' %
+                  (name, len(times), 1000 * sum(times), ' '.join(
+                      '%8.2f' % (1000 * percentile(times, i))
+                      for i in PERCENTILES), 1000 * times[-1],
+                   self.bytes.get(name, '-')), file=fd)
+        if self.dump:
+            print('cProfile statistics saved to %s' % self.dump, file=fd)
+
+
+class LDAPProxy:
+    """LDAPObject with every method call recorded by an RBProfile as
+    name.method."""
+
+    def __init__(self, conn, name, profile):
+        """Create new LDAPProxy for given connection."""
+
+        self.conn = conn
+        self.name = name
+        self.profile = profile
+        self.methods = {}
+
+    def __getattr__(self, attr):
+        value = getattr(self.conn, attr)
+        if not callable(value):
+            return value
+        if attr not in self.methods:
+            self.methods[attr] = self.profile.wrap(
+                '%s.%s' % (self.name, attr), value,
+                result_size if attr in ('search_s', 'result') else None)
+        return self.methods[attr]
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def percentile(values, pct):
+    """Return given percentile of sorted list of values (nearest rank)."""
+
+    return values[max(int(math.ceil(pct / 100.0 * len(values))) - 1, 0)]
+
+
+def result_size(res):
+    """Return number of bytes of DNs, attribute names and values in given
+    search_s() or result() return value."""
+
+    if isinstance(res, tuple):
+        res = res[1]
+    total = 0
+    for dn, data in res or ():
+        total += len(dn)
+        for attr, values in data.items():
+            total += len(attr) + sum(len(i) for i in values)
+    return total
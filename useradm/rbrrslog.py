@@ -0,0 +1,187 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick RRS Log Module; contains RBRRSLog class for incremental
+processing of the rrs.log file used by useradm sync."""
+
+# System modules
+
+import json
+import os
+
+from rberror import RBFatalError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBRRSLog:
+    """Class to stream the rrs.log file and keep the username maps used by
+    sync in a checkpoint file, along with the byte offset processed so far
+    and which sync stages have completed.
+
+    Log lines are of the form 'date time:updatedby:action:args...' as
+    written by rrs_log_add() in rrs.py. The time contains colons, so the
+    action is the fifth colon separated field."""
+
+    def __init__(self, filename, checkpoint=None):
+        """Create new RBRRSLog object for given log file. Checkpoint file
+        defaults to the log filename with '.checkpoint' appended and is
+        loaded if it exists."""
+
+        self.filename = filename
+        self.checkpoint = checkpoint or filename + '.checkpoint'
+        self.reset()
+        self.load()
+
+    def reset(self):
+        """Forget all processed entries and completed stages."""
+
+        self.offset = 0
+        self.inode = None
+        self.user_convert = {}
+        self.user_rename_reverse = {}
+        self.reset_password = {}
+        self.stages_done = []
+
+    def load(self):
+        """Load state from checkpoint file if there is one."""
+
+        try:
+            with open(self.checkpoint, 'r') as fd:
+                state = json.load(fd)
+        except FileNotFoundError:
+            return
+        except (IOError, ValueError) as err:
+            raise RBFatalError("Could not read checkpoint file '%s' [%s]" %
+                               (self.checkpoint, err))
+
+        for k in ('offset', 'inode', 'user_convert', 'user_rename_reverse',
+                  'reset_password', 'stages_done'):
+            setattr(self, k, state[k])
+
+    def save(self):
+        """Write state to checkpoint file atomically."""
+
+        tmpfile = self.checkpoint + '.tmp'
+        with open(tmpfile, 'w') as fd:
+            json.dump({
+                'offset': self.offset,
+                'inode': self.inode,
+                'user_convert': self.user_convert,
+                'user_rename_reverse': self.user_rename_reverse,
+                'reset_password': self.reset_password,
+                'stages_done': self.stages_done
+            }, fd)
+        os.rename(tmpfile, self.checkpoint)
+
+    def update(self):
+        """Process any entries added to the log since the last checkpoint.
+        Returns number of new entries processed.
+
+        If the log was replaced or truncated (i.e. a new rrs.log for a new
+        year) all state is reset and it is processed from the start. If any
+        new entries are found, the completed stages are forgotten as earlier
+        stages may have more work to do. A partially written last line is
+        left for the next update and lines that aren't valid UTF-8 are
+        skipped like any other invalid line."""
+
+        fd = open(self.filename, 'rb')
+        stat = os.fstat(fd.fileno())
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.reset()
+            self.inode = stat.st_ino
+
+        fd.seek(self.offset)
+        entries = 0
+        for line in fd:
+            if not line.endswith(b'\n'):
+                break
+            self.offset += len(line)
+            try:
+                line = line.decode()
+            except UnicodeDecodeError:
+                continue
+            if self.process_line(line.rstrip()):
+                entries += 1
+        fd.close()
+
+        if entries:
+            self.stages_done = []
+        return entries
+
+    def process_line(self, line):
+        """Update username maps for given log line. Returns true if the
+        line was a valid log entry."""
+
+        tlog = line.split(':')
+        try:
+            self.process_entry(tlog)
+        except (IndexError, ValueError):
+            return 0
+        return 1
+
+    def process_entry(self, tlog):
+        """Update username maps for given split up log entry."""
+
+        # We ignore renames of new accounts as we just go by the final
+        # entry in the database.
+        #
+        if tlog[4] == 'rename-existing':
+            olduid = tlog[5]
+            newuid = tlog[6]
+
+            # Remove old user rename mapping and add new one unless
+            # it points back to the original username.
+            #
+            self.user_rename_reverse[newuid] = self.user_rename_reverse.pop(
+                olduid, olduid)
+            if self.user_rename_reverse[newuid] == newuid:
+                self.user_rename_reverse.pop(newuid)
+
+            # If this user was flagged for new password and/or a
+            # conversion, remove the old user mapping and add the
+            # new one.
+            #
+            if olduid in self.user_convert:
+                self.user_convert[newuid] = self.user_convert.pop(olduid)
+            if olduid in self.reset_password:
+                self.reset_password[newuid] = self.reset_password.pop(olduid)
+        elif tlog[4] == 'convert':
+            # User was converted, so we flag it. Don't care what
+            # they're converted to, we check that later.
+            #
+            self.user_convert[tlog[5]] = 1
+        elif tlog[4] == 'renew':
+            # tlog[7] indicates whether a new password is required
+            # or not. We take the last value of this in the log
+            # file as the final decision.
+            #
+            self.reset_password[tlog[5]] = int(tlog[7])
+        elif len(tlog) < 6:
+            raise IndexError(tlog)
+
+    def user_rename(self):
+        """Return olduid -> newuid map built from the reverse one."""
+
+        return dict((olduid, newuid)
+                    for newuid, olduid in self.user_rename_reverse.items())
+
+    def stage_done(self, stage):
+        """Return true if given sync stage has completed."""
+
+        return stage in self.stages_done
+
+    def set_stage_done(self, stage):
+        """Record given sync stage as completed and save checkpoint."""
+
+        if stage not in self.stages_done:
+            self.stages_done.append(stage)
+        self.save()
@@ -0,0 +1,232 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Snapshot Module; contains RBSnapshot class for reading and
+functions for writing the pre_sync account snapshot file.
+
+File format (all integers little endian):
+
+    magic       8 bytes 'RBSNAP1\\n'
+    count       8 byte unsigned, number of records
+    index       8 byte unsigned, file offset of index
+    fields      tab separated field names terminated by newline
+    records     one per line, tab separated values in field order, sorted
+                by uid (first field). Empty value means None.
+    index       count entries of (8 byte offset, 4 byte length), one for
+                each record in the same (sorted) order.
+
+Lookups binary search the index, only touching the records compared, so
+the file is memory mapped and never loaded in full."""
+
+# System modules
+
+import ast
+import mmap
+import os
+import struct
+
+from rberror import RBFatalError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+MAGIC = b'RBSNAP1\n'
+HEADER = struct.Struct('<QQ')
+INDEX_ENTRY = struct.Struct('<QI')
+
+# Fields stored for each account. uid must be first as it is the key. The
+# field names are stored in the file so older snapshots with fewer fields
+# can still be read.
+#
+FIELDS = ('uid', 'homeDirectory', 'usertype', 'uidNumber', 'id', 'yearsPaid',
+          'newbie')
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBSnapshot:
+    """Class for read only access to a snapshot file. Behaves like a
+    dictionary of username -> dictionary of fields."""
+
+    def __init__(self, filename):
+        """Open and memory map given snapshot file."""
+
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise RBFatalError("Snapshot file '%s' is empty" % filename)
+
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise RBFatalError("'%s' is not a snapshot file" % filename)
+
+        self.count, self.index = HEADER.unpack_from(self.map, len(MAGIC))
+        start = len(MAGIC) + HEADER.size
+        end = self.map.find(b'\n', start)
+        self.fields = tuple(self.map[start:end].decode().split('\t'))
+
+    def close(self):
+        """Unmap and close snapshot file."""
+
+        self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, uid):
+        return self.find(uid) is not None
+
+    def __getitem__(self, uid):
+        pos = self.find(uid)
+        if pos is None:
+            raise KeyError(uid)
+        return self.record(pos)
+
+    def __iter__(self):
+        for pos in range(self.count):
+            yield self.key(pos)
+
+    def get(self, uid, default=None):
+        """Return fields for given username or default if not present."""
+
+        pos = self.find(uid)
+        return default if pos is None else self.record(pos)
+
+    def items(self):
+        """Return iterator of (username, fields) pairs in username
+        order."""
+
+        for pos in range(self.count):
+            rec = self.record(pos)
+            yield rec[self.fields[0]], rec
+
+    # ------------------------------------------------------------------ #
+    # INTERNAL METHODS                                                   #
+    # ------------------------------------------------------------------ #
+
+    def line(self, pos):
+        """Return raw record line for given index position."""
+
+        offset, length = INDEX_ENTRY.unpack_from(
+            self.map, self.index + pos * INDEX_ENTRY.size)
+        return self.map[offset:offset + length]
+
+    def key(self, pos):
+        """Return username of record at given index position."""
+
+        line = self.line(pos)
+        return line[:line.find(b'\t')].decode()
+
+    def record(self, pos):
+        """Return fields dictionary of record at given index position."""
+
+        values = self.line(pos).decode().split('\t')
+        return dict((k, v or None) for k, v in zip(self.fields, values))
+
+    def find(self, uid):
+        """Return index position of given username or None."""
+
+        key = uid.encode()
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            line = self.line(mid)
+            cur = line[:line.find(b'\t')]
+            if cur < key:
+                low = mid + 1
+            elif cur > key:
+                high = mid
+            else:
+                return mid
+        return None
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def write_snapshot(filename, records, fields=FIELDS):
+    """Write given dictionary of username -> dictionary of fields to
+    snapshot file. File is written to a temporary file first and renamed
+    into place."""
+
+    index = []
+    tmpfile = '%s.tmp' % filename
+    snap = open(tmpfile, 'wb')
+    snap.write(MAGIC)
+    snap.write(HEADER.pack(0, 0))
+    snap.write(('\t'.join(fields) + '\n').encode())
+
+    for uid in sorted(records, key=lambda k: k.encode()):
+        rec = dict(records[uid], **{fields[0]: uid})
+        values = []
+        for k in fields:
+            val = rec.get(k)
+            val = '' if val is None else str(val)
+            if '\t' in val or '\n' in val:
+                snap.close()
+                os.unlink(tmpfile)
+                raise RBFatalError("Invalid %s for user '%s' in snapshot" %
+                                   (k, uid))
+            values.append(val)
+        line = '\t'.join(values).encode()
+        index.append((snap.tell(), len(line)))
+        snap.write(line + b'\n')
+
+    index_offset = snap.tell()
+    for entry in index:
+        snap.write(INDEX_ENTRY.pack(*entry))
+    snap.seek(len(MAGIC))
+    snap.write(HEADER.pack(len(index), index_offset))
+    snap.close()
+    os.rename(tmpfile, filename)
+
+
+def is_snapshot(filename):
+    """Return true if given file is a snapshot file."""
+
+    with open(filename, 'rb') as snap:
+        return snap.read(len(MAGIC)) == MAGIC
+
+
+def read_old_pre_sync(filename):
+    """Return dictionary from an old style pre_sync file (a pprint of the
+    old_ldap dictionary). The dictionary is parsed as a literal and never
+    executed."""
+
+    with open(filename, 'r') as presync:
+        text = presync.read()
+    start = text.find('{')
+    if start == -1:
+        raise RBFatalError("'%s' is not a pre_sync file" % filename)
+    try:
+        old_ldap = ast.literal_eval(text[start:])
+    except (SyntaxError, ValueError):
+        raise RBFatalError("Could not parse pre_sync file '%s'" % filename)
+
+    # Older dumps have everything as bytes straight from LDAP.
+    #
+    def decode(val):
+        return val.decode() if isinstance(val, bytes) else val
+
+    return dict((decode(uid), dict((k, decode(v)) for k, v in rec.items()))
+                for uid, rec in old_ldap.items())
+
+
+def convert_pre_sync(oldfile, newfile):
+    """Convert old style pre_sync file to a snapshot file. Returns number
+    of records converted."""
+
+    old_ldap = read_old_pre_sync(oldfile)
+    write_snapshot(newfile, old_ldap)
+    return len(old_ldap)
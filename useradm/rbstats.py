@@ -0,0 +1,141 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Stats Module; contains RBStats class for counting accounts by
+usertype, payment and signed-in status, from LDAP or an LDIF dump."""
+
+# System modules
+
+import math
+
+import rbconfig
+import rbldif
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+CATEGORIES = ('paid', 'unpaid', 'nonpay', 'newbie', 'signed_paid',
+              'signed_unpaid', 'signed_nonpay', 'signed_newbie', 'nosign_paid',
+              'nosign_unpaid', 'nosign_nonpay', 'nosign_newbie', 'TOTAL')
+
+# Only these attributes are parsed from an LDIF record, the rest of each
+# record is skipped without decoding.
+#
+LDIF_ATTRS = (b'dn:', b'uid:', b'objectclass:', b'yearspaid:', b'newbie:')
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBStats:
+    """Class for account statistics table and quorum figures."""
+
+    def __init__(self):
+        """Create new RBStats object with all counters zero."""
+
+        self.usertypes = dict((k, dict((c, 0) for c in CATEGORIES))
+                              for k in rbconfig.USERTYPES)
+
+    def add(self, usertype, yearsPaid, newbie, signed):
+        """Count an account."""
+
+        counts = self.usertypes[usertype]
+        sign = signed and 'signed' or 'nosign'
+        pay = (yearsPaid is None and 'nonpay' or yearsPaid > 0 and 'paid' or
+               'unpaid')
+        counts['TOTAL'] += 1
+        counts[pay] += 1
+        counts['%s_%s' % (sign, pay)] += 1
+        if newbie:
+            counts['newbie'] += 1
+            counts['%s_newbie' % sign] += 1
+
+    def totals(self):
+        """Return dictionary of category totals over all usertypes."""
+
+        return dict((c, sum(i[c] for i in self.usertypes.values()))
+                    for c in CATEGORIES)
+
+    def quorum(self):
+        """Return (total paid members, committee & staff, quorum)."""
+
+        total_paid = sum(self.usertypes[i]['paid']
+                         for i in ('member', 'committe', 'staff'))
+        return total_paid, math.ceil(math.sqrt(total_paid))
+
+    def report(self):
+        """Print table and quorum figures on standard output."""
+
+        ordered_usertypes = list(rbconfig.USERTYPES_LIST) + [
+            i for i in rbconfig.USERTYPES if i not in rbconfig.USERTYPES_LIST
+        ]
+        rule = ' ' * 9 + ' ' + ' '.join('  =====' for _ in CATEGORIES) + ' '
+
+        print(' ' * 9, ' '.join(len(c) > 6 and '%7s' % c[:6] or ' ' * 7
+                                for c in CATEGORIES), '')
+        print(' ' * 9, ' '.join(len(c) > 6 and '%7.6s' % c[6:] or '%7s' % c
+                                for c in CATEGORIES), '')
+        print(rule)
+        for usertype in ordered_usertypes:
+            print('%9s' % usertype,
+                  ' '.join('%7d' % self.usertypes[usertype][c]
+                           for c in CATEGORIES), '')
+        print(rule)
+
+        totals = self.totals()
+        print('%9s' % 'ALL', ' '.join('%7d' % totals[c] for c in CATEGORIES),
+              '\n\n')
+
+        total_paid, quorum = self.quorum()
+        print("Total paid members, committee & staff:", total_paid)
+        print("Quorum (rounded-up square root of above):", quorum)
+        print("'Active' users (paid and non-paying signed-in users):",
+              totals['signed_paid'] + totals['signed_nonpay'])
+        print("%d of %d newbies signed-in (%d%%)\n" %
+              (totals['signed_newbie'], totals['newbie'],
+               totals['newbie'] and
+               100.0 * totals['signed_newbie'] / totals['newbie']))
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def usertype_of(objectclasses):
+    """Return usertype for given list of objectClass values or None."""
+
+    for i in objectclasses:
+        if i in rbconfig.USERTYPES:
+            return i
+    return None
+
+
+def from_ldif(fd, signed=None):
+    """Return RBStats for the accounts in given binary file object of LDIF
+    (slapcat or ldapsearch output). signed is the set of usernames that
+    have signed in, if None no one is counted as signed in."""
+
+    stats = RBStats()
+    suffix = ',' + rbconfig.LDAP_ACCOUNTS_TREE.lower()
+    for _, data in rbldif.read_records(fd):
+        attrs = {}
+        for line in rbldif.unfold(data):
+            if line[:12].lower().startswith(LDIF_ATTRS):
+                attr, value = rbldif.parse_line(line)
+                attrs.setdefault(attr.lower(), []).append(value)
+        dn = attrs.get('dn', [''])[0].lower()
+        if not dn.endswith(suffix) or ',' in dn[:-len(suffix)]:
+            continue
+        usertype = usertype_of(attrs.get('objectclass', ()))
+        if usertype is None or 'uid' not in attrs:
+            continue
+        years = attrs.get('yearspaid')
+        stats.add(usertype, years and int(years[0]),
+                  attrs.get('newbie', [''])[0] == 'TRUE',
+                  signed is not None and attrs['uid'][0] in signed)
+    return stats
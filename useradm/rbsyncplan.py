@@ -0,0 +1,224 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick Sync Plan Module; contains RBSyncPlan class which derives the
+actions for useradm sync by comparing two account tree snapshots."""
+
+# RedBrick modules
+
+import rbconfig
+import rbldif
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBSyncPlan:
+    """Class for the sync action plan between an old tree (the pre_sync
+    snapshot) and a new tree (current LDAP, a snapshot or an LDIF dump).
+
+    Both trees are mappings of username -> dictionary of fields as returned
+    by RBUserDB.list_pre_sync() or RBSnapshot. Accounts are matched on
+    uidNumber, which RRS keeps across renames and conversions, then on DCU
+    id number and finally on username for accounts missing either. Newbies
+    are always new accounts.
+
+    Old accounts with neither uidNumber nor id (snapshots converted from an
+    old style pre_sync dump) can't be joined, so their renames are taken
+    from the rrs.log rename map if given.
+
+    Each tree is read once: the old tree is hashed on each key, then every
+    new account is classified by hash lookups in a single pass.
+
+    The plan has the same username maps as RBRRSLog (user_convert,
+    user_rename_reverse, reset_password and user_rename()) so the sync
+    stages can be driven by either."""
+
+    def __init__(self, old, new, reset_password=None, renames=None):
+        """Create new RBSyncPlan object comparing given old and new trees.
+        Password reset flags are only recorded in rrs.log, if not given
+        every renewal is mailed without a new password. renames is the
+        rrs.log map of old username -> new username (RBRRSLog.user_rename())
+        used for old accounts that have no uidNumber or id."""
+
+        self.renames = {}
+        self.converts = {}
+        self.adds = []
+        self.deletes = []
+        self.renewals = []
+        self.warnings = []
+
+        # Hash old tree on each key. Usernames are unique but duplicate
+        # uidNumbers or ids would make matching ambiguous, so they are
+        # dropped from the join and a warning noted.
+        #
+        old_usertype = {}
+        unkeyed = set()
+        by_key = {'uidNumber': {}, 'id': {}}
+        dups = {'uidNumber': set(), 'id': set()}
+        for uid, rec in old.items():
+            old_usertype[uid] = rec.get('usertype')
+            if not rec.get('uidNumber') and not rec.get('id'):
+                unkeyed.add(uid)
+            for key, table in by_key.items():
+                val = rec.get(key)
+                if val is None or val == '':
+                    continue
+                val = str(val)
+                if val in table:
+                    dups[key].add(val)
+                    self.warnings.append(
+                        'Duplicate %s %s in old tree: %s, %s' %
+                        (key, val, table[val], uid))
+                else:
+                    table[val] = uid
+        for key, vals in dups.items():
+            for val in vals:
+                del by_key[key][val]
+
+        # Renames of old accounts that can't be joined come from rrs.log.
+        #
+        logged = {}
+        for olduid, newuid in (renames or {}).items():
+            if olduid in unkeyed and newuid in new:
+                logged[newuid] = olduid
+        if unkeyed and renames is None:
+            self.warnings.append(
+                '%d old accounts have no uidNumber or id, their renames '
+                'are only found from rrs.log' % len(unkeyed))
+
+        # Newbies are always new accounts, even if a uidNumber or id happens
+        # to match an old account.
+        #
+        matched = set(logged.values())
+        for uid, rec in new.items():
+            if rec.get('newbie') == 'TRUE' and uid not in old_usertype:
+                self.adds.append(uid)
+                continue
+
+            olduid = logged.get(uid)
+            if olduid is None:
+                for key in ('uidNumber', 'id'):
+                    val = rec.get(key)
+                    if val is not None and val != '':
+                        olduid = by_key[key].get(str(val))
+                        if olduid is not None and olduid not in matched:
+                            break
+                        olduid = None
+            if olduid is None and uid in old_usertype and uid not in matched:
+                olduid = uid
+
+            if olduid is None:
+                self.adds.append(uid)
+                continue
+
+            matched.add(olduid)
+            if olduid != uid:
+                self.renames[olduid] = uid
+            if rec.get('usertype') != old_usertype[olduid]:
+                self.converts[uid] = (old_usertype[olduid], rec.get('usertype'))
+            if (rec.get('newbie') != 'TRUE' and
+                    int(rec.get('yearsPaid') or 0) > 0):
+                self.renewals.append(uid)
+
+        self.deletes = [uid for uid in old_usertype if uid not in matched]
+
+        self.adds.sort()
+        self.deletes.sort()
+        self.renewals.sort()
+
+        if reset_password is None:
+            reset_password = dict((uid, 0) for uid in self.renewals)
+        self.reset_password = reset_password
+
+    # ------------------------------------------------------------------ #
+    # RBRRSLOG COMPATIBLE MAPS                                           #
+    # ------------------------------------------------------------------ #
+
+    @property
+    def user_convert(self):
+        """Dictionary of converted usernames (new username -> 1)."""
+
+        return dict((uid, 1) for uid in self.converts)
+
+    @property
+    def user_rename_reverse(self):
+        """Dictionary of new username -> old username."""
+
+        return dict((newuid, olduid)
+                    for olduid, newuid in self.renames.items())
+
+    def user_rename(self):
+        """Return dictionary of old username -> new username."""
+
+        return dict(self.renames)
+
+    # ------------------------------------------------------------------ #
+    # REPORT                                                             #
+    # ------------------------------------------------------------------ #
+
+    def report(self):
+        """Return list of lines describing the plan."""
+
+        lines = []
+        for olduid, newuid in sorted(self.renames.items()):
+            lines.append('rename   %s -> %s' % (olduid, newuid))
+        for uid, (oldtype, newtype) in sorted(self.converts.items()):
+            lines.append('convert  %s: %s -> %s' % (uid, oldtype, newtype))
+        for uid in self.deletes:
+            lines.append('delete   %s' % uid)
+        for uid in self.adds:
+            lines.append('add      %s' % uid)
+        for uid in self.renewals:
+            lines.append('renew    %s%s' %
+                         (uid, ' (new password)'
+                          if self.reset_password.get(uid) else ''))
+        for warning in self.warnings:
+            lines.append('WARNING: %s' % warning)
+        lines.append('%d renames, %d converts, %d deletes, %d adds, '
+                     '%d renewals' % (len(self.renames), len(self.converts),
+                                      len(self.deletes), len(self.adds),
+                                      len(self.renewals)))
+        return lines
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def read_ldif(fd):
+    """Return account tree from given LDIF dump (binary file) in the same
+    form as RBUserDB.list_pre_sync(). Entries outside the accounts tree or
+    without a usertype are skipped."""
+
+    tree = {}
+    suffix = ',' + rbconfig.LDAP_ACCOUNTS_TREE.lower()
+    for entry in rbldif.parse(fd):
+        dn = entry.dn.lower()
+        if not dn.endswith(suffix) or ',' in dn[:-len(suffix)]:
+            continue
+        uid = entry.get('uid')
+        if uid is None:
+            continue
+        for usertype in entry.get_all('objectClass'):
+            if usertype in rbconfig.USERTYPES:
+                break
+        else:
+            continue
+        tree[uid] = {
+            'homeDirectory': entry.get('homeDirectory'),
+            'usertype': usertype,
+            'uidNumber': entry.get('uidNumber'),
+            'id': entry.get('id'),
+            'yearsPaid': entry.get('yearsPaid'),
+            'newbie': entry.get('newbie')
+        }
+    return tree
@@ -0,0 +1,181 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick LDIF Transform Module; runs a chain of registered per-entry
+transforms over an LDIF dump using a pool of worker processes."""
+
+# System modules
+
+import collections
+import multiprocessing
+import os
+
+import rbldif
+from rberror import RBFatalError
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+# Transform name -> (function, description, parallel). Functions take an
+# RBLDIFEntry and the context dictionary and return the entry (modified in
+# place or a new one) or None to drop it. Parallel transforms only look at
+# the entry given and run in the worker processes, the rest need state
+# carried from one entry to the next and run in order in the main process.
+#
+TRANSFORMS = {}
+
+# Number of records sent to a worker at a time.
+#
+BATCH_SIZE = 500
+
+# --------------------------------------------------------------------------- #
+# TRANSFORMS                                                                  #
+# --------------------------------------------------------------------------- #
+
+
+def register(name, desc, parallel=True):
+    """Decorator to register a transform function under given name."""
+
+    def decorator(func):
+        TRANSFORMS[name] = (func, desc, parallel)
+        return func
+
+    return decorator
+
+
+@register('yearsPaid', 'Decrement yearsPaid for the new year')
+def transform_yearspaid(entry, context):
+    """Decrement yearsPaid."""
+
+    if entry.get('yearsPaid') is not None:
+        entry.set('yearsPaid', str(int(entry.get('yearsPaid')) - 1))
+    return entry
+
+
+@register('newbie', 'Reset newbie to FALSE')
+def transform_newbie(entry, context):
+    """Reset newbie flag."""
+
+    if entry.get('newbie') is not None:
+        entry.set('newbie', 'FALSE')
+    return entry
+
+
+@register('founder_soc', 'Add 9 to yearsPaid and reset newbie (founders, '
+          'clubs and societies)')
+def transform_founder_soc(entry, context):
+    """Extend yearsPaid for founder and club/soc accounts."""
+
+    if entry.get('yearsPaid') is not None:
+        entry.set('yearsPaid', str(int(entry.get('yearsPaid')) + 9))
+    return transform_newbie(entry, context)
+
+
+@register('uidNumber', 'Assign uidNumbers to entries with uidNumber -1 '
+          'starting from the given uidNumber', parallel=False)
+def transform_uidnumber(entry, context):
+    """Fill in uidNumber placeholders in order."""
+
+    if entry.get('uidNumber') == '-1':
+        if context.get('uidNumber') is None:
+            raise RBFatalError('No starting uidNumber given for uidNumber '
+                               'transform')
+        entry.set('uidNumber', str(context['uidNumber']))
+        context['uidNumber'] += 1
+    return entry
+
+
+# --------------------------------------------------------------------------- #
+# MODULE FUNCTIONS                                                            #
+# --------------------------------------------------------------------------- #
+
+
+def apply_chain(names, data, context):
+    """Apply given transforms to given raw record and return the new raw
+    record (empty if dropped). Records with no entry pass through."""
+
+    entry = rbldif.parse_record(data)
+    if entry is None:
+        return data
+    for name in names:
+        entry = TRANSFORMS[name][0](entry, context)
+        if entry is None:
+            return b''
+    return entry.to_ldif()
+
+
+def transform_batch(args):
+    """Worker function: apply given parallel transforms to a batch of raw
+    records and return the batch of results."""
+
+    names, batch = args
+    context = {}
+    return [apply_chain(names, data, context) for data in batch]
+
+
+def batches(fd, size=BATCH_SIZE):
+    """Return iterator of lists of up to size raw records from given
+    binary file object."""
+
+    batch = []
+    for _, data in rbldif.read_records(fd):
+        batch.append(data)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def transform(infd, outfd, names, processes=None, context=None):
+    """Run given chain of transform names over LDIF from binary file object
+    infd writing to binary file object outfd. Output is in input order.
+
+    The leading run of parallel transforms is done in a process pool (one
+    process per CPU by default), the rest of the chain in this process.
+    At most two batches per process are in flight so memory use does not
+    depend on the size of the input. Returns number of records read."""
+
+    for name in names:
+        if name not in TRANSFORMS:
+            raise RBFatalError("Unknown transform '%s'" % name)
+    context = {} if context is None else context
+
+    split = 0
+    while split < len(names) and TRANSFORMS[names[split]][2]:
+        split += 1
+    parallel, serial = list(names[:split]), list(names[split:])
+
+    def output(results):
+        """Write results of a batch, applying the serial transforms."""
+
+        for data in results:
+            if serial and data:
+                data = apply_chain(serial, data, context)
+            outfd.write(data)
+        return len(results)
+
+    total = 0
+    if not parallel or processes == 1:
+        for batch in batches(infd):
+            total += output(transform_batch((parallel, batch)))
+        return total
+
+    processes = processes or os.cpu_count() or 1
+    pool = multiprocessing.Pool(processes)
+    try:
+        pending = collections.deque()
+        for batch in batches(infd):
+            pending.append(
+                pool.apply_async(transform_batch, ((parallel, batch), )))
+            if len(pending) >= 2 * processes:
+                total += output(pending.popleft().get())
+        while pending:
+            total += output(pending.popleft().get())
+    finally:
+        pool.terminate()
+        pool.join()
+    return total
@@ -0,0 +1,105 @@
+# --------------------------------------------------------------------------- #
+# MODULE DESCRIPTION                                                          #
+# --------------------------------------------------------------------------- #
+"""RedBrick uidNumber Index Module; contains RBUidNumberIndex class."""
+
+# System modules
+
+import bisect
+
+# --------------------------------------------------------------------------- #
+# DATA                                                                        #
+# --------------------------------------------------------------------------- #
+
+__version__ = '$Revision: 1.1 $'
+
+# --------------------------------------------------------------------------- #
+# CLASSES                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+class RBUidNumberIndex:
+    """Class for an index of the uidNumbers in use, built once from a list
+    of (username, uidNumber) pairs (see RBUserDB.uidNumber_index()).
+
+    The distinct uidNumbers are held in a sorted list so that lookups are
+    binary searches. Duplicates are found while building the index."""
+
+    def __init__(self, pairs):
+        """Create new RBUidNumberIndex object from given (username,
+        uidNumber) pairs."""
+
+        pairs = sorted((int(num), uid) for uid, num in pairs)
+
+        self.numbers = []
+        self.uids = {}
+        dups = {}
+        for num, uid in pairs:
+            if self.numbers and self.numbers[-1] == num:
+                dups.setdefault(num, [self.uids[num]]).append(uid)
+            else:
+                self.numbers.append(num)
+                self.uids[num] = uid
+        self.dups = dups
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __contains__(self, num):
+        i = bisect.bisect_left(self.numbers, num)
+        return i < len(self.numbers) and self.numbers[i] == num
+
+    def max(self):
+        """Return highest uidNumber in use or -1 if there are none."""
+
+        return self.numbers[-1] if self.numbers else -1
+
+    def duplicates(self):
+        """Return list of (uidNumber, list of usernames) for uidNumbers
+        shared by more than one user, in uidNumber order."""
+
+        return sorted(self.dups.items())
+
+    def next_free(self, start=0):
+        """Return lowest free uidNumber greater than or equal to start.
+
+        Within a run of consecutive uidNumbers, number - position is
+        constant and it increases after every gap, so the end of the run
+        containing start is found with a second binary search."""
+
+        i = bisect.bisect_left(self.numbers, start)
+        if i == len(self.numbers) or self.numbers[i] != start:
+            return start
+
+        offset = start - i
+        low, high = i, len(self.numbers)
+        while low < high:
+            mid = (low + high) // 2
+            if self.numbers[mid] - mid == offset:
+                low = mid + 1
+            else:
+                high = mid
+        return self.numbers[low - 1] + 1
+
+    def is_free(self, start, count=1):
+        """Return true if all count uidNumbers from start are free."""
+
+        i = bisect.bisect_left(self.numbers, start)
+        return i == len(self.numbers) or self.numbers[i] >= start + count
+
+    def free_ranges(self, start=0, end=None):
+        """Return iterator of (first, last) inclusive ranges of free
+        uidNumbers between start and end (default: highest in use)."""
+
+        if end is None:
+            end = self.max()
+        i = bisect.bisect_left(self.numbers, start)
+        cur = start
+        while cur <= end:
+            if i == len(self.numbers) or self.numbers[i] > end:
+                yield cur, end
+                return
+            if self.numbers[i] > cur:
+                yield cur, self.numbers[i] - 1
+            cur = self.numbers[i] + 1
+            i += 1
@@ -115,7 +115,7 @@ class RBUser():
             for i in self.attr_list_all:
                 setattr(self, i, getattr(usr, i))
 
-        self.set_attr()
+        self.set_attr(**attrs)
 
     def __str__(self):
         """Returns a string representation of a user"""
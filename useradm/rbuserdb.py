@@ -3,18 +3,19 @@
 # --------------------------------------------------------------------------- #
 """RedBrick User Database Module; contains RBUserDB class."""
 import crypt
-import fcntl
-import math
-import os
 import random
 import re
 import sys
 import time
 
 import ldap
+import ldap.filter
 import rbconfig
+import rbstats
+from ldap.controls import SimplePagedResultsControl
 from rberror import RBError, RBFatalError, RBWarningError
 from rbopt import RBOpt
+from rbuidindex import RBUidNumberIndex
 from rbuser import RBUser
 
 # --------------------------------------------------------------------------- #
@@ -24,6 +25,15 @@ from rbuser import RBUser
 __version__ = '$Revision: 1.10 $'
 __author__ = 'Cillian Sharkey'
 
+# Paid state -> LDAP filter, as used by the list_paid/unpaid methods.
+
+FILTER_PAID = {
+    'paid': '(yearsPaid>=1)',
+    'unpaid': '(yearsPaid<=0)',
+    'normal': '(yearsPaid=0)',
+    'grace': '(yearsPaid<=-1)',
+}
+
 # --------------------------------------------------------------------------- #
 # CLASSES                                                                     #
 # --------------------------------------------------------------------------- #
@@ -46,12 +56,14 @@ class RBUserDB:
                 password=None,
                 dcu_uri=rbconfig.LDAP_DCU_URI,
                 dcu_dn=rbconfig.LDAP_DCU_RBDN,
-                dcu_pw=None):
+                dcu_pw=None,
+                dcu=True):
         """Connect to databases.
         Custom URI, DN and password may be given for RedBrick LDAP.
         Password if not given will be read from shared secret file set
         in rbconfig.
-        Custom URI may be given for DCU LDAP. """
+        Custom URI may be given for DCU LDAP. If dcu is false, DCU LDAP
+        is not connected to and ldap_dcu is left as None. """
         if not password:
             try:
                 pw_file = open(rbconfig.LDAP_ROOTPW_FILE, 'r')
@@ -60,6 +72,21 @@ class RBUserDB:
                 raise RBFatalError("Unable to open LDAP root password file")
             pw_file.close()
 
+        # Default protocol seems to be 2, set to 3.
+        ldap.set_option(ldap.OPT_PROTOCOL_VERSION, 3)
+
+        # Connect to RedBrick LDAP.
+        self.ldap = ldap.initialize(uri)
+        self.ldap.simple_bind_s(dn, password)
+
+        if dcu:
+            self.connect_dcu(dcu_uri, dcu_dn, dcu_pw)
+
+    def connect_dcu(self,
+                    dcu_uri=rbconfig.LDAP_DCU_URI,
+                    dcu_dn=rbconfig.LDAP_DCU_RBDN,
+                    dcu_pw=None):
+        """Connect to DCU LDAP only, as per connect()."""
         if not dcu_pw:
             try:
                 pw_file = open(rbconfig.LDAP_DCU_RBPW, 'r')
@@ -68,13 +95,8 @@ class RBUserDB:
                 raise RBFatalError("Unable to open DCU AD root password file")
             pw_file.close()
 
-        # Default protocol seems to be 2, set to 3.
         ldap.set_option(ldap.OPT_PROTOCOL_VERSION, 3)
 
-        # Connect to RedBrick LDAP.
-        self.ldap = ldap.initialize(uri)
-        self.ldap.simple_bind_s(dn, password)
-
         # Connect to DCU LDAP (anonymous bind).
         self.ldap_dcu = ldap.initialize(dcu_uri)
         #       self.ldap_dcu.simple_bind_s('', '')
@@ -101,18 +123,18 @@ class RBUserDB:
         RBFatalError is raised. If the username is in the additional
         reserved LDAP tree, an RBWarningError is raised and checked if
         it is to be overridden. """
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL, 'uid=%s' % uid)
         if res:
             raise RBFatalError(
                 "Username '%s' is already taken by %s account (%s)" %
                 (uid, res[0][1]['objectClass'][0].decode(),
                  res[0][1]['cn'][0].decode()))
-        res = self.ldap.search_s(rbconfig.ldap_group_tree, ldap.SCOPE_ONELEVEL,
+        res = self.ldap.search_s(rbconfig.LDAP_GROUP_TREE, ldap.SCOPE_ONELEVEL,
                                  'cn=%s' % uid)
         if res:
             raise RBFatalError("Username '%s' is reserved (LDAP Group)" % uid)
-        res = self.ldap.search_s(rbconfig.ldap_reserved_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_RESERVED_TREE,
                                  ldap.SCOPE_ONELEVEL, 'uid=%s' % uid)
         if res:
             self.rberror(
@@ -122,28 +144,28 @@ class RBUserDB:
     def check_user_byname(self, uid):
         """Raise RBFatalError if given username does not exist in user
         database."""
-        if not self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        if not self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                   ldap.SCOPE_ONELEVEL, 'uid=%s' % uid):
             raise RBFatalError("User '%s' does not exist" % uid)
 
     def check_user_byid(self, user_id):
         """Raise RBFatalError if given id does not belong to a user in
         user database."""
-        if not self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        if not self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                   ldap.SCOPE_ONELEVEL, 'id=%s' % user_id):
             raise RBFatalError("User with id '%s' does not exist" % user_id)
 
     def check_group_byname(self, group):
         """Raise RBFatalError if given group does not exist in group
         database."""
-        if not self.ldap.search_s(rbconfig.ldap_group_tree,
+        if not self.ldap.search_s(rbconfig.LDAP_GROUP_TREE,
                                   ldap.SCOPE_ONELEVEL, 'cn=%s' % group):
             raise RBFatalError("Group '%s' does not exist" % group)
 
     def check_group_byid(self, gid):
         """Raise RBFatalError if given id does not belong to a group in
         group database."""
-        if not self.ldap.search_s(rbconfig.ldap_group_tree,
+        if not self.ldap.search_s(rbconfig.LDAP_GROUP_TREE,
                                   ldap.SCOPE_ONELEVEL, 'gidNumber=%s' % gid):
             raise RBFatalError("Group with id '%s' does not exist" % gid)
 
@@ -156,12 +178,12 @@ class RBUserDB:
     # def get_usertype_byname(self, uid):
     #     """Return usertype for username in user database. Raise
     #     RBFatalError if user does not exist."""
-    #     res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+    #     res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
     #                              ldap.SCOPE_ONELEVEL, 'uid=%s' % usr.uid,
     #                              ('objectClass', ))
     #     if res:
     #         for i in res[0][1]['objectClass']:
-    #             if i in rbconfig.usertypes:
+    #             if i in rbconfig.USERTYPES:
     #                 return i
     #             else:
     #                raise RBFatalError("Unknown usertype for user '%s'" % uid)
@@ -172,7 +194,7 @@ class RBUserDB:
         """Populate RBUser object with data from user with given
         username in user database. Raise RBFatalError if user does not
         exist."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL, 'uid=%s' % usr.uid)
         if res:
             self.set_user(usr, res[0])
@@ -182,13 +204,43 @@ class RBUserDB:
     def get_user_byid(self, usr):
         """Populate RBUser object with data from user with given id in
         user database. Raise RBFatalError if user does not exist."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL, 'id=%s' % usr.id)
         if res:
             self.set_user(usr, res[0])
         else:
             raise RBFatalError("User with id '%s' does not exist" % usr.id)
 
+    def get_users(self, keys):
+        """Return dictionary of key -> RBUser for given usernames and ids
+        (strings of digits, which are tried as a username first), found
+        with one search. Keys that match no user are left out."""
+
+        terms = []
+        for key in keys:
+            terms.append('(uid=%s)' % ldap.filter.escape_filter_chars(key))
+            if key.isdigit():
+                terms.append('(id=%s)' % key)
+        if not terms:
+            return {}
+
+        by_uid, by_id = {}, {}
+        for entry in self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
+                                        ldap.SCOPE_ONELEVEL,
+                                        '(|%s)' % ''.join(terms)):
+            usr = RBUser()
+            self.set_user(usr, entry)
+            by_uid[usr.uid] = usr
+            if usr.id is not None:
+                by_id[str(usr.id)] = usr
+
+        res = {}
+        for key in keys:
+            usr = by_uid.get(key) or by_id.get(key)
+            if usr is not None:
+                res[key] = usr
+        return res
+
     def get_userinfo_new(self, usr, override=0):
         """Checks if ID already belongs to an existing user and if so
         raises RBFatalError. Populates RBUser object with data for new
@@ -224,7 +276,7 @@ class RBUserDB:
         usr.id = usr.id if usr.id is not None else curusr.id
         self.check_renewal_usertype(usr.usertype)
 
-        if usr.usertype in rbconfig.usertypes_dcu:
+        if usr.usertype in rbconfig.USERTYPES_DCU:
             # Load the dcu data using usertype and ID set in the given usr
             # or failing that from the current user database.
             #
@@ -264,7 +316,7 @@ class RBUserDB:
         if usr.newbie is None:
             usr.newbie = 1
         if (usr.yearsPaid is None and
-                (usr.usertype in rbconfig.usertypes_paying) and
+                (usr.usertype in rbconfig.USERTYPES_PAYING) and
                 usr.usertype not in ('committe', 'guest')):
             usr.yearsPaid = 1
 
@@ -272,7 +324,7 @@ class RBUserDB:
     def get_userdefaults_renew(cls, usr):
         """Populate RBUser object with some reasonable default values
         for renewal user"""
-        if usr.usertype in rbconfig.usertypes_paying:
+        if usr.usertype in rbconfig.USERTYPES_PAYING:
             if usr.yearsPaid is None or usr.yearsPaid < 1:
                 usr.yearsPaid = 1
 
@@ -342,7 +394,7 @@ class RBUserDB:
         value (None) unless override is enabled.
         Note that all students *should* be in the database, but only
         raise a RBWarningError if user does not exist."""
-        res = self.ldap_dcu.search_s(rbconfig.ldap_dcu_students_tree,
+        res = self.ldap_dcu.search_s(rbconfig.LDAP_DCU_STUDENTS_TREE,
                                      ldap.SCOPE_SUBTREE,
                                      'employeeNumber=%s' % usr.id)
         if res:
@@ -360,7 +412,7 @@ class RBUserDB:
         Not all alumni will be in the database, so only raise a
         RBWarningError if user does not exist."""
 
-        res = self.ldap_dcu.search_s(rbconfig.ldap_dcu_alumni_tree,
+        res = self.ldap_dcu.search_s(rbconfig.LDAP_DCU_ALUMNI_TREE,
                                      ldap.SCOPE_SUBTREE, 'cn=%s' % usr.id)
         if res:
             self.set_user_dcu(usr, res[0], override)
@@ -381,7 +433,7 @@ class RBUserDB:
         # or in the gecos, so try both.
         #
         res = self.ldap_dcu.search_s(
-            rbconfig.ldap_dcu_staff_tree, ldap.SCOPE_SUBTREE,
+            rbconfig.LDAP_DCU_STAFF_TREE, ldap.SCOPE_SUBTREE,
             '(|(cn=%s)(gecos=*,*%s))' % (usr.id, usr.id))
         if res:
             self.set_user_dcu(usr, res[0], override)
@@ -393,7 +445,7 @@ class RBUserDB:
     def get_dummyid(self, usr):
         """Set usr.id to unique 'dummy' DCU ID number."""
         raise RBFatalError('NOT YET IMPLEMENTED')
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL,
                                  '(&(id>=10000000)(id<20000000))"' % (usr.uid))
         if res:
@@ -405,7 +457,7 @@ class RBUserDB:
         """Get gid for given group name.
         Raise RBFatalError if given name does not belong to a group in
         group database."""
-        res = self.ldap.search_s(rbconfig.ldap_group_tree, ldap.SCOPE_ONELEVEL,
+        res = self.ldap.search_s(rbconfig.LDAP_GROUP_TREE, ldap.SCOPE_ONELEVEL,
                                  'cn=%s' % group)
         if res:
             return int(res[0][1]['gidNumber'][0])
@@ -416,7 +468,7 @@ class RBUserDB:
         """Get group name for given group ID.
         Raise RBFatalError if given id does not belong to a group in
         group database."""
-        res = self.ldap.search_s(rbconfig.ldap_group_tree, ldap.SCOPE_ONELEVEL,
+        res = self.ldap.search_s(rbconfig.LDAP_GROUP_TREE, ldap.SCOPE_ONELEVEL,
                                  'gidNumber=%s' % gid)
         if res:
             return res[0][1]['cn'][0]
@@ -430,13 +482,13 @@ class RBUserDB:
         # ou=<prevyear>,ou=accounts tree instead.
         if self.backup_shells is None:
             self.backup_shells = {}
-            backup = open(rbconfig.file_backup_passwd, 'r')
+            backup = open(rbconfig.FILE_BACKUP_PASSWD, 'r')
             for line in backup.readlines():
                 passwd = line.split(':')
                 self.backup_shells[passwd[0]] = passwd[6].rstrip()
             backup.close()
 
-        return self.backup_shells.get(username, rbconfig.shell_default)
+        return self.backup_shells.get(username, rbconfig.SHELL_DEFAULT)
 
     # ------------------------------------------------------------------- #
     # USER DATA SYNTAX CHECK METHODS                                      #
@@ -462,9 +514,9 @@ class RBUserDB:
             raise RBFatalError('Username must be given')
         if re.search(r'[^a-z0-9_.-]', uid):
             raise RBFatalError("Invalid characters in username")
-        if len(uid) > rbconfig.maxlen_uname:
+        if len(uid) > rbconfig.MAXLEN_UNAME:
             raise RBFatalError("Username can not be longer than %d characters"
-                               % rbconfig.maxlen_uname)
+                               % rbconfig.MAXLEN_UNAME)
         if re.search(r'^[^a-z0-9]', uid):
             raise RBFatalError("Username must begin with letter or number")
 
@@ -473,27 +525,27 @@ class RBUserDB:
         """Raise RBFatalError if usertype is not valid."""
         if not usertype:
             raise RBFatalError('Usertype must be given')
-        if usertype not in rbconfig.usertypes:
+        if usertype not in rbconfig.USERTYPES:
             raise RBFatalError("Invalid usertype '%s'" % usertype)
 
     @classmethod
     def check_convert_usertype(cls, usertype):
         """Raise RBFatalError if conversion usertype is not valid."""
-        if not (usertype in rbconfig.usertypes or
-                usertype in rbconfig.convert_usertypes):
+        if not (usertype in rbconfig.USERTYPES or
+                usertype in rbconfig.CONVERT_USERTYPES):
             raise RBFatalError("Invalid conversion usertype '%s'" % usertype)
 
     @classmethod
     def check_renewal_usertype(cls, usertype):
         """Raise RBFatalError if renewal usertype is not valid."""
-        if usertype not in rbconfig.usertypes_paying:
+        if usertype not in rbconfig.USERTYPES_PAYING:
             raise RBFatalError("Invalid renewal usertype '%s'" % usertype)
 
     @classmethod
     def check_id(cls, usr):
         """Raise RBFatalError if ID is not valid for usertypes
         that require one."""
-        if usr.usertype in rbconfig.usertypes_dcu:
+        if usr.usertype in rbconfig.USERTYPES_DCU:
             if usr.id is not None:
                 if not isinstance(usr.id, int):
                     raise RBFatalError('ID must be an integer')
@@ -505,7 +557,7 @@ class RBUserDB:
     @classmethod
     def check_years_paid(cls, usr):
         """Raise RBFatalError if years_paid is not valid."""
-        if usr.usertype in rbconfig.usertypes_paying:
+        if usr.usertype in rbconfig.USERTYPES_PAYING:
             if usr.yearsPaid is not None:
                 if not isinstance(usr.yearsPaid, int):
                     raise RBFatalError('Years paid must be an integer')
@@ -587,18 +639,15 @@ class RBUserDB:
         self.gen_accinfo(usr)
         self.set_updated(usr)
 
-        usr_uid, usr.uidNumber = self.uidNumber_getnext()
+        usr.uidNumber = self.uidNumber_getnext()
 
         if not usr.objectClass:
             usr.objectClass = [usr.usertype
-                               ] + rbconfig.ldap_default_objectClass
+                               ] + rbconfig.LDAP_DEFAULT_OBJECTCLASS
 
         self.wrapper(self.ldap.add_s,
                      self.uid2dn(usr.uid), self.usr2ldap_add(usr))
 
-        self.uidNumber_savenext(usr_uid, usr.uidNumber + 1)
-        self.uidNumber_unlock(usr_uid)
-
     def delete(self, usr):
         """Delete user from database."""
 
@@ -669,7 +718,7 @@ class RBUserDB:
         # If usertype is one of the pseudo usertypes, change the
         # usertype to 'committe' for the database conversion.
         #
-        if newusr.usertype in rbconfig.convert_usertypes:
+        if newusr.usertype in rbconfig.CONVERT_USERTYPES:
             newusr.usertype = 'committe'
             raise RBFatalError('NOT IMPLEMENTED YET')
 
@@ -696,14 +745,14 @@ class RBUserDB:
         usr.userPassword = self.userPassword(usr.passwd)
         self.wrapper(self.ldap.modify_s,
                      self.uid2dn(usr.uid), ((ldap.MOD_REPLACE, 'userPassword',
-                                             usr.userPassword), ))
+                                             usr.userPassword.encode()), ))
 
     def set_shell(self, usr):
         """Set shell for given user."""
 
         self.wrapper(self.ldap.modify_s,
                      self.uid2dn(usr.uid), ((ldap.MOD_REPLACE, 'loginShell',
-                                             usr.loginShell), ))
+                                             usr.loginShell.encode()), ))
 
     def reset_shell(self, usr):
         """Reset shell for given user."""
@@ -714,7 +763,7 @@ class RBUserDB:
             return 0
 
         # usr.loginShell = self.get_backup_shell(usr.uid)
-        usr.loginShell = rbconfig.shell_default
+        usr.loginShell = rbconfig.SHELL_DEFAULT
         self.set_shell(usr)
         return 1
 
@@ -769,85 +818,94 @@ class RBUserDB:
         """Return dictionary of all users for useradm pre_sync() dump."""
 
         res = self.ldap.search_s(
-            rbconfig.ldap_accounts_tree, ldap.SCOPE_ONELEVEL,
-            'objectClass=posixAccount', ('uid', 'homeDirectory',
-                                         'objectClass'))
+            rbconfig.LDAP_ACCOUNTS_TREE, ldap.SCOPE_ONELEVEL,
+            'objectClass=posixAccount', ('uid', 'homeDirectory', 'objectClass',
+                                         'uidNumber', 'id', 'yearsPaid',
+                                         'newbie'))
         tmp = {}
-        for data in res:
+        for _, data in res:
+            uid = data['uid'][0].decode()
             for i in data['objectClass']:
                 i = i.decode()
-                if i in rbconfig.usertypes:
+                if i in rbconfig.USERTYPES:
                     break
             else:
-                raise RBFatalError(
-                    "Unknown usertype for user '%s'" % data['uid'][0])
-
-            tmp[data['uid'][0]] = {
-                'homeDirectory': data['homeDirectory'][0],
-                'usertype': data['uid'][0]
+                raise RBFatalError("Unknown usertype for user '%s'" % uid)
+
+            tmp[uid] = {
+                'homeDirectory': data['homeDirectory'][0].decode(),
+                'usertype': i,
+                'uidNumber': data['uidNumber'][0].decode(),
+                'id': data['id'][0].decode() if data.get('id') else None,
+                'yearsPaid': (data['yearsPaid'][0].decode()
+                              if data.get('yearsPaid') else None),
+                'newbie': (data['newbie'][0].decode()
+                           if data.get('newbie') else None)
             }
         return tmp
 
     def list_users(self):
         """Return list of all usernames."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL,
                                  'objectClass=posixAccount', ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_paid_newbies(self):
         """Return list of all paid newbie usernames."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL,
-                                 '(&(yearsPaid>=1)(newbie=TRUE))', ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+                                 '(&%s(newbie=TRUE))' % FILTER_PAID['paid'],
+                                 ('uid', ))
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_paid_non_newbies(self):
         """Return list of all paid renewal (non-newbie) usernames."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL,
-                                 '(&(yearsPaid>=1)(newbie=FALSE))', ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+                                 '(&%s(newbie=FALSE))' % FILTER_PAID['paid'],
+                                 ('uid', ))
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_non_newbies(self):
         """Return list of all non newbie usernames."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL, 'newbie=FALSE',
                                  ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_newbies(self):
         """Return list of all newbie usernames."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL, 'newbie=TRUE', ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_groups(self):
         """Return list of all groups."""
-        res = self.ldap.search_s(rbconfig.ldap_group_tree, ldap.SCOPE_ONELEVEL,
+        res = self.ldap.search_s(rbconfig.LDAP_GROUP_TREE, ldap.SCOPE_ONELEVEL,
                                  'objectClass=posixGroup', ('cn', ))
-        return [data['cn'][0] for dn, data in res]
+        return [data['cn'][0].decode() for dn, data in res]
 
     def list_reserved(self):
         """Return list of all reserved entries."""
-        res = self.ldap.search_s(rbconfig.ldap_reserved_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_RESERVED_TREE,
                                  ldap.SCOPE_ONELEVEL, 'objectClass=reserved',
                                  ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_reserved_static(self):
         """Return list of all static reserved names."""
         res = self.ldap.search_s(
-            rbconfig.ldap_reserved_tree, ldap.SCOPE_ONELEVEL,
+            rbconfig.LDAP_RESERVED_TREE, ldap.SCOPE_ONELEVEL,
             '(&(objectClass=reserved)(flag=static))', ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_reserved_dynamic(self):
         """Return list of all dynamic reserved names."""
         res = self.ldap.search_s(
-            rbconfig.ldap_reserved_tree, ldap.SCOPE_ONELEVEL,
+            rbconfig.LDAP_RESERVED_TREE, ldap.SCOPE_ONELEVEL,
             '(&(objectClass=reserved)(!(flag=static)))', ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_reserved_all(self):
         """Return list of all usernames that are taken or reserved.
@@ -857,32 +915,34 @@ class RBUserDB:
 
     def list_unpaid(self):
         """Return list of all non-renewed users."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
-                                 ldap.SCOPE_ONELEVEL, 'yearsPaid<=0',
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
+                                 ldap.SCOPE_ONELEVEL, FILTER_PAID['unpaid'],
                                  ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_unpaid_normal(self):
         """Return list of all normal non-renewed users."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
-                                 ldap.SCOPE_ONELEVEL, 'yearsPaid=0', ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
+                                 ldap.SCOPE_ONELEVEL, FILTER_PAID['normal'],
+                                 ('uid', ))
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_unpaid_grace(self):
         """Return list of all grace non-renewed users."""
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
-                                 ldap.SCOPE_ONELEVEL, 'yearsPaid<=-1',
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
+                                 ldap.SCOPE_ONELEVEL, FILTER_PAID['grace'],
                                  ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     def list_unpaid_reset(self):
         """Return list of all non-renewed users with reset shells
         (i.e. not expired)."""
         res = self.ldap.search_s(
-            rbconfig.ldap_accounts_tree, ldap.SCOPE_ONELEVEL,
-            '(&(yearsPaid<=0)(!(loginShell=%s)))' % rbconfig.shell_expired,
+            rbconfig.LDAP_ACCOUNTS_TREE, ldap.SCOPE_ONELEVEL,
+            '(&%s(!(loginShell=%s)))' % (FILTER_PAID['unpaid'],
+                                         rbconfig.SHELL_EXPIRED),
             ('uid', ))
-        return [data['uid'][0] for dn, data in res]
+        return [data['uid'][0].decode() for dn, data in res]
 
     # ------------------------------ #
     # METHODS RETURNING DICTIONARIES #
@@ -891,29 +951,83 @@ class RBUserDB:
     def dict_reserved_desc(self):
         """Return dictionary of all reserved entries with their
         description."""
-        res = self.ldap.search_s(rbconfig.ldap_reserved_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_RESERVED_TREE,
                                  ldap.SCOPE_ONELEVEL, 'objectClass=reserved',
                                  ('uid', 'description'))
-        tmp = {}
-        for data in res:
-            tmp[data['uid'][0]] = data['description'][0]
-        return tmp
+        return dict((data['uid'][0].decode(), data['description'][0].decode())
+                    for _, data in res)
 
     def dict_reserved_static(self):
         """Return dictionary of all static reserved entries with their
         description."""
         res = self.ldap.search_s(
-            rbconfig.ldap_reserved_tree, ldap.SCOPE_ONELEVEL,
+            rbconfig.LDAP_RESERVED_TREE, ldap.SCOPE_ONELEVEL,
             '(&(objectClass=reserved)(flag=static))', ('uid', 'description'))
-        tmp = {}
-        for data in res:
-            tmp[data['uid'][0]] = data['description'][0]
-        return tmp
+        return dict((data['uid'][0].decode(), data['description'][0].decode())
+                    for _, data in res)
+
+    def dict_modified(self):
+        """Return dictionary of all usernames with their modifyTimestamp
+        (GeneralizedTime string, so they sort in time order)."""
+
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
+                                 ldap.SCOPE_ONELEVEL,
+                                 'objectClass=posixAccount',
+                                 ('uid', 'modifyTimestamp'))
+        return dict((data['uid'][0].decode(),
+                     data.get('modifyTimestamp', [b''])[0].decode())
+                    for _, data in res)
 
     # -------------------------------- #
     # METHODS RETURNING SEARCH RESULTS #
     # -------------------------------- #
 
+    def search_paged(self, filterstr, attrs=None, size=rbconfig.LDAP_PAGE_SIZE):
+        """Return iterator of (dn, attributes) for users matching given
+        filter. The search is paged (simple paged results control) so the
+        server sends size entries at a time as they are used."""
+
+        ctrl = SimplePagedResultsControl(True, size=size, cookie='')
+        while 1:
+            msgid = self.ldap.search_ext(rbconfig.LDAP_ACCOUNTS_TREE,
+                                         ldap.SCOPE_ONELEVEL, filterstr, attrs,
+                                         serverctrls=[ctrl])
+            _, data, _, ctrls = self.ldap.result3(msgid)
+            for dn, entry in data:
+                if dn is not None:
+                    yield dn, entry
+            cookies = [
+                i.cookie for i in ctrls
+                if i.controlType == SimplePagedResultsControl.controlType
+            ]
+            if not cookies or not cookies[0]:
+                break
+            ctrl.cookie = cookies[0]
+
+    @classmethod
+    def filter_users(cls, usertypes=None, paid=None, newbie=None, uids=None):
+        """Return LDAP filter for users of any of given usertypes, paid
+        state (paid, unpaid, normal or grace as the list_unpaid methods),
+        newbie (true or false) and usernames. None matches any."""
+
+        terms = ['(objectClass=posixAccount)']
+        for usertype in usertypes or ():
+            if usertype not in rbconfig.USERTYPES:
+                raise RBFatalError("Invalid usertype '%s'" % usertype)
+        if usertypes:
+            terms.append(
+                '(|%s)' % ''.join('(objectClass=%s)' % i for i in usertypes))
+        if paid is not None:
+            if paid not in FILTER_PAID:
+                raise RBFatalError("Invalid paid state '%s'" % paid)
+            terms.append(FILTER_PAID[paid])
+        if newbie is not None:
+            terms.append(newbie and '(newbie=TRUE)' or '(newbie=FALSE)')
+        if uids is not None:
+            terms.append('(|%s)' % ''.join(
+                '(uid=%s)' % ldap.filter.escape_filter_chars(i) for i in uids))
+        return '(&%s)' % ''.join(terms)
+
     def search_users_byusername(self, uid):
         """Search user database by username and return results
         ((username, usertype, id, name, course, year, email), ...)"""
@@ -1004,95 +1118,27 @@ class RBUserDB:
     # MISCELLANEOUS METHODS                                               #
     # ------------------------------------------------------------------- #
 
-    def stats(self):
-        """Print database statistics on standard output."""
-        usertypes = {}
-        categories = ('paid', 'unpaid', 'nonpay', 'newbie', 'signed_paid',
-                      'signed_unpaid', 'signed_nonpay', 'signed_newbie',
-                      'nosign_paid', 'nosign_unpaid', 'nosign_nonpay',
-                      'nosign_newbie', 'TOTAL')
-        for k in rbconfig.usertypes:
-            usertypes[k] = dict([(c, 0) for c in categories])
-
-        for uid in self.list_users():
-            usr = RBUser(uid=uid)
-            self.get_user_byname(usr)
-            usertypes[usr.usertype]['TOTAL'] += 1
-            signed = not self.opt.dbonly and os.path.exists(
-                os.path.join(rbconfig.dir_signaway_state, uid))
-            pay = (usr.yearsPaid is None and 'nonpay' or
-                   usr.yearsPaid > 0 and 'paid' or 'unpaid')
-            usertypes[usr.usertype][pay] += 1
-            usertypes[usr.usertype]['%s_%s' %
-                                    (not signed and 'nosign' or 'signed',
-                                     pay)] += 1
-
-            if usr.newbie:
-                usertypes[usr.usertype]['newbie'] += 1
-                usertypes[usr.usertype]['%s_newbie' % (
-                    not signed and 'nosign' or 'signed')] += 1
-
-        ordered_usertypes = list(rbconfig.usertypes_list) + [
-            i for i in rbconfig.usertypes if i not in rbconfig.usertypes_list
-        ]
-
-        # Print out table.
-        print(" " * 9, end=' ')
-        for cat in categories:
-            if len(cat) > 6:
-                print("%7s" % cat[:6], end=' ')
-            else:
-                print(" " * 7, end=' ')
-        print()
-
-        print(" " * 9, end=' ')
-        for cat in categories:
-            if len(cat) > 6:
-                print("%7.6s" % cat[-(len(cat) - 6):], end=' ')
-            else:
-                print("%7s" % cat, end=' ')
-        print()
-
-        print(" " * 9, end=' ')
-        for _ in range(len(categories)):
-            print(' ', '=' * 5, end=' ')
-        print()
-
-        # Work out category totals.
-        #
-        category_totals = dict([(c, 0) for c in categories])
-
-        for usertype in ordered_usertypes:
-            print("%9s" % usertype, end=' ')
-            usertype = usertypes[usertype]
-            for cat in categories:
-                print("%7d" % usertype[cat], end=' ')
-                category_totals[cat] += usertype[cat]
-            print()
-
-        print(" " * 9, end=' ')
-        for _ in range(len(categories)):
-            print(' ', '=' * 5, end=' ')
-        print()
-        print('%9s' % 'ALL', end=' ')
-        for cat in categories:
-            print("%7d" % category_totals[cat], end=' ')
-        print('\n\n')
-
-        total_paid = 0
-        for user in 'member', 'committe', 'staff':
-            total_paid += usertypes[user]['paid']
-
-        print("Total paid members, committee & staff:", total_paid)
-        print("Quorum (rounded-up square root of above):",
-              math.ceil(math.sqrt(total_paid)))
-        print(
-            "'Active' users (paid and non-paying signed-in users):",
-            category_totals['signed_paid'] + category_totals['signed_nonpay'])
-        print("%d of %d newbies signed-in (%d%%)\n" %
-              (category_totals['signed_newbie'], category_totals['newbie'],
-               100.0 * category_totals['signed_newbie'] / category_totals[
-                   'newbie']))
+    def stats(self, signed=None):
+        """Print database statistics on standard output. signed is the set
+        of usernames that have signed in, if None no one is counted as
+        signed in."""
+
+        stats = rbstats.RBStats()
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
+                                 ldap.SCOPE_ONELEVEL, 'objectClass=posixAccount',
+                                 ('uid', 'objectClass', 'yearsPaid', 'newbie'))
+        for _, data in res:
+            uid = data['uid'][0].decode()
+            usertype = rbstats.usertype_of(i.decode()
+                                           for i in data['objectClass'])
+            if usertype is None:
+                raise RBFatalError("Unknown usertype for user '%s'" % uid)
+            stats.add(usertype,
+                      int(data['yearsPaid'][0]) if 'yearsPaid' in data else
+                      None,
+                      data.get('newbie', [b''])[0] == b'TRUE',
+                      signed is not None and uid in signed)
+        stats.report()
 
     @classmethod
     def crypt(cls, password):
@@ -1120,68 +1166,99 @@ class RBUserDB:
     def uid2dn(cls, uid):
         """Return full Distinguished Name (DN) for given username."""
 
-        return "uid=%s,%s" % (uid, rbconfig.ldap_accounts_tree)
+        return "uid=%s,%s" % (uid, rbconfig.LDAP_ACCOUNTS_TREE)
 
-    def uidNumber_findmax(self):
-        """Return highest uidNumber found in LDAP accounts tree.
-        This is only used to create the uidNumber file, the
-        uidNumber_readnext() function should be used for getting the
-        next available uidNumber."""
+    def uidNumber_index(self):
+        """Return RBUidNumberIndex of all uidNumbers in the LDAP accounts
+        tree, fetched with a single search."""
 
-        res = self.ldap.search_s(rbconfig.ldap_accounts_tree,
+        res = self.ldap.search_s(rbconfig.LDAP_ACCOUNTS_TREE,
                                  ldap.SCOPE_ONELEVEL,
-                                 'objectClass=posixAccount', ('uidNumber', ))
+                                 'objectClass=posixAccount',
+                                 ('uid', 'uidNumber'))
+        return RBUidNumberIndex((data['uid'][0].decode(),
+                                 int(data['uidNumber'][0]))
+                                for _, data in res)
 
-        maxuid = -1
-        for i in res:
-            tmp = int(i[1]['uidNumber'][0])
-            if tmp > maxuid:
-                maxuid = tmp
-
-        return maxuid
+    def uidNumber_findmax(self):
+        """Return highest uidNumber found in LDAP accounts tree.
+        This is only used to set the uidNumber counter, the
+        uidNumber_getnext() function should be used for getting the
+        next available uidNumber."""
 
-    def uidNumber_getnext(self):
-        """Get the next available uidNumber for adding a new user.
-        Locks uidNumber file, reads number. Returns (file descriptor,
-        uidNumber). uidNumber_savenext() must be called once the
-        uidNumber is used successfully."""
+        return self.uidNumber_index().max()
 
-        uid_num_file = os.open(rbconfig.file_uidNumber, os.O_RDWR)
-        retries = 0
+    def uidNumber_read(self):
+        """Return next free uidNumber from the counter entry in LDAP."""
 
-        while 1:
+        try:
+            res = self.ldap.search_s(rbconfig.LDAP_UIDNUMBER_DN,
+                                     ldap.SCOPE_BASE, 'objectClass=*',
+                                     ('uidNumber', ))
+        except ldap.NO_SUCH_OBJECT:
+            raise RBFatalError("uidNumber counter '%s' does not exist, "
+                               "use create_uidNumber" %
+                               rbconfig.LDAP_UIDNUMBER_DN)
+        return int(res[0][1]['uidNumber'][0])
+
+    def uidNumber_reserve(self, count=1):
+        """Reserve a block of count uidNumbers and return the first.
+
+        The counter is incremented with a single modify that deletes the
+        current value and adds the new one. The delete fails if another
+        process changed the counter in the meantime, in which case the
+        counter is read again and the modify retried. The modify is atomic
+        on the LDAP server so this works from any host without locks.
+
+        A reserved uidNumber that ends up not being used (e.g. the add
+        failed) is simply skipped. Does not change the counter if in test
+        mode."""
+
+        if count < 1:
+            raise RBFatalError('Invalid uidNumber block size %d' % count)
+
+        for _ in range(rbconfig.UIDNUMBER_RETRIES):
+            num = self.uidNumber_read()
+            if self.opt.test:
+                return num
             try:
-                fcntl.lockf(uid_num_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
-            except IOError:
-                retries += 1
-                if retries == 20:
-                    raise RBFatalError(
-                        ('Could not lock uidNumber.txt file after 20 attempts.'
-                         'Please try again!'))
-                time.sleep(0.5)
+                self.ldap.modify_s(rbconfig.LDAP_UIDNUMBER_DN,
+                                   ((ldap.MOD_DELETE, 'uidNumber',
+                                     str(num).encode()),
+                                    (ldap.MOD_ADD, 'uidNumber',
+                                     str(num + count).encode())))
+            except ldap.NO_SUCH_ATTRIBUTE:
+                # Lost the race, back off for a random time so contending
+                # processes don't retry in lockstep.
+                #
+                time.sleep(random.uniform(0, 0.1))
             else:
-                break
-        num_uid = int(os.read(uid_num_file, 32))
-        return uid_num_file, num_uid
+                return num
+
+        raise RBFatalError('Could not reserve uidNumber after %d attempts. '
+                           'Please try again!' % rbconfig.UIDNUMBER_RETRIES)
 
-    def uidNumber_savenext(self, fd, uidNumber):
-        """Save next uidNumber.
+    def uidNumber_getnext(self):
+        """Reserve and return the next available uidNumber for adding a new
+        user."""
 
-        Writes uidNumber to file descriptor fd, which must be the one
-        returned by uidNumber_getnext(). Does not write anything if in
-        test mode."""
+        return self.uidNumber_reserve(1)
 
-        if not self.opt.test:
-            os.lseek(fd, 0, 0)
-            os.write(fd, '%s\n' % uidNumber)
-            os.fdatasync(fd)
+    def uidNumber_set(self, uidNumber):
+        """Set the uidNumber counter to given next free uidNumber, creating
+        the counter entry if needed."""
 
-    def uidNumber_unlock(self, fd):
-        """Unlock uidNumber text file.
-        This must be called after the last call to uidNumber_save() so
-        that other processes can now obtain a lock on this file.
-        The file will be unlocked after process termination though."""
-        os.close(fd)
+        try:
+            self.uidNumber_read()
+        except RBFatalError:
+            self.wrapper(self.ldap.add_s, rbconfig.LDAP_UIDNUMBER_DN,
+                         (('objectClass', (b'top', b'uidNumberCounter')),
+                          ('cn', b'uidNumber'),
+                          ('uidNumber', str(uidNumber).encode())))
+        else:
+            self.wrapper(self.ldap.modify_s, rbconfig.LDAP_UIDNUMBER_DN,
+                         ((ldap.MOD_REPLACE, 'uidNumber',
+                           str(uidNumber).encode()), ))
 
     def valid_shell(self, shell):
         """Check if given shell is valid by checking against /etc/shells."""
@@ -1192,9 +1269,9 @@ class RBUserDB:
         if self.valid_shells is None:
             self.valid_shells = {}
             re_shell = re.compile(r'^([^\s#]+)')
-            shell_file = open(rbconfig.file_shells, 'r')
+            shell_file = open(rbconfig.FILE_SHELLS, 'r')
             for line in shell_file.readlines():
-                if line.strip() != rbconfig.shell_expired:
+                if line.strip() != rbconfig.SHELL_EXPIRED:
                     res = re_shell.search(line)
                     if res:
                         self.valid_shells[res.group(1)] = 1
@@ -1233,7 +1310,7 @@ class RBUserDB:
             tmp.append(('yearsPaid', str(usr.yearsPaid)))
         if usr.birthday:
             tmp.append(('birthday', usr.birthday))
-        return tmp
+        return cls.encode_modlist(tmp)
 
     @classmethod
     def usr2ldap_renew(cls, usr):
@@ -1257,7 +1334,7 @@ class RBUserDB:
             tmp.append((ldap.MOD_REPLACE, 'yearsPaid', str(usr.yearsPaid)))
         if usr.birthday:
             tmp.append((ldap.MOD_REPLACE, 'birthday', usr.birthday))
-        return tmp
+        return cls.encode_modlist(tmp)
 
     @classmethod
     def usr2ldap_update(cls, usr):
@@ -1279,28 +1356,45 @@ class RBUserDB:
             tmp.append((ldap.MOD_REPLACE, 'yearsPaid', str(usr.yearsPaid)))
         if usr.birthday:
             tmp.append((ldap.MOD_REPLACE, 'birthday', usr.birthday))
-        return tmp
+        return cls.encode_modlist(tmp)
 
     @classmethod
     def usr2ldap_rename(cls, usr):
         """Return a list of (type, attribute) pairs for given user.
         This list is used in LDAP modify queries for renaming."""
 
-        return ((ldap.MOD_REPLACE, 'homeDirectory', usr.homeDirectory),
-                (ldap.MOD_REPLACE, 'updatedby',
-                 usr.updatedby), (ldap.MOD_REPLACE, 'updated', usr.updated))
+        return cls.encode_modlist(
+            ((ldap.MOD_REPLACE, 'homeDirectory', usr.homeDirectory),
+             (ldap.MOD_REPLACE, 'updatedby', usr.updatedby),
+             (ldap.MOD_REPLACE, 'updated', usr.updated)))
 
     @classmethod
     def usr2ldap_convert(cls, usr):
         """Return a list of (type, attribute) pairs for given user.
         This list is used in LDAP modify queries for converting."""
 
-        return ((ldap.MOD_REPLACE, 'objectClass', usr.objectClass),
-                (ldap.MOD_REPLACE, 'gidNumber', str(usr.gidNumber)),
-                (ldap.MOD_REPLACE, 'homeDirectory',
-                 usr.homeDirectory), (ldap.MOD_REPLACE, 'updatedby',
-                                      usr.updatedby), (ldap.MOD_REPLACE,
-                                                       'updated', usr.updated))
+        return cls.encode_modlist(
+            ((ldap.MOD_REPLACE, 'objectClass', usr.objectClass),
+             (ldap.MOD_REPLACE, 'gidNumber', str(usr.gidNumber)),
+             (ldap.MOD_REPLACE, 'homeDirectory', usr.homeDirectory),
+             (ldap.MOD_REPLACE, 'updatedby', usr.updatedby),
+             (ldap.MOD_REPLACE, 'updated', usr.updated)))
+
+    @classmethod
+    def encode_modlist(cls, modlist):
+        """Return given add or modify list with str values (and lists of
+        them) encoded, as python-ldap only takes bytes."""
+
+        res = []
+        for mod in modlist:
+            value = mod[-1]
+            if isinstance(value, str):
+                value = value.encode()
+            elif isinstance(value, (list, tuple)):
+                value = [i.encode() if isinstance(i, str) else i
+                         for i in value]
+            res.append(tuple(mod[:-1]) + (value, ))
+        return res
 
     def gen_accinfo(self, usr):
         """Generate information for user account"""
@@ -1312,14 +1406,14 @@ class RBUserDB:
             usr.gidNumber = self.get_gid_byname(usr.usertype)
         if not usr.gecos:
             # Hide a user's identity for paying accounts.
-            if usr.usertype in rbconfig.usertypes_paying:
+            if usr.usertype in rbconfig.USERTYPES_PAYING:
                 usr.gecos = usr.uid
             else:
                 usr.gecos = usr.cn
         if not usr.loginShell:
-            usr.loginShell = rbconfig.shell_default
+            usr.loginShell = rbconfig.SHELL_DEFAULT
         if not usr.host:
-            usr.host = rbconfig.ldap_default_hosts
+            usr.host = rbconfig.LDAP_DEFAULT_HOSTS
 
     @classmethod
     def set_updated(cls, usr):
@@ -1340,7 +1434,7 @@ class RBUserDB:
         if not usr.usertype:
             for i in res[1]['objectClass']:
                 i = i.decode()
-                if i in rbconfig.usertypes:
+                if i in rbconfig.USERTYPES:
                     usr.usertype = i
                     break
             else:
@@ -1349,7 +1443,7 @@ class RBUserDB:
         for k, var in list(res[1].items()):
             if getattr(usr, k) is None:
                 if k == 'newbie':
-                    usr.newbie = var[0].decode == 'TRUE'
+                    usr.newbie = var[0].decode() == 'TRUE'
                 elif k not in RBUser.attr_list_value:
                     setattr(usr, k, var[0].decode())
                 else:
@@ -1375,12 +1469,14 @@ class RBUserDB:
         # gecos up to the comma.
         if override or usr.cn is None:
             if res[1].get('givenName') and res[1].get('sn'):
-                usr.cn = '%s %s' % (res[1]['givenName'][0], res[1]['sn'][0])
+                usr.cn = '%s %s' % (res[1]['givenName'][0].decode(),
+                                    res[1]['sn'][0].decode())
             elif res[1].get('gecos'):
-                usr.cn = res[1].get('gecos')[:res[1].get('gecos').find(',')]
+                gecos = res[1]['gecos'][0].decode()
+                usr.cn = gecos[:gecos.find(',')]
 
         if override or usr.altmail is None:
-            usr.altmail = res[1]['mail'][0]
+            usr.altmail = res[1]['mail'][0].decode()
 
     @classmethod
     def set_user_dcu_student(cls, usr, res, override=0):
@@ -1392,10 +1488,11 @@ class RBUserDB:
         # rest is the course name. Uppercase course & year for
         # consistency.
         if res[1].get('l'):
+            tmp = res[1]['l'][0].decode()
             if override or usr.course is None:
-                usr.course = res[1]['l'][0][:-1].upper()
+                usr.course = tmp[:-1].upper()
             if override or usr.year is None:
-                usr.year = res[1]['l'][0][-1].upper()
+                usr.year = tmp[-1].upper()
 
     @classmethod
     def set_user_dcu_staff(cls, usr, res, override=0):
@@ -1404,7 +1501,7 @@ class RBUserDB:
         # Set course to department name from 'l' attribute if set.
         if res[1].get('l'):
             if override or usr.course is None:
-                usr.course = res[1]['l'][0]
+                usr.course = res[1]['l'][0].decode()
 
     @classmethod
     def set_user_dcu_alumni(cls, usr, res, override=0):
@@ -1414,7 +1511,7 @@ class RBUserDB:
         # syntax of [a-zA-Z]+[0-9]+ i.e. course code followed by year
         # of graduation. Uppercase course for consistency.
         if res[1].get('l'):
-            tmp = res[1].get('l')[0]
+            tmp = res[1]['l'][0].decode()
             for i, _ in enumerate(tmp):
                 if tmp[i].isdigit():
                     if override or usr.year is None:
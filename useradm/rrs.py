@@ -15,6 +15,7 @@ import time
 from xml.sax.saxutils import quoteattr
 
 import ldap
+import rbmetrics
 from rberror import RBError, RBFatalError, RBWarningError
 from rbopt import RBOpt
 from rbuser import RBUser
@@ -104,10 +105,11 @@ fields_input = {
 #
 usr = RBUser()
 opt = RBOpt()
-udb = form = None  # Initalised later in main()
+udb = form = metrics = None  # Initalised later in main()
 okay = 0
 start_done = end_done = 0
 error_string = notice_string = okay_string = ''
+request_start = 0
 
 # --------------------------------------------------------------------------- #
 # MAIN                                                                        #
@@ -117,6 +119,13 @@ error_string = notice_string = okay_string = ''
 def main():
     """Program entry function."""
 
+    global metrics, request_start
+    metrics = rbmetrics.RBMetrics()
+    request_start = time.perf_counter()
+    startup = rbmetrics.process_age()
+    if startup is not None:
+        metrics.observe('rrs_phase_seconds', startup, phase='startup')
+
     # XXX: Stupid Apache on shrapnel has TZ set to US/Eastern, no idea why!
     os.environ['TZ'] = 'Eire'
 
@@ -158,16 +167,24 @@ def main():
     # stage).
     #
     if opt.mode in cmds_noform or opt.action:
+        start = time.perf_counter()
         try:
             udb.connect()
         except ldap.LDAPError as err:
             error(err, 'Could not connect to user database')
             # not reached
+        metrics.observe('rrs_phase_seconds', time.perf_counter() - start,
+                        phase='connect')
+        metrics.instrument(udb)
+        start = time.perf_counter()
         try:
             eval(opt.mode + '()')
         except (ldap.LDAPError, RBError) as err:
             error(err)
             # not reached
+        finally:
+            metrics.observe('rrs_phase_seconds', time.perf_counter() - start,
+                            phase='command')
     html_form()
     sys.exit(0)
 
@@ -178,6 +195,16 @@ def shutdown():
     html_end()
     if udb:
         udb.close()
+    if metrics:
+        metrics.observe('rrs_request_seconds',
+                        time.perf_counter() - request_start, mode=opt.mode,
+                        stage=(opt.mode in cmds_noform or opt.action) and
+                        'action' or 'form')
+        # Metrics must never break a request, the page is already out.
+        try:
+            metrics.save()
+        except OSError:
+            pass
 
 
 def html_start():
@@ -345,7 +372,7 @@ def html_form():
                     usr.usertype = 'member'
 
                 print('<select name=usertype>')
-                for i in rbconfig.usertypes_paying:
+                for i in rbconfig.USERTYPES_PAYING:
                     print('<option value=%s' % i, end=' ')
                     if usr.usertype == i:
                         print(' selected', end=' ')
@@ -875,7 +902,7 @@ def get_usertype(usr):
 def get_id(usr):
     """Get DCU ID."""
 
-    if usr.usertype in rbconfig.usertypes_dcu:
+    if usr.usertype in rbconfig.USERTYPES_DCU:
         if form.getfirst('id'):
             usr.id = int(form.getfirst('id'))
         else:
@@ -908,7 +935,7 @@ def get_name(usr):
 def get_years_paid(usr):
     """Get years paid."""
 
-    if usr.usertype not in rbconfig.usertypes_paying:
+    if usr.usertype not in rbconfig.USERTYPES_PAYING:
         return
     if form.getfirst('yearsPaid'):
         usr.yearsPaid = int(form.getfirst('yearsPaid'))
@@ -1029,6 +1056,8 @@ def error(err, mesg=''):
     # If we reach here the override option wasn't set, so all errors result
     # in program exit.
     #
+    if metrics:
+        metrics.inc('rrs_errors_total', mode=opt.mode)
     html_form()
     sys.exit(1)
 
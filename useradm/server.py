@@ -4,6 +4,8 @@
 import cgitb
 import http.server
 
+import rbconfig
+
 cgitb.enable()  # This line enables CGI error reporting
 
 SERVER = http.server.HTTPServer
@@ -20,6 +22,23 @@ class Handler(http.server.CGIHTTPRequestHandler):
             return True
         return False
 
+    def do_GET(self):
+        """Serve RRS metrics as /metrics, everything else as usual."""
+
+        if self.path != "/metrics":
+            super().do_GET()
+            return
+        try:
+            with open(rbconfig.FILE_RRS_METRICS, "rb") as metrics:
+                body = metrics.read()
+        except OSError:
+            body = b""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
 
 HTTPD = SERVER(SERVER_ADDRESS, Handler)
 HTTPD.serve_forever()
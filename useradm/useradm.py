@@ -9,18 +9,19 @@
 import atexit
 import getopt
 import os
-import pprint
 import re
-import readline
 import sys
+import time
+import traceback
 
-import ldap
 import rbconfig
-from rbaccount import RBAccount
 from rberror import RBError, RBFatalError, RBWarningError
 from rbopt import RBOpt
 from rbuser import RBUser
-from rbuserdb import RBUserDB
+
+# Everything else (ldap, RBUserDB, RBAccount, readline and the modules used
+# by only a few commands) is imported when first needed, so usage and
+# commands that need no database start quickly. See CMDS_BACKENDS.
 
 # --------------------------------------------------------------------------- #
 # DATA                                                                        #
@@ -45,8 +46,10 @@ CMDS = {
     'convert': ('Change user to a different usertype', '[username]'),
     'disuser': ('Disuser a user', '[username [new username]]'),
     'reuser': ('Re-user a user', '[username]'),
-    'show': ('Show user details', '[username]'),
-    'info': ('Show shorter user details', '[username]'),
+    'show': ('Show user details (- reads usernames from standard input)',
+             '[username|id ...]'),
+    'info': ('Show shorter user details (- as for show)',
+             '[username|id ...]'),
     'freename': ('Check if a username is free', '[username]'),
     'search': ('Search user and dcu databases', '[username]'),
     'pre_sync': ('Dump LDAP tree for use by sync before new tree is loaded',
@@ -56,6 +59,8 @@ CMDS = {
     'sync_dcu_info': ('Interactive update of userdb using dcu database info',
                       ''),
     'list_users': ('List all usernames', ''),
+    'export': ('Export users matching the options (and usernames given, - '
+               'to read them from standard input)', '[username ...]'),
     'list_unavailable': ('List all usernames that are unavailable', ''),
     'list_newbies': ('List all paid newbies', ''),
     'list_renewals': ('List all paid renewals (non-newbie)', ''),
@@ -70,8 +75,16 @@ CMDS = {
     'unpaid_delete': ('Delete all grace non-renewed users', ''),
     'checkdb': ('Check database for inconsistencies', ''),
     'stats': ('Show database and account statistics', ''),
-    'create_uidNumber': ('Create uidNumber text file with next free uidNumber',
-                         ''),
+    'stats_ldif': ('Show account statistics from an LDIF dump', 'ldif-file'),
+    'create_uidNumber': ('Set uidNumber counter to next free uidNumber', ''),
+    'convert_pre_sync': ('Convert old style pre_sync dump to snapshot format',
+                         '[old-file [new-file]]'),
+    'sync_report': ('Show what sync did (default: last run)', '[run]'),
+    'sync_plan': ('Show sync actions found by comparing pre_sync with userdb',
+                  '[presync-file [snapshot-or-ldif-file]]'),
+    'daemon': ('Serve commands from useradm over a Unix socket', '[socket]'),
+    'batch': ('Run JSON lines or CSV operations (default: standard input)',
+              '[file]'),
 }
 
 # Command groups
@@ -81,12 +94,69 @@ CMDS_SINGLE_USER = ('add', 'delete', 'renew', 'update', 'altmail', 'activate',
 CMDS_SINGLE_ACCOUNT = ('resetpw', 'resetsh', 'disuser', 'reuser', 'setshell')
 CMDS_SINGLE_USER_INFO = ('show', 'info', 'freename')
 CMDS_INTERACTIVE_BATCH = ('search', 'sync', 'sync_dcu_info')
-CMDS_BATCH = ('newyear', 'unpaid_warn', 'unpaid_disable', 'unpaid_delete')
+CMDS_BATCH = ('newyear', 'unpaid_warn', 'unpaid_disable', 'unpaid_delete',
+              'batch')
 CMDS_BATCH_INFO = ('pre_sync', 'list_users', 'list_unavailable',
                    'list_newbies', 'list_renewals', 'list_unpaid',
                    'list_unpaid_normal', 'list_unpaid_reset',
-                   'list_unpaid_grace')
-CMDS_MISC = ('checkdb', 'stats', 'create_uidNumber')
+                   'list_unpaid_grace', 'export')
+CMDS_MISC = ('checkdb', 'stats', 'stats_ldif', 'create_uidNumber',
+             'convert_pre_sync', 'sync_report', 'sync_plan', 'daemon')
+
+# Command name -> backends it needs, in the order main() sets them up:
+#   userdb   RedBrick LDAP (RBUserDB, UDB)
+#   dcu      DCU AD as well (needs userdb)
+#   account  Unix accounts (RBAccount, ACC)
+#
+CMDS_BACKENDS = {
+    'add': ('userdb', 'dcu', 'account'),
+    'renew': ('userdb', 'dcu', 'account'),
+    'update': ('userdb', 'dcu', 'account'),
+    'altmail': ('userdb', 'dcu', 'account'),
+    'activate': ('userdb', 'dcu', 'account'),
+    'delete': ('userdb', 'account'),
+    'resetpw': ('userdb', 'account'),
+    'setshell': ('userdb', 'account'),
+    'resetsh': ('userdb', 'account'),
+    'rename': ('userdb', 'account'),
+    'convert': ('userdb', 'account'),
+    'disuser': ('userdb', 'account'),
+    'reuser': ('userdb', 'account'),
+    'show': ('userdb', 'account'),
+    'info': ('userdb', 'account'),
+    'freename': ('userdb', ),
+    'search': ('userdb', 'dcu'),
+    'pre_sync': ('userdb', ),
+    'sync': ('userdb', 'account'),
+    'sync_dcu_info': ('userdb', 'dcu', 'account'),
+    'list_users': ('userdb', ),
+    'list_unavailable': ('userdb', ),
+    'list_newbies': ('userdb', ),
+    'list_renewals': ('userdb', ),
+    'list_unpaid': ('userdb', ),
+    'list_unpaid_normal': ('userdb', ),
+    'list_unpaid_reset': ('userdb', ),
+    'list_unpaid_grace': ('userdb', ),
+    'export': ('userdb', ),
+    'newyear': ('userdb', 'account'),
+    'unpaid_warn': ('userdb', 'account'),
+    'unpaid_disable': ('userdb', 'account'),
+    'unpaid_delete': ('userdb', 'account'),
+    'batch': ('userdb', 'account'),
+    'checkdb': ('userdb', 'dcu', 'account'),
+    'stats': ('userdb', 'account'),
+    'stats_ldif': ('account', ),
+    'create_uidNumber': ('userdb', ),
+    'convert_pre_sync': (),
+    'sync_report': (),
+    'sync_plan': ('userdb', ),
+    'daemon': ('userdb', 'account'),
+}
+
+# Commands never run by the daemon: they need the terminal (editor, pager)
+# or are the daemon.
+#
+CMDS_LOCAL = ('disuser', 'search', 'daemon')
 
 # Command group descriptions
 #
@@ -112,14 +182,14 @@ CMDS_OPTS = (('h', '', 'Display this usage',
               CMDS_ALL), ('T', '', 'Test mode, show what would be done',
                           CMDS_ALL), ('d', '',
                                       'Perform database operations only',
-                                      CMDS_SINGLE_USER),
+                                      CMDS_SINGLE_USER + ('batch', )),
              ('a', '', 'Perform unix account operations only',
-              CMDS_SINGLE_USER), ('u', 'username',
-                                  'Unix username of who updated this user',
-                                  CMDS_SINGLE_USER + ('disuser', 'reuser')),
-             ('f', '', 'Set newbie (fresher) to true',
-              ('add', 'update')), ('F', '', 'Opposite of -f', ('add',
-                                                               'update')),
+              CMDS_SINGLE_USER + ('batch', )),
+             ('u', 'username', 'Unix username of who updated this user',
+              CMDS_SINGLE_USER + ('disuser', 'reuser', 'batch')),
+             ('f', '', 'Set newbie (fresher) to true (export: newbies only)',
+              ('add', 'update', 'export')),
+             ('F', '', 'Opposite of -f', ('add', 'update', 'export')),
              ('m', '',
               'Send account details to user\'s alternate email address',
               ('add', 'renew', 'rename',
@@ -129,13 +199,12 @@ CMDS_OPTS = (('h', '', 'Display this usage',
               CMDS_ALL), ('p', '', 'Set new random password',
                           ('add', 'renew')), ('P', '', 'Opposite of -p',
                                               ('add', 'renew')),
-             ('t', 'usertype', 'Type of account',
-              ('add', 'renew', 'update',
-               'convert')), ('n', 'name', 'Real name or account description',
-                             ('add', 'renew', 'update',
-                              'search')), ('e', 'email',
-                                           'Alternative email address',
-                                           ('add', 'renew', 'update')),
+             ('t', 'usertype', 'Type of account (export: comma separated list)',
+              ('add', 'renew', 'update', 'convert', 'export')),
+             ('n', 'name', 'Real name or account description',
+              ('add', 'renew', 'update', 'search')),
+             ('e', 'email', 'Alternative email address',
+              ('add', 'renew', 'update')),
              ('i', 'id', 'Student/Staff ID',
               ('add', 'renew', 'update',
                'search')), ('c', 'course', 'DCU course (abbreviation)',
@@ -146,16 +215,35 @@ CMDS_OPTS = (('h', '', 'Display this usage',
               ('add', 'renew',
                'update')), ('b', 'birthday', 'Birthday (format YYYY-MM-DD)',
                             ('add', 'renew',
-                             'update')), ('q', '', 'Quiet mode', ('reuser', )))
+                             'update')), ('q', '', 'Quiet mode', ('reuser', )),
+             ('I', '', 'Only check users changed since the last run',
+              ('checkdb', )),
+             ('-paid', 'state', 'Only paid, unpaid, normal or grace users',
+              ('export', )),
+             ('-attrs', 'attr,...', 'Attributes to export (RBUser names)',
+              ('export', )),
+             ('-format', 'format', 'Export as csv (default), jsonl or ldif',
+              ('export', )),
+             ('-local', '', 'Run in this process even if a daemon is running',
+              CMDS_ALL),
+             ('-profile', '', 'Print operation counts and timings at exit',
+              CMDS_ALL),
+             ('-profile-dump', 'file', 'Also save cProfile statistics to file',
+              CMDS_ALL))
 
 INPUT_INSTRUCTIONS = '\033[1mRETURN\033[0m: use [default] given \
                       \033[1mTAB\033[0m: answer completion \
                       \033[1mEOF\033[0m: give empty answer\n'
 
+# Altmail addresses members, staff and committee must have.
+#
+RE_DCU_MAIL = re.compile(r'.+@.*dcu\.ie', re.I)
+
 # Global variables.
 #
 OPT = RBOpt()
 UDB = ACC = None  # Initialised later in main()
+LDAP_ERRORS = ()  # (ldap.LDAPError, ) once ldap is imported
 HEADER_MSG = None
 
 # --------------------------------------------------------------------------- #
@@ -168,12 +256,50 @@ def main():
 
     atexit.register(shutdown)
 
-    if len(sys.argv) > 1 and sys.argv[1][0] != '-':
-        OPT.mode = sys.argv.pop(1)
+    argv = sys.argv[1:]
+    args = parse_options(argv)
+
+    # Run the command in the resident daemon if there is one.
+    #
+    if OPT.mode not in CMDS_LOCAL and not OPT.local and not OPT.profile:
+        import rbdaemon
+        status = rbdaemon.forward(rbconfig.FILE_USERADM_SOCKET, argv)
+        if status is not None:
+            sys.exit(status)
+
+    # Profiling starts here so cProfile sees the imports and connect too.
+    #
+    if OPT.profile:
+        import rbprofile
+        profile = rbprofile.RBProfile(OPT.profile_dump)
+
+    global sendmail_open
+    setup(CMDS_BACKENDS[OPT.mode])
+
+    if OPT.profile:
+        profile.instrument(UDB, ACC)
+        sendmail_open = profile.wrap('sendmail_open', sendmail_open)
+        atexit.register(profile.report, sys.stderr)
+
+    # Optional additional parameters after command line options.
+    OPT.args = args
+
+    run()
+    sys.exit(0)
+
+
+def parse_options(argv):
+    """Set OPT from given command line arguments and return the remaining
+    arguments. Prints usage and exits for help or errors."""
+
+    if argv and argv[0][0] != '-':
+        OPT.mode = argv[0]
+        argv = argv[1:]
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:],
-                                   'b:c:e:i:n:s:t:u:y:adfFhmMopPqT')
+        opts, args = getopt.getopt(argv, 'b:c:e:i:n:s:t:u:y:adfFhImMopPqT',
+                                   ['local', 'profile', 'profile-dump=',
+                                    'paid=', 'attrs=', 'format='])
     except getopt.GetoptError as err:
         print(err)
         usage()
@@ -228,32 +354,68 @@ def main():
             OPT.birthday = arg
         elif option == '-q':
             OPT.quiet = 1
+        elif option == '-I':
+            OPT.incremental = 1
+        elif option == '--paid':
+            OPT.paid = arg
+        elif option == '--attrs':
+            OPT.attrs = arg
+        elif option == '--format':
+            OPT.format = arg
+        elif option == '--local':
+            OPT.local = 1
+        elif option == '--profile':
+            OPT.profile = 1
+        elif option == '--profile-dump':
+            OPT.profile = 1
+            OPT.profile_dump = arg
 
     if OPT.mode not in CMDS:
         usage()
         sys.exit(1)
 
-    global UDB, ACC
-    UDB = RBUserDB()
+    return args
 
-    try:
-        UDB.connect()
-    except ldap.LDAPError as err:
-        error(err, 'Could not connect to user database')
-        # not reached
-    except KeyboardInterrupt:
-        print()
-        sys.exit(1)
-        # not reached
 
-    ACC = RBAccount()
+def setup(backends):
+    """Import modules for and connect to given backends (see CMDS_BACKENDS)
+    that are not set up already."""
 
-    # Optional additional parameters after command line options.
-    OPT.args = args
+    global UDB, ACC, LDAP_ERRORS
+
+    if 'userdb' in backends:
+        import ldap
+        from rbuserdb import RBUserDB
+        LDAP_ERRORS = (ldap.LDAPError, )
+        try:
+            if UDB is None:
+                udb = RBUserDB()
+                udb.connect(dcu='dcu' in backends)
+                UDB = udb
+            elif 'dcu' in backends and UDB.ldap_dcu is None:
+                UDB.connect_dcu()
+        except ldap.LDAPError as err:
+            error(err, 'Could not connect to user database')
+            # not reached
+        except RBError as err:
+            rberror(err)
+            # not reached
+        except KeyboardInterrupt:
+            print()
+            sys.exit(1)
+            # not reached
+
+    if 'account' in backends and ACC is None:
+        from rbaccount import RBAccount
+        ACC = RBAccount()
+
+
+def run():
+    """Call function for command OPT.mode, handling errors."""
 
     try:
         # Call function for specific mode.
-        eval(OPT.mode + "()")
+        globals()[OPT.mode]()
     except KeyboardInterrupt:
         print()
         sys.exit(1)
@@ -261,12 +423,10 @@ def main():
     except RBError as err:
         rberror(err)
         # not reached
-    except ldap.LDAPError as err:
+    except LDAP_ERRORS as err:
         error(err)
         # not reached
 
-    sys.exit(0)
-
 
 def shutdown():
     """Cleanup function registered with atexit."""
@@ -299,7 +459,7 @@ def usage():
         print(("Usage: useradm", OPT.mode, "[options]", CMDS[OPT.mode][1]))
         for i in CMDS_OPTS:
             if OPT.mode in i[3]:
-                print((" -%s %-15s%s" % (i[0], i[1], i[2])))
+                print(" %-17s %s" % ('-%s %s' % (i[0], i[1]), i[2]))
 
 
 # =========================================================================== #
@@ -800,29 +960,60 @@ def setshell():
 def show():
     """Show user's database and account details."""
 
-    usr = RBUser()
-    get_username(usr, check_user_exists=0)
+    show_users(UDB.show, account=1)
 
-    # End of user interaction, set options for override & test mode.
-    UDB.setopt(OPT)
 
-    UDB.get_user_byname(usr)
-    print(header('User Information'))
-    UDB.show(usr)
-    print(header('Account Information'))
-    ACC.show(usr)
+def info():
+    """Show user's database details."""
 
+    show_users(UDB.info)
 
-def info():
-    """Show user's database and account details."""
 
-    usr = RBUser()
-    get_username(usr, check_user_exists=0)
+def show_users(show_user, account=0):
+    """Show details of each user given (usernames or ids, - to read them
+    from standard input) in the order given, using one search for all of
+    them and, for account details, one concurrent scan of their home
+    directories."""
+
+    if len(OPT.args) > 0 and OPT.args[0]:
+        keys = []
+        for i in OPT.args:
+            keys.extend(sys.stdin.read().split() if i == '-' else [i])
+        OPT.args = []
+    else:
+        usr = RBUser()
+        get_username(usr, check_user_exists=0)
+        keys = [usr.uid]
+
     # End of user interaction, set options for override & test mode.
     UDB.setopt(OPT)
-    UDB.get_user_byname(usr)
-    print(header('User Information'))
-    UDB.info(usr)
+
+    errors = {}
+    for key in keys:
+        if not key.isdigit():
+            try:
+                UDB.check_username(key)
+            except RBError as err:
+                errors[key] = err
+    users = UDB.get_users([i for i in keys if i not in errors])
+    dirstat = None
+    if account and len(users) > 1:
+        dirstat = ACC.stat_dirs(set(i.homeDirectory for i in users.values()))
+
+    failed = False
+    for key in keys:
+        if key not in users:
+            print(errors.get(key) or RBFatalError(
+                "User '%s' does not exist" % key), file=sys.stderr)
+            failed = True
+            continue
+        print(header('User Information'))
+        show_user(users[key])
+        if account:
+            print(header('Account Information'))
+            ACC.show(users[key], dirstat)
+    if failed:
+        sys.exit(1)
 
 
 def freename():
@@ -900,17 +1091,17 @@ def show_search_results(res, file_pager):
 
     if res:
         file_pager.write('%-*s %-*s %-8s %-30s %-6s %-4s %s' %
-                         (rbconfig.maxlen_uname, 'username',
-                          rbconfig.maxlen_group, 'usertype', 'id', 'name',
+                         (rbconfig.MAXLEN_UNAME, 'username',
+                          rbconfig.MAXLEN_GROUP, 'usertype', 'id', 'name',
                           'course', 'year', 'email'), )
         file_pager.write('%s %s %s %s %s %s %s' %
-                         ('-' * rbconfig.maxlen_uname,
-                          '-' * rbconfig.maxlen_group, '-' * 8, '-' * 30,
+                         ('-' * rbconfig.MAXLEN_UNAME,
+                          '-' * rbconfig.MAXLEN_GROUP, '-' * 8, '-' * 30,
                           '-' * 6, '-' * 4, '-' * 30), )
         for username, usertype, uid, name, course, year, email in res:
             file_pager.write("%-*s %-*s %-8s %-30.30s %-6.6s %-4.4s %s" %
-                             (rbconfig.maxlen_uname, username or '-',
-                              rbconfig.maxlen_group, usertype or '-',
+                             (rbconfig.MAXLEN_UNAME, username or '-',
+                              rbconfig.MAXLEN_GROUP, usertype or '-',
                               uid is not None and id or '-', name,
                               course or '-', year or '-', email), )
 
@@ -921,29 +1112,28 @@ def pre_sync():
     This step is performed before the new LDAP accounts tree is loaded so
     that a bare minimum copy of the old tree is available."""
 
+    import rbsnapshot
+
     get_pre_sync()
 
     print('Dumping...')
 
-    file_presync = open(OPT.presync, 'w')
-    file_presync.write('global old_ldap\nold_ldap = ', end=' ')
-    pprint.pprint(UDB.list_pre_sync(), file_presync)
-    file_presync.close()
+    rbsnapshot.write_snapshot(OPT.presync, UDB.list_pre_sync())
 
 
 def sync():
     """Synchronise accounts (i.e. no changes are made to userdb) after an
-    offline update to user database with RRS. Needs rrs.log to process
-    renames and password resets for existing accounts.
+    offline update to user database with RRS. Renames and conversions are
+    found by comparing the pre_sync snapshot with the current database (see
+    sync_plan). Needs rrs.log for password resets for existing accounts.
 
     Procedure:
 
-    1. Process all renames, only applicable to existing accounts. Taken from
-    rrs.log. Keep a mapping of username renewals. Note there may be
-    multiple rename entries.
+    1. Process all renames, only applicable to existing accounts. Detected
+    by matching accounts on uidNumber. Keep a mapping of username renewals.
 
     2. Process all conversions, only applicable to existing accounts.
-    Detected by comparing Unix group and usertype in database.
+    Detected by comparing old and new usertype of matched accounts.
 
     3. Process all deletions, only applicable to existing accounts.
     Detected by checking for unix accounts missing a database entry. All
@@ -962,104 +1152,95 @@ def sync():
     will be marked on the original username so the rename map is used to
     map this to the current username.
 
+    rrs.log is processed incrementally with the position and username maps
+    kept in a checkpoint file next to it. Completed stages are recorded in
+    the checkpoint too, so rerunning sync resumes at the first stage not
+    yet completed unless new entries were added to rrs.log.
+
     """
 
+    import rbjournal
+    import rbrrslog
+    import rbsnapshot
+    import rbsyncplan
+
     get_rrslog()
     get_pre_sync()
 
-    # Load in old_ldap dictionary.
+    # Open old_ldap snapshot. Lookups are done directly on the file so it's
+    # never loaded in full.
     #
-    old_ldap = exec(compile(open(OPT.presync).read(), OPT.presync, 'exec'))
+    if not rbsnapshot.is_snapshot(OPT.presync):
+        raise RBFatalError("'%s' is an old style pre_sync file, use "
+                           "convert_pre_sync first" % OPT.presync)
+    old_ldap = rbsnapshot.RBSnapshot(OPT.presync)
 
     # fixme: Set override by default ?
     # Set options for override & test mode.
     UDB.setopt(OPT)
     ACC.setopt(OPT)
 
-    # Build user_rename maps.
-
-    user_convert = {}
-    user_rename = {}
-    user_rename_reverse = {}
-    # user_rename_stages = {}
-    reset_password = {}
-
-    # Open log file to build map of renamed usernames, usernames flagged
-    # for a new password and usernames that were converted.
+    # Read usernames flagged for a new password from rrs.log. Only entries
+    # added since the last run are read, the rest come from the checkpoint
+    # file.
     #
-    rss_file = open(OPT.rrslog, 'r')
-    for line in rss_file.readlines():
-        tlog = line.rstrip().split(':')
-
-        # We ignore renames of new accounts as we just go by the final
-        # entry in the database.
-        #
-        if tlog[4] == 'rename-existing':
-            olduid = tlog[5]
-            newuid = tlog[6]
-
-            # Remove old user rename mapping and add new one unless
-            # it points back to the original username.
-            #
-            user_rename_reverse[newuid] = user_rename_reverse.pop(
-                olduid, olduid)
-            if user_rename_reverse[newuid] == newuid:
-                user_rename_reverse.pop(newuid)
-
-            # If this user was flagged for new password and/or a
-            # conversion, remove the old user mapping and add the
-            # new one.
-            #
-            if olduid in user_convert:
-                user_convert[tlog[6]] = user_convert.pop(tlog[5])
-            if tlog[5] in reset_password:
-                reset_password[tlog[6]] = reset_password.pop(tlog[5])
-        elif tlog[4] == 'convert':
-            # User was converted, so we flag it. Don't care what
-            # they're converted to, we check that later.
-            #
-            user_convert[tlog[5]] = 1
-        elif tlog[4] == 'renew':
-            # tlog[7] indicates whether a new password is required
-            # or not. We take the last value of this in the log
-            # file as the final decision.
-            #
-            reset_password[tlog[5]] = int(tlog[7])
-    rss_file.close()
+    rrslog = rbrrslog.RBRRSLog(OPT.rrslog)
+    entries = rrslog.update()
+    print('rrs.log: %d new entries processed' % entries)
+    if not OPT.test:
+        rrslog.save()
 
-    # Now build olduid -> newuid map from the reverse one.
+    # Renames and conversions are derived by comparing the old tree with
+    # the current one, using the rrs.log renames for old accounts that
+    # can't be matched (converted old style pre_sync dumps). Any rrs.log
+    # renames that don't match are reported as they may indicate a problem
+    # with either.
     #
-    for newuid, olduid in list(user_rename_reverse.items()):
-        user_rename[olduid] = newuid
+    plan = rbsyncplan.RBSyncPlan(old_ldap, UDB.list_pre_sync(),
+                                 rrslog.reset_password, rrslog.user_rename())
+    for olduid, newuid in rrslog.user_rename().items():
+        if plan.renames.get(olduid) != newuid:
+            print('WARNING: rrs.log rename %s -> %s not found in tree' %
+                  (olduid, newuid))
 
     if OPT.test:
-        print('rrs.log username maps')
+        print('sync plan')
         print()
-        print('RENAME')
-        print()
-        for key, value in list(user_rename.items()):
-            print(key, '->', value)
-        print()
-        print('CONVERT')
-        print()
-        for key in list(user_convert.keys()):
-            print(key)
-        print()
-        print('RESETPW')
-        print()
-        for key, value in list(reset_password.items()):
-            if value:
-                print(key)
+        for line in plan.report():
+            print(line)
         print()
 
-    # ----------- #
-    # sync_rename #
-    # ----------- #
+    # Every stage and user outcome is recorded in the sync journal, see
+    # sync_report.
+    #
+    journal = rbjournal.RBJournal(rbconfig.FILE_SYNC_JOURNAL, OPT.test)
+    journal.start_run(OPT.rrslog, OPT.presync)
 
-    print('===> start sync_rename')
-    pause()
+    for stage, func in SYNC_STAGES:
+        if rrslog.stage_done(stage):
+            print('\n===> skipping sync_%s, already completed' % stage)
+            journal.record(stage, None, 'skipped')
+            continue
+        print('\n===> start sync_%s' % stage)
+        pause()
+        journal.record(stage, None, 'started')
+        func(old_ldap, plan, journal)
+        journal.record(stage, None, 'completed')
+        if not OPT.test:
+            rrslog.set_stage_done(stage)
+
+    journal.finish_run()
+    journal.close()
+    old_ldap.close()
 
-    for olduid, newuid in list(user_rename.items()):
+    print()
+    print('sync completed.')
+
+
+def sync_rename(old_ldap, plan, journal):
+    """Rename accounts for existing users renamed since pre_sync."""
+
+    for olduid, newuid in list(plan.user_rename().items()):
         oldusr = RBUser(
             uid=olduid, homeDirectory=old_ldap[olduid]['homeDirectory'])
         newusr = RBUser(uid=newuid)
@@ -1073,16 +1254,15 @@ def sync():
         else:
             print('Account renamed: %s -> %s' % (olduid, newuid))
             ACC.rename(oldusr, newusr)
+            journal.record('rename', newuid, 'renamed', olduid)
             # pause()
 
-    # ------------ #
-    # sync_convert #
-    # ------------ #
 
-    print('\n===> start sync_convert')
-    pause()
+def sync_convert(old_ldap, plan, journal):
+    """Convert accounts for existing users converted since pre_sync."""
 
-    for newuid in list(user_convert.keys()):
+    user_rename_reverse = plan.user_rename_reverse
+    for newuid in list(plan.user_convert.keys()):
         olduid = user_rename_reverse.get(newuid, newuid)
         if olduid not in old_ldap:
             print('WARNING: Existing non newbie user', newuid,
@@ -1114,34 +1294,30 @@ def sync():
             print('Account converted: %s: %s -> %s' %
                   (oldusr.uid, oldusr.usertype, newusr.usertype))
             ACC.convert(oldusr, newusr)
+            journal.record('convert', newuid, 'converted',
+                           '%s -> %s' % (oldusr.usertype, newusr.usertype))
             # pause()
 
-    # ----------- #
-    # sync_delete #
-    # ----------- #
-
-    # print '\n===> start sync_delete'
-    # pause()
-
-    # for pw in pwd.getpwall():
-    #       try:
-    #               UDB.check_user_byname(pw[0])
-    #       except RBError:
-    #               # User doesn't exist in database, ask to delete it.
-    #               #
-    #               if yesno("Delete account %s" % pw[0]):
-    #                       print 'Account deleted: %s' % pw[0]
-    #                       ACC.delete(pw[0])
-    #       else:
-    #               # User exists in database, do nothing!
-    #               pass
-
-    # -------- #
-    # sync_add #
-    # -------- #
-
-    print('\n===> start sync_add')
-    pause()
+
+# def sync_delete(old_ldap, plan, journal):
+#     """Delete accounts missing a database entry."""
+#
+#     for pw in pwd.getpwall():
+#             try:
+#                     UDB.check_user_byname(pw[0])
+#             except RBError:
+#                     # User doesn't exist in database, ask to delete it.
+#                     #
+#                     if yesno("Delete account %s" % pw[0]):
+#                             print 'Account deleted: %s' % pw[0]
+#                             ACC.delete(pw[0])
+#             else:
+#                     # User exists in database, do nothing!
+#                     pass
+
+
+def sync_add(old_ldap, plan, journal):
+    """Create accounts for new users."""
 
     for username in UDB.list_newbies():
         usr = RBUser(uid=username)
@@ -1155,23 +1331,31 @@ def sync():
             UDB.set_passwd(usr)
             print("Account created: %s %s" % (usr.usertype, usr.uid))
             ACC.add(usr)
+            journal.record('add', usr.uid, 'created', usr.usertype)
             print("User mailed:", usr.altmail)
             mailuser(usr)
+            journal.record('add', usr.uid, 'mailed', usr.altmail)
             # pause()
         else:
             # New account exists, must be created already.
             if OPT.test:
                 print('SKIPPED: account create:', usr.usertype, usr.uid)
 
-    # ---------- #
-    # sync_renew #
-    # ---------- #
 
-    print('\n===> start sync_renew')
-    pause()
+def sync_renew(old_ldap, plan, journal):
+    """Reset shells and passwords and mail existing users who renewed."""
 
-    if not os.path.isdir('renewal_mailed'):
-        os.mkdir('renewal_mailed')
+    reset_password = plan.reset_password
+    user_rename_reverse = plan.user_rename_reverse
+
+    # Users already mailed by an earlier run. Marker files left in the old
+    # renewal_mailed directory are imported into the journal.
+    #
+    mailed = journal.users('renew', 'mailed')
+    if os.path.isdir('renewal_mailed'):
+        legacy = set(os.listdir('renewal_mailed')) - mailed
+        journal.add_users('renew', 'mailed', sorted(legacy))
+        mailed |= legacy
 
     for newuid in UDB.list_paid_non_newbies():
         # action = 0
@@ -1199,9 +1383,10 @@ def sync():
             print('Account shell reset for:', newuid,
                   '(%s)' % newusr.loginShell)
             UDB.set_shell(newusr)
+            journal.record('renew', newuid, 'shell', newusr.loginShell)
             # action = 1
 
-        if not os.path.exists('renewal_mailed/%s' % newusr.uid):
+        if newusr.uid not in mailed:
             # Set a new password if they need one.
             #
             if reset_password.get(newuid):
@@ -1209,7 +1394,8 @@ def sync():
                 print('Account password reset for %s password: %s' %
                       (newuid, newusr.passwd))
                 UDB.set_passwd(newusr)
-                action = 1
+                journal.record('renew', newuid, 'passwd')
+                # action = 1
 
             # Send a mail to people who renewed. All renewals should have
             # an entry in reset_password i.e. 0 or 1.
@@ -1222,16 +1408,17 @@ def sync():
             # Flag this user as mailed so we don't do it again if
             # sync is rerun.
             #
-            if not OPT.test:
-                open('renewal_mailed/%s' % newusr.uid, 'w').close()
+            journal.record('renew', newuid, 'mailed', newusr.altmail)
+            mailed.add(newusr.uid)
         elif OPT.test:
             print('SKIPPED: User mailed:', newusr.uid)
 
         # if action:
         #       pause()
 
-    print()
-    print('sync completed.')
+
+SYNC_STAGES = (('rename', sync_rename), ('convert', sync_convert),
+               ('add', sync_add), ('renew', sync_renew))
 
 
 def sync_dcu_info():
@@ -1259,6 +1446,29 @@ def list_users():
         print(username)
 
 
+def export():
+    """Export users matching the options with one paged search."""
+
+    import rbexport
+
+    uids = OPT.args or None
+    if uids == ['-']:
+        uids = sys.stdin.read().split()
+
+    # Set options for override & test mode.
+    UDB.setopt(OPT)
+
+    attrs = OPT.attrs and [i.strip() for i in OPT.attrs.split(',')
+                           ] or rbexport.DEFAULT_ATTRS
+    exporter = rbexport.RBExport(sys.stdout, OPT.format or 'csv', attrs)
+    if uids == []:
+        return
+    exporter.export(
+        UDB.search_paged(
+            UDB.filter_users(OPT.usertype and OPT.usertype.split(','),
+                             OPT.paid, OPT.newbie, uids), exporter.attrlist))
+
+
 def list_newbies():
     """List all paid newbies."""
 
@@ -1330,15 +1540,25 @@ def newyear():
 def unpaid_warn():
     """Mail a reminder/warning message to all non-renewed users."""
 
+    import rbmail
+
     # Set options for override & test mode.
     UDB.setopt(OPT)
     ACC.setopt(OPT)
 
+    users = []
     for username in UDB.list_unpaid():
         usr = RBUser(uid=username)
         UDB.get_user_byname(usr)
-        print("Warned user:", username)
-        mail_unpaid(usr)
+        users.append(usr)
+
+    # Render all the reminders in one go with the same template data before
+    # sending any of them.
+    #
+    messages = rbmail.UNPAID.render_batch(users, rbmail.gen_unpaid_data())
+    for usr, (_, message) in zip(users, messages):
+        print("Warned user:", usr.uid)
+        sendmail_send(message)
 
 
 def unpaid_disable():
@@ -1350,7 +1570,7 @@ def unpaid_disable():
 
     for username in UDB.list_unpaid_reset():
         print("Account disabled:", username)
-        UDB.set_shell(RBUser(uid=username, loginShell=rbconfig.shell_expired))
+        UDB.set_shell(RBUser(uid=username, loginShell=rbconfig.SHELL_EXPIRED))
 
 
 def unpaid_delete():
@@ -1369,132 +1589,98 @@ def unpaid_delete():
         ACC.delete(usr)
 
 
+def batch():
+    """Run operations (see rbbatch) read from given file or standard input,
+    printing a JSON result line for each and a summary at the end."""
+
+    import rbbatch
+
+    if len(OPT.args) > 0 and OPT.args[0] != '-':
+        try:
+            ops = open(OPT.args.pop(0))
+        except OSError as err:
+            raise RBFatalError("Can't open %s: %s" % (err.filename,
+                                                      err.strerror))
+    else:
+        ops = sys.stdin
+
+    # Set options for override & test mode.
+    UDB.setopt(OPT)
+    ACC.setopt(OPT)
+
+    runner = rbbatch.RBBatch(UDB, ACC, OPT)
+    try:
+        runner.run(rbbatch.read_operations(ops), sys.stdout)
+    finally:
+        if ops is not sys.stdin:
+            ops.close()
+        runner.summary(sys.stderr)
+    if runner.failed:
+        sys.exit(1)
+
+
 # --------------------------------------------------------------------------- #
 # MISCELLANEOUS COMMANDS                                                      #
 # --------------------------------------------------------------------------- #
 
 
 def checkdb():
-    """Check database for inconsistencies."""
+    """Check database for inconsistencies.
 
-    uidNumbers = {}
-    re_mail = re.compile(r'.+@.*dcu\.ie', re.I)
-    set_header('User database problems')
-    unpaid_valid_shells = 0
-    reserved = UDB.dict_reserved_desc()
+    Findings for each user are saved with the highest modifyTimestamp seen.
+    In incremental mode (-I) only users modified since the last run are
+    checked against the database, and only those or users whose home or
+    webtree directory has changed (by ctime, which chmod and chown update
+    too) get the filesystem checks. Findings for the rest come from the
+    last run. Changes outside a user's entry (reserved names, DCU
+    database, groups) are only picked up by a full run."""
 
-    for uid in UDB.list_users():
+    import json
+
+    state = None
+    if OPT.incremental:
+        try:
+            with open(rbconfig.FILE_CHECKDB_STATE) as fd:
+                state = json.load(fd)
+        except FileNotFoundError:
+            print('No previous checkdb run, checking all users.')
+    hwm = state['hwm'] if state else ''
+
+    modified = UDB.dict_modified()
+    users = dict((uid, findings)
+                 for uid, findings in (state['users'] if state else {}).items()
+                 if uid in modified)
+    reserved = UDB.dict_reserved_desc()
+    recheck = set()
+    for uid, timestamp in modified.items():
+        if uid in users and timestamp < hwm:
+            continue
         usr = RBUser(uid=uid)
         UDB.get_user_byname(usr)
+        users[uid] = checkdb_user(usr, reserved)
+        recheck.add(uid)
 
-        desc = reserved.get(uid)
-        if desc:
-            show_header()
-            print('%-*s  is reserved: %s' % (rbconfig.maxlen_uname, uid, desc))
-
-        if usr.uidNumber not in uidNumbers:
-            uidNumbers[usr.uidNumber] = [uid]
-        else:
-            uidNumbers[usr.uidNumber].append(uid)
-
-        if usr.usertype == 'member':
-            try:
-                UDB.get_student_byid(usr)
-            except RBWarningError:
-                show_header()
-                print('%-*s  is a member without a valid DCU student id: %s' %
-                      (rbconfig.maxlen_uname, uid, usr.id))
-
-        if usr.yearsPaid is not None:
-            if not -1 <= usr.yearsPaid <= 5:
-                show_header()
-                print('%-*s  has bogus yearsPaid: %s' % (rbconfig.maxlen_uname,
-                                                         uid, usr.yearsPaid))
-
-            if usr.newbie and usr.yearsPaid < 1:
-                show_header()
-                print('%-*s  is a newbie but is unpaid (yearsPaid = %s)' %
-                      (rbconfig.maxlen_uname, uid, usr.yearsPaid))
-
-            if usr.yearsPaid < 1 and UDB.valid_shell(usr.loginShell):
-                unpaid_valid_shells += 1
-
-            if usr.yearsPaid > 0 and not UDB.valid_shell(usr.loginShell):
-                show_header()
-                print('%-*s  is paid but has an invalid shell: %s' %
-                      (rbconfig.maxlen_uname, uid, usr.loginShell))
-            if usr.yearsPaid < -1:
-                print('%-*s  has should have been deleted: %s' %
-                      (rbconfig.maxlen_uname, uid, usr.yearsPaid))
-
-        if usr.yearsPaid is None and usr.usertype in ('member', 'associat',
-                                                      'staff'):
-            show_header()
-            print('%-*s  is missing a yearsPaid attribute' %
-                  (rbconfig.maxlen_uname, uid))
-
-        if usr.id is None and usr.usertype in ('member', 'associat', 'staff'):
-            show_header()
-            print('%-*s  is missing a DCU ID number' % (rbconfig.maxlen_uname,
-                                                        uid))
-
-        for directory, desc in (usr.homeDirectory,
-                                'home'), (rbconfig.gen_webtree(uid),
-                                          'webtree'):
-            if not os.path.exists(directory) or not os.path.isdir(directory):
-                show_header()
-                print('%-*s  is missing %s directory: %s' %
-                      (rbconfig.maxlen_uname, uid, desc, directory))
-            else:
-                stat = os.stat(directory)
-                if (stat.st_uid, stat.st_gid) != (usr.uidNumber,
-                                                  usr.gidNumber):
-                    show_header()
-                    print('%-*s  has wrong %s ownership' %
-                          (rbconfig.maxlen_uname, uid, desc))
-                if stat.st_mode & 0o020:
-                    show_header()
-                    print('%-*s  has group writeable %s' %
-                          (rbconfig.maxlen_uname, uid, desc))
-                if stat.st_mode & 0o002:
-                    show_header()
-                    print('%-*s  has WORLD writeable %s' %
-                          (rbconfig.maxlen_uname, uid, desc))
-
-        try:
-            grp = UDB.get_group_byid(usr.gidNumber)
-        except RBFatalError:
-            grp = '#%d' % usr.gidNumber
-            show_header()
-            print('%-*s  has unknown gidNumber: %d' % (rbconfig.maxlen_uname,
-                                                       uid, usr.gidNumber))
+    # Filesystem audit: stat all home and webtree directories up front.
+    #
+    dirstat = ACC.stat_dirs([
+        path for findings in users.values() for _, path in findings['dirs']
+    ])
+    for uid, findings in users.items():
+        ctimes = [
+            dirstat[path] and dirstat[path].st_ctime_ns
+            for _, path in findings['dirs']
+        ]
+        if uid in recheck or ctimes != findings['ctimes']:
+            findings['fs'] = checkdb_dirs(uid, findings, dirstat)
+            findings['ctimes'] = ctimes
 
-        if usr.usertype in ('member', 'staff', 'committe') and \
-            (usr.altmail.lower().find('%s@redbrick.dcu.ie' % usr.uid) != -1 or
-             not re.search(re_mail, usr.altmail)):
+    set_header('User database problems')
+    for uid in sorted(users):
+        for line in users[uid]['db'] + users[uid]['fs']:
             show_header()
-            print("%-*s  is a %s without a DCU altmail address: %s" %
-                  (rbconfig.maxlen_uname, uid, usr.usertype, usr.altmail))
-
-            # commented by receive, it makes stuff crash
-            # if not usr.userPassword[7].isalnum(
-            # ) and not usr.userPassword[7] in '/.':
-            #     show_header()
-            #     print('%-*s  has a disabled password: %s' %
-            #           (rbconfig.maxlen_uname, uid, usr.userPassword))
-
-        if usr.usertype != 'redbrick':
-            if grp != usr.usertype:
-                show_header()
-                print('%-*s  has different group [%s] and usertype [%s]' %
-                      (rbconfig.maxlen_uname, uid, grp, usr.usertype))
-
-            if usr.homeDirectory != rbconfig.gen_homedir(uid, usr.usertype):
-                show_header()
-                print('%-*s  has wrong home directory [%s] for usertype [%s]' %
-                      (rbconfig.maxlen_uname, uid, usr.homeDirectory,
-                       usr.usertype))
+            print(line)
 
+    unpaid_valid_shells = sum(i['unpaid_shell'] for i in users.values())
     if unpaid_valid_shells > 0:
         show_header()
         print()
@@ -1504,28 +1690,369 @@ def checkdb():
 
     set_header('Duplicate uidNumbers')
 
-    for uidNumber, uids in list(uidNumbers.items()):
-        if len(uids) > 1:
-            show_header()
-            print('%d  is shared by: %s' % (uidNumber, ', '.join(uids)))
+    for uidNumber, uids in UDB.uidNumber_index().duplicates():
+        show_header()
+        print('%d  is shared by: %s' % (uidNumber, ', '.join(uids)))
+
+    if not OPT.test:
+        tmpfile = rbconfig.FILE_CHECKDB_STATE + '.tmp'
+        with open(tmpfile, 'w') as fd:
+            json.dump({'hwm': max(modified.values(), default=hwm),
+                       'users': users}, fd)
+        os.rename(tmpfile, rbconfig.FILE_CHECKDB_STATE)
+
+
+def checkdb_user(usr, reserved):
+    """Return dictionary of database findings for given user: problem
+    lines, whether they are unpaid with a valid shell and the directories
+    and ownership for checkdb_dirs()."""
+
+    uid = usr.uid
+    problems = []
+
+    def problem(mesg, *args):
+        """Add a problem line for this user."""
+
+        problems.append('%-*s  %s' % (rbconfig.MAXLEN_UNAME, uid,
+                                      mesg % args))
+
+    desc = reserved.get(uid)
+    if desc:
+        problem('is reserved: %s', desc)
+
+    if usr.usertype == 'member':
+        try:
+            UDB.get_student_byid(usr)
+        except RBWarningError:
+            problem('is a member without a valid DCU student id: %s', usr.id)
+
+    unpaid_shell = False
+    if usr.yearsPaid is not None:
+        if not -1 <= usr.yearsPaid <= 5:
+            problem('has bogus yearsPaid: %s', usr.yearsPaid)
+
+        if usr.newbie and usr.yearsPaid < 1:
+            problem('is a newbie but is unpaid (yearsPaid = %s)',
+                    usr.yearsPaid)
+
+        if usr.yearsPaid < 1 and UDB.valid_shell(usr.loginShell):
+            unpaid_shell = True
+
+        if usr.yearsPaid > 0 and not UDB.valid_shell(usr.loginShell):
+            problem('is paid but has an invalid shell: %s', usr.loginShell)
+        if usr.yearsPaid < -1:
+            problem('has should have been deleted: %s', usr.yearsPaid)
+
+    if usr.yearsPaid is None and usr.usertype in ('member', 'associat',
+                                                  'staff'):
+        problem('is missing a yearsPaid attribute')
+
+    if usr.id is None and usr.usertype in ('member', 'associat', 'staff'):
+        problem('is missing a DCU ID number')
+
+    try:
+        grp = UDB.get_group_byid(usr.gidNumber)
+    except RBFatalError:
+        grp = '#%d' % usr.gidNumber
+        problem('has unknown gidNumber: %d', usr.gidNumber)
+
+    if usr.usertype in ('member', 'staff', 'committe') and \
+        (usr.altmail.lower().find('%s@redbrick.dcu.ie' % usr.uid) != -1 or
+         not re.search(RE_DCU_MAIL, usr.altmail)):
+        problem('is a %s without a DCU altmail address: %s', usr.usertype,
+                usr.altmail)
+
+        # commented by receive, it makes stuff crash
+        # if not usr.userPassword[7].isalnum(
+        # ) and not usr.userPassword[7] in '/.':
+        #     problem('has a disabled password: %s', usr.userPassword)
+
+    if usr.usertype != 'redbrick':
+        if grp != usr.usertype:
+            problem('has different group [%s] and usertype [%s]', grp,
+                    usr.usertype)
+
+        if usr.homeDirectory != rbconfig.gen_homedir(uid, usr.usertype):
+            problem('has wrong home directory [%s] for usertype [%s]',
+                    usr.homeDirectory, usr.usertype)
+
+    return {
+        'db': problems,
+        'unpaid_shell': unpaid_shell,
+        'dirs': [('home', usr.homeDirectory),
+                 ('webtree', rbconfig.gen_webtree(uid))],
+        'owner': (usr.uidNumber, usr.gidNumber),
+        'ctimes': None,
+        'fs': [],
+    }
+
+
+def checkdb_dirs(uid, findings, dirstat):
+    """Return filesystem problem lines for given user's checkdb_user()
+    findings using given RBAccount.stat_dirs() results."""
+
+    problems = []
+    for desc, directory in findings['dirs']:
+        stat = dirstat[directory]
+        if stat is None:
+            problems.append('%-*s  is missing %s directory: %s' %
+                            (rbconfig.MAXLEN_UNAME, uid, desc, directory))
+            continue
+        if [stat.st_uid, stat.st_gid] != list(findings['owner']):
+            problems.append('%-*s  has wrong %s ownership' %
+                            (rbconfig.MAXLEN_UNAME, uid, desc))
+        if stat.st_mode & 0o020:
+            problems.append('%-*s  has group writeable %s' %
+                            (rbconfig.MAXLEN_UNAME, uid, desc))
+        if stat.st_mode & 0o002:
+            problems.append('%-*s  has WORLD writeable %s' %
+                            (rbconfig.MAXLEN_UNAME, uid, desc))
+    return problems
 
 
 def stats():
     """Show database and account statistics."""
 
     print(header('User database stats'))
-    UDB.stats()
+    UDB.stats(None if OPT.dbonly else ACC.signed_in())
+
+
+def stats_ldif():
+    """Show account statistics from an LDIF dump (e.g. slapcat output)
+    without using the user database."""
+
+    import rbstats
+
+    if len(OPT.args) > 0 and OPT.args[0]:
+        filename = OPT.args.pop(0)
+    else:
+        filename = ask('Enter name of LDIF file')
+    try:
+        with open(filename, 'rb') as fd:
+            stats = rbstats.from_ldif(fd,
+                                      None if OPT.dbonly else ACC.signed_in())
+    except IOError as err:
+        raise RBFatalError("Could not open LDIF file '%s' [%s]" %
+                           (filename, err))
+    print(header('User database stats (%s)' % filename))
+    stats.report()
 
 
 def create_uidNumber():
-    """Find next available uidNumber and write it out to uidNumber
-    text file."""
+    """Find next available uidNumber and set the uidNumber counter in
+    LDAP to it."""
 
     next_number = UDB.uidNumber_findmax() + 1
     print('Next available uidNumber:', next_number)
-    uid_file = open(rbconfig.file_uidNumber, 'w')
-    uid_file.write('%s\n' % next_number)
-    uid_file.close()
+    UDB.setopt(OPT)
+    UDB.uidNumber_set(next_number)
+
+
+def convert_pre_sync():
+    """Convert an old style (pprint) pre_sync dump to snapshot format."""
+
+    import rbsnapshot
+
+    get_pre_sync()
+    if len(OPT.args) > 0 and OPT.args[0]:
+        newfile = OPT.args.pop(0)
+    else:
+        newfile = ask('Enter name of new pre_sync file',
+                      OPT.presync + '.snap')
+
+    if rbsnapshot.is_snapshot(OPT.presync):
+        raise RBFatalError("'%s' is already a snapshot file" % OPT.presync)
+    print('Converted %d users to %s' %
+          (rbsnapshot.convert_pre_sync(OPT.presync, newfile), newfile))
+
+
+def sync_plan():
+    """Dry run report of the actions sync would take, found by comparing
+    the pre_sync snapshot with the current database or, if given, another
+    snapshot file or an LDIF dump."""
+
+    import rbsnapshot
+    import rbsyncplan
+
+    get_pre_sync()
+    if not rbsnapshot.is_snapshot(OPT.presync):
+        raise RBFatalError("'%s' is an old style pre_sync file, use "
+                           "convert_pre_sync first" % OPT.presync)
+    old_ldap = rbsnapshot.RBSnapshot(OPT.presync)
+
+    if len(OPT.args) > 0 and OPT.args[0]:
+        newfile = OPT.args.pop(0)
+        if rbsnapshot.is_snapshot(newfile):
+            new_ldap = rbsnapshot.RBSnapshot(newfile)
+        else:
+            with open(newfile, 'rb') as fd:
+                new_ldap = rbsyncplan.read_ldif(fd)
+    else:
+        new_ldap = UDB.list_pre_sync()
+
+    for line in rbsyncplan.RBSyncPlan(old_ldap, new_ldap).report():
+        print(line)
+
+    old_ldap.close()
+    if isinstance(new_ldap, rbsnapshot.RBSnapshot):
+        new_ldap.close()
+
+
+def sync_report():
+    """Show the sync journal for given run (default: the last run) with a
+    summary of actions per stage."""
+
+    import rbjournal
+
+    journal = rbjournal.RBJournal(rbconfig.FILE_SYNC_JOURNAL)
+    runs = dict((i[0], i) for i in journal.runs())
+    if not runs:
+        journal.close()
+        print('No sync runs recorded.')
+        return
+
+    if len(OPT.args) > 0 and OPT.args[0]:
+        try:
+            run = int(OPT.args.pop(0))
+        except ValueError:
+            raise RBFatalError('Run must be a number')
+    else:
+        run = journal.last_run()
+    if run not in runs:
+        journal.close()
+        raise RBFatalError('No such sync run %d (runs are %d-%d)' %
+                           (run, min(runs), max(runs)))
+
+    _, started, finished, rrslog, presync = runs[run]
+    print('Sync run %d of %d' % (run, max(runs)))
+    print('%13s %s' % ('started:', started))
+    print('%13s %s' % ('finished:', finished or 'not completed'))
+    print('%13s %s' % ('rrs.log:', rrslog))
+    print('%13s %s' % ('pre_sync:', presync))
+    print()
+
+    summary = {}
+    for when, stage, uid, action, detail in journal.outcomes(run):
+        print('%s %-8s %-10s %-9s %s' % (when, stage, action, uid or '-',
+                                         detail or ''))
+        if uid is not None:
+            summary[(stage, action)] = summary.get((stage, action), 0) + 1
+    journal.close()
+
+    print()
+    print('Summary')
+    print()
+    for (stage, action), total in sorted(summary.items()):
+        print('%-8s %-10s %5d' % (stage, action, total))
+
+
+def daemon():
+    """Serve commands from useradm clients over a Unix socket, keeping the
+    user database connections, RBAccount and their caches between
+    commands."""
+
+    import rbdaemon
+
+    if len(OPT.args) > 0 and OPT.args[0]:
+        path = OPT.args.pop(0)
+    else:
+        path = rbconfig.FILE_USERADM_SOCKET
+
+    instructions = INPUT_INSTRUCTIONS
+    cached = (rbconfig.FILE_SHELLS, rbconfig.FILE_BACKUP_PASSWD)
+    state = {'used': time.time(), 'mtimes': [mtime(i) for i in cached]}
+
+    def handler(request, stdin, stdout, stderr):
+        """Run command line of given request as main() would."""
+
+        global OPT, INPUT_INSTRUCTIONS, HEADER_MSG, UDB
+        OPT = RBOpt()
+        INPUT_INSTRUCTIONS = instructions
+        HEADER_MSG = None
+
+        saved = sys.stdin, sys.stdout, sys.stderr
+        env = dict((i, os.environ.get(i)) for i in rbdaemon.ENVIRONMENT)
+        cwd = os.getcwd()
+        sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+        status = 0
+        try:
+            os.chdir(request.get('cwd') or '/')
+            for i in rbdaemon.ENVIRONMENT:
+                os.environ.pop(i, None)
+            os.environ.update(request.get('env') or {})
+
+            args = parse_options(list(request.get('argv') or ()))
+            if OPT.mode in CMDS_LOCAL:
+                raise RBFatalError("Command '%s' can not be run by the "
+                                   "daemon, use --local" % OPT.mode)
+
+            # Drop the /etc/shells and backup passwd caches if the files
+            # changed and check connections that have been idle a while
+            # (the servers may have dropped them).
+            #
+            mtimes = [mtime(i) for i in cached]
+            if UDB is not None and mtimes != state['mtimes']:
+                UDB.valid_shells = UDB.backup_shells = None
+            state['mtimes'] = mtimes
+            if UDB is not None and \
+                    time.time() - state['used'] > rbconfig.DAEMON_IDLE_CHECK:
+                try:
+                    for conn in UDB.ldap, UDB.ldap_dcu:
+                        if conn is not None:
+                            conn.whoami_s()
+                except LDAP_ERRORS:
+                    backends = ('userdb', 'dcu') if UDB.ldap_dcu else (
+                        'userdb', )
+                    try:
+                        UDB.close()
+                    except LDAP_ERRORS:
+                        pass
+                    UDB = None
+                    setup(backends)
+
+            setup(CMDS_BACKENDS[OPT.mode])
+            for i in UDB, ACC:
+                if i is not None:
+                    i.setopt(OPT)
+            OPT.args = args
+            run()
+        except SystemExit as err:
+            if err.code is None or isinstance(err.code, int):
+                status = err.code or 0
+            else:
+                print(err.code, file=sys.stderr)
+                status = 1
+        except RBError as err:
+            print(err, file=sys.stderr)
+            status = 1
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = saved
+            for i, value in env.items():
+                if value is None:
+                    os.environ.pop(i, None)
+                else:
+                    os.environ[i] = value
+            os.chdir(cwd)
+            state['used'] = time.time()
+        return status
+
+    server = rbdaemon.RBDaemon(path, handler, log=sys.stderr)
+    server.listen()
+    print('useradm daemon listening on %s' % path, file=sys.stderr)
+    server.serve()
+
+
+def mtime(filename):
+    """Return modification time of given file or None if it can't be
+    stat'ed."""
+
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
 
 
 # --------------------------------------------------------------------------- #
@@ -1554,6 +2081,8 @@ def ask(prompt, default=None, optional=0, hints=None):
 
     """
 
+    import readline
+
     def complete(text, state):
         """Completion function used by readline module for ask().
 
@@ -1617,6 +2146,9 @@ def ask(prompt, default=None, optional=0, hints=None):
 def yesno(prompt, default=None):
     """Prompt for confirmation to a question. Returns boolean."""
 
+    # Imported for its side effect of line editing in input().
+    import readline  # noqa: F401
+
     global INPUT_INSTRUCTIONS
     if INPUT_INSTRUCTIONS:
         print(INPUT_INSTRUCTIONS)
@@ -1697,159 +2229,33 @@ def show_header():
 def mailuser(usr):
     """Mail user's account details to their alternate email address."""
 
-    file_descriptor = sendmail_open()
-    file_descriptor.write("""From: Redbrick Admin Team <admins@redbrick.dcu.ie>
-Subject: Welcome to Redbrick! - Your Account Details
-To: %s
-Reply-To: admin-request@redbrick.dcu.ie
-
-""" % usr.altmail)
-    if usr.newbie:
-        file_descriptor.write("Welcome to Redbrick, \
-            the DCU Networking Society! Thank you for joining.")
-    else:
-        file_descriptor.write("Welcome back to Redbrick, \
-            the DCU Networking Society! Thank you for renewing.")
-    file_descriptor.write("\n\nYour Redbrick Account details are:\n\n")
-
-    file_descriptor.write('%21s: %s\n' % ('username', usr.uid))
-    if usr.passwd:
-        file_descriptor.write('%21s: %s\n\n' % ('password', usr.passwd))
-    file_descriptor.write('%21s: %s\n' % ('account type', usr.usertype))
-    file_descriptor.write('%21s: %s\n' % ('name', usr.cn))
-    if usr.id is not None:
-        file_descriptor.write('%21s: %s\n' % ('id number', usr.id))
-    if usr.course:
-        file_descriptor.write('%21s: %s\n' % ('course', usr.course))
-    if usr.year is not None:
-        file_descriptor.write('%21s: %s\n' % ('year', usr.year))
-
-    file_descriptor.write("""
--------------------------------------------------------------------------------
-
-your Redbrick webpage: https://www.redbrick.dcu.ie/~%s
-your Redbrick email: %s@redbrick.dcu.ie
-
-You can find out more about our services at:
-https://www.redbrick.dcu.ie/about/welcome
-""" % (usr.uid, usr.uid))
-
-    file_descriptor.write("""
-We recommend that you change your password as soon as you login.
+    import rbmail
 
-Problems with your password or wish to change your username? Contact:
-admin-request@redbrick.dcu.ie
+    sendmail_send(rbmail.WELCOME.render(usr))
 
-Problems using Redbrick in general or not sure what to do? Contact:
-helpdesk-request@redbrick.dcu.ie
 
-Have fun!
-
-- Redbrick Admin Team
-""")
-
-    sendmail_close(file_descriptor)
-
-
-def mail_unpaid(usr):
+def mail_unpaid(usr, data=None):
     """Mail a warning to a non-renewed user."""
 
-    file_descriptor = sendmail_open()
-    file_descriptor.write("""From: Redbrick Admin Team <admins@redbrick.dcu.ie>
-Subject: Time to renew your Redbrick account!
-To: %s@redbrick.dcu.ie
-""" % usr.uid)
-
-    if usr.altmail.lower().find('%s@redbrick.dcu.ie' % usr.uid) == -1:
-        file_descriptor.write('Cc:', usr.altmail)
+    import rbmail
 
-    file_descriptor.write("""Reply-To: accounts@redbrick.dcu.ie
-
-Hey there,
-
-It's that time again to renew your Redbrick account!
-Membership prices, as set by the SLC, are as follows:
-
-Members      EUR 4
-Associates   EUR 8
-Staff        EUR 8
-Guests       EUR 10
-
-Note: if you have left DCU, you need to apply for associate membership.
-
-You can pay in person, by lodging money into our account, electronic bank
-transfer, or even PayPal! All the details you need are here:
-
-https://www.redbrick.dcu.ie/help/joining/
-
-Our bank details are:
-
-a/c name: DCU Redbrick Society
-IBAN: IE59BOFI90675027999600
-BIC: BOFIIE2D
-a/c number: 27999600
-sort code: 90 - 67 - 50
+    sendmail_send(rbmail.UNPAID.render(usr, data or rbmail.gen_unpaid_data()))
 
 
+def mail_committee(subject, body):
+    """Email committee with given subject and message body."""
 
-Please Note!
-------------""")
-    # Change the message below every year
+    import rbmail
 
-    if usr.yearsPaid == 0:
-        file_descriptor.write("""
-If you do not renew by the 30th October 2016, your account will be disabled.
-Your account will remain on the system for a grace period of a year - you
-just won't be able to login. So don't worry, it won't be deleted any time
-soon! You can renew at any time during the year.
-""")
-    else:
-        file_descriptor.write("""
-If you do not renew within the following month, your account WILL BE
-DELETED at the start of the new year. This is because you were not
-recorded as having paid for last year and as such are nearing the end of
-your one year 'grace' period to renew. Please make sure to renew as soon
-as possible otherwise please contact us at: accounts@redbrick.dcu.ie.
-""")
-    file_descriptor.write("""
-If in fact you have renewed and have received this email in error, it is
-important you let us know. Just reply to this email and tell us how and
-when you renewed and we'll sort it out.
-
-For your information, your current Redbrick account details are:
-
-         username: %s
-     account type: %s
-             name: %s
-alternative email: %s
-""" % (usr.uid, usr.usertype, usr.cn, usr.altmail))
-
-    if usr.id is not None:
-        file_descriptor.write('%21s: %s\n' % ('id number', usr.id))
-    if usr.course:
-        file_descriptor.write('%21s: %s\n' % ('course', usr.course))
-    if usr.year is not None:
-        file_descriptor.write('%21s: %s\n' % ('year', usr.year))
-
-    file_descriptor.write("""
-If any of the above details are wrong, please correct them when you
-renew!
-
-- Redbrick Admin Team
-""")
-    sendmail_close(file_descriptor)
+    sendmail_send(
+        rbmail.COMMITTEE.render(None, {'subject': subject, 'body': body}))
 
 
-def mail_committee(subject, body):
-    """Email committee with given subject and message body."""
+def sendmail_send(message):
+    """Send given complete message as rendered by RBMailTemplate."""
 
     file_descriptor = sendmail_open()
-    file_descriptor.write("""From: Redbrick Admin Team <admins@redbrick.dcu.ie>
-Subject: %s
-To: committee@redbrick.dcu.ie
-
-%s
-""" % (subject, body))
+    file_descriptor.write(message)
     sendmail_close(file_descriptor)
 
 
@@ -1860,7 +2266,7 @@ def sendmail_open():
         sys.stderr.write(header('Email message that would be sent'))
         return sys.stderr
     else:
-        return os.popen('%s -t -i' % rbconfig.command_sendmail, 'w')
+        return os.popen('%s -t -i' % rbconfig.COMMAND_SENDMAIL, 'w')
 
 
 def sendmail_close(file_descriptor):
@@ -1941,9 +2347,9 @@ def get_usertype(usr):
     else:
         interact = 1
         print("Usertype must be specified. List of valid usertypes:\n")
-        for i in rbconfig.usertypes_list:
-            if OPT.mode != 'renew' or i in rbconfig.usertypes_paying:
-                print(" %-12s %s" % (i, rbconfig.usertypes[i]))
+        for i in rbconfig.USERTYPES_LIST:
+            if OPT.mode != 'renew' or i in rbconfig.USERTYPES_PAYING:
+                print(" %-12s %s" % (i, rbconfig.USERTYPES[i]))
         print()
 
     defans = usr.usertype or 'member'
@@ -1954,8 +2360,8 @@ def get_usertype(usr):
                 'Enter usertype',
                 defans,
                 hints=[
-                    i for i in rbconfig.usertypes_list
-                    if OPT.mode != 'renew' or i in rbconfig.usertypes_paying
+                    i for i in rbconfig.USERTYPES_LIST
+                    if OPT.mode != 'renew' or i in rbconfig.USERTYPES_PAYING
                 ])
         try:
             if OPT.mode == 'renew':
@@ -1980,11 +2386,11 @@ def get_convert_usertype(usr):
         print(
             "Conversion usertype must be specified. List of valid usertypes:\n"
         )
-        for i in rbconfig.usertypes_list:
-            print(" %-12s %s" % (i, rbconfig.usertypes[i]))
+        for i in rbconfig.USERTYPES_LIST:
+            print(" %-12s %s" % (i, rbconfig.USERTYPES[i]))
 
         print("\nSpecial committee positions (usertype is 'committe'):\n")
-        for i, j in list(rbconfig.convert_usertypes.items()):
+        for i, j in list(rbconfig.CONVERT_USERTYPES.items()):
             print(" %-12s %s" % (i, j))
         print()
 
@@ -1992,8 +2398,8 @@ def get_convert_usertype(usr):
         if interact:
             usr.usertype = ask(
                 'Enter conversion usertype',
-                hints=list(rbconfig.usertypes_list) +
-                list(rbconfig.convert_usertypes.keys()))
+                hints=list(rbconfig.USERTYPES_LIST) +
+                list(rbconfig.CONVERT_USERTYPES.keys()))
         try:
             UDB.check_convert_usertype(usr.usertype)
         except RBError as e:
@@ -2006,7 +2412,7 @@ def get_convert_usertype(usr):
 def get_id(usr):
     """Get DCU ID."""
 
-    if usr.usertype not in rbconfig.usertypes_dcu and OPT.mode != 'update':
+    if usr.usertype not in rbconfig.USERTYPES_DCU and OPT.mode != 'update':
         return
 
     if OPT.id is not None:
@@ -2119,7 +2525,7 @@ def get_newbie(usr):
 def get_years_paid(usr):
     """Get years paid."""
 
-    if usr.usertype not in rbconfig.usertypes_paying and OPT.mode != 'update':
+    if usr.usertype not in rbconfig.USERTYPES_PAYING and OPT.mode != 'update':
         return
 
     if OPT.yearsPaid is not None:
@@ -2238,7 +2644,7 @@ def get_updatedby(usr):
 def get_birthday(usr):
     """Get (optional) birthday."""
 
-    if usr.usertype not in rbconfig.usertypes_paying:
+    if usr.usertype not in rbconfig.USERTYPES_PAYING:
         return
 
     if OPT.birthday is not None:
@@ -2292,7 +2698,7 @@ def get_disuser_period(usr):
 def get_disuser_message(usr):
     """Get message to display when disusered user tries to log in."""
 
-    file = os.path.join(rbconfig.dir_daft, usr.uid)
+    file = os.path.join(rbconfig.DIR_DAFT, usr.uid)
     editor = os.environ.get('EDITOR', os.environ.get('VISUAL', 'vi'))
 
     while 1:
@@ -2328,7 +2734,7 @@ def get_rrslog():
 
     while 1:
         if interact:
-            OPT.rrslog = ask('Enter name of RRS logfile', rbconfig.file_rrslog)
+            OPT.rrslog = ask('Enter name of RRS logfile', rbconfig.FILE_RRSLOG)
         try:
             open(OPT.rrslog, 'r').close()
         except IOError as e:
@@ -2350,7 +2756,7 @@ def get_pre_sync():
     while 1:
         if interact:
             OPT.presync = ask('Enter name of pre_sync file',
-                              rbconfig.file_pre_sync)
+                              rbconfig.FILE_PRE_SYNC)
         try:
             open(OPT.presync, 'r').close()
         except IOError as e: